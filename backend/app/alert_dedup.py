@@ -0,0 +1,129 @@
+"""
+Alert Dedup Cache
+
+The alert engine suppresses a repeat of the same symptom type in the same
+consultation for a few minutes. It used to remember every
+``(consultation_id, symptom_type)`` it ever alerted on in a plain dict,
+purged only by ``/clear-cache/{consultation_id}`` (which scanned every key),
+so a long-running process grew without bound.
+
+``AlertDedupCache`` keeps the same semantics with bounded memory:
+
+- Every entry has the same lifetime (the dedup window), so expiry order is
+  insertion order and a FIFO queue (``OrderedDict``) is the expiry
+  structure: each operation first pops the expired entries at its head,
+  O(1) amortized per entry, with no background task
+- A per-consultation index makes clearing a consultation O(its entries)
+- ``max_entries`` caps memory; beyond it the oldest entries are evicted
+  (their symptoms may alert again early, counted in ``evictions``)
+
+Usage:
+    dedup = AlertDedupCache(window=timedelta(minutes=5))
+    if not dedup.seen_recently(consultation_id, symptom_type, datetime.now()):
+        raise_alert()
+"""
+
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Set, Tuple
+
+ALERT_DEDUP_MAX_ENTRIES = int(os.getenv("ALERT_DEDUP_MAX_ENTRIES", "100000"))
+
+_Key = Tuple[str, str]
+
+
+class AlertDedupCache:
+    """Self-expiring ``(consultation_id, symptom_type) -> last alert time`` map."""
+
+    def __init__(self, window: timedelta, max_entries: int = ALERT_DEDUP_MAX_ENTRIES):
+        """
+        Args:
+            window: How long a symptom stays suppressed after an alert
+            max_entries: Entries kept before the oldest are evicted
+        """
+        self.window = window
+        self.max_entries = max_entries
+        # Oldest alert first; the head is always the next entry to expire
+        self._entries: "OrderedDict[_Key, datetime]" = OrderedDict()
+        self._by_consultation: Dict[str, Set[str]] = {}
+
+        self.recorded = 0
+        self.suppressed = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: _Key) -> bool:
+        return key in self._entries
+
+    def _remove(self, key: _Key) -> None:
+        del self._entries[key]
+        consultation_id, symptom_type = key
+        symptoms = self._by_consultation[consultation_id]
+        symptoms.discard(symptom_type)
+        if not symptoms:
+            del self._by_consultation[consultation_id]
+
+    def expire(self, now: datetime) -> int:
+        """Drop entries whose window has passed; returns how many."""
+        cutoff = now - self.window
+        dropped = 0
+        entries = self._entries
+        while entries:
+            key, alerted_at = next(iter(entries.items()))
+            if alerted_at > cutoff:
+                break
+            self._remove(key)
+            dropped += 1
+        self.expired += dropped
+        return dropped
+
+    def seen_recently(self, consultation_id: str, symptom_type: str, now: datetime) -> bool:
+        """
+        Whether this symptom already alerted in the consultation within the
+        window; if not, record ``now`` as its alert time.
+        """
+        self.expire(now)
+        key = (consultation_id, symptom_type)
+        alerted_at = self._entries.get(key)
+        if alerted_at is not None and now - alerted_at < self.window:
+            self.suppressed += 1
+            return True
+
+        if alerted_at is not None:
+            # Clock moved backwards past the head; re-queue at the tail
+            self._remove(key)
+        self._entries[key] = now
+        self._by_consultation.setdefault(consultation_id, set()).add(symptom_type)
+        self.recorded += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return False
+
+    def clear_consultation(self, consultation_id: str) -> int:
+        """Forget every alert of one consultation; returns how many."""
+        symptoms = self._by_consultation.pop(consultation_id, set())
+        for symptom_type in symptoms:
+            del self._entries[(consultation_id, symptom_type)]
+        return len(symptoms)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_consultation.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and activity counters."""
+        return {
+            "size": len(self._entries),
+            "consultations": len(self._by_consultation),
+            "max_entries": self.max_entries,
+            "window_seconds": self.window.total_seconds(),
+            "recorded": self.recorded,
+            "suppressed": self.suppressed,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
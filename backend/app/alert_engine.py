@@ -3,20 +3,84 @@ AI-Powered Alert Engine using Google Gemini
 
 This module uses Google Gemini AI to intelligently analyze patient symptoms
 in ANY language and provide accurate severity assessment and recommendations.
+
+Model results are cached per normalized utterance (app.utterance_cache), so
+repeated or near-identical patient sentences skip the model call; the alert
+itself still goes through the per-consultation 5-minute dedup.
 """
 
 import re
 import os
-import json
+import hashlib
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Optional
 from pydantic import BaseModel
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from .alert_dedup import AlertDedupCache
+from .llm_gateway import get_llm_gateway
+from .llm_json import LLMOutputError, json_generation_config, parse_llm_json
+from .models import TriageResult
+from .triage_filter import CRITICAL_KEYWORDS, TRIAGE_PREFILTER_ENABLED, get_triage_prefilter
+from .utterance_cache import UtteranceCache, normalize_utterance
+
 # Load environment variables
 load_dotenv()
 
+TRIAGE_MODEL = "models/gemini-2.5-flash"
+ALERT_DEDUP_WINDOW = timedelta(minutes=5)
+
+# Triage results cached per normalized utterance (see app.utterance_cache)
+ALERT_RESULT_CACHE_TTL_SECONDS = float(os.getenv("ALERT_RESULT_CACHE_TTL", "86400"))
+ALERT_RESULT_CACHE_SIZE = int(os.getenv("ALERT_RESULT_CACHE_SIZE", "5000"))
+# SQLite file for the on-disk tier; unset keeps the cache in memory only
+ALERT_RESULT_CACHE_PATH = os.getenv("ALERT_RESULT_CACHE_PATH") or None
+ALERT_CACHE_TRANSLITERATE = os.getenv("ALERT_CACHE_TRANSLITERATE", "false").lower() == "true"
+
+TRIAGE_PROMPT = """You are a medical triage AI assistant. Analyze the following patient symptom description and provide a JSON response.
+
+Patient says: "{text}"
+
+IMPORTANT MEDICAL TRIAGE GUIDELINES:
+- ANY injury (fracture, broken bone, severe cut, head injury) = severity 4-5
+- ANY severe pain (unbearable, worst ever, 8+/10) = severity 4-5
+- Life-threatening (chest pain, can't breathe, stroke, severe bleeding) = severity 5
+- Urgent care needed (fractures, deep cuts, high fever, severe pain) = severity 4
+- Concerning symptoms (persistent pain, infection signs, moderate injury) = severity 3
+- Mild symptoms (minor aches, cold, mild discomfort) = severity 1-2
+
+Respond with ONLY a valid JSON object (no markdown, no extra text):
+{{
+    "is_critical": boolean (true if severity >= 3, requires medical attention),
+    "symptom_type": string (category: "injury", "chest_pain", "breathing_difficulty", "neurological", "mental_health", "pain", "infection", "bleeding", "other"),
+    "severity_score": integer (1-5 scale:
+        5 = Life-threatening emergency (call 911 immediately)
+        4 = Urgent care needed (ER or urgent care within hours)
+        3 = Medical attention needed (see doctor within 24-48 hours)
+        2 = Mild concern (monitor, see doctor if worsens)
+        1 = Minor issue (self-care, monitor)
+    ),
+    "analysis": string (brief medical analysis explaining the concern),
+    "recommendations": string (specific action: "Call 911 immediately", "Go to ER now", "Visit urgent care today", "Schedule doctor appointment", "Monitor symptoms"),
+    "emergency_keywords": array of strings (key symptoms found)
+}}
+
+EXAMPLES:
+- "bone fracture" → severity 4 (urgent care needed)
+- "broken arm" → severity 4 (urgent care needed)
+- "severe headache" → severity 4 (urgent evaluation)
+- "chest pain" → severity 5 (call 911)
+- "can't breathe" → severity 5 (call 911)
+- "mild headache" → severity 2 (monitor)
+
+Respond with ONLY the JSON object, nothing else."""
+
+# Cached results are only reused while the prompt and model are unchanged
+TRIAGE_PROMPT_VERSION = hashlib.blake2b(
+    (TRIAGE_MODEL + TRIAGE_PROMPT).encode(), digest_size=8
+).hexdigest()
+
 
 class Alert(BaseModel):
     """Medical alert with AI-analyzed symptom details."""
@@ -48,7 +112,17 @@ class AlertEngine:
     
     def __init__(self):
         """Initialize the Alert Engine with Gemini AI."""
-        self.alert_cache: Dict[tuple, datetime] = {}
+        self.alert_cache = AlertDedupCache(window=ALERT_DEDUP_WINDOW)
+        # Model results per normalized utterance; alerts still go through alert_cache
+        self.result_cache = UtteranceCache(
+            "alert_results",
+            version=TRIAGE_PROMPT_VERSION,
+            ttl=ALERT_RESULT_CACHE_TTL_SECONDS,
+            max_size=ALERT_RESULT_CACHE_SIZE,
+            path=ALERT_RESULT_CACHE_PATH,
+            transliterate=ALERT_CACHE_TRANSLITERATE
+        )
+        self.ai_calls = 0
         
         # Initialize Gemini AI
         api_key = os.getenv("GEMINI_API_KEY")
@@ -58,9 +132,11 @@ class AlertEngine:
         if api_key and api_key != "your_gemini_api_key_here":
             try:
                 print(f"[AlertEngine] Configuring Gemini with key: {api_key[:20]}...")
-                genai.configure(api_key=api_key)
+                get_llm_gateway().configure(api_key)
                 # Use Gemini 2.5 Flash for faster, more reliable responses
-                self.model = genai.GenerativeModel('models/gemini-2.5-flash')
+                self.model = genai.GenerativeModel(
+                    TRIAGE_MODEL, generation_config=json_generation_config(TriageResult)
+                )
                 self.ai_enabled = True
                 print("[AlertEngine] ✅ Gemini 1.5 Flash enabled successfully!")
             except Exception as e:
@@ -73,13 +149,13 @@ class AlertEngine:
             print("[AlertEngine] Get your free API key from: https://makersuite.google.com/app/apikey")
         
         # Fallback patterns for when AI is not available
-        self.critical_keywords = [
-            "chest pain", "can't breathe", "heart attack", "stroke", "seizure",
-            "passed out", "bleeding", "suicidal", "overdose", "severe pain",
-            "unconscious", "paralysis", "can't move", "vision loss",
-            "fracture", "broken bone", "broken arm", "broken leg", "head injury",
-            "deep cut", "severe burn", "can't walk", "severe injury"
-        ]
+        self.critical_keywords = list(CRITICAL_KEYWORDS)
+        
+        # Local pre-filter: clear small talk never reaches the model, and the
+        # fallback matcher uses its critical terms (English and Hindi)
+        self.prefilter = get_triage_prefilter()
+        self.prefilter_enabled = TRIAGE_PREFILTER_ENABLED
+        self.prefiltered = 0
     
     async def analyze_transcript(
         self,
@@ -104,6 +180,10 @@ class AlertEngine:
         
         # Use AI analysis if available
         if self.ai_enabled:
+            # Skip the model only for clear small talk (greetings, thanks, "haan")
+            if self.prefilter_enabled and not self.prefilter.should_escalate(text):
+                self.prefiltered += 1
+                return None
             return await self._ai_analysis(text, consultation_id)
         else:
             return await self._fallback_analysis(text, consultation_id)
@@ -112,57 +192,24 @@ class AlertEngine:
         """Use Google Gemini AI to analyze symptoms."""
         
         try:
-            # Create a detailed prompt for Gemini
-            prompt = f"""You are a medical triage AI assistant. Analyze the following patient symptom description and provide a JSON response.
-
-Patient says: "{text}"
-
-IMPORTANT MEDICAL TRIAGE GUIDELINES:
-- ANY injury (fracture, broken bone, severe cut, head injury) = severity 4-5
-- ANY severe pain (unbearable, worst ever, 8+/10) = severity 4-5
-- Life-threatening (chest pain, can't breathe, stroke, severe bleeding) = severity 5
-- Urgent care needed (fractures, deep cuts, high fever, severe pain) = severity 4
-- Concerning symptoms (persistent pain, infection signs, moderate injury) = severity 3
-- Mild symptoms (minor aches, cold, mild discomfort) = severity 1-2
+            # Repeated or near-identical utterances reuse the earlier result
+            ai_result = self.result_cache.get(text)
+            if ai_result is None:
+                # Create a detailed prompt for Gemini
+                prompt = TRIAGE_PROMPT.format(text=text)
 
-Respond with ONLY a valid JSON object (no markdown, no extra text):
-{{
-    "is_critical": boolean (true if severity >= 3, requires medical attention),
-    "symptom_type": string (category: "injury", "chest_pain", "breathing_difficulty", "neurological", "mental_health", "pain", "infection", "bleeding", "other"),
-    "severity_score": integer (1-5 scale:
-        5 = Life-threatening emergency (call 911 immediately)
-        4 = Urgent care needed (ER or urgent care within hours)
-        3 = Medical attention needed (see doctor within 24-48 hours)
-        2 = Mild concern (monitor, see doctor if worsens)
-        1 = Minor issue (self-care, monitor)
-    ),
-    "analysis": string (brief medical analysis explaining the concern),
-    "recommendations": string (specific action: "Call 911 immediately", "Go to ER now", "Visit urgent care today", "Schedule doctor appointment", "Monitor symptoms"),
-    "emergency_keywords": array of strings (key symptoms found)
-}}
-
-EXAMPLES:
-- "bone fracture" → severity 4 (urgent care needed)
-- "broken arm" → severity 4 (urgent care needed)
-- "severe headache" → severity 4 (urgent evaluation)
-- "chest pain" → severity 5 (call 911)
-- "can't breathe" → severity 5 (call 911)
-- "mild headache" → severity 2 (monitor)
-
-Respond with ONLY the JSON object, nothing else."""
-
-            # Call Gemini AI
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean up response (remove markdown if present)
-            if response_text.startswith("```json"):
-                response_text = response_text.replace("```json", "").replace("```", "").strip()
-            elif response_text.startswith("```"):
-                response_text = response_text.replace("```", "").strip()
-            
-            # Parse AI response
-            ai_result = json.loads(response_text)
+                # Call Gemini AI (rate-limited and retried by the shared gateway)
+                self.ai_calls += 1
+                response = await get_llm_gateway().generate(self.model, prompt, caller="alert_engine")
+                response_text = response.text
+                
+                # Parse AI response (JSON mode; tolerant of fences and truncation)
+                try:
+                    ai_result = parse_llm_json(response_text, TriageResult, allow_repair=False)
+                    self.result_cache.set(text, ai_result)
+                except LLMOutputError:
+                    # Usable only after repair: act on it this once, but don't cache it
+                    ai_result = parse_llm_json(response_text, TriageResult)
             
             # Check if critical
             if not ai_result.get("is_critical", False):
@@ -176,15 +223,10 @@ Respond with ONLY the JSON object, nothing else."""
             
             # Check deduplication cache
             symptom_type = ai_result.get("symptom_type", "unknown")
-            cache_key = (consultation_id, symptom_type)
             current_time = datetime.now()
             
-            if cache_key in self.alert_cache:
-                last_alert_time = self.alert_cache[cache_key]
-                if current_time - last_alert_time < timedelta(minutes=5):
-                    return None
-            
-            self.alert_cache[cache_key] = current_time
+            if self._recently_alerted(consultation_id, symptom_type, current_time):
+                return None
             
             # Create alert with AI insights
             return Alert(
@@ -196,7 +238,7 @@ Respond with ONLY the JSON object, nothing else."""
                 recommendations=ai_result.get("recommendations", "")
             )
             
-        except json.JSONDecodeError as e:
+        except LLMOutputError as e:
             print(f"JSON parsing error: {e}")
             print(f"Response was: {response_text}")
             # Fall back to pattern matching
@@ -211,59 +253,82 @@ Respond with ONLY the JSON object, nothing else."""
         
         text_lower = text.lower()
         
-        # Check for critical keywords
-        for keyword in self.critical_keywords:
-            if keyword in text_lower:
-                # Determine severity based on keyword
-                severity = 4  # Default to urgent
-                
-                if any(word in text_lower for word in ["severe", "extreme", "unbearable", "worst"]):
-                    severity = 5
-                elif any(word in text_lower for word in ["mild", "slight", "minor"]):
-                    severity = 3
-                
-                # Determine symptom type
-                symptom_type = "unknown"
-                if "chest" in text_lower or "heart" in text_lower:
-                    symptom_type = "chest_pain"
-                elif "breath" in text_lower:
-                    symptom_type = "breathing_difficulty"
-                elif "head" in text_lower:
-                    symptom_type = "neurological"
-                elif "suicid" in text_lower or "kill" in text_lower:
-                    symptom_type = "mental_health"
-                elif "bleed" in text_lower:
-                    symptom_type = "bleeding"
-                else:
-                    symptom_type = "critical_symptom"
-                
-                # Check deduplication
-                cache_key = (consultation_id, symptom_type)
-                current_time = datetime.now()
-                
-                if cache_key in self.alert_cache:
-                    last_alert_time = self.alert_cache[cache_key]
-                    if current_time - last_alert_time < timedelta(minutes=5):
-                        return None
-                
-                self.alert_cache[cache_key] = current_time
-                
-                return Alert(
-                    symptom_text=text[:200],
-                    symptom_type=symptom_type,
-                    severity_score=severity,
-                    timestamp=current_time,
-                    ai_analysis="Pattern-based detection (AI unavailable)",
-                    recommendations="Please consult a healthcare provider for proper evaluation."
-                )
+        # Check for critical keywords (one pass over all terms)
+        if not self.prefilter.score(text).critical:
+            return None
+        
+        # Determine severity based on keyword
+        severity = 4  # Default to urgent
+        
+        if any(word in text_lower for word in ["severe", "extreme", "unbearable", "worst"]):
+            severity = 5
+        elif any(word in text_lower for word in ["mild", "slight", "minor"]):
+            severity = 3
+        
+        # Determine symptom type (Hindi terms are matched in romanized form)
+        romanized = normalize_utterance(text, transliterate=True)
+        symptom_type = "unknown"
+        if "chest" in text_lower or "heart" in text_lower or re.search(r"\b(sine|chati|dil)\b", romanized):
+            symptom_type = "chest_pain"
+        elif re.search(r"suicid|kill|end my life|end it all|\bdie\b|dying|dead|(hurt|harm|cutting) myself", text_lower) or re.search(
+                r"\b(jan dena|mar jana|marne ka|marna chah|jina nahi|atmahatya|khudkushi|khud ko)", romanized):
+            symptom_type = "mental_health"
+        elif re.search(r"breath|chok|gasp|(can'?t|cannot) swallow|throat|blue", text_lower) or re.search(
+                r"\b(sans|dum ghut|gala ghut|gale me atak|honth? nile)", romanized):
+            symptom_type = "breathing_difficulty"
+        elif re.search(r"head|droop|slur|speak|talk|feel my|lift my|one side", text_lower) or re.search(
+                r"\b(lakva|mirgi|daura pad|chehra latak|juban|bol nahi)", romanized):
+            symptom_type = "neurological"
+        elif re.search(r"overdos|pills|tablets|poison|bleach|pesticide|kerosene|acid", text_lower) or re.search(
+                r"\b(jeher|jehar|goliyan|kitnashak|chuhe mar)", romanized):
+            symptom_type = "poisoning"
+        elif "bleed" in text_lower or re.search(r"\bkhun (beh|bah|a raha)", romanized):
+            symptom_type = "bleeding"
+        else:
+            symptom_type = "critical_symptom"
         
-        return None
+        # Check deduplication
+        current_time = datetime.now()
+        
+        if self._recently_alerted(consultation_id, symptom_type, current_time):
+            return None
+        
+        return Alert(
+            symptom_text=text[:200],
+            symptom_type=symptom_type,
+            severity_score=severity,
+            timestamp=current_time,
+            ai_analysis="Pattern-based detection (AI unavailable)",
+            recommendations="Please consult a healthcare provider for proper evaluation."
+        )
+    
+    def _recently_alerted(self, consultation_id: str, symptom_type: str, current_time: datetime) -> bool:
+        """
+        Whether this symptom was already alerted for the consultation within
+        the dedup window; otherwise record the alert time.
+        """
+        return self.alert_cache.seen_recently(consultation_id, symptom_type, current_time)
+    
+    def cache_stats(self) -> dict:
+        """Utterance result cache counters, model calls made, utterances pre-filtered and dedup state."""
+        return {
+            **self.result_cache.stats(),
+            "ai_calls": self.ai_calls,
+            "prefiltered": self.prefiltered,
+            "dedup": self.alert_cache.stats(),
+        }
     
     def clear_consultation_cache(self, consultation_id: str):
         """Clear alert cache for a specific consultation."""
-        keys_to_remove = [
-            key for key in self.alert_cache.keys()
-            if key[0] == consultation_id
-        ]
-        for key in keys_to_remove:
-            del self.alert_cache[key]
+        self.alert_cache.clear_consultation(consultation_id)
+
+
+_alert_engine: Optional[AlertEngine] = None
+
+
+def get_alert_engine() -> AlertEngine:
+    """Shared engine, so every caller sees the same dedup window and result cache."""
+    global _alert_engine
+    if _alert_engine is None:
+        _alert_engine = AlertEngine()
+    return _alert_engine
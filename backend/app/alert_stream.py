@@ -0,0 +1,202 @@
+"""
+Streaming Alert Analysis
+
+Alert analysis used to be reachable only through ``POST /analyze``, so the
+frontend had to send every caption back over HTTP, one fragment at a time.
+Speech-to-text yields a sentence in several fragments ("mujhe", "seene
+mein", "dard ho raha hai"), and each fragment was analyzed on its own: more
+model calls, and a symptom split across fragments could be missed.
+
+``AlertStreamWorker`` takes patient captions straight from the caption
+pipeline and analyzes them in-process:
+
+- Fragments are collected per consultation into a window that closes when
+  the patient pauses for ``ALERT_STREAM_DEBOUNCE`` seconds, when it is
+  ``ALERT_STREAM_MAX_WAIT`` seconds old or when it holds
+  ``ALERT_STREAM_WINDOW`` fragments, so a continuous talker is still
+  analyzed promptly
+- Each closed window is analyzed once, as one utterance, by a single
+  background task; the caption loop never waits for the model
+- Alerts are handed to ``on_alert`` (the caption manager pushes them over
+  the caption WebSocket) with their latency from the window's last
+  fragment: the debounce plus queueing plus the model call
+
+Usage:
+    worker = AlertStreamWorker(get_alert_engine(), on_alert=send_alert)
+    worker.submit(consultation_id, caption_text)
+    await worker.close()
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .alert_engine import Alert, AlertEngine
+
+logger = logging.getLogger(__name__)
+
+ALERT_STREAM_DEBOUNCE_SECONDS = float(os.getenv("ALERT_STREAM_DEBOUNCE", "1.2"))
+ALERT_STREAM_MAX_WAIT_SECONDS = float(os.getenv("ALERT_STREAM_MAX_WAIT", "4.0"))
+ALERT_STREAM_WINDOW = int(os.getenv("ALERT_STREAM_WINDOW", "8"))
+# Windows waiting for analysis before new ones are dropped
+ALERT_STREAM_QUEUE_SIZE = int(os.getenv("ALERT_STREAM_QUEUE_SIZE", "256"))
+
+# Latencies kept for the percentile in stats()
+_LATENCY_SAMPLES = 1000
+
+AlertCallback = Callable[[str, Alert, float], Awaitable[None]]
+
+
+class _Window:
+    """Fragments of one consultation not yet analyzed."""
+
+    __slots__ = ("fragments", "opened_at", "last_at", "timer")
+
+    def __init__(self, opened_at: float):
+        self.fragments: List[str] = []
+        self.opened_at = opened_at
+        self.last_at = opened_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class AlertStreamWorker:
+    """Debounces patient captions per consultation and analyzes them in the background."""
+
+    def __init__(
+        self,
+        engine: AlertEngine,
+        on_alert: Optional[AlertCallback] = None,
+        debounce: float = ALERT_STREAM_DEBOUNCE_SECONDS,
+        max_wait: float = ALERT_STREAM_MAX_WAIT_SECONDS,
+        window: int = ALERT_STREAM_WINDOW,
+        queue_size: int = ALERT_STREAM_QUEUE_SIZE
+    ):
+        """
+        Args:
+            engine: Alert engine the windows are analyzed with
+            on_alert: Awaited with (consultation_id, alert, latency seconds)
+            debounce: Pause that closes a window
+            max_wait: Age at which a window is closed regardless of pauses
+            window: Fragments at which a window is closed
+            queue_size: Closed windows waiting for analysis
+        """
+        self.engine = engine
+        self.on_alert = on_alert
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.window = window
+        self.queue_size = queue_size
+        self._windows: Dict[str, _Window] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._latencies: deque = deque(maxlen=_LATENCY_SAMPLES)
+
+        self.fragments = 0
+        self.windows = 0
+        self._windowed_fragments = 0
+        self.analyses = 0
+        self.alerts = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, consultation_id: str, text: str) -> None:
+        """Add one patient caption fragment (must be called from the event loop)."""
+        text = (text or "").strip()
+        if not text:
+            return
+        self.fragments += 1
+        now = time.monotonic()
+        window = self._windows.get(consultation_id)
+        if window is None:
+            window = self._windows[consultation_id] = _Window(now)
+        window.fragments.append(text)
+        window.last_at = now
+
+        remaining = self.max_wait - (now - window.opened_at)
+        if len(window.fragments) >= self.window or remaining <= 0:
+            self._close_window(consultation_id)
+            return
+        if window.timer is not None:
+            window.timer.cancel()
+        window.timer = asyncio.get_running_loop().call_later(
+            min(self.debounce, remaining), self._close_window, consultation_id
+        )
+
+    def _close_window(self, consultation_id: str) -> None:
+        window = self._windows.pop(consultation_id, None)
+        if window is None:
+            return
+        if window.timer is not None:
+            window.timer.cancel()
+        self.windows += 1
+        self._windowed_fragments += len(window.fragments)
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait((consultation_id, " ".join(window.fragments), window.last_at))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Alert analysis queue full; dropping window for {consultation_id}")
+
+    async def _run(self) -> None:
+        while True:
+            consultation_id, text, last_at = await self._queue.get()
+            try:
+                await self._analyze(consultation_id, text, last_at)
+            finally:
+                self._queue.task_done()
+
+    async def _analyze(self, consultation_id: str, text: str, last_at: float) -> None:
+        self.analyses += 1
+        try:
+            alert = await self.engine.analyze_transcript(text, consultation_id, "patient")
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Alert analysis failed for {consultation_id}: {e}")
+            return
+        if alert is None:
+            return
+        latency = time.monotonic() - last_at
+        self.alerts += 1
+        self._latencies.append(latency)
+        if self.on_alert is not None:
+            try:
+                await self.on_alert(consultation_id, alert, latency)
+            except Exception as e:
+                logger.error(f"Error delivering alert for {consultation_id}: {e}")
+
+    async def drain(self) -> None:
+        """Close every open window and wait until all of them are analyzed."""
+        for consultation_id in list(self._windows):
+            self._close_window(consultation_id)
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """Analyze what is pending, then stop the background task (application shutdown)."""
+        await self.drain()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Stream counters and alert latency from a window's last fragment."""
+        latencies = sorted(self._latencies)
+        return {
+            "fragments": self.fragments,
+            "windows": self.windows,
+            # Fragments that shared a window instead of being analyzed one by one
+            "analyses_saved": self._windowed_fragments - self.windows,
+            "analyses": self.analyses,
+            "alerts": self.alerts,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "open_windows": len(self._windows),
+            "latency_mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else 0.0,
+        }
@@ -140,6 +140,53 @@ class AvailabilityCheckResponse(BaseModel):
     message: Optional[str] = None
 
 
+class DaySlots(BaseModel):
+    """Free slots on one day"""
+    date: DateType
+    available: List[str] = Field(default_factory=list, description="Free times in HH:MM format")
+
+
+class DoctorSlotsResponse(BaseModel):
+    """Model for a doctor's free slots over a date range"""
+    doctor_id: str
+    start_date: DateType
+    end_date: DateType
+    days: List[DaySlots]
+
+
+class AvailabilitySearchRequest(BaseModel):
+    """Model for searching free slots across doctors and dates"""
+    doctor_ids: List[str] = Field(..., min_length=1, max_length=1000, description="Doctor user IDs")
+    start_date: DateType = Field(..., description="First day (inclusive)")
+    end_date: DateType = Field(..., description="Last day (inclusive)")
+    time_from: Optional[str] = Field(None, description="Only slots at or after this HH:MM")
+    time_to: Optional[str] = Field(None, description="Only slots before this HH:MM")
+
+    @validator('time_from', 'time_to')
+    def validate_time_format(cls, v):
+        """Validate time is in HH:MM format"""
+        if v is not None:
+            try:
+                DateTimeType.strptime(v, '%H:%M')
+                return v
+            except ValueError:
+                raise ValueError('Time must be in HH:MM format')
+        return v
+
+
+class DoctorFreeSlots(BaseModel):
+    """Free slots for one doctor, by day"""
+    doctor_id: str
+    days: List[DaySlots]
+
+
+class AvailabilitySearchResponse(BaseModel):
+    """Model for availability search response"""
+    start_date: DateType
+    end_date: DateType
+    doctors: List[DoctorFreeSlots]
+
+
 class ConsultationStart(BaseModel):
     """Model for starting a consultation"""
     appointment_id: str = Field(..., description="Appointment ID")
@@ -187,6 +234,7 @@ class ConsultationResponse(BaseModel):
 class AppointmentListResponse(BaseModel):
     """Model for list of appointments"""
     appointments: List[AppointmentResponse]
-    total: int
+    total: Optional[int] = Field(None, description="Matching appointments (not counted when paging by cursor)")
     page: int
     page_size: int
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
@@ -6,7 +6,6 @@ import os
 from datetime import datetime, date as DateType, time as TimeType, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Query, Depends
-from supabase import create_client, Client
 import logging
 
 from app.appointment_models import (
@@ -22,56 +21,64 @@ from app.appointment_models import (
     ConsultationEnd,
     ConsultationResponse,
     AppointmentStatus,
-    TimeSlot
+    TimeSlot,
+    DaySlots,
+    DoctorSlotsResponse,
+    AvailabilitySearchRequest,
+    AvailabilitySearchResponse,
+    DoctorFreeSlots
 )
-from app.summarizer import generate_notes_with_empathy
+from app.soap_cache import cached_soap_notes, save_soap_notes
+from app.soap_drafter import get_soap_drafter
 from app.models import SoapGenerationResponse
+from app.data_access import get_data_access, SupabaseDataAccess
+from app.cache import cache_stats
+from app.availability_index import get_availability_index
+from app.slot_booking import SlotBookingEngine, SlotUnavailableError, normalize_time
+from app.streaming import ndjson_response
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["appointments"])
 
-# Initialize Supabase client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
+if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_SERVICE_KEY"):
     logger.warning("Supabase credentials not found. Appointment features will not work.")
-    supabase: Optional[Client] = None
-else:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
-def get_supabase() -> Client:
-    """Dependency to get Supabase client"""
-    if supabase is None:
+def get_supabase() -> SupabaseDataAccess:
+    """Dependency to get the shared Supabase data access layer"""
+    try:
+        return get_data_access()
+    except ValueError:
         raise HTTPException(status_code=500, detail="Database not configured")
-    return supabase
 
 
 @router.post("/appointments", response_model=AppointmentResponse)
 async def create_appointment(
     appointment: AppointmentCreate,
-    db: Client = Depends(get_supabase)
+    db: SupabaseDataAccess = Depends(get_supabase)
 ):
     """
     Create a new appointment
     
     Validates:
     - Doctor availability for the selected time slot
-    - No conflicting appointments
+    - No conflicting appointments (atomic, returns 409 if the slot is taken)
     - Date is not in the past
     """
     logger.info(f"Creating appointment: {appointment.dict()}")
     
     try:
-        # Skip availability check for now - table structure needs to be fixed
-        logger.info("Skipping availability check - proceeding with booking")
+        engine = SlotBookingEngine(db)
+        
+        # The doctor's published schedule must offer this slot (cached per day)
+        offered, reason = await engine.is_offered(appointment.doctor_id, appointment.date, appointment.time)
+        if not offered:
+            raise HTTPException(status_code=409, detail=reason)
         
         # Fetch patient details from auth.users to get name and email
         try:
-            patient_result = db.auth.admin.get_user_by_id(appointment.patient_id)
-            patient_user = patient_result.user if patient_result else None
+            patient_user = await db.get_auth_user(appointment.patient_id)
             
             if patient_user:
                 # Try to get full_name from metadata, fall back to email username
@@ -90,41 +97,27 @@ async def create_appointment(
             patient_name = 'Patient'
             patient_email = ''
         
-        # Create appointment
-        # Combine date and time into date timestamp
-        from datetime import datetime
-        appointment_datetime = datetime.combine(appointment.date, datetime.strptime(appointment.time, "%H:%M").time())
-        
-        appointment_data = {
-            "patient_id": appointment.patient_id,
-            "patient_name": patient_name,
-            "patient_email": patient_email,
-            "doctor_id": appointment.doctor_id,
-            "date": appointment_datetime.isoformat(),
-            "time": appointment.time,
-            "consultation_fee": appointment.consultation_fee,
-            "status": AppointmentStatus.SCHEDULED.value,
-            "notes": f"Symptom: {appointment.symptom_category}, Severity: {appointment.severity}" if appointment.symptom_category else None
-        }
-        
-        result = db.table("appointments").insert(appointment_data).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Failed to create appointment")
-        
-        created_appointment = result.data[0]
-        
-        # Skip marking slot as booked - doctor_availability table doesn't exist
-        logger.info("Skipping slot booking - doctor_availability table not implemented")
-        
-        # Fetch doctor details from doctors table
-        doctor_result = db.table("doctors").select("*").eq("id", appointment.doctor_id).execute()
-        doctor = doctor_result.data[0] if doctor_result.data else {}
-        
-        # Add doctor details to response
-        created_appointment["doctor_name"] = doctor.get("full_name")
-        created_appointment["doctor_specialty"] = doctor.get("specialty")
-        created_appointment["doctor_image"] = doctor.get("avatar_url")
+        # Claim the slot and create the appointment in one transaction
+        try:
+            created_appointment = await engine.book({
+                "patient_id": appointment.patient_id,
+                "patient_name": patient_name,
+                "patient_email": patient_email,
+                "doctor_id": appointment.doctor_id,
+                "date": appointment.date,
+                "time": appointment.time,
+                "consultation_fee": appointment.consultation_fee,
+                "symptom_category": appointment.symptom_category,
+                "severity": appointment.severity,
+                "notes": f"Symptom: {appointment.symptom_category}, Severity: {appointment.severity}" if appointment.symptom_category else None
+            })
+        except SlotUnavailableError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        created_appointment["time"] = normalize_time(created_appointment["time"])
+        
+        # Add doctor details to response (cached profile lookup)
+        await attach_doctor_details([created_appointment], db)
         
         return AppointmentResponse(**created_appointment)
         
@@ -135,13 +128,53 @@ async def create_appointment(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/appointments/availability/search", response_model=AvailabilitySearchResponse)
+async def search_availability(
+    search: AvailabilitySearchRequest,
+    db: SupabaseDataAccess = Depends(get_supabase)
+):
+    """
+    Free slots for many doctors across a date range in one call
+    
+    Served from per-doctor, per-day slot bitmaps that are cached and
+    invalidated on booking and schedule changes. Days without a free slot
+    are omitted.
+    """
+    try:
+        free = await get_availability_index(db).search(
+            search.doctor_ids,
+            search.start_date,
+            search.end_date,
+            search.time_from,
+            search.time_to
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching availability: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return AvailabilitySearchResponse(
+        start_date=search.start_date,
+        end_date=search.end_date,
+        doctors=[
+            DoctorFreeSlots(
+                doctor_id=doctor_id,
+                days=[DaySlots(date=day, available=slots) for day, slots in sorted(days.items())]
+            )
+            for doctor_id, days in free.items()
+        ]
+    )
+
+
 @router.get("/appointments/patient/{patient_id}", response_model=AppointmentListResponse)
 async def get_patient_appointments(
     patient_id: str,
     status: Optional[str] = Query(None, description="Filter by status"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    db: Client = Depends(get_supabase)
+    cursor: Optional[str] = None,
+    db: SupabaseDataAccess = Depends(get_supabase)
 ):
     """
     Get all appointments for a patient
@@ -150,75 +183,65 @@ async def get_patient_appointments(
     - status: Filter by appointment status
     - page: Page number for pagination
     - page_size: Number of results per page
+    - cursor: Continue after the previous page (keyset pagination; page is
+      ignored and the total is not counted)
     """
     try:
-        # Build query
-        query = db.table("appointments").select("*").eq("patient_id", patient_id)
-        
-        if status:
-            query = query.eq("status", status)
-        
-        # Order by date and time
-        query = query.order("date", desc=False).order("time", desc=False)
-        
-        # Get total count
-        count_result = db.table("appointments").select("id", count="exact").eq("patient_id", patient_id)
-        if status:
-            count_result = count_result.eq("status", status)
-        count_data = count_result.execute()
-        total = count_data.count if count_data.count else 0
-        
-        # Apply pagination
-        offset = (page - 1) * page_size
-        query = query.range(offset, offset + page_size - 1)
-        
-        result = query.execute()
-        
-        appointments = []
-        for apt in result.data:
-            # Fetch doctor details from doctors table
-            doctor_result = db.table("doctors").select("*").eq("id", apt["doctor_id"]).execute()
-            doctor = doctor_result.data[0] if doctor_result.data else {}
-            
-            apt["doctor_name"] = doctor.get("full_name")
-            apt["doctor_specialty"] = doctor.get("specialty")
-            apt["doctor_image"] = doctor.get("avatar_url")
-            
-            appointments.append(AppointmentResponse(**apt))
+        if cursor:
+            # Seek past the last row served; cost does not grow with depth
+            rows, next_cursor = await db.appointments.keyset_for_patient(patient_id, status, cursor, page_size)
+            total = None
+        else:
+            # One request returns the page and the total count
+            offset = (page - 1) * page_size
+            rows, total = await db.appointments.page_for_patient(patient_id, status, offset, page_size)
+            next_cursor = db.appointments.cursor_for(rows[-1]) if rows and offset + len(rows) < total else None
+        
+        # One batched (and usually cached) lookup for every doctor on the page
+        await attach_doctor_details(rows, db)
+        appointments = [AppointmentResponse(**apt) for apt in rows]
         
         return AppointmentListResponse(
             appointments=appointments,
             total=total,
             page=page,
-            page_size=page_size
+            page_size=page_size,
+            next_cursor=next_cursor
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching appointments: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/appointments/patient/{patient_id}/export")
+async def export_patient_appointments(
+    patient_id: str,
+    db: SupabaseDataAccess = Depends(get_supabase)
+):
+    """Stream every appointment of a patient as NDJSON"""
+    return ndjson_response(
+        db.appointments.iter_for_patient(patient_id),
+        f"appointments-{patient_id}.ndjson"
+    )
+
+
 @router.get("/appointments/{appointment_id}", response_model=AppointmentResponse)
 async def get_appointment(
     appointment_id: str,
-    db: Client = Depends(get_supabase)
+    db: SupabaseDataAccess = Depends(get_supabase)
 ):
     """Get a specific appointment by ID"""
     try:
-        result = db.table("appointments").select("*").eq("id", appointment_id).execute()
+        appointment = await db.appointments.get(appointment_id)
         
-        if not result.data:
+        if not appointment:
             raise HTTPException(status_code=404, detail="Appointment not found")
         
-        appointment = result.data[0]
-        
-        # Fetch doctor details from doctors table
-        doctor_result = db.table("doctors").select("*").eq("id", appointment["doctor_id"]).execute()
-        doctor = doctor_result.data[0] if doctor_result.data else {}
-        
-        appointment["doctor_name"] = doctor.get("full_name")
-        appointment["doctor_specialty"] = doctor.get("specialty")
-        appointment["doctor_image"] = doctor.get("avatar_url")
+        # Add doctor details (cached profile lookup)
+        await attach_doctor_details([appointment], db)
         
         return AppointmentResponse(**appointment)
         
@@ -233,14 +256,14 @@ async def get_appointment(
 async def update_appointment(
     appointment_id: str,
     update_data: AppointmentUpdate,
-    db: Client = Depends(get_supabase)
+    db: SupabaseDataAccess = Depends(get_supabase)
 ):
     """Update an appointment"""
     try:
         # Get existing appointment
-        existing = db.table("appointments").select("*").eq("id", appointment_id).execute()
+        existing = await db.appointments.get(appointment_id)
         
-        if not existing.data:
+        if not existing:
             raise HTTPException(status_code=404, detail="Appointment not found")
         
         # Prepare update data
@@ -250,25 +273,43 @@ async def update_appointment(
         if "status" in update_dict:
             update_dict["status"] = update_dict["status"].value
         
+        engine = SlotBookingEngine(db)
+        old_day = DateType.fromisoformat(str(existing["date"])[:10])
+        old_time = normalize_time(existing["time"])
+        new_day = update_dict.get("date", old_day)
+        new_time = update_dict.get("time", old_time)
+        
+        # Rescheduling claims the new slot first, so a taken or unpublished slot fails with 409
+        moving = (new_day, new_time) != (old_day, old_time)
+        if moving:
+            try:
+                await engine.claim(appointment_id, existing["doctor_id"], new_day, new_time)
+            except SlotUnavailableError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+        
         # Convert date to ISO format
         if "date" in update_dict:
             update_dict["date"] = update_dict["date"].isoformat()
         
-        # Update appointment
-        result = db.table("appointments").update(update_dict).eq("id", appointment_id).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Failed to update appointment")
+        # Update appointment; if that fails the new claim is undone and the old slot kept
+        try:
+            updated_appointment = await db.appointments.update(appointment_id, update_dict)
+            if not updated_appointment:
+                raise HTTPException(status_code=500, detail="Failed to update appointment")
+        except Exception:
+            if moving:
+                await engine.release_slot(existing["doctor_id"], new_day, new_time)
+            raise
         
-        updated_appointment = result.data[0]
+        if moving:
+            await engine.release_slot(existing["doctor_id"], old_day, old_time)
         
-        # Fetch doctor details from doctors table
-        doctor_result = db.table("doctors").select("*").eq("id", updated_appointment["doctor_id"]).execute()
-        doctor = doctor_result.data[0] if doctor_result.data else {}
+        # Cancelling through an update frees the slot as well
+        if update_dict.get("status") == AppointmentStatus.CANCELLED.value:
+            await engine.release(appointment_id)
         
-        updated_appointment["doctor_name"] = doctor.get("full_name")
-        updated_appointment["doctor_specialty"] = doctor.get("specialty")
-        updated_appointment["doctor_image"] = doctor.get("avatar_url")
+        # Add doctor details (cached profile lookup)
+        await attach_doctor_details([updated_appointment], db)
         
         return AppointmentResponse(**updated_appointment)
         
@@ -282,41 +323,34 @@ async def update_appointment(
 @router.delete("/appointments/{appointment_id}")
 async def cancel_appointment(
     appointment_id: str,
-    db: Client = Depends(get_supabase)
+    db: SupabaseDataAccess = Depends(get_supabase)
 ):
     """Cancel an appointment"""
     try:
         # Get appointment details
-        appointment = db.table("appointments").select("*").eq("id", appointment_id).execute()
+        apt_data = await db.appointments.get(appointment_id)
         
-        if not appointment.data:
+        if not apt_data:
             raise HTTPException(status_code=404, detail="Appointment not found")
         
-        apt_data = appointment.data[0]
-        
         # Check if cancellation is late (< 2 hours before)
         apt_datetime = datetime.combine(
             datetime.fromisoformat(apt_data["date"]).date(),
-            datetime.strptime(apt_data["time"], "%H:%M").time()
+            datetime.strptime(normalize_time(apt_data["time"]), "%H:%M").time()
         )
         time_until = apt_datetime - datetime.now()
         is_late_cancellation = time_until < timedelta(hours=2)
         
         # Update status to cancelled
-        result = db.table("appointments").update({
+        cancelled = await db.appointments.update(appointment_id, {
             "status": AppointmentStatus.CANCELLED.value
-        }).eq("id", appointment_id).execute()
+        })
         
-        if not result.data:
+        if not cancelled:
             raise HTTPException(status_code=500, detail="Failed to cancel appointment")
         
         # Free up the time slot
-        await mark_slot_as_available(
-            apt_data["doctor_id"],
-            datetime.fromisoformat(apt_data["date"]).date(),
-            apt_data["time"],
-            db
-        )
+        await SlotBookingEngine(db).release(appointment_id)
         
         return {
             "message": "Appointment cancelled successfully",
@@ -330,65 +364,65 @@ async def cancel_appointment(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/doctors/{doctor_id}/slots", response_model=DoctorSlotsResponse)
+async def get_doctor_slots(
+    doctor_id: str,
+    start_date: DateType = Query(..., description="First day (inclusive)"),
+    end_date: DateType = Query(..., description="Last day (inclusive)"),
+    db: SupabaseDataAccess = Depends(get_supabase)
+):
+    """
+    Free slots for a doctor over a date range
+    
+    Served from the same cached slot bitmaps as the availability search
+    (one schedule query and one range scan of booked slots on a miss).
+    Days without a free slot are omitted.
+    """
+    try:
+        free = await get_availability_index(db).search([doctor_id], start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching doctor slots: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return DoctorSlotsResponse(
+        doctor_id=doctor_id,
+        start_date=start_date,
+        end_date=end_date,
+        days=[DaySlots(date=day, available=slots) for day, slots in sorted(free[doctor_id].items())]
+    )
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit-rate metrics for the in-process doctor profile and availability caches"""
+    return cache_stats()
+
+
 # Helper functions
 
+async def attach_doctor_details(appointments: List[dict], db: SupabaseDataAccess):
+    """Add doctor name, specialty and image to appointment rows in place"""
+    doctors = await db.doctors.get_profiles(apt["doctor_id"] for apt in appointments)
+    
+    for apt in appointments:
+        doctor = doctors.get(apt["doctor_id"], {})
+        apt["doctor_name"] = doctor.get("full_name")
+        apt["doctor_specialty"] = doctor.get("specialty")
+        apt["doctor_image"] = doctor.get("avatar_url")
+
+
 async def check_slot_availability(
     request: AvailabilityCheckRequest,
-    db: Client
+    db: SupabaseDataAccess
 ) -> AvailabilityCheckResponse:
     """Check if a specific time slot is available"""
     try:
-        # Check for existing appointments at this time
-        # Combine date and time to match appointment_date
-        from datetime import datetime
-        appointment_datetime = datetime.combine(request.date, datetime.strptime(request.time, "%H:%M").time())
-        
-        # Query appointments on the same date for this doctor
-        existing = db.table("appointments").select("id, appointment_date").eq(
-            "doctor_id", request.doctor_id
-        ).gte("appointment_date", request.date.isoformat()).lte(
-            "appointment_date", f"{request.date.isoformat()}T23:59:59"
-        ).in_(
-            "status", [AppointmentStatus.SCHEDULED.value, AppointmentStatus.IN_PROGRESS.value]
-        ).execute()
-        
-        # Check if any appointment matches the exact time
-        if existing.data:
-            for appt in existing.data:
-                appt_time = datetime.fromisoformat(appt['appointment_date'].replace('Z', '+00:00'))
-                if appt_time.strftime("%H:%M") == request.time:
-                    return AvailabilityCheckResponse(
-                        available=False,
-                        message="This time slot is already booked"
-                    )
-        
-        # Check doctor availability
-        availability = db.table("doctor_availability").select("time_slots").eq(
-            "doctor_id", request.doctor_id
-        ).eq("date", request.date.isoformat()).execute()
-        
-        if not availability.data:
-            # No availability set, assume available
-            return AvailabilityCheckResponse(available=True)
-        
-        time_slots = availability.data[0]["time_slots"]
-        
-        # Check if the specific time slot is marked as available
-        for slot in time_slots:
-            if slot["time"] == request.time:
-                if slot["is_available"]:
-                    return AvailabilityCheckResponse(available=True)
-                else:
-                    return AvailabilityCheckResponse(
-                        available=False,
-                        message="Doctor is not available at this time"
-                    )
-        
-        # Time slot not found in availability, assume unavailable
-        return AvailabilityCheckResponse(
-            available=False,
-            message="Doctor has not set availability for this time"
+        available, message = await SlotBookingEngine(db).check(
+            request.doctor_id, request.date, request.time
         )
+        return AvailabilityCheckResponse(available=available, message=message)
         
     except Exception as e:
         logger.error(f"Error checking availability: {e}")
@@ -398,73 +432,10 @@ async def check_slot_availability(
         )
 
 
-async def mark_slot_as_booked(
-    doctor_id: str,
-    date: DateType,
-    time_str: str,
-    appointment_id: str,
-    db: Client
-):
-    """Mark a time slot as booked"""
-    try:
-        # Get existing availability
-        result = db.table("doctor_availability").select("*").eq(
-            "doctor_id", doctor_id
-        ).eq("date", date.isoformat()).execute()
-        
-        if result.data:
-            # Update existing availability
-            time_slots = result.data[0]["time_slots"]
-            
-            for slot in time_slots:
-                if slot["time"] == time_str:
-                    slot["is_available"] = False
-                    slot["appointment_id"] = appointment_id
-                    break
-            
-            db.table("doctor_availability").update({
-                "time_slots": time_slots
-            }).eq("id", result.data[0]["id"]).execute()
-            
-    except Exception as e:
-        logger.error(f"Error marking slot as booked: {e}")
-
-
-async def mark_slot_as_available(
-    doctor_id: str,
-    date: DateType,
-    time_str: str,
-    db: Client
-):
-    """Mark a time slot as available again"""
-    try:
-        # Get existing availability
-        result = db.table("doctor_availability").select("*").eq(
-            "doctor_id", doctor_id
-        ).eq("date", date.isoformat()).execute()
-        
-        if result.data:
-            # Update existing availability
-            time_slots = result.data[0]["time_slots"]
-            
-            for slot in time_slots:
-                if slot["time"] == time_str:
-                    slot["is_available"] = True
-                    slot["appointment_id"] = None
-                    break
-            
-            db.table("doctor_availability").update({
-                "time_slots": time_slots
-            }).eq("id", result.data[0]["id"]).execute()
-            
-    except Exception as e:
-        logger.error(f"Error marking slot as available: {e}")
-
-
 @router.post("/consultations/{consultation_id}/generate_soap", response_model=SoapGenerationResponse)
 async def generate_soap_notes(
     consultation_id: str,
-    db: Client = Depends(get_supabase)
+    db: SupabaseDataAccess = Depends(get_supabase)
 ):
     """
     Generate SOAP notes from consultation transcript
@@ -486,13 +457,11 @@ async def generate_soap_notes(
         
         # Step 1: Fetch consultation and transcript
         # Try to fetch all possible transcript field names
-        consultation_result = db.table("consultations").select("*").eq("id", consultation_id).execute()
+        consultation = await db.consultations.get(consultation_id)
         
-        if not consultation_result.data:
+        if not consultation:
             raise HTTPException(status_code=404, detail="Consultation not found")
         
-        consultation = consultation_result.data[0]
-        
         # Log available columns for debugging
         available_columns = list(consultation.keys())
         logger.info(f"Available columns in consultation: {available_columns}")
@@ -521,8 +490,13 @@ async def generate_soap_notes(
         logger.info(f"Found transcript with {len(transcript)} characters")
         
         # Step 2: Generate SOAP notes with empathy suggestions
+        # (an unchanged transcript reuses the stored note, see app.soap_cache)
         try:
-            raw_soap_note, de_stigma_suggestions = await generate_notes_with_empathy(transcript)
+            cached = cached_soap_notes(consultation, transcript)
+            # Reconciles the live draft when one exists (see app.soap_drafter)
+            raw_soap_note, de_stigma_suggestions = cached or await get_soap_drafter().generate(
+                consultation_id, transcript
+            )
             logger.info(f"Generated SOAP note with {len(de_stigma_suggestions)} suggestions")
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
@@ -536,19 +510,10 @@ async def generate_soap_notes(
         # Step 3: Save SOAP notes to database
         # Database schema uses 'soap_notes' and 'stigma_suggestions'
         # Frontend expects 'raw_soap_note' and 'de_stigma_suggestions'
-        # We'll save to both for compatibility (database columns will be added if needed)
-        update_data = {
-            "soap_notes": raw_soap_note,
-            "raw_soap_note": raw_soap_note,  # For frontend compatibility
-            "stigma_suggestions": de_stigma_suggestions,
-            "de_stigma_suggestions": de_stigma_suggestions  # For frontend compatibility
-        }
-        
-        update_result = db.table("consultations").update(update_data).eq(
-            "id", consultation_id
-        ).execute()
+        # Both are written, with the transcript hash the note is cached under
+        updated = await save_soap_notes(db, consultation_id, raw_soap_note, de_stigma_suggestions, transcript)
         
-        if not update_result.data:
+        if not updated:
             raise HTTPException(status_code=500, detail="Failed to save SOAP notes to database")
         
         logger.info(f"Successfully saved SOAP notes for consultation: {consultation_id}")
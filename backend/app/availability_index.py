@@ -0,0 +1,202 @@
+"""
+Availability Bitmap Index
+
+Answers "which slots are free for these doctors on these days" for a whole
+booking grid at once. Each (doctor, day) is reduced to one integer bitmap in
+which bit ``i`` is set when a slot starting ``i`` minutes after midnight is
+published by the doctor and not booked (one bit per minute, so a 10:10 slot
+is kept as 10:10 whatever the length of the doctor's slots):
+
+    published schedule (doctor_availability.time_slots)
+      AND NOT booked slots (appointment_slots)
+
+Bitmaps are built in bulk (a few range queries per chunk of doctors), kept in
+a shared TTL cache, and dropped whenever a booking or schedule write for that
+doctor and day goes through the data access layer. Other workers see such
+writes after at most the TTL; booking itself is atomic (see slot_booking), so
+a stale grid can only show a slot that then fails with 409.
+
+Usage:
+    index = get_availability_index(get_data_access())
+    free = await index.search(doctor_ids, start, end)
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import TTLCache, register_cache
+from .data_access import MAX_ROWS_PER_REQUEST, SupabaseDataAccess
+from .slot_booking import MAX_RANGE_DAYS
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+BITMAP_TTL_SECONDS = float(os.getenv("AVAILABILITY_BITMAP_CACHE_TTL", "60"))
+BITMAP_CACHE_SIZE = int(os.getenv("AVAILABILITY_BITMAP_CACHE_SIZE", "200000"))
+MAX_SEARCH_DOCTORS = 1000
+
+# HH:MM label of every bit position
+SLOT_LABELS = [f"{i // 60:02d}:{i % 60:02d}" for i in range(MINUTES_PER_DAY)]
+
+
+def slot_bit(time: str) -> int:
+    """Bit position of an HH:MM (or HH:MM:SS) time: its minute of the day."""
+    hours, minutes = int(time[0:2]), int(time[3:5])
+    return hours * 60 + minutes
+
+
+def window_mask(time_from: Optional[str] = None, time_to: Optional[str] = None) -> int:
+    """Bitmap of the slots starting within [time_from, time_to)."""
+    first = slot_bit(time_from) if time_from else 0
+    last = slot_bit(time_to) if time_to else MINUTES_PER_DAY
+    return ((1 << last) - 1) & ~((1 << first) - 1)
+
+
+def decode(bitmap: int) -> List[str]:
+    """HH:MM labels of the set bits, earliest first."""
+    times = []
+    while bitmap:
+        low = bitmap & -bitmap
+        times.append(SLOT_LABELS[low.bit_length() - 1])
+        bitmap ^= low
+    return times
+
+
+def _days(start: date, end: date) -> List[str]:
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+class AvailabilityIndex:
+    """Per-(doctor, day) free-slot bitmaps with bulk loading and caching."""
+
+    def __init__(self, dal: SupabaseDataAccess):
+        self.dal = dal
+        self.bitmaps = TTLCache(ttl=BITMAP_TTL_SECONDS, max_size=BITMAP_CACHE_SIZE)
+        register_cache("availability_bitmaps", self.bitmaps)
+        dal.add_slot_listener(self.invalidate)
+
+    def invalidate(self, doctor_id: str, day: str) -> None:
+        """Drop one doctor's bitmap for one day."""
+        self.bitmaps.invalidate((doctor_id, day))
+
+    async def bitmaps_for(
+        self,
+        doctor_ids: List[str],
+        start: date,
+        end: date
+    ) -> Dict[Tuple[str, str], int]:
+        """Bitmap for every (doctor, day) in the range, loading cache misses in bulk."""
+        days = _days(start, end)
+        found: Dict[Tuple[str, str], int] = {}
+        stale_doctors = []
+
+        for doctor_id in doctor_ids:
+            complete = True
+            for day in days:
+                bitmap = self.bitmaps.get((doctor_id, day))
+                if bitmap is None:
+                    complete = False
+                    break
+                found[(doctor_id, day)] = bitmap
+            if not complete:
+                stale_doctors.append(doctor_id)
+
+        if stale_doctors:
+            found.update(await self._load(stale_doctors, start, end))
+        return found
+
+    async def _load(self, doctor_ids: List[str], start: date, end: date) -> Dict[Tuple[str, str], int]:
+        """Build bitmaps from the schedules and booked slots of these doctors."""
+        days = _days(start, end)
+        # Keep each schedule query within one max-rows page (one row per doctor per day)
+        chunk_size = max(1, MAX_ROWS_PER_REQUEST // len(days))
+        chunks = [doctor_ids[i:i + chunk_size] for i in range(0, len(doctor_ids), chunk_size)]
+
+        async def load_chunk(chunk: List[str]):
+            return await asyncio.gather(
+                self.dal.doctor_availability.list_in_range(chunk, days[0], days[-1], cache=False),
+                self.dal.appointment_slots.booked_in_range(chunk, days[0], days[-1]),
+            )
+
+        results = await asyncio.gather(*(load_chunk(chunk) for chunk in chunks))
+
+        bitmaps: Dict[Tuple[str, str], int] = defaultdict(int)
+        booked: Dict[Tuple[str, str], int] = defaultdict(int)
+        for schedules, booked_rows in results:
+            for schedule in schedules:
+                key = (schedule["doctor_id"], str(schedule["date"]))
+                for slot in schedule["time_slots"]:
+                    if slot.get("is_available", True):
+                        bitmaps[key] |= 1 << slot_bit(slot["time"])
+            for row in booked_rows:
+                booked[(row["doctor_id"], str(row["date"]))] |= 1 << slot_bit(str(row["time"]))
+
+        loaded = {}
+        for doctor_id in doctor_ids:
+            for day in days:
+                key = (doctor_id, day)
+                bitmap = bitmaps.get(key, 0) & ~booked.get(key, 0)
+                self.bitmaps.set(key, bitmap)
+                loaded[key] = bitmap
+        return loaded
+
+    async def search(
+        self,
+        doctor_ids: Iterable[str],
+        start: date,
+        end: date,
+        time_from: Optional[str] = None,
+        time_to: Optional[str] = None
+    ) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Free slots for many doctors across a date range.
+
+        Args:
+            doctor_ids: Doctors to search
+            start: First day (inclusive)
+            end: Last day (inclusive)
+            time_from: Only slots starting at or after this HH:MM
+            time_to: Only slots starting before this HH:MM
+
+        Returns:
+            {doctor_id: {ISO date: [HH:MM, ...]}} with days that have no free
+            slot omitted
+
+        Raises:
+            ValueError: If the range or the number of doctors is too large
+        """
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        if end < start:
+            raise ValueError("end date must not be before start date")
+        if (end - start).days + 1 > MAX_RANGE_DAYS:
+            raise ValueError(f"date range cannot exceed {MAX_RANGE_DAYS} days")
+        if len(doctor_ids) > MAX_SEARCH_DOCTORS:
+            raise ValueError(f"cannot search more than {MAX_SEARCH_DOCTORS} doctors at once")
+
+        mask = window_mask(time_from, time_to)
+        bitmaps = await self.bitmaps_for(doctor_ids, start, end)
+
+        free: Dict[str, Dict[str, List[str]]] = {doctor_id: {} for doctor_id in doctor_ids}
+        for (doctor_id, day), bitmap in bitmaps.items():
+            bitmap &= mask
+            if bitmap:
+                free[doctor_id][day] = decode(bitmap)
+        return free
+
+
+# One index per data access layer (listeners are registered on it)
+_indexes: "weakref.WeakKeyDictionary[SupabaseDataAccess, AvailabilityIndex]" = weakref.WeakKeyDictionary()
+
+
+def get_availability_index(dal: SupabaseDataAccess) -> AvailabilityIndex:
+    """Get or create the availability index bound to a data access layer."""
+    index = _indexes.get(dal)
+    if index is None:
+        index = AvailabilityIndex(dal)
+        _indexes[dal] = index
+    return index
@@ -0,0 +1,140 @@
+"""
+In-Process TTL Cache
+
+Small time-bounded caches for data that is read far more often than it is
+written (doctor profiles, per-day doctor availability). Entries expire after
+a fixed TTL, the oldest entries are evicted once ``max_size`` is reached, and
+writers invalidate keys explicitly so readers never wait a full TTL for a
+change they made themselves.
+
+Caches are created through ``get_cache(name, ...)`` (or registered with
+``register_cache``) so every part of the app shares the same instance per
+name, and ``cache_stats()`` reports hit rates for all of them.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded mapping whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, ttl: float, max_size: int = 1024, lru: bool = False):
+        """
+        Args:
+            ttl: Seconds an entry stays valid
+            max_size: Maximum number of entries kept (oldest evicted first)
+            lru: Count a hit as use, so the least recently used entry is
+                evicted instead of the oldest
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lru = lru
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Optional[Any]:
+        """Return the cached value, or ``default`` if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.lru:
+            self._entries.move_to_end(key)
+        return entry[1]
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Return the cached values for whichever of ``keys`` are present."""
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the oldest entry if the cache is full."""
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop one key (no-op if absent)."""
+        if self._entries.pop(key, _MISSING) is not _MISSING:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def reset_stats(self) -> None:
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+
+# Named caches shared across the process
+_caches: Dict[str, TTLCache] = {}
+
+
+def get_cache(name: str, ttl: float, max_size: int = 1024) -> TTLCache:
+    """
+    Get or create the shared cache registered under ``name``.
+
+    Args:
+        name: Cache name (also the key in ``cache_stats()``)
+        ttl: Seconds an entry stays valid (used when the cache is created)
+        max_size: Maximum number of entries (used when the cache is created)
+
+    Returns:
+        TTLCache instance
+    """
+    if name not in _caches:
+        _caches[name] = TTLCache(ttl=ttl, max_size=max_size)
+    return _caches[name]
+
+
+def register_cache(name: str, cache: TTLCache) -> TTLCache:
+    """Expose a cache owned by another object (e.g. a repository) in ``cache_stats()``."""
+    _caches[name] = cache
+    return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit-rate metrics for every named cache."""
+    return {name: cache.stats() for name, cache in _caches.items()}
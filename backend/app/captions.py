@@ -9,8 +9,12 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from typing import Dict, Set
 import json
 import logging
+from .alert_engine import Alert, get_alert_engine
+from .alert_stream import AlertStreamWorker
+from .soap_drafter import get_soap_drafter
 from .stt_pipeline import get_stt_pipeline
 from .database import DatabaseClient
+from .ws_framing import negotiate_format, encode_frame, send_frame, send_message, JSON_FORMAT
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +30,8 @@ class CaptionManager:
         self.rooms: Dict[str, Set[WebSocket]] = {}
         # Track user types per connection
         self.user_types: Dict[WebSocket, str] = {}
+        # Negotiated wire format per connection ("json" or "msgpack")
+        self.formats: Dict[WebSocket, str] = {}
         # STT pipeline instance
         self.stt_pipeline = get_stt_pipeline()
         # Database client
@@ -34,31 +40,64 @@ class CaptionManager:
         except Exception as e:
             logger.warning(f"Database client initialization failed: {e}")
             self.db_client = None
+        # Patient captions are analyzed for critical symptoms in the background
+        self.alert_worker = AlertStreamWorker(get_alert_engine(), on_alert=self.send_alert)
+        # Optional rolling SOAP draft, so notes are ready soon after the call
+        self.soap_drafter = get_soap_drafter()
     
     async def connect(self, websocket: WebSocket, consultation_id: str, user_type: str):
         """Add a new caption connection"""
-        await websocket.accept()
+        wire_format, subprotocol = negotiate_format(websocket)
+        await websocket.accept(subprotocol=subprotocol)
         
         if consultation_id not in self.rooms:
             self.rooms[consultation_id] = set()
         
         self.rooms[consultation_id].add(websocket)
         self.user_types[websocket] = user_type
+        self.formats[websocket] = wire_format
         
-        logger.info(f"✅ Caption connection: {user_type} joined room {consultation_id}")
+        logger.info(f"✅ Caption connection: {user_type} joined room {consultation_id} ({wire_format})")
         
         # Send connection confirmation
-        await websocket.send_json({
+        await send_message(websocket, {
             "type": "connected",
             "message": "Caption service connected",
             "user_type": user_type
-        })
+        }, wire_format)
+    
+    async def send_to(self, websocket: WebSocket, message: dict):
+        """Send a message to one connection using its negotiated format"""
+        await send_message(websocket, message, self.formats.get(websocket, JSON_FORMAT))
+    
+    async def send_alert(self, consultation_id: str, alert: Alert, latency: float):
+        """Push a critical symptom alert to the doctors in a consultation room"""
+        message = {
+            "type": "alert",
+            "consultation_id": consultation_id,
+            "alert": alert.to_dict(),
+            "latency_ms": round(latency * 1000, 1)
+        }
+        frames = {}
+        for connection in list(self.rooms.get(consultation_id, ())):
+            if self.user_types.get(connection) != "doctor":
+                continue
+            try:
+                wire_format = self.formats.get(connection, JSON_FORMAT)
+                if wire_format not in frames:
+                    frames[wire_format] = encode_frame(message, wire_format)
+                await send_frame(connection, frames[wire_format])
+            except Exception as e:
+                logger.error(f"❌ Error sending alert to connection {id(connection)}: {e}")
+        logger.info(f"🚨 Alert for room {consultation_id}: {alert.symptom_type} "
+                    f"(severity {alert.severity_score}, {latency * 1000:.0f}ms)")
     
     def disconnect(self, websocket: WebSocket, consultation_id: str):
         """Remove a caption connection"""
         if consultation_id in self.rooms:
             self.rooms[consultation_id].discard(websocket)
             user_type = self.user_types.pop(websocket, "unknown")
+            self.formats.pop(websocket, None)
             
             logger.info(f"❌ Caption disconnection: {user_type} left room {consultation_id}")
             
@@ -140,19 +179,25 @@ class CaptionManager:
         disconnected = []
         successful_sends = 0
         
-        for connection in self.rooms[consultation_id]:
+        # Task 6.2: Ensure both original and translated text are included
+        message = {
+            "type": "caption",
+            "speaker": caption_data["speaker"],  # Task 6.2: Speaker identification
+            "original_text": caption_data["original_text"],
+            "translated_text": caption_data["translated_text"],
+            "timestamp": caption_data.get("timestamp")  # Optional timestamp
+        }
+        # Encode once per wire format instead of once per connection
+        frames = {}
+        
+        for connection in list(self.rooms[consultation_id]):
             # Task 6.2: Send to everyone (including sender for their own caption display)
             try:
-                # Task 6.2: Ensure both original and translated text are included
-                message = {
-                    "type": "caption",
-                    "speaker": caption_data["speaker"],  # Task 6.2: Speaker identification
-                    "original_text": caption_data["original_text"],
-                    "translated_text": caption_data["translated_text"],
-                    "timestamp": caption_data.get("timestamp")  # Optional timestamp
-                }
+                wire_format = self.formats.get(connection, JSON_FORMAT)
+                if wire_format not in frames:
+                    frames[wire_format] = encode_frame(message, wire_format)
                 
-                await connection.send_json(message)
+                await send_frame(connection, frames[wire_format])
                 successful_sends += 1
                 
                 # Log recipient info
@@ -236,6 +281,11 @@ class CaptionManager:
                 logger.info(f"⏱️ Total processing time (end-to-end): {total_time:.2f}ms")
                 
                 logger.info(f"📝 Caption generated for {user_type}: {result['original_text'][:50]}...")
+                
+                # Critical symptom check runs off the caption path (see app.alert_stream)
+                if user_type == "patient":
+                    self.alert_worker.submit(consultation_id, result["original_text"])
+                self.soap_drafter.add_utterance(consultation_id, user_type, result["original_text"])
             else:
                 # Don't log every silence - only log occasionally to reduce noise
                 logger.debug(f"No caption generated (silence, unclear audio, or STT service unavailable)")
@@ -255,7 +305,7 @@ class CaptionManager:
             if "quota" in error_msg or "authentication" in error_msg or "credentials" in error_msg:
                 try:
                     if sender.client_state.name == "CONNECTED":
-                        await sender.send_json({
+                        await self.send_to(sender, {
                             "type": "error",
                             "message": f"Caption service error: {str(e)}"
                         })
@@ -285,7 +335,8 @@ async def caption_endpoint(
     - Binary: Audio chunk (WebM/Opus format)
     - JSON: Control messages
     
-    Message format (to client):
+    Message format (to client), JSON by default or msgpack when negotiated
+    (see app.ws_framing):
     {
         "type": "caption",
         "speaker": "doctor" | "patient",
@@ -293,6 +344,15 @@ async def caption_endpoint(
         "translated_text": "Translated text",
         "timestamp": 1234567890
     }
+    
+    Doctors also receive critical symptom alerts detected in the patient's
+    captions:
+    {
+        "type": "alert",
+        "consultation_id": "...",
+        "alert": {"symptom_type": ..., "severity_score": ..., ...},
+        "latency_ms": 1450.2
+    }
     """
     await caption_manager.connect(websocket, consultation_id, user_type)
     
@@ -332,7 +392,7 @@ async def caption_endpoint(
                         # Send error message to client but don't close connection
                         try:
                             if websocket.client_state.name == "CONNECTED":
-                                await websocket.send_json({
+                                await caption_manager.send_to(websocket, {
                                     "type": "error",
                                     "message": "Audio processing failed, continuing..."
                                 })
@@ -347,7 +407,7 @@ async def caption_endpoint(
                     
                     # Handle control messages (e.g., pause, resume)
                     if message.get("type") == "ping":
-                        await websocket.send_json({"type": "pong"})
+                        await caption_manager.send_to(websocket, {"type": "pong"})
                         logger.debug(f"Ping/pong with {user_type}")
                     else:
                         logger.debug(f"Received control message from {user_type}: {message}")
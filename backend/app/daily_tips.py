@@ -0,0 +1,237 @@
+"""
+Daily Health Tips Store
+
+Every ``/health-tips/{category}`` request used to ask Gemini for a new tip,
+and ``/health-tips/all/today`` asked three times in a row, although the tip
+of the day is the same for everyone all day. ``DailyTips`` produces each
+day's tips once:
+
+- Served from memory for the rest of the day (no Gemini call, no query)
+- The first request of the day (or the precompute job just after midnight,
+  and at startup) loads them from the ``health_tips`` table, shared rows with
+  ``user_id`` NULL, so restarts and other instances reuse them
+- Categories missing from the table are generated concurrently and stored;
+  concurrent requests wait for that one load (single-flight). If another
+  instance stored a category first, its tip wins (unique index, migration
+  008)
+- A category whose generation fails gets the fallback tip, which is not
+  stored and is retried after ``HEALTH_TIP_RETRY_SECONDS``
+
+Without Supabase credentials or on database errors tips are kept in memory
+only.
+
+Usage:
+    tips = DailyTips(generate, HEALTH_TIP_CATEGORIES, FALLBACK_TIPS, dal)
+    tips.start()                      # precompute at startup and each midnight
+    text = await tips.get("nutrition")
+"""
+
+import asyncio
+import logging
+import os
+import time
+import weakref
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from postgrest.exceptions import APIError
+
+from .data_access import SupabaseDataAccess
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a category served with its fallback tip is generated again
+HEALTH_TIP_RETRY_SECONDS = float(os.getenv("HEALTH_TIP_RETRY_SECONDS", "600"))
+# Seconds after midnight at which the precompute job generates the new day's tips
+HEALTH_TIP_PRECOMPUTE_DELAY_SECONDS = float(os.getenv("HEALTH_TIP_PRECOMPUTE_DELAY", "5"))
+
+UNIQUE_VIOLATION = "23505"
+
+
+class DailyTips:
+    """Tips of the day per category: generated once, stored, served from memory."""
+
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[str]],
+        categories: Iterable[str],
+        fallback: Dict[str, str],
+        dal: Optional[SupabaseDataAccess] = None,
+        retry_seconds: float = HEALTH_TIP_RETRY_SECONDS,
+        today: Callable[[], date] = date.today
+    ):
+        """
+        Args:
+            generate: ``await generate(category)`` returns a new tip; raises on failure
+            categories: Categories of the day
+            fallback: Tip per category served when generation fails
+            dal: Data access layer for the ``health_tips`` table (None: memory only)
+            retry_seconds: Seconds before failed categories are generated again
+            today: Current date (injectable for tests)
+        """
+        self.generate = generate
+        self.categories = tuple(categories)
+        self.fallback = fallback
+        self.dal = dal
+        self.retry_seconds = retry_seconds
+        self.today = today
+
+        self._day: Optional[date] = None
+        self._tips: Dict[str, str] = {}
+        # Categories currently served with their fallback tip
+        self._failed: set = set()
+        self._retry_at = 0.0
+        # The in-flight load per event loop (tasks belong to one loop)
+        self._loading: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._scheduler: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.loads = 0
+        self.generated = 0
+        self.failures = 0
+        self.stored = 0
+        self.db_errors = 0
+
+    async def get(self, category: str) -> str:
+        """Tip of the day for ``category``."""
+        return (await self.get_all())[category]
+
+    async def get_all(self) -> Dict[str, str]:
+        """Tips of the day for every category."""
+        day = self.today()
+        if self._day == day and (not self._failed or time.monotonic() < self._retry_at):
+            self.hits += 1
+            return dict(self._tips)
+
+        loop = asyncio.get_running_loop()
+        task = self._loading.get(loop)
+        if task is None:
+            task = loop.create_task(self._load(day))
+            self._loading[loop] = task
+            task.add_done_callback(lambda _: self._loading.pop(loop, None))
+        return dict(await asyncio.shield(task))
+
+    async def _load(self, day: date) -> Dict[str, str]:
+        self.loads += 1
+        tips = dict(self._tips) if self._day == day else {}
+        tips = {category: text for category, text in tips.items() if category not in self._failed}
+        if len(tips) < len(self.categories):
+            tips.update(await self._read(day))
+
+        missing = [category for category in self.categories if category not in tips]
+        results = await asyncio.gather(*(self._generate(category) for category in missing))
+        failed = set()
+        store = {}
+        for category, text in zip(missing, results):
+            if text is None:
+                failed.add(category)
+                tips[category] = self.fallback[category]
+            else:
+                store[category] = text
+                tips[category] = text
+        if store:
+            tips.update(await self._store(day, store))
+
+        self._day, self._tips, self._failed = day, tips, failed
+        self._retry_at = time.monotonic() + self.retry_seconds
+        return tips
+
+    async def _generate(self, category: str) -> Optional[str]:
+        try:
+            text = await self.generate(category)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Health tip generation failed for {category}, serving fallback tip: {e}")
+            return None
+        self.generated += 1
+        return text
+
+    async def _read(self, day: date) -> Dict[str, str]:
+        """Shared tips already stored for ``day``."""
+        if self.dal is None:
+            return {}
+        try:
+            rows = await self.dal.health_tips.daily(day.isoformat())
+        except Exception as e:
+            self.db_errors += 1
+            logger.warning(f"Could not read stored health tips (serving from memory only): {e}")
+            return {}
+        return {row["category"]: row["tip_text"] for row in rows if row["category"] in self.categories}
+
+    async def _store(self, day: date, tips: Dict[str, str]) -> Dict[str, str]:
+        """
+        Store new tips; returns the tips to serve (another instance's, where it stored first).
+        """
+        if self.dal is None:
+            return tips
+
+        async def insert(category: str, text: str) -> bool:
+            try:
+                await self.dal.health_tips.insert({
+                    "user_id": None,
+                    "category": category,
+                    "tip_text": text,
+                    "generated_date": day.isoformat(),
+                })
+                self.stored += 1
+                return True
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    self.db_errors += 1
+                    logger.warning(f"Could not store the {category} health tip: {e}")
+                return False
+            except Exception as e:
+                self.db_errors += 1
+                logger.warning(f"Could not store the {category} health tip: {e}")
+                return False
+
+        inserted = await asyncio.gather(*(insert(category, text) for category, text in tips.items()))
+        if all(inserted):
+            return tips
+        # Lost a race (or the insert failed): prefer what is stored
+        stored = await self._read(day)
+        return {category: stored.get(category, text) for category, text in tips.items()}
+
+    # ------------------------------------------------------------------
+    # Precompute job
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Precompute today's tips now and each new day's just after midnight."""
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.get_all()
+            except Exception as e:
+                logger.error(f"Health tip precompute failed: {e}")
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            await asyncio.sleep((midnight - now).total_seconds() + HEALTH_TIP_PRECOMPUTE_DELAY_SECONDS)
+
+    async def close(self) -> None:
+        """Stop the precompute job (application shutdown)."""
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Serving and generation counters."""
+        return {
+            "day": self._day.isoformat() if self._day else None,
+            "memory_hits": self.hits,
+            "loads": self.loads,
+            "generated": self.generated,
+            "failures": self.failures,
+            "stored": self.stored,
+            "db_errors": self.db_errors,
+            "fallback_categories": sorted(self._failed),
+        }
@@ -0,0 +1,914 @@
+"""
+Async Supabase Data Access Layer
+
+Every router used to build its own synchronous ``create_client`` and call
+``.execute()`` directly on the event loop. This module replaces those with one
+process-wide, async-native data access layer:
+
+- A single pooled HTTP/2 transport with keep-alive, shared by the PostgREST,
+  Storage and Auth clients
+- A concurrency limit on in-flight Supabase requests so bursts queue in the
+  app instead of opening unbounded connections
+- Per-table repository classes with the queries the routers actually need
+
+Usage:
+    dal = get_data_access()
+    appointment = await dal.appointments.get(appointment_id)
+"""
+
+import asyncio
+import base64
+import copy
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from gotrue import AsyncGoTrueAdminAPI
+from postgrest import AsyncPostgrestClient
+from postgrest.utils import AsyncClient as PostgrestSession
+from storage3 import AsyncStorageClient
+
+from .cache import TTLCache, register_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pool and concurrency settings (override through the environment)
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+MAX_CONCURRENT_REQUESTS = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "16"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+# PostgREST caps every response at its max-rows setting (1000 on Supabase)
+MAX_ROWS_PER_REQUEST = int(os.getenv("SUPABASE_MAX_ROWS", "1000"))
+DOCTOR_PROFILE_TTL_SECONDS = float(os.getenv("DOCTOR_PROFILE_CACHE_TTL", "300"))
+DOCTOR_PROFILE_CACHE_SIZE = int(os.getenv("DOCTOR_PROFILE_CACHE_SIZE", "2048"))
+AVAILABILITY_TTL_SECONDS = float(os.getenv("DOCTOR_AVAILABILITY_CACHE_TTL", "60"))
+AVAILABILITY_CACHE_SIZE = int(os.getenv("DOCTOR_AVAILABILITY_CACHE_SIZE", "8192"))
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque page cursor holding the sort key of the last row served."""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Sort key values from a cursor made by ``encode_cursor``.
+
+    Raises:
+        ValueError: If the cursor is malformed or does not fit the sort key
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_filter(keys: List[Tuple[str, bool]], values: List[Any]) -> str:
+    """
+    Body of a PostgREST ``or`` filter selecting the rows after ``values`` in
+    key order (pass it to ``.or_()``).
+
+    For keys (a, b, id) this is ``a > x OR (a = x AND b > y) OR (a = x AND
+    b = y AND id > z)``, with ``<`` for descending keys. Values are quoted so
+    timestamps and other reserved characters pass through intact.
+    """
+    def condition(column: str, operator: str, value: Any) -> str:
+        literal = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        return f'{column}.{operator}."{literal}"'
+
+    branches = []
+    for i, (column, desc) in enumerate(keys):
+        terms = [condition(c, "eq", v) for (c, _), v in zip(keys[:i], values[:i])]
+        terms.append(condition(column, "lt" if desc else "gt", values[i]))
+        branches.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return ",".join(branches)
+
+
+def create_pooled_transport() -> httpx.AsyncHTTPTransport:
+    """Create the shared HTTP/2 keep-alive transport."""
+    return httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST client whose session runs on the shared transport."""
+
+    def __init__(self, base_url: str, transport: httpx.AsyncBaseTransport, **kwargs):
+        self._transport = transport
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return PostgrestSession(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=self._transport,
+            follow_redirects=True,
+        )
+
+
+class _PooledStorageClient(AsyncStorageClient):
+    """Storage client whose session runs on the shared transport."""
+
+    def __init__(self, url: str, headers: Dict[str, str], transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        super().__init__(url, headers)
+
+    def _create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=self._transport,
+            follow_redirects=True,
+        )
+
+
+class TableRepository:
+    """
+    Base repository for a single PostgREST table or view.
+
+    Subclasses set ``table_name`` and add the queries their routers need.
+    All queries go through ``SupabaseDataAccess.execute`` so they share the
+    connection pool and the concurrency limit.
+    """
+
+    table_name: str = ""
+
+    def __init__(self, dal: "SupabaseDataAccess"):
+        self._dal = dal
+
+    def query(self):
+        """Start a query builder on this repository's table."""
+        return self._dal.postgrest.table(self.table_name)
+
+    async def execute(self, query):
+        """Run a query builder under the shared concurrency limit."""
+        return await self._dal.execute(query)
+
+    async def fetch_all(
+        self,
+        build: Callable[[], Any],
+        order: List[str],
+        page_size: int = MAX_ROWS_PER_REQUEST
+    ) -> List[Dict[str, Any]]:
+        """
+        Run a query page by page until every matching row is read.
+
+        PostgREST silently truncates responses at max-rows, so range queries
+        that may return more rows than that must page.
+
+        Args:
+            build: Returns a fresh filtered query builder for each page
+            order: Columns giving a stable order for paging
+            page_size: Rows per request
+        """
+        rows: List[Dict[str, Any]] = []
+        while True:
+            query = build()
+            for column in order:
+                query = query.order(column)
+            result = await self.execute(query.range(len(rows), len(rows) + page_size - 1))
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+
+    async def keyset_page(
+        self,
+        build: Callable[[], Any],
+        keys: List[Tuple[str, bool]],
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page in ``keys`` order, starting after ``cursor``.
+
+        Unlike offset paging the cost of a page does not grow with its depth
+        and rows inserted meanwhile do not shift later pages. The selected
+        columns must include every key column; the last key must be unique.
+
+        Args:
+            build: Returns a fresh filtered query builder
+            keys: (column, descending) pairs, ending with a unique column
+            cursor: Cursor returned with the previous page, or None
+            limit: Rows per page
+
+        Returns:
+            Tuple of (rows, cursor for the next page or None on the last page)
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        query = build()
+        if cursor:
+            query = query.or_(keyset_filter(keys, decode_cursor(cursor, len(keys))))
+        for column, desc in keys:
+            query = query.order(column, desc=desc)
+        result = await self.execute(query.limit(limit + 1))
+        rows = result.data or []
+
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor([rows[-1][column] for column, _ in keys])
+
+    async def iter_keyset(
+        self,
+        build: Callable[[], Any],
+        keys: List[Tuple[str, bool]],
+        page_size: int = MAX_ROWS_PER_REQUEST
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every matching row, one keyset page at a time (for exports)."""
+        cursor = None
+        while True:
+            rows, cursor = await self.keyset_page(build, keys, cursor, page_size)
+            if rows:
+                yield rows
+            if cursor is None:
+                return
+
+    async def get(self, record_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        """Fetch one row by primary key, or None if it does not exist."""
+        result = await self.execute(
+            self.query().select(columns).eq("id", record_id).limit(1)
+        )
+        return result.data[0] if result.data else None
+
+    async def insert(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert one row and return it."""
+        result = await self.execute(self.query().insert(record))
+        row = result.data[0] if result.data else None
+        self._dal.notify_write(self.table_name, row or record)
+        return row
+
+    async def insert_many(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert several rows in a single request."""
+        if not records:
+            return []
+        result = await self.execute(self.query().insert(records))
+        rows = result.data or []
+        for row in rows or records:
+            self._dal.notify_write(self.table_name, row)
+        return rows
+
+    async def update(self, record_id: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update one row by primary key and return the updated row."""
+        result = await self.execute(self.query().update(changes).eq("id", record_id))
+        row = result.data[0] if result.data else None
+        self._dal.notify_write(self.table_name, row or {"id": record_id})
+        return row
+
+    async def delete(self, record_id: str) -> None:
+        """Delete one row by primary key."""
+        await self.execute(self.query().delete().eq("id", record_id))
+        self._dal.notify_write(self.table_name, {"id": record_id})
+
+
+class AppointmentRepository(TableRepository):
+    table_name = "appointments"
+
+    # Patient listings: soonest first, id breaks ties
+    PATIENT_ORDER = [("date", False), ("time", False), ("id", False)]
+
+    async def page_for_patient(
+        self,
+        patient_id: str,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Page of a patient's appointments ordered by date and time.
+
+        The total is read from the same response (``count=exact``), so a page
+        costs a single round trip.
+
+        Returns:
+            Tuple of (rows on this page, total matching rows)
+        """
+        query = self.query().select("*", count="exact").eq("patient_id", patient_id)
+        if status:
+            query = query.eq("status", status)
+        query = query.order("date", desc=False).order("time", desc=False).order("id", desc=False)
+        result = await self.execute(query.range(offset, offset + limit - 1))
+        return result.data or [], result.count or 0
+
+    async def keyset_for_patient(
+        self,
+        patient_id: str,
+        status: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Page of a patient's appointments after a cursor (no count)."""
+        return await self.keyset_page(
+            lambda: self._for_patient(patient_id, status), self.PATIENT_ORDER, cursor, limit
+        )
+
+    def iter_for_patient(self, patient_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """All of a patient's appointments, page by page."""
+        return self.iter_keyset(lambda: self._for_patient(patient_id), self.PATIENT_ORDER)
+
+    def cursor_for(self, row: Dict[str, Any]) -> str:
+        """Cursor continuing a patient listing after this row."""
+        return encode_cursor([row[column] for column, _ in self.PATIENT_ORDER])
+
+    def _for_patient(self, patient_id: str, status: Optional[str] = None):
+        query = self.query().select("*").eq("patient_id", patient_id)
+        if status:
+            query = query.eq("status", status)
+        return query
+
+
+class DoctorRepository(TableRepository):
+    """
+    Doctor profiles, fronted by a TTL cache.
+
+    Appointment responses embed the doctor's name, specialty and avatar, so
+    the same handful of profiles is read on almost every request. There is no
+    foreign key from appointments to doctors to embed them in a select, so
+    profiles are fetched in one batched ``in`` query and cached.
+    """
+
+    table_name = "doctors"
+
+    def __init__(self, dal: "SupabaseDataAccess"):
+        super().__init__(dal)
+        self.profiles = TTLCache(ttl=DOCTOR_PROFILE_TTL_SECONDS, max_size=DOCTOR_PROFILE_CACHE_SIZE)
+        register_cache("doctor_profiles", self.profiles)
+
+    async def get_profiles(self, doctor_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Profiles for several doctors, keyed by id.
+
+        Cached profiles are served from memory; the rest are fetched in a
+        single request. Unknown ids are absent from the result.
+        """
+        wanted = {doctor_id for doctor_id in doctor_ids if doctor_id}
+        profiles = self.profiles.get_many(wanted)
+        missing = wanted - profiles.keys()
+
+        if missing:
+            result = await self.execute(self.query().select("*").in_("id", sorted(missing)))
+            for row in result.data or []:
+                self.profiles.set(row["id"], row)
+                profiles[row["id"]] = row
+        return profiles
+
+    async def update(self, record_id: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        self.profiles.invalidate(record_id)
+        return await super().update(record_id, changes)
+
+    async def delete(self, record_id: str) -> None:
+        self.profiles.invalidate(record_id)
+        await super().delete(record_id)
+
+
+class DoctorAvailabilityRepository(TableRepository):
+    """
+    Per-day doctor availability, fronted by a TTL cache.
+
+    Slot checks read ``time_slots`` for the same (doctor, day) over and over.
+    Rows (and the absence of a row) are cached per (doctor, day); every write
+    through this repository drops the cached entry for that day.
+    """
+
+    table_name = "doctor_availability"
+
+    def __init__(self, dal: "SupabaseDataAccess"):
+        super().__init__(dal)
+        self.days = TTLCache(ttl=AVAILABILITY_TTL_SECONDS, max_size=AVAILABILITY_CACHE_SIZE)
+        register_cache("doctor_availability", self.days)
+
+    async def get_for_day(self, doctor_id: str, day: str) -> Optional[Dict[str, Any]]:
+        """
+        Availability row for a doctor on one day (``day`` is an ISO date).
+
+        Returns a copy, so callers may modify ``time_slots`` before writing
+        them back with ``update_time_slots``.
+        """
+        key = (doctor_id, day)
+        row = self.days.get(key)
+        if row is None:
+            result = await self.execute(
+                self.query().select("*").eq("doctor_id", doctor_id).eq("date", day).limit(1)
+            )
+            row = result.data[0] if result.data else {}
+            self.days.set(key, row)
+        return copy.deepcopy(row) if row else None
+
+    async def list_in_range(
+        self,
+        doctor_ids: List[str],
+        start: str,
+        end: str,
+        cache: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Availability rows for several doctors over a date range.
+
+        One request unless the result exceeds PostgREST's max-rows. With
+        ``cache`` set, also refreshes the per-day cache for every (doctor, day)
+        in the range, including days with no published schedule; bulk callers
+        that keep their own derived cache pass ``cache=False``.
+        """
+        rows = await self.fetch_all(
+            lambda: self.query()
+            .select("*")
+            .in_("doctor_id", doctor_ids)
+            .gte("date", start)
+            .lte("date", end),
+            order=["doctor_id", "date"],
+        )
+        if not cache:
+            return rows
+
+        found = {(row["doctor_id"], str(row["date"])): row for row in rows}
+        day = date.fromisoformat(start)
+        last = date.fromisoformat(end)
+        while day <= last:
+            for doctor_id in doctor_ids:
+                key = (doctor_id, day.isoformat())
+                self.days.set(key, found.get(key, {}))
+            day += timedelta(days=1)
+        return copy.deepcopy(rows)
+
+    async def update_time_slots(
+        self,
+        availability: Dict[str, Any],
+        time_slots: List[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Write a day's time slots and invalidate the cached day."""
+        try:
+            return await self.update(availability["id"], {"time_slots": time_slots})
+        finally:
+            self.invalidate(availability["doctor_id"], str(availability["date"]))
+
+    async def insert(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            return await super().insert(record)
+        finally:
+            self.invalidate(record["doctor_id"], str(record["date"]))
+
+    def invalidate(self, doctor_id: str, day: str) -> None:
+        """Drop the cached availability for one doctor and day."""
+        self.days.invalidate((doctor_id, day))
+        self._dal.notify_slots_changed(doctor_id, day)
+
+
+class AppointmentSlotRepository(TableRepository):
+    """
+    Booked slots, one row per (doctor, date, time).
+
+    The primary key on (doctor_id, date, time) is what makes double booking
+    impossible; see migrations/004_create_appointment_slots.sql.
+    """
+
+    table_name = "appointment_slots"
+
+    async def is_booked(self, doctor_id: str, day: str, time: str) -> bool:
+        """Primary-key lookup for a single slot."""
+        result = await self.execute(
+            self.query()
+            .select("appointment_id")
+            .eq("doctor_id", doctor_id)
+            .eq("date", day)
+            .eq("time", time)
+            .limit(1)
+        )
+        return bool(result.data)
+
+    async def booked_in_range(
+        self,
+        doctor_ids: List[str],
+        start: str,
+        end: str
+    ) -> List[Dict[str, Any]]:
+        """Booked slots for several doctors over a date range (paged past max-rows)."""
+        return await self.fetch_all(
+            lambda: self.query()
+            .select("doctor_id, date, time")
+            .in_("doctor_id", doctor_ids)
+            .gte("date", start)
+            .lte("date", end),
+            order=["doctor_id", "date", "time"],
+        )
+
+    async def claim(self, doctor_id: str, day: str, time: str, appointment_id: str) -> Dict[str, Any]:
+        """
+        Claim a slot for an existing appointment.
+
+        Raises:
+            postgrest.exceptions.APIError: With code 23505 if the slot is taken
+        """
+        claimed = await self.insert({
+            "doctor_id": doctor_id,
+            "date": day,
+            "time": time,
+            "appointment_id": appointment_id,
+        })
+        self._dal.notify_slots_changed(doctor_id, day)
+        return claimed
+
+    async def release(self, doctor_id: str, day: str, time: str) -> None:
+        """Free one slot."""
+        await self.execute(
+            self.query().delete().eq("doctor_id", doctor_id).eq("date", day).eq("time", time)
+        )
+        self._dal.notify_slots_changed(doctor_id, day)
+
+    async def release_for_appointment(self, appointment_id: str) -> None:
+        """Free whatever slot an appointment holds."""
+        result = await self.execute(self.query().delete().eq("appointment_id", appointment_id))
+        for row in result.data or []:
+            self._dal.notify_slots_changed(row["doctor_id"], str(row["date"]))
+
+
+class ConsultationRepository(TableRepository):
+    table_name = "consultations"
+
+
+class PatientRepository(TableRepository):
+    table_name = "patients"
+
+
+class EmotionLogRepository(TableRepository):
+    table_name = "emotion_logs"
+
+    async def recent_for_user(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent emotion logs for a user, newest first."""
+        result = await self.execute(
+            self.query()
+            .select("*")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(limit)
+        )
+        return result.data or []
+
+    async def for_consultation(self, consultation_id: str) -> List[Dict[str, Any]]:
+        """All emotion logs for a consultation in chronological order."""
+        result = await self.execute(
+            self.query()
+            .select("*")
+            .eq("consultation_id", consultation_id)
+            .order("created_at", desc=False)
+        )
+        return result.data or []
+
+    async def samples_for_consultation(self, consultation_id: str) -> List[Dict[str, Any]]:
+        """Time, emotion and confidence of every log in a consultation, oldest first."""
+        return await self.fetch_all(
+            lambda: self.query()
+            .select("created_at, emotion_type, confidence_score")
+            .eq("consultation_id", consultation_id),
+            order=["created_at", "id"],
+        )
+
+    async def delete_for_user(self, user_id: str) -> None:
+        """Delete every emotion log for a user."""
+        await self.execute(self.query().delete().eq("user_id", user_id))
+        self._dal.notify_write(self.table_name, {"user_id": user_id})
+
+
+class EmotionStatsRepository(TableRepository):
+    table_name = "emotion_stats"
+
+    async def for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """Aggregated per-emotion rows from the ``emotion_stats`` view."""
+        result = await self.execute(self.query().select("*").eq("user_id", user_id))
+        return result.data or []
+
+
+def _projection(summary: List[str], heavy: Iterable[str], include: Iterable[str]) -> str:
+    """Column list: the summary columns plus the requested heavy ones."""
+    include = list(dict.fromkeys(include))
+    unknown = [column for column in include if column not in heavy]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Optional fields: {', '.join(heavy)}")
+    return ", ".join(summary + include)
+
+
+class MedicalImageRepository(TableRepository):
+    table_name = "medical_images"
+
+    # Listing columns; the full AI analysis is opt-in
+    SUMMARY_COLUMNS = [
+        "id", "patient_id", "appointment_id", "image_url", "image_type", "body_part",
+        "patient_description", "symptoms", "severity_level", "detected_conditions",
+        "recommendations", "requires_immediate_attention", "uploaded_at", "analyzed_at",
+        "is_follow_up", "parent_image_id", "days_since_previous", "doctor_notes",
+        "doctor_reviewed_at",
+    ]
+    HEAVY_COLUMNS = ["ai_analysis"]
+    PATIENT_ORDER = [("uploaded_at", True), ("id", True)]
+
+    async def page_for_patient(
+        self,
+        patient_id: str,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        include: Iterable[str] = ()
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Page of a patient's images, newest first.
+
+        Args:
+            include: Heavy columns to add to the summary projection
+
+        Returns:
+            Tuple of (rows, cursor for the next page or None)
+
+        Raises:
+            ValueError: If the cursor or an included column is invalid
+        """
+        columns = _projection(self.SUMMARY_COLUMNS, self.HEAVY_COLUMNS, include)
+        return await self.keyset_page(
+            lambda: self.query().select(columns).eq("patient_id", patient_id),
+            self.PATIENT_ORDER, cursor, limit
+        )
+
+    def iter_for_patient(self, patient_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every image row of a patient with all columns, page by page."""
+        return self.iter_keyset(
+            lambda: self.query().select("*").eq("patient_id", patient_id), self.PATIENT_ORDER
+        )
+
+    async def hashes_for_patient(self, patient_id: str) -> List[Dict[str, Any]]:
+        """Perceptual hashes of a patient's analysed images (see app/image_dedup.py)."""
+        result = await self.execute(
+            self.query()
+            .select("id, body_part, symptoms, patient_description, image_phash, image_dhash")
+            .eq("patient_id", patient_id)
+            .not_.is_("image_phash", "null")
+        )
+        return result.data or []
+
+    async def list_for_appointment(self, appointment_id: str) -> List[Dict[str, Any]]:
+        """Images attached to an appointment, newest first."""
+        result = await self.execute(
+            self.query()
+            .select("*")
+            .eq("appointment_id", appointment_id)
+            .order("uploaded_at", desc=True)
+        )
+        return result.data or []
+
+
+class LabReportRepository(TableRepository):
+    table_name = "lab_reports"
+
+    # Listing columns; the OCR text and the analysis JSON are opt-in
+    SUMMARY_COLUMNS = [
+        "id", "patient_id", "file_name", "file_type", "status",
+        "uploaded_at", "created_at", "updated_at",
+    ]
+    HEAVY_COLUMNS = ["extracted_text", "analysis_result"]
+    PATIENT_ORDER = [("uploaded_at", True), ("id", True)]
+
+    async def page_for_patient(
+        self,
+        patient_id: str,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        include: Iterable[str] = ()
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Page of a patient's lab reports, newest first.
+
+        Args:
+            include: Heavy columns to add to the summary projection
+
+        Returns:
+            Tuple of (rows, cursor for the next page or None)
+
+        Raises:
+            ValueError: If the cursor or an included column is invalid
+        """
+        columns = _projection(self.SUMMARY_COLUMNS, self.HEAVY_COLUMNS, include)
+        return await self.keyset_page(
+            lambda: self.query().select(columns).eq("patient_id", patient_id),
+            self.PATIENT_ORDER, cursor, limit
+        )
+
+    def iter_for_patient(self, patient_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every lab report row of a patient with all columns, page by page."""
+        return self.iter_keyset(
+            lambda: self.query().select("*").eq("patient_id", patient_id), self.PATIENT_ORDER
+        )
+
+
+class VoiceIntakeRepository(TableRepository):
+    table_name = "voice_intake_records"
+
+
+class HealthTipRepository(TableRepository):
+    """
+    Wellness tips. Rows without a ``user_id`` are the shared tips of the day,
+    one per (category, generated_date); see migrations/008_add_daily_health_tips_index.sql.
+    """
+
+    table_name = "health_tips"
+
+    async def daily(self, day: str) -> List[Dict[str, Any]]:
+        """Shared tips generated for ``day`` (YYYY-MM-DD)."""
+        result = await self.execute(
+            self.query()
+            .select("category, tip_text, generated_date")
+            .is_("user_id", "null")
+            .eq("generated_date", day)
+        )
+        return result.data or []
+
+
+class StorageBucket:
+    """Concurrency-limited access to one Supabase Storage bucket."""
+
+    def __init__(self, dal: "SupabaseDataAccess", bucket: str):
+        self._dal = dal
+        self._bucket = bucket
+
+    def _files(self):
+        return self._dal.storage.from_(self._bucket)
+
+    async def upload(self, path: str, data: bytes, content_type: str, upsert: bool = False):
+        file_options = {"content-type": content_type}
+        if upsert:
+            file_options["upsert"] = "true"
+        async with self._dal.limiter:
+            return await self._files().upload(path, data, file_options=file_options)
+
+    async def download(self, path: str) -> bytes:
+        async with self._dal.limiter:
+            return await self._files().download(path)
+
+    async def remove(self, paths: List[str]):
+        async with self._dal.limiter:
+            return await self._files().remove(paths)
+
+    async def get_public_url(self, path: str) -> str:
+        return await self._files().get_public_url(path)
+
+
+class SupabaseDataAccess:
+    """
+    Process-wide async access to Supabase.
+
+    Owns the pooled transport, the PostgREST/Storage/Auth clients built on it,
+    and one repository instance per table.
+    """
+
+    def __init__(
+        self,
+        supabase_url: str,
+        supabase_key: str,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        max_concurrency: int = MAX_CONCURRENT_REQUESTS
+    ):
+        """
+        Initialize the data access layer.
+
+        Args:
+            supabase_url: Project URL (or a PostgREST-compatible stand-in)
+            supabase_key: Service role key
+            transport: Optional transport override (defaults to the pooled HTTP/2 transport)
+            max_concurrency: Maximum number of in-flight Supabase requests
+        """
+        self.url = supabase_url.rstrip("/")
+        self.transport = transport or create_pooled_transport()
+        self.limiter = asyncio.Semaphore(max_concurrency)
+        self._slot_listeners: List[Callable[[str, str], None]] = []
+        self._write_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+        headers = {"apikey": supabase_key, "Authorization": f"Bearer {supabase_key}"}
+
+        self.postgrest = _PooledPostgrestClient(
+            f"{self.url}/rest/v1",
+            self.transport,
+            headers=headers,
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+        self.storage = _PooledStorageClient(f"{self.url}/storage/v1", headers, self.transport)
+        self.auth_admin = AsyncGoTrueAdminAPI(
+            url=f"{self.url}/auth/v1",
+            headers=headers,
+            http_client=httpx.AsyncClient(transport=self.transport, timeout=REQUEST_TIMEOUT_SECONDS),
+        )
+
+        # Per-table repositories
+        self.appointments = AppointmentRepository(self)
+        self.appointment_slots = AppointmentSlotRepository(self)
+        self.doctors = DoctorRepository(self)
+        self.doctor_availability = DoctorAvailabilityRepository(self)
+        self.consultations = ConsultationRepository(self)
+        self.patients = PatientRepository(self)
+        self.emotion_logs = EmotionLogRepository(self)
+        self.emotion_stats = EmotionStatsRepository(self)
+        self.medical_images = MedicalImageRepository(self)
+        self.lab_reports = LabReportRepository(self)
+        self.voice_intake_records = VoiceIntakeRepository(self)
+        self.health_tips = HealthTipRepository(self)
+
+    def add_slot_listener(self, callback: Callable[[str, str], None]) -> None:
+        """Register ``callback(doctor_id, day)`` for schedule or booking changes."""
+        self._slot_listeners.append(callback)
+
+    def notify_slots_changed(self, doctor_id: str, day: str) -> None:
+        """Tell listeners (e.g. derived availability caches) a doctor's day changed."""
+        for callback in self._slot_listeners:
+            callback(doctor_id, day)
+
+    def add_write_listener(self, callback: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Register ``callback(table, row)`` for rows written through the repositories."""
+        self._write_listeners.append(callback)
+
+    def notify_write(self, table: str, row: Dict[str, Any]) -> None:
+        """
+        Tell listeners (e.g. the response cache) a row was written.
+
+        ``row`` holds the written row, or at least its ``id`` (or the filter
+        columns of a bulk delete).
+        """
+        for callback in self._write_listeners:
+            callback(table, row)
+
+    def bucket(self, name: str) -> StorageBucket:
+        """Access a Storage bucket through the shared pool."""
+        return StorageBucket(self, name)
+
+    async def execute(self, query):
+        """Execute a PostgREST query builder under the concurrency limit."""
+        async with self.limiter:
+            return await query.execute()
+
+    async def rpc(self, function: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Call a Postgres function through PostgREST under the concurrency limit."""
+        result = await self.execute(self.postgrest.rpc(function, params))
+        return result.data or []
+
+    async def get_auth_user(self, user_id: str):
+        """Fetch an auth user (admin API), or None if not found."""
+        async with self.limiter:
+            response = await self.auth_admin.get_user_by_id(user_id)
+        return response.user if response else None
+
+    async def aclose(self) -> None:
+        """Close the shared transport and all clients built on it."""
+        await self.transport.aclose()
+
+
+# Singleton instance
+_data_access: Optional[SupabaseDataAccess] = None
+
+
+def get_data_access() -> SupabaseDataAccess:
+    """
+    Get or create the process-wide data access layer.
+
+    Returns:
+        SupabaseDataAccess instance
+
+    Raises:
+        ValueError: If SUPABASE_URL or SUPABASE_SERVICE_KEY is not set
+    """
+    global _data_access
+    if _data_access is None:
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+
+        if not supabase_url or not supabase_key:
+            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+
+        _data_access = SupabaseDataAccess(supabase_url, supabase_key)
+        logger.info(
+            f"Supabase data access initialized (HTTP/2 pool: {MAX_CONNECTIONS} connections, "
+            f"{MAX_CONCURRENT_REQUESTS} concurrent requests)"
+        )
+    return _data_access
+
+
+async def close_data_access() -> None:
+    """Close the shared pool (called on application shutdown)."""
+    global _data_access
+    if _data_access is not None:
+        await _data_access.aclose()
+        _data_access = None
@@ -3,16 +3,15 @@ Database Client Module for Supabase Integration
 
 This module provides methods for interacting with the Supabase database,
 including emotion logging, statistics retrieval, and consultation management.
+All queries run through the shared async data access layer (app.data_access).
 """
 
 from typing import List, Dict, Optional
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
-
-# Load environment variables from .env file
-load_dotenv()
+from .data_access import get_data_access, SupabaseDataAccess
+from .emotion_stats import get_emotion_stats_tracker
+from .emotion_timeline import get_emotion_timeline
+from . import soap_cache
 
 
 class DatabaseClient:
@@ -22,15 +21,18 @@ class DatabaseClient:
     Handles emotion logs, consultation data, and user statistics.
     """
     
-    def __init__(self):
-        """Initialize Supabase client with environment variables."""
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-        
-        if not supabase_url or not supabase_key:
-            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+    def __init__(self, dal: Optional[SupabaseDataAccess] = None):
+        """
+        Initialize on top of the shared data access layer.
         
-        self.client: Client = create_client(supabase_url, supabase_key)
+        Raises:
+            ValueError: If SUPABASE_URL and SUPABASE_SERVICE_KEY are not set
+        """
+        self.dal = dal or get_data_access()
+        # Running per-user emotion counters, updated by every emotion log write
+        self.emotion_stats = get_emotion_stats_tracker(self.dal)
+        # Bucketed consultation emotion timelines, cached once a consultation ends
+        self.emotion_timeline = get_emotion_timeline(self.dal)
     
     async def log_emotion(
         self,
@@ -62,8 +64,8 @@ class DatabaseClient:
             if consultation_id:
                 data["consultation_id"] = consultation_id
             
-            result = self.client.table("emotion_logs").insert(data).execute()
-            return result.data[0] if result.data else {}
+            result = await self.dal.emotion_logs.insert(data)
+            return result or {}
         
         except Exception as e:
             print(f"Error logging emotion: {e}")
@@ -80,12 +82,7 @@ class DatabaseClient:
             List of emotion statistics
         """
         try:
-            result = self.client.from_("emotion_stats")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .execute()
-            
-            return result.data if result.data else []
+            return await self.emotion_stats.stats(user_id)
         
         except Exception as e:
             print(f"Error fetching emotion stats: {e}")
@@ -107,14 +104,7 @@ class DatabaseClient:
             List of recent emotion logs
         """
         try:
-            result = self.client.table("emotion_logs")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .order("created_at", desc=True)\
-                .limit(limit)\
-                .execute()
-            
-            return result.data if result.data else []
+            return await self.dal.emotion_logs.recent_for_user(user_id, limit)
         
         except Exception as e:
             print(f"Error fetching recent emotions: {e}")
@@ -134,22 +124,39 @@ class DatabaseClient:
             List of emotion logs for the consultation
         """
         try:
-            result = self.client.table("emotion_logs")\
-                .select("*")\
-                .eq("consultation_id", consultation_id)\
-                .order("created_at", desc=False)\
-                .execute()
-            
-            return result.data if result.data else []
+            return await self.dal.emotion_logs.for_consultation(consultation_id)
         
         except Exception as e:
             print(f"Error fetching consultation emotions: {e}")
             return []
     
+    async def get_consultation_emotion_timeline(
+        self,
+        consultation_id: str,
+        bucket_seconds: int = 30
+    ) -> Dict:
+        """
+        Get a time-bucketed emotion timeline for a consultation.
+        
+        Args:
+            consultation_id: ID of the consultation
+            bucket_seconds: Width of each bucket in seconds
+        
+        Returns:
+            Dictionary with per-bucket counts, mean confidence and dominant emotion
+        
+        Raises:
+            ValueError: If bucket_seconds is out of range
+        """
+        return await self.emotion_timeline.timeline(consultation_id, bucket_seconds)
+    
     async def get_emotion_summary(self, user_id: str) -> Dict:
         """
         Get a summary of emotion detections for dashboard display.
         
+        Served from running per-user counters (see app.emotion_stats); only
+        the first request for a user reads the emotion_stats view.
+        
         Args:
             user_id: ID of the user
         
@@ -157,32 +164,7 @@ class DatabaseClient:
             Dictionary with emotion summary statistics
         """
         try:
-            # Get stats from view
-            stats = await self.get_emotion_stats(user_id)
-            
-            # Calculate totals
-            total_detections = sum(stat.get("detection_count", 0) for stat in stats)
-            
-            # Create distribution
-            distribution = {}
-            for stat in stats:
-                emotion_type = stat.get("emotion_type")
-                count = stat.get("detection_count", 0)
-                if total_detections > 0:
-                    distribution[emotion_type] = round((count / total_detections) * 100, 1)
-                else:
-                    distribution[emotion_type] = 0
-            
-            # Get most recent emotion
-            recent = await self.get_recent_emotions(user_id, limit=1)
-            last_emotion = recent[0] if recent else None
-            
-            return {
-                "total_detections": total_detections,
-                "distribution": distribution,
-                "last_emotion": last_emotion,
-                "stats": stats
-            }
+            return await self.emotion_stats.summary(user_id)
         
         except Exception as e:
             print(f"Error getting emotion summary: {e}")
@@ -204,14 +186,10 @@ class DatabaseClient:
             True if emotion analysis is enabled, False otherwise
         """
         try:
-            result = self.client.table("patients")\
-                .select("emotion_analysis_enabled")\
-                .eq("id", user_id)\
-                .single()\
-                .execute()
+            patient = await self.dal.patients.get(user_id, "emotion_analysis_enabled")
             
-            if result.data:
-                return result.data.get("emotion_analysis_enabled", True)
+            if patient:
+                return patient.get("emotion_analysis_enabled", True)
             return True  # Default to enabled
         
         except Exception as e:
@@ -229,10 +207,7 @@ class DatabaseClient:
             True if successful, False otherwise
         """
         try:
-            self.client.table("emotion_logs")\
-                .delete()\
-                .eq("user_id", user_id)\
-                .execute()
+            await self.dal.emotion_logs.delete_for_user(user_id)
             
             return True
         
@@ -257,18 +232,12 @@ class DatabaseClient:
         """
         try:
             # Get current consultation
-            consultation = self.client.table("consultations")\
-                .select("*")\
-                .eq("id", consultation_id)\
-                .single()\
-                .execute()
+            current_data = await self.dal.consultations.get(consultation_id)
             
-            if not consultation.data:
+            if not current_data:
                 print(f"Consultation {consultation_id} not found")
                 return False
             
-            current_data = consultation.data
-            
             # Get existing transcript (try both column names)
             existing_transcript = (
                 current_data.get("transcript") or 
@@ -288,10 +257,7 @@ class DatabaseClient:
             # Remove None values
             update_data = {k: v for k, v in update_data.items() if v is not None}
             
-            self.client.table("consultations")\
-                .update(update_data)\
-                .eq("id", consultation_id)\
-                .execute()
+            await self.dal.consultations.update(consultation_id, update_data)
             
             return True
         
@@ -310,19 +276,15 @@ class DatabaseClient:
             Transcript text or None if not found
         """
         try:
-            result = self.client.table("consultations")\
-                .select("*")\
-                .eq("id", consultation_id)\
-                .single()\
-                .execute()
+            consultation = await self.dal.consultations.get(consultation_id)
             
-            if not result.data:
+            if not consultation:
                 return None
             
             # Try both column names
             return (
-                result.data.get("transcript") or 
-                result.data.get("full_transcript") or
+                consultation.get("transcript") or 
+                consultation.get("full_transcript") or
                 None
             )
         
@@ -334,7 +296,8 @@ class DatabaseClient:
         self,
         consultation_id: str,
         soap_note: Dict,
-        stigma_suggestions: List[Dict]
+        stigma_suggestions: List[Dict],
+        transcript: Optional[str] = None
     ) -> bool:
         """
         Save SOAP notes and stigma suggestions to a consultation.
@@ -343,20 +306,17 @@ class DatabaseClient:
             consultation_id: ID of the consultation
             soap_note: Dictionary with SOAP note sections
             stigma_suggestions: List of stigma suggestion dictionaries
+            transcript: Transcript the note was generated from; stores the
+                hash that lets an unchanged transcript reuse it (app.soap_cache)
         
         Returns:
             True if successful, False otherwise
         """
         try:
-            self.client.table("consultations")\
-                .update({
-                    "raw_soap_note": soap_note,
-                    "de_stigma_suggestions": stigma_suggestions,
-                    "soap_notes": soap_note,  # Also update old column
-                    "stigma_suggestions": stigma_suggestions  # Also update old column
-                })\
-                .eq("id", consultation_id)\
-                .execute()
+            # Writes raw_soap_note/de_stigma_suggestions and the old columns
+            await soap_cache.save_soap_notes(
+                self.dal, consultation_id, soap_note, stigma_suggestions, transcript
+            )
             
             return True
         
@@ -375,18 +335,17 @@ class DatabaseClient:
             Dictionary with soap_note and stigma_suggestions, or None if not found
         """
         try:
-            result = self.client.table("consultations")\
-                .select("raw_soap_note, de_stigma_suggestions, soap_notes, stigma_suggestions")\
-                .eq("id", consultation_id)\
-                .single()\
-                .execute()
+            consultation = await self.dal.consultations.get(
+                consultation_id,
+                "raw_soap_note, de_stigma_suggestions, soap_notes, stigma_suggestions"
+            )
             
-            if not result.data:
+            if not consultation:
                 return None
             
             # Try new column names first, fall back to old ones
-            soap_note = result.data.get("raw_soap_note") or result.data.get("soap_notes")
-            stigma_suggestions = result.data.get("de_stigma_suggestions") or result.data.get("stigma_suggestions") or []
+            soap_note = consultation.get("raw_soap_note") or consultation.get("soap_notes")
+            stigma_suggestions = consultation.get("de_stigma_suggestions") or consultation.get("stigma_suggestions") or []
             
             if not soap_note:
                 return None
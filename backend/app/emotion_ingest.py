@@ -0,0 +1,207 @@
+"""
+Batched Emotion Log Ingestion
+
+A patient on a live call produces several ``emotion_update`` messages per
+second, and each one used to be written with its own insert before the
+WebSocket loop could read the next message. ``EmotionLogBatcher`` queues
+updates instead and writes them as multi-row inserts:
+
+- A batch is flushed when it reaches ``EMOTION_BATCH_SIZE`` rows or
+  ``EMOTION_BATCH_MAX_DELAY`` seconds after its first row, whichever comes
+  first
+- Callers flush explicitly when a client disconnects and on shutdown
+- Optionally (``EMOTION_DOWNSAMPLE_SECONDS`` > 0) an update repeating the
+  previous emotion of the same user and consultation within that window is
+  dropped, so a long steady "calm" becomes one row per window
+
+Rows are validated on submit so one bad update cannot fail a whole batch.
+Readers (emotion stats, recent emotions) see an update at most one batch
+delay after it was submitted.
+
+Usage:
+    batcher = get_emotion_batcher(get_data_access())
+    batcher.submit(user_id, "calm", 0.82, consultation_id)
+    await batcher.flush()
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .cache import TTLCache
+from .data_access import SupabaseDataAccess
+
+logger = logging.getLogger(__name__)
+
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", "50"))
+EMOTION_BATCH_MAX_DELAY_SECONDS = float(os.getenv("EMOTION_BATCH_MAX_DELAY", "0.5"))
+EMOTION_DOWNSAMPLE_SECONDS = float(os.getenv("EMOTION_DOWNSAMPLE_SECONDS", "0"))
+# Rows kept for retry after failed inserts before new updates are dropped
+EMOTION_MAX_PENDING = int(os.getenv("EMOTION_MAX_PENDING", "5000"))
+# (user, consultation) pairs whose last emotion is remembered for downsampling
+EMOTION_DOWNSAMPLE_SESSIONS = int(os.getenv("EMOTION_DOWNSAMPLE_SESSIONS", "10000"))
+
+# Allowed by the emotion_logs.emotion_type check constraint
+EMOTION_TYPES = ("calm", "anxious", "distressed", "pain", "sad", "neutral")
+
+
+class EmotionLogBatcher:
+    """Coalesces emotion updates into multi-row inserts by size or time."""
+
+    def __init__(
+        self,
+        dal: SupabaseDataAccess,
+        batch_size: int = EMOTION_BATCH_SIZE,
+        max_delay: float = EMOTION_BATCH_MAX_DELAY_SECONDS,
+        downsample_seconds: float = EMOTION_DOWNSAMPLE_SECONDS
+    ):
+        """
+        Args:
+            dal: Data access layer the rows are written through
+            batch_size: Rows that trigger an immediate flush
+            max_delay: Longest time a row waits before its batch is flushed
+            downsample_seconds: Drop repeats of the previous emotion within
+                this window (0 disables downsampling)
+        """
+        self.dal = dal
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.downsample_seconds = downsample_seconds
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._size_flushes: set = set()
+        # (user_id, consultation_id) -> emotion_type last kept; entries expire
+        # after the downsampling window, so only active sessions are held
+        self._last_kept = TTLCache(ttl=downsample_seconds or 1, max_size=EMOTION_DOWNSAMPLE_SESSIONS)
+
+        self.submitted = 0
+        self.downsampled = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.dropped = 0
+
+    def submit(
+        self,
+        user_id: str,
+        emotion_type: str,
+        confidence_score: float,
+        consultation_id: Optional[str] = None
+    ) -> bool:
+        """
+        Queue one emotion detection for writing.
+
+        Returns:
+            True if queued, False if dropped by downsampling or back-pressure
+
+        Raises:
+            ValueError: If the emotion type or confidence is invalid
+        """
+        if emotion_type not in EMOTION_TYPES:
+            raise ValueError(f"Unknown emotion type: {emotion_type}")
+        try:
+            confidence_score = float(confidence_score)
+        except (TypeError, ValueError):
+            raise ValueError("confidence_score must be a number")
+        if not 0 <= confidence_score <= 1:
+            raise ValueError("confidence_score must be between 0 and 1")
+
+        self.submitted += 1
+        if self.downsample_seconds > 0:
+            key = (user_id, consultation_id)
+            if self._last_kept.get(key) == emotion_type:
+                self.downsampled += 1
+                return False
+            self._last_kept.set(key, emotion_type)
+
+        if len(self._pending) >= EMOTION_MAX_PENDING:
+            self.dropped += 1
+            logger.warning(f"Emotion log queue full; dropping update for {user_id}")
+            return False
+
+        self._pending.append({
+            "user_id": user_id,
+            "emotion_type": emotion_type,
+            "confidence_score": confidence_score,
+            "consultation_id": consultation_id,
+            "created_at": datetime.now().isoformat(),
+        })
+
+        if len(self._pending) >= self.batch_size:
+            task = asyncio.create_task(self.flush())
+            self._size_flushes.add(task)
+            task.add_done_callback(self._size_flushes.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_after_delay())
+        return True
+
+    async def _flush_after_delay(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        await self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """
+        Write every queued row, one insert per ``batch_size`` rows.
+
+        Returns:
+            Number of rows written
+        """
+        written = 0
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    await self.dal.emotion_logs.insert_many(batch)
+                except Exception as e:
+                    self.failed_batches += 1
+                    logger.error(f"Error writing {len(batch)} emotion logs: {e}")
+                    # Keep the rows for the next flush (bounded by EMOTION_MAX_PENDING)
+                    room = max(0, EMOTION_MAX_PENDING - len(self._pending))
+                    self._pending[:0] = batch[:room]
+                    self.dropped += len(batch) - min(room, len(batch))
+                    break
+                self.batches += 1
+                written += len(batch)
+            self.written += written
+        return written
+
+    async def close(self) -> None:
+        """Flush everything and stop the delay timer (application shutdown)."""
+        if self._timer is not None:
+            self._timer.cancel()
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Ingestion counters."""
+        return {
+            "submitted": self.submitted,
+            "downsampled": self.downsampled,
+            "written": self.written,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "dropped": self.dropped,
+            "pending": self.pending,
+            "rows_per_batch": round(self.written / self.batches, 1) if self.batches else 0.0,
+        }
+
+
+# One batcher per data access layer
+_batchers: "weakref.WeakKeyDictionary[SupabaseDataAccess, EmotionLogBatcher]" = weakref.WeakKeyDictionary()
+
+
+def get_emotion_batcher(dal: SupabaseDataAccess) -> EmotionLogBatcher:
+    """Get or create the emotion log batcher bound to a data access layer."""
+    batcher = _batchers.get(dal)
+    if batcher is None:
+        batcher = EmotionLogBatcher(dal)
+        _batchers[dal] = batcher
+    return batcher
@@ -0,0 +1,205 @@
+"""
+Running Emotion Statistics
+
+The emotion summary (per-emotion counts, average confidence, distribution and
+the latest detection) used to be rebuilt on every ``get_stats`` message from
+the ``emotion_stats`` view plus a second query for the latest log. During a
+consultation the client asks for stats after nearly every detection, so each
+one re-aggregated the user's whole history.
+
+``EmotionStatsTracker`` keeps per-user running counters instead:
+
+- The first request for a user seeds the counters from the view and the
+  latest log (two queries, once)
+- Every emotion log written through the data access layer updates the
+  counters in O(1) (write listener on ``emotion_logs``)
+- Summaries are then served from memory without touching Supabase
+
+Counters expire after ``EMOTION_STATS_TTL`` seconds and are re-seeded, which
+bounds drift from writes made by other worker processes.
+
+Usage:
+    tracker = get_emotion_stats_tracker(get_data_access())
+    summary = await tracker.summary(user_id)
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from typing import Any, Dict, List, Optional
+
+from .cache import TTLCache, register_cache
+from .data_access import SupabaseDataAccess
+
+logger = logging.getLogger(__name__)
+
+EMOTION_STATS_TTL_SECONDS = float(os.getenv("EMOTION_STATS_TTL", "300"))
+EMOTION_STATS_CACHE_SIZE = int(os.getenv("EMOTION_STATS_CACHE_SIZE", "10000"))
+
+
+class UserEmotionStats:
+    """Running per-emotion counters for one user."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.counts: Dict[str, int] = {}
+        self.confidence_sums: Dict[str, float] = {}
+        self.first_detected: Dict[str, str] = {}
+        self.last_detected: Dict[str, str] = {}
+        self.last_emotion: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_view(
+        cls,
+        user_id: str,
+        rows: List[Dict[str, Any]],
+        last_emotion: Optional[Dict[str, Any]]
+    ) -> "UserEmotionStats":
+        """Seed counters from ``emotion_stats`` view rows and the latest log."""
+        stats = cls(user_id)
+        for row in rows:
+            emotion_type = row["emotion_type"]
+            count = int(row.get("detection_count") or 0)
+            stats.counts[emotion_type] = count
+            stats.confidence_sums[emotion_type] = float(row.get("avg_confidence") or 0) * count
+            stats.first_detected[emotion_type] = row.get("first_detected")
+            stats.last_detected[emotion_type] = row.get("last_detected")
+        stats.last_emotion = last_emotion
+        return stats
+
+    def add(self, log: Dict[str, Any]) -> None:
+        """Count one new emotion log row."""
+        emotion_type = log["emotion_type"]
+        created_at = log.get("created_at")
+        self.counts[emotion_type] = self.counts.get(emotion_type, 0) + 1
+        self.confidence_sums[emotion_type] = (
+            self.confidence_sums.get(emotion_type, 0.0) + float(log["confidence_score"])
+        )
+        if created_at is not None:
+            first = self.first_detected.get(emotion_type)
+            if first is None or str(created_at) < str(first):
+                self.first_detected[emotion_type] = created_at
+            last = self.last_detected.get(emotion_type)
+            if last is None or str(created_at) > str(last):
+                self.last_detected[emotion_type] = created_at
+        if self.last_emotion is None:
+            self.last_emotion = dict(log)
+        elif created_at is not None:
+            latest = self.last_emotion.get("created_at")
+            if latest is None or str(created_at) >= str(latest):
+                self.last_emotion = dict(log)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Rows shaped like the ``emotion_stats`` view."""
+        return [
+            {
+                "user_id": self.user_id,
+                "emotion_type": emotion_type,
+                "detection_count": count,
+                "avg_confidence": self.confidence_sums[emotion_type] / count,
+                "last_detected": self.last_detected.get(emotion_type),
+                "first_detected": self.first_detected.get(emotion_type),
+            }
+            for emotion_type, count in sorted(self.counts.items())
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        """Dashboard summary, as returned by ``DatabaseClient.get_emotion_summary``."""
+        total = sum(self.counts.values())
+        distribution = {
+            emotion_type: round((count / total) * 100, 1) if total > 0 else 0
+            for emotion_type, count in sorted(self.counts.items())
+        }
+        return {
+            "total_detections": total,
+            "distribution": distribution,
+            "last_emotion": dict(self.last_emotion) if self.last_emotion else None,
+            "stats": self.rows(),
+        }
+
+
+class EmotionStatsTracker:
+    """Per-user running emotion statistics kept current by log writes."""
+
+    def __init__(self, dal: SupabaseDataAccess):
+        self.dal = dal
+        self.users = TTLCache(ttl=EMOTION_STATS_TTL_SECONDS, max_size=EMOTION_STATS_CACHE_SIZE)
+        register_cache("emotion_stats", self.users)
+        # Bumped on writes for a user being seeded so a seed that raced a write is discarded
+        self._writes: Dict[str, int] = {}
+        self._seeding: Dict[str, asyncio.Lock] = {}
+        dal.add_write_listener(self.on_write)
+
+    def on_write(self, table: str, row: Dict[str, Any]) -> None:
+        """Data access write listener for ``emotion_logs``."""
+        if table != "emotion_logs":
+            return
+        user_id = row.get("user_id")
+        if user_id is None:
+            # A delete by id: the affected user is unknown
+            self.users.clear()
+            return
+        if user_id in self._seeding:
+            self._writes[user_id] = self._writes.get(user_id, 0) + 1
+        stats = self.users.get(user_id)
+        if stats is None:
+            return
+        if "emotion_type" in row and "confidence_score" in row:
+            stats.add(row)
+        else:
+            # Bulk delete for the user
+            self.users.invalidate(user_id)
+
+    async def get(self, user_id: str) -> UserEmotionStats:
+        """The user's running counters, seeding them on first use."""
+        stats = self.users.get(user_id)
+        if stats is not None:
+            return stats
+
+        lock = self._seeding.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            stats = self.users.get(user_id)
+            if stats is None:
+                stats = await self._seed(user_id)
+        self._seeding.pop(user_id, None)
+        return stats
+
+    async def _seed(self, user_id: str) -> UserEmotionStats:
+        try:
+            for _ in range(3):
+                writes = self._writes.get(user_id, 0)
+                rows, recent = await asyncio.gather(
+                    self.dal.emotion_stats.for_user(user_id),
+                    self.dal.emotion_logs.recent_for_user(user_id, limit=1),
+                )
+                stats = UserEmotionStats.from_view(user_id, rows, recent[0] if recent else None)
+                if self._writes.get(user_id, 0) == writes:
+                    self.users.set(user_id, stats)
+                    return stats
+            # Writes keep landing mid-seed; serve this snapshot without caching it
+            logger.info(f"Emotion stats for {user_id} not cached: concurrent writes while seeding")
+            return stats
+        finally:
+            self._writes.pop(user_id, None)
+
+    async def summary(self, user_id: str) -> Dict[str, Any]:
+        """Emotion summary for dashboard display."""
+        return (await self.get(user_id)).summary()
+
+    async def stats(self, user_id: str) -> List[Dict[str, Any]]:
+        """Per-emotion statistics, shaped like the ``emotion_stats`` view."""
+        return (await self.get(user_id)).rows()
+
+
+# One tracker per data access layer (its write listener is registered there)
+_trackers: "weakref.WeakKeyDictionary[SupabaseDataAccess, EmotionStatsTracker]" = weakref.WeakKeyDictionary()
+
+
+def get_emotion_stats_tracker(dal: SupabaseDataAccess) -> EmotionStatsTracker:
+    """Get or create the emotion stats tracker bound to a data access layer."""
+    tracker = _trackers.get(dal)
+    if tracker is None:
+        tracker = EmotionStatsTracker(dal)
+        _trackers[dal] = tracker
+    return tracker
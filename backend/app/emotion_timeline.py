@@ -0,0 +1,213 @@
+"""
+Consultation Emotion Timeline
+
+``/api/emotions/consultation/{id}`` returns every raw emotion log and leaves
+bucketing to the frontend, which for a long consultation means thousands of
+rows over the wire. ``EmotionTimeline`` aggregates server-side instead:
+
+- A consultation's logs are loaded once as compact numpy arrays (seconds
+  since the first detection, emotion code, confidence), about 13 bytes per
+  detection instead of a JSON row
+- Any bucket width is computed from those arrays with ``np.bincount``:
+  per bucket the detection count, per-emotion counts, mean confidence and
+  the dominant emotion (most detections, ties broken by total confidence)
+- Arrays of consultations that have ended are cached
+  (``EMOTION_TIMELINE_TTL``); emotion log writes for a consultation drop its
+  entry, so late batched inserts are never hidden
+
+Usage:
+    timeline = get_emotion_timeline(get_data_access())
+    result = await timeline.timeline(consultation_id, bucket_seconds=30)
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .cache import TTLCache, register_cache
+from .data_access import SupabaseDataAccess
+from .emotion_ingest import EMOTION_TYPES
+
+logger = logging.getLogger(__name__)
+
+EMOTION_TIMELINE_TTL_SECONDS = float(os.getenv("EMOTION_TIMELINE_TTL", "3600"))
+EMOTION_TIMELINE_CACHE_SIZE = int(os.getenv("EMOTION_TIMELINE_CACHE_SIZE", "1000"))
+MIN_BUCKET_SECONDS = 1
+MAX_BUCKET_SECONDS = 3600
+
+_EMOTION_CODES = {emotion_type: code for code, emotion_type in enumerate(EMOTION_TYPES)}
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parse a ``created_at`` value; naive timestamps are taken as UTC."""
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _check_bucket_seconds(bucket_seconds: int) -> None:
+    if not MIN_BUCKET_SECONDS <= bucket_seconds <= MAX_BUCKET_SECONDS:
+        raise ValueError(
+            f"bucket_seconds must be between {MIN_BUCKET_SECONDS} and {MAX_BUCKET_SECONDS}"
+        )
+
+
+class EmotionSeries:
+    """A consultation's emotion logs as parallel arrays, in time order."""
+
+    def __init__(self, start: Optional[datetime], offsets: np.ndarray, codes: np.ndarray, confidence: np.ndarray):
+        self.start = start
+        self.offsets = offsets
+        self.codes = codes
+        self.confidence = confidence
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "EmotionSeries":
+        """Build from rows with ``created_at``, ``emotion_type`` and ``confidence_score``."""
+        rows = [row for row in rows if row.get("emotion_type") in _EMOTION_CODES]
+        if not rows:
+            return cls(None, np.empty(0), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.float32))
+
+        times = np.array([_parse_timestamp(row["created_at"]).timestamp() for row in rows])
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+        codes = np.array([_EMOTION_CODES[row["emotion_type"]] for row in rows], dtype=np.uint8)[order]
+        confidence = np.array(
+            [float(row.get("confidence_score") or 0) for row in rows], dtype=np.float32
+        )[order]
+        start = datetime.fromtimestamp(times[0], tz=timezone.utc)
+        return cls(start, times - times[0], codes, confidence)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.codes.nbytes + self.confidence.nbytes
+
+    def buckets(self, bucket_seconds: int) -> List[Dict[str, Any]]:
+        """
+        Aggregate into fixed-width buckets; empty buckets are omitted.
+
+        Raises:
+            ValueError: If the bucket width is out of range
+        """
+        _check_bucket_seconds(bucket_seconds)
+        if not len(self):
+            return []
+
+        # Only occupied buckets get a row, so sparse or very long series stay cheap
+        occupied, index = np.unique((self.offsets // bucket_seconds).astype(np.int64), return_inverse=True)
+        emotion_count = len(EMOTION_TYPES)
+        cells = index * emotion_count + self.codes
+        shape = (len(occupied), emotion_count)
+        counts = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+        confidence_sums = np.bincount(cells, weights=self.confidence, minlength=shape[0] * shape[1]).reshape(shape)
+        totals = counts.sum(axis=1)
+        # Most detections wins; confidence sums (always below the bucket total) break ties
+        dominant = (counts * (totals[:, None] + 1) + confidence_sums).argmax(axis=1)
+        means = confidence_sums.sum(axis=1) / totals
+
+        buckets = []
+        for bucket, number in enumerate(occupied.tolist()):
+            offset = number * bucket_seconds
+            buckets.append({
+                "offset_seconds": offset,
+                "start": (self.start + timedelta(seconds=offset)).isoformat(),
+                "count": int(totals[bucket]),
+                "dominant_emotion": EMOTION_TYPES[dominant[bucket]],
+                "mean_confidence": round(float(means[bucket]), 4),
+                "counts": {
+                    EMOTION_TYPES[code]: int(count)
+                    for code, count in enumerate(counts[bucket].tolist()) if count
+                },
+            })
+        return buckets
+
+
+class EmotionTimeline:
+    """Bucketed consultation emotion timelines, cached once a consultation ends."""
+
+    def __init__(self, dal: SupabaseDataAccess):
+        self.dal = dal
+        self.series = TTLCache(ttl=EMOTION_TIMELINE_TTL_SECONDS, max_size=EMOTION_TIMELINE_CACHE_SIZE)
+        register_cache("emotion_timeline", self.series)
+        # Bumped on every write for a consultation so a load that raced a write is not cached
+        self._writes: Dict[str, int] = {}
+        self._clears = 0
+        dal.add_write_listener(self.on_write)
+
+    def on_write(self, table: str, row: Dict[str, Any]) -> None:
+        """Data access write listener for ``emotion_logs``."""
+        if table != "emotion_logs":
+            return
+        consultation_id = row.get("consultation_id")
+        if consultation_id is not None:
+            self._writes[consultation_id] = self._writes.get(consultation_id, 0) + 1
+            self.series.invalidate(consultation_id)
+        elif "emotion_type" not in row:
+            # Delete by id or for a whole user: the affected consultations are unknown
+            self._clears += 1
+            self.series.clear()
+
+    async def _has_ended(self, consultation_id: str) -> bool:
+        try:
+            consultation = await self.dal.consultations.get(consultation_id, "status, end_time")
+        except Exception as e:
+            # Older schemas have neither column; such timelines are just not cached
+            logger.debug(f"Could not read status of consultation {consultation_id}: {e}")
+            return False
+        return bool(consultation) and (
+            consultation.get("status") == "completed" or consultation.get("end_time") is not None
+        )
+
+    async def load(self, consultation_id: str) -> EmotionSeries:
+        """The consultation's emotion series, from the cache when it has ended."""
+        series = self.series.get(consultation_id)
+        if series is not None:
+            return series
+
+        version = (self._clears, self._writes.get(consultation_id, 0))
+        ended, rows = await asyncio.gather(
+            self._has_ended(consultation_id),
+            self.dal.emotion_logs.samples_for_consultation(consultation_id),
+        )
+        series = EmotionSeries.from_rows(rows)
+        if ended and (self._clears, self._writes.get(consultation_id, 0)) == version:
+            self.series.set(consultation_id, series)
+        return series
+
+    async def timeline(self, consultation_id: str, bucket_seconds: int = 30) -> Dict[str, Any]:
+        """
+        Time-bucketed emotion summary for a consultation.
+
+        Raises:
+            ValueError: If ``bucket_seconds`` is out of range
+        """
+        _check_bucket_seconds(bucket_seconds)
+        series = await self.load(consultation_id)
+        return {
+            "consultation_id": consultation_id,
+            "bucket_seconds": bucket_seconds,
+            "start": series.start.isoformat() if series.start else None,
+            "duration_seconds": round(float(series.offsets[-1]), 3) if len(series) else 0,
+            "total_detections": len(series),
+            "buckets": series.buckets(bucket_seconds),
+        }
+
+
+# One timeline service per data access layer (its write listener is registered there)
+_timelines: "weakref.WeakKeyDictionary[SupabaseDataAccess, EmotionTimeline]" = weakref.WeakKeyDictionary()
+
+
+def get_emotion_timeline(dal: SupabaseDataAccess) -> EmotionTimeline:
+    """Get or create the emotion timeline service bound to a data access layer."""
+    timeline = _timelines.get(dal)
+    if timeline is None:
+        timeline = EmotionTimeline(dal)
+        _timelines[dal] = timeline
+    return timeline
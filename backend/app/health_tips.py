@@ -1,22 +1,35 @@
 """
 Health Tips Generator using Gemini AI
-Generates personalized daily wellness tips for patients
+Generates daily wellness tips for patients
+
+The tips of the day are generated once per day (concurrently), stored in the
+health_tips table and served from memory; see daily_tips.py.
 """
 
+import logging
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional, List
-import google.generativeai as genai
 from datetime import date
-import os
 from dotenv import load_dotenv
 
-load_dotenv()
+from .daily_tips import DailyTips
+from .data_access import get_data_access
+from .llm_gateway import get_llm_gateway
 
-# Configure Gemini AI
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+load_dotenv()
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('nutrition', 'exercise', 'mental_health')
+
+# Served when Gemini fails (not stored; generation is retried later)
+FALLBACK_TIPS = {
+    'nutrition': "Start your day with a glass of water and a balanced breakfast. Include protein, whole grains, and fruits to fuel your body and mind.",
+    'exercise': "Take a 10-minute walk after meals to improve digestion and boost energy. Even small movements throughout the day add up to better health.",
+    'mental_health': "Practice deep breathing for 5 minutes when feeling stressed. Inhale for 4 counts, hold for 4, exhale for 4 - this activates your body's relaxation response."
+}
 
 class HealthTip(BaseModel):
     category: str
@@ -28,11 +41,11 @@ class HealthTipResponse(BaseModel):
     tip: Optional[HealthTip] = None
     error: Optional[str] = None
 
-# Initialize Gemini model
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
+# Initialize Gemini model (shared gateway: rate-limited, retried)
+model = get_llm_gateway().model('gemini-2.0-flash-exp', caller="health_tips")
 
-def generate_health_tip(category: str) -> str:
-    """Generate a health tip using Gemini AI"""
+async def generate_health_tip(category: str) -> str:
+    """Generate a health tip using Gemini AI (raises on failure)"""
     
     prompts = {
         'nutrition': """Generate a single, practical nutrition tip for maintaining good health. 
@@ -66,18 +79,23 @@ def generate_health_tip(category: str) -> str:
         Do not include any introduction or explanation, just the tip itself."""
     }
     
-    try:
-        prompt = prompts.get(category, prompts['nutrition'])
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        # Fallback tips if AI fails
-        fallback_tips = {
-            'nutrition': "Start your day with a glass of water and a balanced breakfast. Include protein, whole grains, and fruits to fuel your body and mind.",
-            'exercise': "Take a 10-minute walk after meals to improve digestion and boost energy. Even small movements throughout the day add up to better health.",
-            'mental_health': "Practice deep breathing for 5 minutes when feeling stressed. Inhale for 4 counts, hold for 4, exhale for 4 - this activates your body's relaxation response."
-        }
-        return fallback_tips.get(category, fallback_tips['nutrition'])
+    prompt = prompts.get(category, prompts['nutrition'])
+    response = await model.generate_content_async(prompt)
+    return response.text.strip()
+
+_daily_tips = None
+
+def get_daily_tips() -> DailyTips:
+    """Process-wide store of the tips of the day"""
+    global _daily_tips
+    if _daily_tips is None:
+        try:
+            dal = get_data_access()
+        except ValueError as e:
+            logger.warning(f"Health tips will not be stored ({e}); keeping them in memory only")
+            dal = None
+        _daily_tips = DailyTips(generate_health_tip, CATEGORIES, FALLBACK_TIPS, dal)
+    return _daily_tips
 
 @router.get("/health-tips/{category}", response_model=HealthTipResponse)
 async def get_health_tip(category: str):
@@ -86,21 +104,20 @@ async def get_health_tip(category: str):
     Categories: nutrition, exercise, mental_health
     """
     
-    valid_categories = ['nutrition', 'exercise', 'mental_health']
-    
-    if category not in valid_categories:
+    if category not in CATEGORIES:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid category. Must be one of: {', '.join(valid_categories)}"
+            detail=f"Invalid category. Must be one of: {', '.join(CATEGORIES)}"
         )
     
     try:
-        tip_text = generate_health_tip(category)
+        daily_tips = get_daily_tips()
+        tip_text = await daily_tips.get(category)
         
         tip = HealthTip(
             category=category,
             tip_text=tip_text,
-            generated_date=date.today()
+            generated_date=daily_tips.today()
         )
         
         return HealthTipResponse(success=True, tip=tip)
@@ -116,13 +133,13 @@ async def get_all_daily_tips():
     """Get all three categories of tips for today"""
     
     try:
+        daily_tips = get_daily_tips()
         tips = {}
-        for category in ['nutrition', 'exercise', 'mental_health']:
-            tip_text = generate_health_tip(category)
+        for category, tip_text in (await daily_tips.get_all()).items():
             tips[category] = {
                 'category': category,
                 'tip_text': tip_text,
-                'generated_date': str(date.today())
+                'generated_date': str(daily_tips.today())
             }
         
         return {
@@ -0,0 +1,251 @@
+"""
+Perceptual-Hash Dedup for Medical Image Uploads
+
+Patients often upload the same photo twice (a retry, a second appointment)
+or a follow-up that is practically identical to the last one, and every
+upload used to pay for a full Gemini Vision analysis. ``ImageHashIndex``
+keeps, per patient, the pHash and dHash of each analysed image
+(``image_preprocessing``) and finds an earlier image that is effectively the
+same picture:
+
+- Both hashes within ``IMAGE_DEDUP_MAX_DISTANCE`` bits (re-encoding,
+  resizing, EXIF rotation and recompression by messaging apps stay within a
+  few bits; different photos differ in 20-30)
+- Same prompt: body part, symptoms and patient description (case,
+  whitespace and symptom order aside), since the analysis depends on them
+- Never for a follow-up upload, which is there to be analysed again
+
+The upload then stores that image's ``ai_analysis`` (marked with
+``reused_from_image_id``) instead of calling the model. A patient's index is
+loaded from ``medical_images`` on their first upload (migration 009 adds the
+hash columns) and kept in memory. Only images whose analysis succeeded are
+indexed. ``IMAGE_DEDUP_MAX_DISTANCE=-1`` turns dedup off; without migration
+009 images are saved without hashes and always analysed, as before.
+
+Usage:
+    index = ImageHashIndex(dal)
+    duplicate = await index.find(patient_id, prepared, body_part, symptoms, description, is_follow_up)
+    analysis = duplicate["ai_analysis"] if duplicate else await analyzer.analyze_image(...)
+    saved = await index.insert(record, prepared)   # stores and indexes the hashes
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .cache import TTLCache, register_cache
+from .data_access import SupabaseDataAccess
+from .image_preprocessing import PreparedImage, hamming_distance
+
+logger = logging.getLogger(__name__)
+
+# Bits in which both hashes may differ for an upload to count as a duplicate
+# (-1 disables dedup)
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+# Patients whose hash index is kept in memory
+IMAGE_INDEX_PATIENTS = int(os.getenv("IMAGE_INDEX_PATIENTS", "1024"))
+IMAGE_INDEX_TTL_SECONDS = float(os.getenv("IMAGE_INDEX_TTL", "3600"))
+
+IMAGE_HASH_COLUMNS = ("image_phash", "image_dhash")
+
+
+# Normalized (body part, symptoms, patient description) of an analysis prompt
+PromptKey = Tuple[str, Tuple[str, ...], str]
+
+
+class IndexedImage(NamedTuple):
+    image_id: str
+    prompt: PromptKey
+    phash: int
+    dhash: int
+
+
+def _text(value: Optional[str]) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def prompt_key(
+    body_part: Optional[str],
+    symptoms: Union[Sequence[str], str, None] = None,
+    patient_description: Optional[str] = None
+) -> PromptKey:
+    """What the analysis depends on besides the image: case, whitespace and symptom order aside."""
+    if isinstance(symptoms, str):
+        symptoms = [symptoms]
+    normalized = sorted({_text(str(symptom)) for symptom in symptoms or ()} - {""})
+    return _text(body_part), tuple(normalized), _text(patient_description)
+
+
+def _record_prompt(record: Dict[str, Any]) -> PromptKey:
+    return prompt_key(record.get("body_part"), record.get("symptoms"), record.get("patient_description"))
+
+
+def image_hash_columns(image: PreparedImage) -> Dict[str, str]:
+    """Hash columns stored with an analysed image."""
+    return {"image_phash": f"{image.phash:016x}", "image_dhash": f"{image.dhash:016x}"}
+
+
+class ImageHashIndex:
+    """Per-patient index of analysed images by perceptual hash."""
+
+    def __init__(
+        self,
+        dal: SupabaseDataAccess,
+        max_distance: int = IMAGE_DEDUP_MAX_DISTANCE,
+        ttl: float = IMAGE_INDEX_TTL_SECONDS,
+        max_patients: int = IMAGE_INDEX_PATIENTS
+    ):
+        """
+        Args:
+            dal: Data access layer for the ``medical_images`` table
+            max_distance: Hamming distance (per hash) up to which images match
+            ttl: Seconds a patient's index is kept before it is reloaded
+            max_patients: Patients whose index is kept in memory
+        """
+        self.dal = dal
+        self.max_distance = max_distance
+        self._patients = register_cache(
+            "medical_image_hashes", TTLCache(ttl=ttl, max_size=max_patients, lru=True)
+        )
+        # False once the hash columns turn out to be missing (no migration 009)
+        self._columns_available = True
+
+        self.lookups = 0
+        self.reused = 0
+        self.analyzed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0 and self._columns_available
+
+    async def find(
+        self,
+        patient_id: str,
+        image: PreparedImage,
+        body_part: Optional[str] = None,
+        symptoms: Union[Sequence[str], str, None] = None,
+        patient_description: Optional[str] = None,
+        is_follow_up: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Earlier analysed image of the patient that ``image`` duplicates.
+
+        Args:
+            patient_id: Uploading patient
+            image: Prepared upload (hashes)
+            body_part, symptoms, patient_description: The upload's prompt;
+                only an image analysed with the same prompt is reused
+            is_follow_up: Follow-ups are always analysed
+
+        Returns:
+            The earlier row (``id``, ``ai_analysis``), or None if the upload
+            needs its own analysis
+        """
+        row = None
+        if self.enabled and not is_follow_up:
+            row = await self._find(patient_id, image, prompt_key(body_part, symptoms, patient_description))
+        if row is None:
+            self.analyzed += 1
+        else:
+            self.reused += 1
+        return row
+
+    async def _find(self, patient_id: str, image: PreparedImage, prompt: PromptKey) -> Optional[Dict[str, Any]]:
+        self.lookups += 1
+        matches = []
+        for entry in await self._entries(patient_id):
+            if entry.prompt != prompt:
+                continue
+            phash_distance = hamming_distance(entry.phash, image.phash)
+            dhash_distance = hamming_distance(entry.dhash, image.dhash)
+            if phash_distance <= self.max_distance and dhash_distance <= self.max_distance:
+                matches.append((phash_distance + dhash_distance, entry))
+
+        for distance, entry in sorted(matches, key=lambda match: match[0]):
+            try:
+                row = await self.dal.medical_images.get(entry.image_id, "id, ai_analysis")
+            except Exception as e:
+                logger.warning(f"Could not read the analysis of image {entry.image_id}: {e}")
+                return None
+            analysis = row.get("ai_analysis") if row else None
+            if isinstance(analysis, dict) and "error" not in analysis:
+                logger.info(
+                    f"Upload for patient {patient_id} duplicates image {entry.image_id} "
+                    f"({distance} bits apart): reusing its analysis"
+                )
+                return row
+            # Deleted or without a usable analysis
+            self.discard(patient_id, entry.image_id)
+        return None
+
+    async def insert(self, record: Dict[str, Any], image: Optional[PreparedImage]) -> Optional[Dict[str, Any]]:
+        """
+        Insert an image row with its hashes and index it.
+
+        The hashes are left out when the analysis failed (nothing to reuse)
+        or the columns are missing (migration 009 not applied).
+        """
+        analysis = record.get("ai_analysis")
+        indexable = (
+            image is not None and self.enabled
+            and isinstance(analysis, dict) and "error" not in analysis
+        )
+        if not indexable:
+            return await self.dal.medical_images.insert(record)
+
+        try:
+            saved = await self.dal.medical_images.insert({**record, **image_hash_columns(image)})
+        except Exception as e:
+            if not any(column in str(e) for column in IMAGE_HASH_COLUMNS):
+                raise
+            logger.warning(f"Image hash columns missing (run migration 009_add_medical_image_hashes.sql): {e}")
+            self._columns_available = False
+            return await self.dal.medical_images.insert(record)
+
+        entries = self._patients.get(record["patient_id"])
+        if saved and entries is not None:
+            entries.append(IndexedImage(saved["id"], _record_prompt(record), image.phash, image.dhash))
+        return saved
+
+    def discard(self, patient_id: str, image_id: str) -> None:
+        """Forget a deleted image."""
+        entries = self._patients.get(patient_id)
+        if entries is not None:
+            entries[:] = [entry for entry in entries if entry.image_id != image_id]
+
+    async def _entries(self, patient_id: str) -> List[IndexedImage]:
+        entries = self._patients.get(patient_id)
+        if entries is not None:
+            return entries
+        try:
+            rows = await self.dal.medical_images.hashes_for_patient(patient_id)
+        except Exception as e:
+            if any(column in str(e) for column in IMAGE_HASH_COLUMNS):
+                logger.warning(f"Image hash columns missing (run migration 009_add_medical_image_hashes.sql): {e}")
+                self._columns_available = False
+            else:
+                logger.warning(f"Could not load image hashes of patient {patient_id}: {e}")
+            return []
+        entries = []
+        for row in rows:
+            try:
+                entries.append(IndexedImage(
+                    row["id"], _record_prompt(row), int(row["image_phash"], 16), int(row["image_dhash"], 16)
+                ))
+            except (TypeError, ValueError):
+                continue
+        self._patients.set(patient_id, entries)
+        return entries
+
+    def stats(self) -> Dict[str, Any]:
+        """Dedup counters: uploads analysed vs reused."""
+        uploads = self.reused + self.analyzed
+        return {
+            "enabled": self.enabled,
+            "max_distance": self.max_distance,
+            "lookups": self.lookups,
+            "analyses_reused": self.reused,
+            "analyses_run": self.analyzed,
+            "reuse_rate": round(self.reused / uploads, 3) if uploads else 0.0,
+            "patients_indexed": len(self._patients),
+        }
@@ -0,0 +1,197 @@
+"""
+Image Preprocessing for Gemini Vision
+
+Patient uploads (up to 10 MB, often 12+ megapixel phone photos) used to be
+opened in full and handed to the SDK as PIL images, which the SDK re-encodes
+as lossless WebP: slow to encode and frequently larger than the upload.
+``prepare_image`` turns an upload into what the model actually needs:
+
+1. Decode at reduced size where the format allows it (JPEG draft mode decodes
+   at 1/2, 1/4 or 1/8 scale directly from the DCT coefficients)
+2. Apply the EXIF orientation, so sideways phone photos are analysed upright
+3. Downscale to ``IMAGE_MAX_SIDE`` (Gemini tiles images at 768 px, so
+   anything larger only costs bandwidth and tokens)
+4. Re-encode as JPEG at ``IMAGE_JPEG_QUALITY`` (transparency flattened onto
+   white); an upload that is already a small upright JPEG is sent as is when
+   re-encoding would not make it smaller
+
+The result carries two 64-bit perceptual hashes (pHash: DCT of a 32x32
+greyscale thumbnail; dHash: brightness gradients of a 9x8 one) that survive
+re-encoding and resizing; image_dedup.py uses them to find re-uploads. Prepared images are kept in
+a small LRU cache keyed by the upload's digest, so an image that is compared
+against several follow-ups is decoded once.
+
+Usage:
+    prepared = prepare_image(upload_bytes)
+    response = await model.generate_content_async([prompt, prepared.part()])
+"""
+
+import hashlib
+import io
+import os
+import threading
+from typing import Any, Dict, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .cache import TTLCache, register_cache
+
+# Longest side sent to the model, in pixels
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+# JPEG quality of re-encoded images
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Prepared images kept in memory (by upload digest)
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "64"))
+IMAGE_CACHE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL", "3600"))
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+class PreparedImage(NamedTuple):
+    """An upload ready to send to the model."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    phash: int
+    dhash: int
+
+    def part(self) -> Dict[str, Any]:
+        """Inline-data part for ``generate_content``."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix: ``m @ x`` is the DCT of the columns of ``x``."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(image: Image.Image) -> int:
+    """
+    64-bit perceptual hash: the signs of the lowest 8x8 DCT frequencies of a
+    32x32 greyscale thumbnail relative to their median.
+    """
+    grey = image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(grey, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    64-bit difference hash: whether each pixel of a 9x8 greyscale thumbnail
+    is brighter than its left neighbour.
+    """
+    grey = image.convert("L").resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(grey, dtype=np.int16)
+    return _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _target_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    width, height = size
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """RGB copy of ``image``, with any transparency flattened onto white."""
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if image.mode.startswith("I;16"):
+        # 16-bit greyscale (some scans): keep the high byte
+        image = image.convert("I").point(lambda value: value / 256).convert("L")
+    return image.convert("RGB")
+
+
+def prepare_image(
+    image_data: bytes,
+    max_side: int = IMAGE_MAX_SIDE,
+    quality: int = IMAGE_JPEG_QUALITY
+) -> PreparedImage:
+    """
+    Decode, orient, downscale and re-encode an uploaded image.
+
+    Args:
+        image_data: Uploaded image bytes (any format PIL reads)
+        max_side: Longest side of the result, in pixels
+        quality: JPEG quality of the result
+
+    Returns:
+        PreparedImage (cached by the upload's digest)
+
+    Raises:
+        PIL.UnidentifiedImageError: If the bytes are not a readable image
+    """
+    key = (hashlib.sha256(image_data).digest(), max_side, quality)
+    with _cache_lock:
+        prepared = _prepared_images.get(key)
+    if prepared is not None:
+        return prepared
+
+    image = Image.open(io.BytesIO(image_data))
+    source_format, source_size = image.format, image.size
+    orientation = image.getexif().get(0x0112, 1)
+    if source_format == "JPEG":
+        # Decode straight at the smallest scale that is still >= the target
+        image.draft("RGB", _target_size(source_size, max_side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    image = _to_rgb(image)
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    data = output.getvalue()
+    if (
+        source_format == "JPEG"
+        and orientation == 1
+        and max(source_size) <= max_side
+        and len(image_data) <= len(data)
+    ):
+        # Already small and upright: the upload itself is the smaller payload
+        data = image_data
+
+    prepared = PreparedImage(
+        data=data,
+        mime_type="image/jpeg",
+        width=image.width,
+        height=image.height,
+        original_bytes=len(image_data),
+        phash=phash(image),
+        dhash=dhash(image),
+    )
+    with _cache_lock:
+        _prepared_images.set(key, prepared)
+    return prepared
+
+
+# prepare_image runs on worker threads
+_cache_lock = threading.Lock()
+_prepared_images = register_cache(
+    "prepared_images",
+    TTLCache(ttl=IMAGE_CACHE_TTL_SECONDS, max_size=IMAGE_CACHE_SIZE, lru=True)
+)
@@ -0,0 +1,370 @@
+"""
+Background Job Queue
+
+Medical image and lab report uploads used to do everything inside the HTTP
+request: storage upload, OCR, a Gemini analysis and the database insert,
+holding the connection (and a server worker) for tens of seconds. With
+``?background=true`` the upload endpoints now only validate and enqueue;
+``JobQueue`` does the rest:
+
+- Jobs are rows in a local SQLite file (``JOB_QUEUE_PATH``); uploaded bytes
+  are spooled next to it. A restart re-queues jobs that were queued or
+  running, so no accepted upload is lost
+- ``JOB_WORKERS`` worker tasks run jobs concurrently; the rest wait in FIFO
+  order
+- A failing job is retried up to ``JOB_MAX_ATTEMPTS`` times with exponential
+  backoff; ``JobError`` marks a failure that retrying cannot fix
+- Clients poll ``GET /api/jobs/{id}`` or get each status change pushed over
+  ``/api/jobs/{id}/ws`` (app/jobs.py); finished jobs are kept for
+  ``JOB_RETENTION`` seconds
+
+Jobs are claimed by the process that enqueued them (or that recovers them at
+startup), so each server process needs its own ``JOB_QUEUE_PATH``.
+
+Usage:
+    queue = get_job_queue()
+    queue.register("lab_report", process_lab_report)   # async (payload, data) -> result dict
+    queue.start()
+    job_id = await queue.enqueue("lab_report", {"patient_id": ...}, file_bytes)
+    job = queue.get(job_id)    # {"status": "queued" | "running" | "completed" | "failed", ...}
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "uploads/jobs/jobs.db")
+# Jobs running at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Delay before the first retry; doubles with each attempt (with jitter)
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY", "2.0"))
+# Seconds finished jobs (and their status) are kept
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION", "86400"))
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+FINISHED = (COMPLETED, FAILED)
+
+# Queue waits kept for the percentile in stats()
+_LATENCY_SAMPLES = 1000
+
+JobHandler = Callable[[Dict[str, Any], Optional[bytes]], Awaitable[Dict[str, Any]]]
+FailureHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class JobError(Exception):
+    """A job failure that retrying cannot fix (bad input); the job fails at once."""
+
+
+class JobQueue:
+    """SQLite-backed queue of background jobs with a bounded worker pool."""
+
+    def __init__(
+        self,
+        path: str = JOB_QUEUE_PATH,
+        workers: int = JOB_WORKERS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_delay: float = JOB_RETRY_DELAY_SECONDS,
+        retention: float = JOB_RETENTION_SECONDS
+    ):
+        """
+        Args:
+            path: SQLite file of the queue (uploaded bytes are spooled in its directory)
+            workers: Jobs run concurrently
+            max_attempts: Runs of a job before it fails
+            retry_delay: Seconds before the first retry (doubled per attempt)
+            retention: Seconds finished jobs are kept
+        """
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self._handlers: Dict[str, JobHandler] = {}
+        self._failure_handlers: Dict[str, FailureHandler] = {}
+
+        self._spool = Path(path).parent / "spool"
+        self._spool.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, data_path TEXT, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, run_after REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, run_after)")
+        self._db_lock = threading.Lock()
+
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._timers: List[asyncio.TimerHandle] = []
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.recovered = 0
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started_at: Optional[float] = None
+        self._waits: deque = deque(maxlen=_LATENCY_SAMPLES)
+
+    def register(self, kind: str, handler: JobHandler, on_failure: Optional[FailureHandler] = None) -> None:
+        """
+        Run ``await handler(payload, data)`` for jobs of ``kind``; its dict is the job's result.
+
+        ``await on_failure(payload)`` cleans up after a job that failed for good.
+        """
+        self._handlers[kind] = handler
+        if on_failure is not None:
+            self._failure_handlers[kind] = on_failure
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def _execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        with self._db_lock:
+            return self._db.execute(sql, parameters)
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], data: Optional[bytes] = None) -> str:
+        """
+        Persist a job and hand it to the workers.
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable job arguments
+            data: Uploaded bytes, spooled to disk until the job finishes
+
+        Returns:
+            Job id
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        self.start()
+        job_id = str(uuid.uuid4())
+        data_path = None
+        if data is not None:
+            data_path = str(self._spool / job_id)
+            await asyncio.to_thread(Path(data_path).write_bytes, data)
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, payload, data_path, status, created_at, run_after) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), data_path, QUEUED, now, now)
+        )
+        self.enqueued += 1
+        self._ready.put_nowait(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job (result when completed, error when failed), or None if unknown."""
+        row = self._execute(
+            "SELECT id, kind, status, attempts, result, error, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._snapshot(row) if row else None
+
+    @staticmethod
+    def _snapshot(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the job's status now and after every change, until it has finished."""
+        updates: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, []).append(updates)
+        try:
+            job = self.get(job_id)
+            while job is not None:
+                yield job
+                if job["status"] in FINISHED:
+                    return
+                job = await updates.get()
+        finally:
+            listeners = self._listeners.get(job_id, [])
+            if updates in listeners:
+                listeners.remove(updates)
+            if not listeners:
+                self._listeners.pop(job_id, None)
+
+    def _notify(self, job_id: str) -> None:
+        listeners = self._listeners.get(job_id)
+        if listeners:
+            job = self.get(job_id)
+            for updates in listeners:
+                updates.put_nowait(job)
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the workers (once per event loop) and re-queue unfinished jobs."""
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._started_at = time.monotonic()
+        self._busy_seconds = 0.0
+
+        # Jobs of a previous run: running ones were interrupted
+        now = time.time()
+        self._execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                      (COMPLETED, FAILED, now - self.retention))
+        interrupted = self._execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)).rowcount
+        pending = self._execute(
+            "SELECT id, run_after FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+        ).fetchall()
+        for row in pending:
+            self._schedule(row["id"], row["run_after"] - now)
+        self.recovered += len(pending)
+        if pending:
+            logger.info(f"Job queue resumed {len(pending)} unfinished jobs ({interrupted} interrupted)")
+        self._purge_spool()
+
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    def _schedule(self, job_id: str, delay: float) -> None:
+        if delay <= 0:
+            self._ready.put_nowait(job_id)
+        else:
+            self._timers.append(asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, job_id))
+
+    def _purge_spool(self) -> None:
+        """Remove spooled uploads of jobs that no longer exist."""
+        known = {row[0] for row in self._execute("SELECT data_path FROM jobs WHERE data_path IS NOT NULL")}
+        for path in self._spool.iterdir():
+            if str(path) not in known:
+                path.unlink(missing_ok=True)
+
+    def _claim(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._db_lock:
+            claimed = self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED)
+            ).rowcount
+            if not claimed:
+                return None
+            return self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._ready.get()
+            job = self._claim(job_id)
+            if job is None:
+                continue
+            self._waits.append(job["started_at"] - job["run_after"])
+            self._notify(job_id)
+            self._busy += 1
+            started = time.monotonic()
+            try:
+                await self._run(job)
+            finally:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - started
+
+    async def _run(self, job: sqlite3.Row) -> None:
+        job_id, attempts = job["id"], job["attempts"]
+        try:
+            handler = self._handlers.get(job["kind"])
+            if handler is None:
+                raise JobError(f"No handler registered for job kind {job['kind']!r}")
+            data = await asyncio.to_thread(Path(job["data_path"]).read_bytes) if job["data_path"] else None
+            result = await handler(json.loads(job["payload"]), data)
+        except asyncio.CancelledError:
+            # Shutdown: run it again after the restart
+            self._execute("UPDATE jobs SET status = ?, attempts = attempts - 1 WHERE id = ?", (QUEUED, job_id))
+            raise
+        except Exception as e:
+            if isinstance(e, JobError) or attempts >= self.max_attempts:
+                logger.error(f"Job {job_id} ({job['kind']}) failed after {attempts} attempts: {e}")
+                self._finish(job, FAILED, error=str(e) or type(e).__name__)
+                self.failed += 1
+                on_failure = self._failure_handlers.get(job["kind"])
+                if on_failure is not None:
+                    try:
+                        await on_failure(json.loads(job["payload"]))
+                    except Exception as cleanup_error:
+                        logger.warning(f"Cleanup of failed job {job_id} failed: {cleanup_error}")
+                return
+            delay = self.retry_delay * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"Job {job_id} ({job['kind']}) attempt {attempts} failed, retrying in {delay:.1f}s: {e}")
+            self._execute("UPDATE jobs SET status = ?, error = ?, run_after = ? WHERE id = ?",
+                          (QUEUED, str(e), time.time() + delay, job_id))
+            self.retried += 1
+            self._notify(job_id)
+            self._schedule(job_id, delay)
+            return
+        self._finish(job, COMPLETED, result=result)
+        self.completed += 1
+
+    def _finish(self, job: sqlite3.Row, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, data_path = NULL WHERE id = ?",
+            (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job["id"])
+        )
+        if job["data_path"]:
+            Path(job["data_path"]).unlink(missing_ok=True)
+        self._notify(job["id"])
+
+    async def drain(self) -> None:
+        """Wait until every queued job, including retries, has finished."""
+        while self._execute("SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", (QUEUED, RUNNING)).fetchone():
+            await asyncio.sleep(0.05)
+
+    async def close(self) -> None:
+        """Stop the workers; interrupted and queued jobs resume on the next start."""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, outcomes, queue wait and worker utilization."""
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        waits = sorted(self._waits)
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "utilization": round(self._busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "queue_wait_p50_seconds": round(waits[len(waits) // 2], 3) if waits else None,
+            "queue_wait_p95_seconds": round(waits[int(len(waits) * 0.95)], 3) if waits else None,
+        }
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue used by the upload endpoints."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,47 @@
+"""
+Background Job API endpoints
+
+Status of jobs enqueued by the upload endpoints (``?background=true``);
+see job_queue.py.
+"""
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from .job_queue import get_job_queue
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.get("/stats")
+async def get_job_stats():
+    """Queue depth, outcomes, queue wait and worker utilization"""
+    return get_job_queue().stats()
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of a background job
+
+    status is queued, running, completed (with result) or failed (with error).
+    """
+    job = get_job_queue().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.websocket("/{job_id}/ws")
+async def watch_job(websocket: WebSocket, job_id: str):
+    """Push the job's status on connect and on every change; closes once it has finished"""
+    await websocket.accept()
+    try:
+        found = False
+        async for job in get_job_queue().watch(job_id):
+            found = True
+            await websocket.send_json(job)
+        if not found:
+            await websocket.send_json({"id": job_id, "error": "Job not found"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
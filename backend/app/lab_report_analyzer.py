@@ -3,12 +3,13 @@ Lab Report Analyzer Module
 Extracts text from PDF/images and analyzes using Gemini AI
 """
 
-import os
-import json
 from typing import Dict, List, Optional
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from .llm_gateway import get_llm_gateway
+from .llm_json import LLMOutputError, json_generation_config, parse_llm_json
+from .models import LabReportAnalysis
+
 # PDF processing
 import PyPDF2
 import pdfplumber
@@ -23,15 +24,16 @@ except ImportError:
 
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-
 
 class LabReportAnalyzer:
     """Analyzes lab reports from PDF or image files"""
     
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = get_llm_gateway().model(
+            'gemini-2.5-flash',
+            caller="lab_report_analyzer",
+            generation_config=json_generation_config(LabReportAnalysis)
+        )
     
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF using pdfplumber"""
@@ -132,20 +134,13 @@ Important:
         
         try:
             response = await self.model.generate_content_async(prompt)
-            result_text = response.text
-            
-            # Try to extract JSON from response
-            # Sometimes Gemini wraps JSON in markdown code blocks
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0].strip()
             
-            # Parse JSON
-            analysis = json.loads(result_text)
+            # Parse JSON (JSON mode; tolerant of fences and prose). A truncated
+            # reply is not repaired, since the analysis is stored with the report
+            analysis = parse_llm_json(response.text, LabReportAnalysis, allow_repair=False)
             return analysis
             
-        except json.JSONDecodeError as e:
+        except LLMOutputError as e:
             # If JSON parsing fails, return a structured error
             return {
                 "values": [],
@@ -3,16 +3,18 @@ Lab Reports API Routes
 Handles file upload, text extraction, and AI analysis
 """
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
 from fastapi.responses import JSONResponse
-from typing import Optional
+from typing import Any, Dict, Optional
 import os
 import uuid
 import shutil
 from pathlib import Path
 
 from .lab_report_analyzer import get_lab_report_analyzer
-from .database import DatabaseClient
+from .data_access import get_data_access
+from .job_queue import JobError, get_job_queue
+from .streaming import ndjson_response
 
 router = APIRouter(prefix="/api/lab-reports", tags=["Lab Reports"])
 
@@ -20,16 +22,21 @@ router = APIRouter(prefix="/api/lab-reports", tags=["Lab Reports"])
 UPLOAD_DIR = Path("uploads/lab_reports")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-db_client = DatabaseClient()
+db = get_data_access()
 
 
 @router.post("/upload")
 async def upload_lab_report(
     file: UploadFile = File(...),
-    patient_id: str = Form(...)
+    patient_id: str = Form(...),
+    background: bool = False
 ):
     """
     Upload and analyze a lab report (PDF or image)
+    
+    With background=true the report is analyzed by a background job: the
+    response (202) holds its job id, and the job's result the report id and
+    analysis (GET /api/jobs/{job_id}).
     """
     try:
         # Validate file type
@@ -51,37 +58,33 @@ async def upload_lab_report(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Determine file type for processing
-        file_type = 'pdf' if file_extension == 'pdf' else 'image'
-        
-        # Process and analyze
-        analyzer = get_lab_report_analyzer()
-        result = await analyzer.process_lab_report(str(file_path), file_type)
-        
-        if not result['success']:
-            # Clean up file
-            os.remove(file_path)
-            raise HTTPException(status_code=400, detail=result.get('error', 'Analysis failed'))
-        
-        # Save to database
-        lab_report_data = {
+        upload = {
             'patient_id': patient_id,
             'file_name': file.filename,
             'file_path': str(file_path),
-            'file_type': file_type,
-            'extracted_text': result['extracted_text'],
-            'analysis_result': result['analysis'],
-            'status': 'completed'
+            # Determine file type for processing
+            'file_type': 'pdf' if file_extension == 'pdf' else 'image'
         }
         
-        # Insert into database
-        db_result = db_client.client.table('lab_reports').insert(lab_report_data).execute()
+        if background:
+            job_id = await get_job_queue().enqueue("lab_report", upload)
+            return JSONResponse(status_code=202, content={
+                "success": True,
+                "message": "Lab report queued for analysis",
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}"
+            })
+        
+        try:
+            processed = await process_lab_report(upload)
+        except JobError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         return JSONResponse(content={
             "success": True,
             "message": "Lab report analyzed successfully",
-            "report_id": db_result.data[0]['id'] if db_result.data else None,
-            "analysis": result['analysis']
+            **processed
         })
         
     except HTTPException:
@@ -94,45 +97,102 @@ async def upload_lab_report(
         raise HTTPException(status_code=500, detail=f"Error processing lab report: {str(e)}")
 
 
+async def process_lab_report(upload: Dict[str, Any], data: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Analyze a saved lab report file and store the result (inline or as a background job)
+    
+    Returns the report id and analysis; raises JobError (after removing the
+    file) when the report cannot be analyzed.
+    """
+    # Process and analyze
+    analyzer = get_lab_report_analyzer()
+    result = await analyzer.process_lab_report(upload['file_path'], upload['file_type'])
+    
+    if not result['success']:
+        # Clean up file
+        await remove_lab_report_file(upload)
+        raise JobError(result.get('error', 'Analysis failed'))
+    
+    # Save to database
+    lab_report_data = {
+        **upload,
+        'extracted_text': result['extracted_text'],
+        'analysis_result': result['analysis'],
+        'status': 'completed'
+    }
+    
+    # Insert into database
+    saved = await db.lab_reports.insert(lab_report_data)
+    
+    return {
+        "report_id": saved['id'] if saved else None,
+        "analysis": result['analysis']
+    }
+
+
+async def remove_lab_report_file(upload: Dict[str, Any]) -> None:
+    """Remove the file of a report that could not be processed"""
+    if os.path.exists(upload['file_path']):
+        os.remove(upload['file_path'])
+
+
+get_job_queue().register("lab_report", process_lab_report, on_failure=remove_lab_report_file)
+
+
 @router.get("/patient/{patient_id}")
-async def get_patient_lab_reports(patient_id: str):
+async def get_patient_lab_reports(
+    patient_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    include: Optional[str] = Query(None, description="Comma-separated optional fields: extracted_text, analysis_result")
+):
     """
-    Get all lab reports for a patient
+    Get a patient's lab reports, newest first
+    
+    Extracted text and analysis are left out unless requested with include.
+    Pass next_cursor back as cursor to fetch the next page.
     """
     try:
-        result = db_client.client.table('lab_reports')\
-            .select('*')\
-            .eq('patient_id', patient_id)\
-            .order('uploaded_at', desc=True)\
-            .execute()
+        fields = [f.strip() for f in include.split(',') if f.strip()] if include else []
+        reports, next_cursor = await db.lab_reports.page_for_patient(patient_id, cursor, limit, fields)
         
         return JSONResponse(content={
             "success": True,
-            "reports": result.data
+            "reports": reports,
+            "next_cursor": next_cursor
         })
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching lab reports: {str(e)}")
 
 
+@router.get("/patient/{patient_id}/export")
+async def export_patient_lab_reports(patient_id: str):
+    """
+    Stream every lab report of a patient, with text and analysis, as NDJSON
+    """
+    return ndjson_response(
+        db.lab_reports.iter_for_patient(patient_id),
+        f"lab-reports-{patient_id}.ndjson"
+    )
+
+
 @router.get("/{report_id}")
 async def get_lab_report(report_id: str):
     """
     Get a specific lab report by ID
     """
     try:
-        result = db_client.client.table('lab_reports')\
-            .select('*')\
-            .eq('id', report_id)\
-            .single()\
-            .execute()
+        report = await db.lab_reports.get(report_id)
         
-        if not result.data:
+        if not report:
             raise HTTPException(status_code=404, detail="Lab report not found")
         
         return JSONResponse(content={
             "success": True,
-            "report": result.data
+            "report": report
         })
         
     except HTTPException:
@@ -148,22 +208,18 @@ async def delete_lab_report(report_id: str):
     """
     try:
         # Get report to find file path
-        result = db_client.client.table('lab_reports')\
-            .select('file_path')\
-            .eq('id', report_id)\
-            .single()\
-            .execute()
+        report = await db.lab_reports.get(report_id, 'file_path')
         
-        if not result.data:
+        if not report:
             raise HTTPException(status_code=404, detail="Lab report not found")
         
         # Delete file if it exists
-        file_path = result.data.get('file_path')
+        file_path = report.get('file_path')
         if file_path and os.path.exists(file_path):
             os.remove(file_path)
         
         # Delete from database
-        db_client.client.table('lab_reports').delete().eq('id', report_id).execute()
+        await db.lab_reports.delete(report_id)
         
         return JSONResponse(content={
             "success": True,
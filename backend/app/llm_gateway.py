@@ -0,0 +1,383 @@
+"""
+Shared Gemini Gateway
+
+The alert engine, the SOAP summarizer, the lab report and medical image
+analyzers, health tips and voice intake each configured ``genai`` and called
+the model on their own: some with the blocking ``generate_content`` inside
+request handlers, none with any limit on how fast they call. ``LLMGateway``
+is the one path to the model:
+
+- Async for every caller: Gemini models use ``generate_content_async``
+  (or the blocking call on a worker thread over the REST transport, whose
+  async call is not supported), and sync-only model objects run on worker
+  threads, so the event loop never waits on the model
+- A token bucket per model (``LLM_RATE_LIMITS``, requests per minute):
+  calls beyond the limit wait their turn instead of failing with 429
+- Retries on 429 and 5xx with full-jitter exponential backoff
+  (``LLM_MAX_RETRIES``), so callers hitting a limit together do not retry
+  in lockstep
+- Single-flight: identical text prompts to the same model that are already
+  in flight share one call
+- Per-caller metrics (``stats()``, ``GET /api/llm/stats``): calls,
+  coalesced calls, retries, errors, time spent throttled, latency and
+  prompt/output tokens
+
+Usage:
+    model = get_llm_gateway().model("models/gemini-2.5-flash", caller="summarizer")
+    response = await model.generate_content_async(prompt)
+
+    # or, for a model object owned by the caller:
+    response = await get_llm_gateway().generate(model, prompt, caller="alert_engine")
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# "model=requests per minute" pairs; models not listed are not limited
+LLM_RATE_LIMITS = os.getenv(
+    "LLM_RATE_LIMITS",
+    "gemini-2.5-flash=1000,gemini-2.0-flash-exp=10"
+)
+# Requests a model may send at once after being idle
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX", "8"))
+# Worker threads for blocking model calls
+LLM_THREADS = int(os.getenv("LLM_THREADS", "16"))
+# Alternative API endpoint (a proxy, or a local fake in tests); uses the REST transport
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# Latencies kept per caller for the percentile in stats()
+_LATENCY_SAMPLES = 1000
+
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+def _model_key(model: Any) -> str:
+    """Rate-limit key: the Gemini model name without the "models/" prefix."""
+    name = getattr(model, "model_name", None) or type(model).__name__
+    return name[len("models/"):] if name.startswith("models/") else name
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """``"a=60,b=10"`` -> ``{"a": 60.0, "b": 10.0}`` (requests per minute)."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, rpm = item.partition("=")
+        name = name.strip()
+        limits[name[len("models/"):] if name.startswith("models/") else name] = float(rpm)
+    return limits
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429 and 5xx responses (google.api_core exceptions carry the HTTP code)."""
+    for attribute in ("code", "status_code"):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int) and code in _RETRYABLE_CODES:
+            return True
+    return False
+
+
+class TokenBucket:
+    """Requests-per-minute limiter; a caller reserves a token and sleeps until it is due."""
+
+    def __init__(self, requests_per_minute: float, burst: int = LLM_BURST):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.throttled = 0
+
+    def reserve(self) -> float:
+        """Take one token; returns the seconds to wait before using it (FIFO)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        self.throttled += 1
+        return -self.tokens / self.rate
+
+
+class _CallerStats:
+    """Counters for one caller."""
+
+    def __init__(self, caller: str):
+        self.caller = caller
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies: deque = deque(maxlen=_LATENCY_SAMPLES)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "errors": self.errors,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else 0.0,
+        }
+
+
+class GatewayModel:
+    """A Gemini model whose calls go through the gateway (drop-in for ``GenerativeModel``)."""
+
+    def __init__(self, gateway: "LLMGateway", model: Any, caller: str):
+        self.gateway = gateway
+        self.model = model
+        self.caller = caller
+        self.model_name = getattr(model, "model_name", None)
+
+    async def generate_content_async(self, contents: Any, **kwargs) -> Any:
+        return await self.gateway.generate(self.model, contents, caller=self.caller, **kwargs)
+
+
+class LLMGateway:
+    """Rate-limited, retrying, coalescing access to Gemini, with per-caller metrics."""
+
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, float]] = None,
+        burst: int = LLM_BURST,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base: float = LLM_RETRY_BASE_SECONDS,
+        retry_max: float = LLM_RETRY_MAX_SECONDS,
+        threads: int = LLM_THREADS,
+        api_endpoint: Optional[str] = GEMINI_API_ENDPOINT
+    ):
+        """
+        Args:
+            rate_limits: Requests per minute per model name (default ``LLM_RATE_LIMITS``)
+            burst: Bucket capacity per model
+            max_retries: Retries of a 429/5xx response before giving up
+            retry_base: First backoff ceiling in seconds (doubled per retry)
+            retry_max: Largest backoff ceiling in seconds
+            threads: Worker threads for blocking model calls
+            api_endpoint: Alternative Gemini endpoint (REST transport)
+        """
+        self.rate_limits = parse_rate_limits(LLM_RATE_LIMITS) if rate_limits is None else dict(rate_limits)
+        self.burst = burst
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.api_endpoint = api_endpoint
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="llm")
+        self._buckets: Dict[str, TokenBucket] = {}
+        # In-flight calls per event loop (futures belong to one loop)
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._callers: Dict[str, _CallerStats] = {}
+        self._configured = False
+
+    # ------------------------------------------------------------------
+    # Models
+    # ------------------------------------------------------------------
+
+    def configure(self, api_key: Optional[str] = None) -> bool:
+        """Configure ``genai`` once for the whole app; False without an API key."""
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            return False
+        if not self._configured:
+            if self.api_endpoint:
+                genai.configure(api_key=api_key, transport="rest",
+                                client_options={"api_endpoint": self.api_endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            self._configured = True
+        return True
+
+    def model(
+        self,
+        model_name: str,
+        caller: str,
+        generation_config: Optional[Dict[str, Any]] = None
+    ) -> GatewayModel:
+        """Gemini model for ``caller``, configuring ``genai`` on first use."""
+        self.configure()
+        return GatewayModel(self, genai.GenerativeModel(model_name, generation_config=generation_config), caller)
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+
+    async def generate(self, model: Any, contents: Any, caller: str, **kwargs) -> Any:
+        """
+        ``model.generate_content(contents, **kwargs)`` through the limiter, retries and single-flight.
+
+        Raises:
+            The model's error once retries are exhausted or for non-retryable errors
+        """
+        stats = self._caller(caller)
+        stats.calls += 1
+        key = self._flight_key(model, contents, kwargs)
+        if key is None:
+            return await self._call(model, contents, kwargs, stats)
+
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        while (pending := inflight.get(key)) is not None:
+            stats.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The leader was cancelled, not this caller: lead (or follow) a new call
+                stats.coalesced -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        inflight[key] = future
+        try:
+            response = await self._call(model, contents, kwargs, stats)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers get the same error; mark it retrieved in case there are none
+            future.exception()
+            raise
+        finally:
+            inflight.pop(key, None)
+
+    async def _call(self, model: Any, contents: Any, kwargs: Dict[str, Any], stats: _CallerStats) -> Any:
+        attempt = 0
+        while True:
+            await self._throttle(model, stats)
+            started = time.monotonic()
+            try:
+                response = await self._invoke(model, contents, kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    stats.errors += 1
+                    raise
+                # Full jitter: uniform in [0, base * 2^attempt], capped
+                delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+                attempt += 1
+                stats.retries += 1
+                logger.warning(f"LLM call for {stats.caller} failed ({e}); "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            stats.latencies.append(time.monotonic() - started)
+            self._count_tokens(stats, contents, response)
+            return response
+
+    async def _throttle(self, model: Any, stats: _CallerStats) -> None:
+        name = _model_key(model)
+        rpm = self.rate_limits.get(name)
+        if not rpm:
+            return
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = TokenBucket(rpm, self.burst)
+        wait = bucket.reserve()
+        if wait > 0:
+            stats.throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+    async def _invoke(self, model: Any, contents: Any, kwargs: Dict[str, Any]) -> Any:
+        call_async = getattr(model, "generate_content_async", None)
+        # The REST transport has no working async call
+        if call_async is not None and not (self.api_endpoint and isinstance(model, genai.GenerativeModel)):
+            return await call_async(contents, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(model.generate_content, contents, **kwargs)
+        )
+
+    @staticmethod
+    def _flight_key(model: Any, contents: Any, kwargs: Dict[str, Any]) -> Optional[str]:
+        """Key of a text-only call; calls with images or other parts are never coalesced."""
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        if not all(isinstance(part, str) for part in parts):
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(_model_key(model).encode())
+        # Same prompt under a different response schema is a different call
+        digest.update(repr(getattr(model, "_generation_config", None)).encode())
+        digest.update(repr(sorted(kwargs.items())).encode())
+        for part in parts:
+            digest.update(b"\0" + part.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _count_tokens(stats: _CallerStats, contents: Any, response: Any) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if prompt_tokens is None:
+            # Estimate (about four characters per token) for text parts
+            parts = contents if isinstance(contents, (list, tuple)) else [contents]
+            prompt_tokens = sum(len(part) // 4 + 1 for part in parts if isinstance(part, str))
+        if output_tokens is None:
+            try:
+                output_tokens = len(response.text) // 4 + 1
+            except Exception:
+                output_tokens = 0
+        stats.prompt_tokens += int(prompt_tokens)
+        stats.output_tokens += int(output_tokens)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def _caller(self, caller: str) -> _CallerStats:
+        stats = self._callers.get(caller)
+        if stats is None:
+            stats = self._callers[caller] = _CallerStats(caller)
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-caller call metrics and per-model limiter state."""
+        return {
+            "callers": {name: stats.to_dict() for name, stats in self._callers.items()},
+            "models": {
+                name: {
+                    "requests_per_minute": self.rate_limits[name],
+                    "throttled": bucket.throttled,
+                }
+                for name, bucket in self._buckets.items()
+            },
+        }
+
+    def close(self) -> None:
+        """Stop the worker threads (application shutdown)."""
+        self._executor.shutdown(wait=False)
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Shared gateway used by every Gemini caller."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
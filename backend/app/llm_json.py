@@ -0,0 +1,327 @@
+"""
+Tolerant JSON Extraction for LLM Output
+
+Every Gemini caller used to strip ```json fences by hand and hand the rest to
+``json.loads``; any other deviation (prose around the object, a trailing
+comma, a response cut off at the token limit) fell back to a slow path or a
+raw dump. ``parse_llm_json`` replaces all of them:
+
+1. Plain JSON: one ``json.loads`` (the common case in JSON mode)
+2. JSON inside fences or prose: ``raw_decode`` from the first ``{`` / ``[``
+3. Anything else: a single-pass tokenizer that repairs what LLMs get wrong
+   (trailing or missing commas, single or curly quotes, Python literals,
+   comments, unquoted keys, invalid escapes) and closes output that was cut
+   off mid-stream
+
+The result is validated against a pydantic schema when one is given.
+``json_generation_config`` turns the same schema into Gemini's
+``response_schema`` (JSON mode), so in practice step 1 is all that runs.
+
+Usage:
+    model = genai.GenerativeModel(name, generation_config=json_generation_config(TriageResult))
+    result = parse_llm_json(response.text, TriageResult)   # dict, or LLMOutputError
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+_DECODER = json.JSONDecoder(strict=False)
+
+_TOKEN = re.compile(
+    r"""
+      (?P<space>\s+)
+    | (?P<comment>//[^\n]*|\#[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>"(?:[^"\\]|\\.)*(?:"|\\?\Z))
+    | (?P<single>'(?:[^'\\]|\\.)*(?:'|\\?\Z))
+    | (?P<curly>[“”](?:[^“”\\]|\\.)*(?:[“”]|\\?\Z))
+    | (?P<punct>[{}\[\]:,])
+    | (?P<fence>```[a-zA-Z]*)
+    | (?P<word>[^\s{}\[\]:,"'“”`]+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_INVALID_ESCAPE = re.compile(r'\\(?!["\\/bfnrtu])')
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+_LOOSE_NUMBER = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$")
+_LITERALS = {
+    "true": "true", "false": "false", "null": "null",
+    "True": "true", "False": "false", "None": "null",
+    "NaN": "null", "Infinity": "null", "-Infinity": "null", "undefined": "null",
+}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class LLMOutputError(ValueError):
+    """The model's response holds no usable JSON, or it does not match the schema."""
+
+
+def extract_json(text: str, allow_repair: bool = True) -> Any:
+    """
+    First JSON value in ``text``, repairing common LLM formatting errors.
+
+    Args:
+        text: Raw response text
+        allow_repair: False accepts only well-formed JSON (fences and prose
+            around it are fine)
+
+    Raises:
+        LLMOutputError: If no object or array can be recovered
+    """
+    stripped = (text or "").strip()
+    try:
+        return _unwrap(json.loads(stripped))
+    except ValueError:
+        pass
+
+    start = _value_start(stripped)
+    if start < 0:
+        raise LLMOutputError(f"No JSON object in LLM response: {stripped[:80]!r}")
+    try:
+        value, _ = _DECODER.raw_decode(stripped, start)
+        return _unwrap(value)
+    except ValueError:
+        pass
+
+    if not allow_repair:
+        raise LLMOutputError(f"LLM response is not well-formed JSON: {stripped[:80]!r}")
+    repaired = _repair(stripped, start)
+    try:
+        return _unwrap(json.loads(repaired, strict=False))
+    except ValueError as e:
+        raise LLMOutputError(f"Invalid JSON response from LLM: {e}") from e
+
+
+def parse_llm_json(
+    text: str,
+    schema: Optional[Type[BaseModel]] = None,
+    allow_repair: bool = True
+) -> Dict[str, Any]:
+    """
+    JSON object in an LLM response, validated against ``schema`` when given.
+
+    Args:
+        text: Raw response text
+        schema: Pydantic model the object must match; missing optional fields
+            get their defaults
+        allow_repair: False raises instead of repairing malformed or
+            truncated output
+
+    Returns:
+        The object as a dict (``schema.model_dump()`` when validated)
+
+    Raises:
+        LLMOutputError: If no object can be recovered or it fails validation
+    """
+    value = extract_json(text, allow_repair)
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+        # Some responses wrap the object in a one-element array
+        value = value[0]
+    if not isinstance(value, dict):
+        raise LLMOutputError(f"Expected a JSON object from LLM, got {type(value).__name__}")
+    if schema is None:
+        return value
+    try:
+        return schema.model_validate(value).model_dump()
+    except ValidationError as e:
+        raise LLMOutputError(f"LLM response does not match {schema.__name__}: {e}") from e
+
+
+def json_generation_config(schema: Optional[Type[BaseModel]] = None) -> Dict[str, Any]:
+    """Gemini ``generation_config`` for JSON mode, constrained to ``schema`` when given."""
+    config: Dict[str, Any] = {"response_mime_type": "application/json"}
+    if schema is not None:
+        config["response_schema"] = response_schema(schema)
+    return config
+
+
+def response_schema(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Gemini ``response_schema`` for a pydantic model.
+
+    Gemini accepts a subset of OpenAPI: no ``$ref``, ``default`` or
+    ``title``, and ``Optional`` becomes ``nullable``.
+    """
+    document = schema.model_json_schema()
+    return _gemini_schema(document, document.get("$defs", {}))
+
+
+def _gemini_schema(node: Dict[str, Any], definitions: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        node = definitions[node["$ref"].rsplit("/", 1)[-1]]
+    variants = node.get("anyOf")
+    if variants:
+        present = [variant for variant in variants if variant.get("type") != "null"]
+        converted = _gemini_schema(present[0], definitions)
+        if len(present) < len(variants):
+            converted["nullable"] = True
+        if "description" in node:
+            converted["description"] = node["description"]
+        return converted
+
+    converted: Dict[str, Any] = {"type": node.get("type", "string")}
+    for key in ("description", "enum", "format"):
+        if key in node:
+            converted[key] = node[key]
+    if "items" in node:
+        converted["items"] = _gemini_schema(node["items"], definitions)
+    if "properties" in node:
+        converted["properties"] = {
+            name: _gemini_schema(child, definitions) for name, child in node["properties"].items()
+        }
+        if node.get("required"):
+            converted["required"] = list(node["required"])
+    return converted
+
+
+def _unwrap(value: Any) -> Any:
+    """Decode JSON that was returned as a JSON string (double-encoded)."""
+    if isinstance(value, str) and value.lstrip()[:1] in ("{", "["):
+        try:
+            return json.loads(value, strict=False)
+        except ValueError:
+            pass
+    return value
+
+
+def _value_start(text: str) -> int:
+    """Offset of the first ``{`` or ``[`` (after an opening code fence, if any)."""
+    fence = text.find("```")
+    search_from = text.find("\n", fence) + 1 if fence >= 0 else 0
+    starts = [i for i in (text.find("{", search_from), text.find("[", search_from)) if i >= 0]
+    if not starts and search_from:
+        starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(starts) if starts else -1
+
+
+def _string_token(kind: str, token: str) -> str:
+    """Any quoted token as a valid JSON string (closing it if it was cut off)."""
+    if kind == "string":
+        # Closed unless the final quote is escaped (an odd run of backslashes)
+        backslashes = len(token) - 1 - len(token[:-1].rstrip("\\"))
+        closed = len(token) > 1 and token.endswith('"') and backslashes % 2 == 0
+        body = token[1:-1] if closed else token[1:]
+    else:
+        body = token[1:-1] if len(token) > 1 and token[-1] in "'“”" else token[1:]
+        body = body.replace("\\'", "'").replace('"', '\\"')
+    if (len(body) - len(body.rstrip("\\"))) % 2:
+        # Cut off in the middle of an escape
+        body = body[:-1]
+    body = _INVALID_ESCAPE.sub(r"\\\\", body)
+    return f'"{body}"'
+
+
+def _repair(text: str, start: int) -> str:
+    """
+    Re-emit the value starting at ``start`` as valid JSON, token by token.
+
+    Stops when the outermost container closes; output that ends first
+    (truncated) is closed: a key whose value never started is dropped, open
+    containers are closed in order.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    # What the previous token ended: a value ("value"), a key, ":", "," or an opener
+    previous = None
+    # Where the last key starts in ``out``
+    key_index = 0
+    position = start
+    length = len(text)
+
+    def emit_value(rendered: str) -> None:
+        nonlocal previous, key_index
+        # Missing comma between two values or members
+        if previous == "value" and stack:
+            out.append(",")
+        in_object = bool(stack) and stack[-1] == "{"
+        if in_object and previous in ("{", ",", "value"):
+            previous = "key"
+            key_index = len(out)
+        else:
+            previous = "value"
+        out.append(rendered)
+
+    while position < length and (stack or not out):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            position += 1
+            continue
+        position = match.end()
+        kind, token = match.lastgroup, match.group()
+
+        if kind in ("space", "comment", "fence"):
+            if kind == "fence" and out:
+                break
+            continue
+        if kind == "punct":
+            if token in "{[":
+                if previous == "value" and stack:
+                    out.append(",")
+                if previous == "key":
+                    out.append(":")
+                stack.append(token)
+                out.append(token)
+                previous = token
+            elif token in "}]":
+                if not stack:
+                    continue
+                if previous == ",":
+                    out.pop()
+                if previous == "key":
+                    out.append(":null")
+                if previous == ":":
+                    out.append("null")
+                # Close whatever is open up to the matching opener
+                opener = "{" if token == "}" else "["
+                while stack and stack[-1] != opener:
+                    out.append(_CLOSERS[stack.pop()])
+                if stack:
+                    out.append(_CLOSERS[stack.pop()])
+                previous = "value"
+            elif token == ":":
+                if previous == "key":
+                    out.append(":")
+                    previous = ":"
+            elif token == ",":
+                if previous in ("value",):
+                    out.append(",")
+                    previous = ","
+                elif previous == "key":
+                    out.append(":null,")
+                    previous = ","
+            continue
+
+        if kind in ("string", "single", "curly"):
+            rendered = _string_token(kind, token)
+        elif token in _LITERALS:
+            rendered = _LITERALS[token]
+        elif position == length and any(literal.startswith(token) for literal in ("true", "false", "null")):
+            # Literal cut off at the end of the output
+            rendered = next(literal for literal in ("true", "false", "null") if literal.startswith(token))
+        elif _NUMBER.match(token):
+            rendered = token
+        elif _LOOSE_NUMBER.match(token):
+            # .5, 1., +3
+            rendered = json.dumps(float(token)) if "." in token or "e" in token.lower() else str(int(token))
+        else:
+            # Unquoted key or bare word
+            rendered = json.dumps(token)
+        if previous == "key":
+            out.append(":")
+            previous = ":"
+        if previous == ":":
+            out.append(rendered)
+            previous = "value"
+        else:
+            emit_value(rendered)
+
+    # Truncated output: finish the last member and close what is still open
+    if previous in ("key", ":"):
+        del out[key_index:]
+    if out and out[-1] == ",":
+        out.pop()
+    while stack:
+        out.append(_CLOSERS[stack.pop()])
+    return "".join(out)
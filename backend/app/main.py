@@ -12,9 +12,10 @@ from typing import Optional, List, Dict
 from datetime import datetime
 import json
 
-from .alert_engine import AlertEngine, Alert
+from .alert_engine import Alert, get_alert_engine
 from .emotion_analyzer import EmotionAnalyzer, EmotionResult
 from .database import DatabaseClient
+from .data_access import close_data_access
 from .stt_pipeline import get_stt_pipeline, validate_stt_configuration
 from .audio_converter_ffmpeg import get_audio_converter
 from .appointments import router as appointments_router
@@ -22,9 +23,16 @@ from .lab_reports import router as lab_reports_router
 from .medical_images import router as medical_images_router
 from .signaling import router as signaling_router
 from .voice_intake import router as voice_intake_router
-from .health_tips import router as health_tips_router
-from .captions import router as captions_router
-from .summarizer import generate_notes_with_empathy
+from .health_tips import router as health_tips_router, get_daily_tips
+from .captions import router as captions_router, caption_manager
+from .jobs import router as jobs_router
+from .job_queue import get_job_queue
+from .soap_cache import cached_soap_notes
+from .soap_drafter import get_soap_drafter
+from .ws_framing import negotiate_format, decode_frame, send_message, JSON_FORMAT
+from .response_cache import DEFAULT_ROUTES, ResponseCache, ResponseCacheMiddleware
+from .emotion_ingest import get_emotion_batcher
+from .llm_gateway import get_llm_gateway
 import logging
 
 # Configure logging
@@ -72,6 +80,21 @@ async def startup_validation():
     
     logger.info("=" * 80)
 
+    # Precompute today's health tips (and each new day's after midnight)
+    get_daily_tips().start()
+    # Resume background analysis jobs left over from the last run
+    get_job_queue().start()
+
+@app.on_event("shutdown")
+async def shutdown_data_access():
+    """Stop background jobs, write queued emotion logs and pending alert checks, then close the shared Supabase connection pool and LLM worker threads."""
+    await get_job_queue().close()
+    await get_daily_tips().close()
+    await emotion_batcher.close()
+    await caption_manager.alert_worker.close()
+    await close_data_access()
+    get_llm_gateway().close()
+
 # Include appointment routes
 app.include_router(appointments_router)
 
@@ -87,6 +110,8 @@ app.include_router(voice_intake_router)
 app.include_router(health_tips_router)
 # Include captions routes for live transcription
 app.include_router(captions_router)
+# Include background job status routes
+app.include_router(jobs_router)
 
 # Production CORS configuration
 import os
@@ -118,6 +143,10 @@ if os.getenv("RAILWAY_ENVIRONMENT") == "production" or os.getenv("RENDER") or os
 
 logger.info(f"🔒 CORS allowed origins: {allowed_origins}")
 
+# Cache polled GET endpoints (added before CORS so 304s still get CORS headers)
+response_cache = ResponseCache(DEFAULT_ROUTES)
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -127,9 +156,13 @@ app.add_middleware(
 )
 
 # Initialize services
-alert_engine = AlertEngine()
+alert_engine = get_alert_engine()
 emotion_analyzer = EmotionAnalyzer()
 db_client = DatabaseClient()
+# Writes through the data access layer invalidate cached responses
+db_client.dal.add_write_listener(response_cache.on_write)
+# Live emotion updates are written in batches (see app.emotion_ingest)
+emotion_batcher = get_emotion_batcher(db_client.dal)
 stt_pipeline = get_stt_pipeline()
 audio_converter = get_audio_converter()
 
@@ -137,20 +170,29 @@ audio_converter = get_audio_converter()
 class ConnectionManager:
     """Manages WebSocket connections for real-time communication"""
     
-    def _init_(self):
+    def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        # Negotiated wire format per user ("json" or "msgpack")
+        self.formats: Dict[str, str] = {}
     
     async def connect(self, user_id: str, websocket: WebSocket):
-        await websocket.accept()
+        wire_format, subprotocol = negotiate_format(websocket)
+        await websocket.accept(subprotocol=subprotocol)
         self.active_connections[user_id] = websocket
+        self.formats[user_id] = wire_format
     
     def disconnect(self, user_id: str):
         if user_id in self.active_connections:
             del self.active_connections[user_id]
+        self.formats.pop(user_id, None)
     
     async def send_personal_message(self, message: dict, user_id: str):
         if user_id in self.active_connections:
-            await self.active_connections[user_id].send_json(message)
+            await send_message(
+                self.active_connections[user_id],
+                message,
+                self.formats.get(user_id, JSON_FORMAT)
+            )
 
 manager = ConnectionManager()
 
@@ -210,6 +252,12 @@ async def health_check():
     }
 
 
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """Gemini calls, coalescing, retries, throttling, latency and tokens per caller"""
+    return get_llm_gateway().stats()
+
+
 # ============================================================================
 # EMOTION ANALYZER ENDPOINTS
 # ============================================================================
@@ -309,6 +357,27 @@ async def get_consultation_emotions(consultation_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/emotions/consultation/{consultation_id}/timeline")
+async def get_consultation_emotion_timeline(consultation_id: str, bucket_seconds: int = 30):
+    """
+    Get a time-bucketed emotion timeline for a consultation.
+    
+    Args:
+        consultation_id: ID of the consultation
+        bucket_seconds: Width of each bucket in seconds (1-3600)
+    
+    Returns:
+        Per-bucket detection counts, mean confidence and dominant emotion
+    """
+    try:
+        return await db_client.get_consultation_emotion_timeline(consultation_id, bucket_seconds)
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.delete("/api/emotions/{user_id}")
 async def delete_user_emotions(user_id: str):
     """
@@ -433,6 +502,9 @@ async def emotion_websocket(websocket: WebSocket, user_id: str):
     Clients connect and receive emotion updates in real-time.
     Can also send simulated emotions for testing.
     
+    Messages are JSON by default; clients that negotiate msgpack framing
+    (see app.ws_framing) may send and receive binary frames instead.
+    
     Args:
         websocket: WebSocket connection
         user_id: ID of the user
@@ -441,21 +513,35 @@ async def emotion_websocket(websocket: WebSocket, user_id: str):
     
     try:
         while True:
-            # Receive message from client
-            data = await websocket.receive_json()
+            # Receive message from client (JSON text or msgpack binary frame)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            try:
+                data = decode_frame(message.get("bytes") or message.get("text") or "")
+            except ValueError as e:
+                print(f"Invalid emotion message from {user_id}: {e}")
+                continue
             
             message_type = data.get("type")
             
             if message_type == "emotion_update":
-                # Log emotion to database
+                # Queue emotion for the next batched insert
                 emotion_data = data.get("data", {})
                 
-                await db_client.log_emotion(
-                    user_id=user_id,
-                    emotion_type=emotion_data.get("emotion_type"),
-                    confidence_score=emotion_data.get("confidence_score"),
-                    consultation_id=emotion_data.get("consultation_id")
-                )
+                try:
+                    if not isinstance(emotion_data, dict):
+                        raise ValueError("data must be an object")
+                    emotion_batcher.submit(
+                        user_id=user_id,
+                        emotion_type=emotion_data.get("emotion_type"),
+                        confidence_score=emotion_data.get("confidence_score"),
+                        consultation_id=emotion_data.get("consultation_id")
+                    )
+                except ValueError as e:
+                    print(f"Invalid emotion update from {user_id}: {e}")
+                    continue
                 
                 # Broadcast back to client
                 await manager.send_personal_message({
@@ -476,6 +562,9 @@ async def emotion_websocket(websocket: WebSocket, user_id: str):
     except Exception as e:
         print(f"WebSocket error: {e}")
         manager.disconnect(user_id)
+    finally:
+        # Don't leave this session's updates waiting for the batch timer
+        await emotion_batcher.flush()
 
 
 # ============================================================================
@@ -574,9 +663,10 @@ async def generate_soap_notes(consultation_id: str):
         HTTPException: If consultation not found or generation fails
     """
     try:
-        # 1. Fetch the consultation transcript
+        # 1. Fetch the consultation transcript (and the note stored for it)
         logger.info(f"Fetching transcript for consultation {consultation_id}")
-        transcript = await db_client.get_transcript(consultation_id)
+        consultation = await db_client.dal.consultations.get(consultation_id) or {}
+        transcript = consultation.get("transcript") or consultation.get("full_transcript")
         
         if not transcript:
             logger.error(f"Consultation {consultation_id} not found or has no transcript")
@@ -587,24 +677,20 @@ async def generate_soap_notes(consultation_id: str):
         
         # 2. Generate SOAP notes with Compassion Reflex
         logger.info(f"Generating SOAP notes for consultation {consultation_id}")
-        soap_note, stigma_suggestions = await generate_notes_with_empathy(transcript)
+        # An unchanged transcript reuses the stored note (see app.soap_cache);
+        # otherwise the live draft is reconciled when one exists (see app.soap_drafter)
+        soap_note, stigma_suggestions = (
+            cached_soap_notes(consultation, transcript)
+            or await get_soap_drafter().generate(consultation_id, transcript)
+        )
         
         # 3. Save to database
         logger.info(f"Saving SOAP notes to database for consultation {consultation_id}")
-        try:
-            db_client.client.table("consultations")\
-                .update({
-                    "raw_soap_note": soap_note,
-                    "de_stigma_suggestions": stigma_suggestions,
-                    "soap_notes": soap_note,  # Also update old column for compatibility
-                    "stigma_suggestions": stigma_suggestions  # Also update old column
-                })\
-                .eq("id", consultation_id)\
-                .execute()
-            
+        saved = await db_client.save_soap_notes(consultation_id, soap_note, stigma_suggestions, transcript)
+        if saved:
             logger.info(f"SOAP notes saved successfully for consultation {consultation_id}")
-        except Exception as db_error:
-            logger.error(f"Error saving SOAP notes to database: {db_error}")
+        else:
+            logger.error(f"Error saving SOAP notes to database for consultation {consultation_id}")
             # Continue anyway - we can still return the generated notes
         
         # 4. Return the generated notes
@@ -647,18 +733,17 @@ async def get_soap_notes(consultation_id: str):
         HTTPException: If consultation not found or no SOAP notes exist
     """
     try:
-        result = db_client.client.table("consultations")\
-            .select("raw_soap_note, de_stigma_suggestions, soap_notes, stigma_suggestions")\
-            .eq("id", consultation_id)\
-            .single()\
-            .execute()
+        consultation = await db_client.dal.consultations.get(
+            consultation_id,
+            "raw_soap_note, de_stigma_suggestions, soap_notes, stigma_suggestions"
+        )
         
-        if not result.data:
+        if not consultation:
             raise HTTPException(status_code=404, detail="Consultation not found")
         
         # Try new column names first, fall back to old ones
-        soap_note = result.data.get("raw_soap_note") or result.data.get("soap_notes")
-        stigma_suggestions = result.data.get("de_stigma_suggestions") or result.data.get("stigma_suggestions") or []
+        soap_note = consultation.get("raw_soap_note") or consultation.get("soap_notes")
+        stigma_suggestions = consultation.get("de_stigma_suggestions") or consultation.get("stigma_suggestions") or []
         
         if not soap_note:
             raise HTTPException(status_code=404, detail="No SOAP notes found for this consultation")
@@ -679,4 +764,4 @@ async def get_soap_notes(consultation_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=True)
\ No newline at end of file
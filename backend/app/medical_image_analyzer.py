@@ -3,14 +3,15 @@ Medical Image Analyzer using Google Gemini Vision API
 Analyzes patient-uploaded medical images for preliminary assessment
 """
 
-import google.generativeai as genai
-from PIL import Image
-import io
-import json
+import asyncio
 import os
 from datetime import datetime
 from typing import Optional, Dict, Any, List
-import base64
+
+from .image_preprocessing import prepare_image
+from .llm_gateway import get_llm_gateway
+from .llm_json import LLMOutputError, json_generation_config, parse_llm_json
+from .models import ImageAnalysis, ImageComparison
 
 class MedicalImageAnalyzer:
     """Analyzes medical images using Gemini Vision API"""
@@ -21,8 +22,17 @@ class MedicalImageAnalyzer:
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('models/gemini-2.0-flash-exp')
+        get_llm_gateway().configure(api_key)
+        self.model = get_llm_gateway().model(
+            'models/gemini-2.0-flash-exp',
+            caller="medical_image_analyzer",
+            generation_config=json_generation_config(ImageAnalysis)
+        )
+        self.comparison_model = get_llm_gateway().model(
+            'models/gemini-2.0-flash-exp',
+            caller="medical_image_analyzer",
+            generation_config=json_generation_config(ImageComparison)
+        )
         
     def _create_analysis_prompt(
         self,
@@ -147,35 +157,27 @@ Format your response as JSON with these keys:
             Dictionary with analysis results
         """
         try:
-            # Load image
-            pil_image = Image.open(io.BytesIO(image_data))
-            
-            # Resize if too large (max 4MB for Gemini)
-            max_size = (2048, 2048)
-            if pil_image.size[0] > max_size[0] or pil_image.size[1] > max_size[1]:
-                pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            # Orient, downscale and re-encode (off the event loop)
+            image = await asyncio.to_thread(prepare_image, image_data)
             
             # Create prompt
             prompt = self._create_analysis_prompt(body_part, symptoms, patient_description)
             
             # Generate analysis
-            response = self.model.generate_content([prompt, pil_image])
+            response = await self.model.generate_content_async([prompt, image.part()])
             
             # Parse response
             response_text = response.text.strip()
             
-            # Try to extract JSON from response
+            # Parse JSON (JSON mode; tolerant of fences and prose). A truncated
+            # reply is not repaired: its defaults would be stored and reused by dedup
             try:
-                # Remove markdown code blocks if present
-                if response_text.startswith('```json'):
-                    response_text = response_text.split('```json')[1].split('```')[0].strip()
-                elif response_text.startswith('```'):
-                    response_text = response_text.split('```')[1].split('```')[0].strip()
-                
-                analysis = json.loads(response_text)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return raw text with basic structure
+                analysis = parse_llm_json(response_text, ImageAnalysis, allow_repair=False)
+            except LLMOutputError as e:
+                # If JSON parsing fails, return raw text with basic structure;
+                # "error" keeps it out of the dedup index (app.image_dedup)
                 analysis = {
+                    "error": f"Unable to parse structured response: {e}",
                     "visual_description": response_text,
                     "possible_conditions": [],
                     "severity": "unknown",
@@ -235,14 +237,11 @@ Format your response as JSON with these keys:
             Dictionary with comparison results
         """
         try:
-            # Load images
-            before_image = Image.open(io.BytesIO(before_image_data))
-            after_image = Image.open(io.BytesIO(after_image_data))
-            
-            # Resize if needed
-            max_size = (2048, 2048)
-            before_image.thumbnail(max_size, Image.Resampling.LANCZOS)
-            after_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            # Orient, downscale and re-encode both images (same stage as uploads)
+            before_image, after_image = await asyncio.gather(
+                asyncio.to_thread(prepare_image, before_image_data),
+                asyncio.to_thread(prepare_image, after_image_data)
+            )
             
             prompt = f"""Compare these two medical images taken {days_between} days apart.
 
@@ -296,18 +295,13 @@ Format as JSON:
 }}
 """
             
-            response = self.model.generate_content([prompt, before_image, after_image])
+            response = await self.comparison_model.generate_content_async([prompt, before_image.part(), after_image.part()])
             response_text = response.text.strip()
             
-            # Parse JSON
+            # Parse JSON (not repaired: a truncated comparison is stored as unknown)
             try:
-                if response_text.startswith('```json'):
-                    response_text = response_text.split('```json')[1].split('```')[0].strip()
-                elif response_text.startswith('```'):
-                    response_text = response_text.split('```')[1].split('```')[0].strip()
-                
-                comparison = json.loads(response_text)
-            except json.JSONDecodeError:
+                comparison = parse_llm_json(response_text, ImageComparison, allow_repair=False)
+            except LLMOutputError:
                 comparison = {
                     "overall_progress": "unknown",
                     "improvement_percentage": 0,
@@ -62,7 +62,7 @@ class MedicalImageResponse(BaseModel):
     body_part: Optional[str]
     patient_description: Optional[str]
     symptoms: Optional[List[str]]
-    ai_analysis: Optional[Dict[str, Any]]
+    ai_analysis: Optional[Dict[str, Any]] = None  # only when requested in listings
     severity_level: Optional[str]
     detected_conditions: Optional[List[str]]
     recommendations: Optional[List[str]]
@@ -75,6 +75,11 @@ class MedicalImageResponse(BaseModel):
     doctor_notes: Optional[str]
     doctor_reviewed_at: Optional[datetime]
 
+class MedicalImageListResponse(BaseModel):
+    """One page of a patient's medical images"""
+    images: List[MedicalImageResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
+
 class ImageComparisonRequest(BaseModel):
     """Request to compare two images"""
     before_image_id: UUID
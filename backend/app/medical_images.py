@@ -2,34 +2,41 @@
 Medical Image Analysis API endpoints
 """
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
-from typing import Optional, List
-from uuid import UUID
+from typing import Any, Dict, Optional, List
+from uuid import UUID, uuid4
+import asyncio
 import os
 from datetime import datetime
 import json
 
+from .image_dedup import ImageHashIndex
+from .image_preprocessing import prepare_image
+from .job_queue import JobError, get_job_queue
 from .medical_image_analyzer import MedicalImageAnalyzer
 from .medical_image_models import (
     MedicalImageResponse,
+    MedicalImageListResponse,
     ImageComparisonRequest,
     ImageComparisonResponse,
     DoctorNoteUpdate
 )
-from supabase import create_client, Client
+from .data_access import get_data_access
+from .streaming import ndjson_response
 
 router = APIRouter(prefix="/api/medical-images", tags=["medical-images"])
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+# Shared Supabase data access layer
+db = get_data_access()
+images_bucket = db.bucket('medical-images')
 
 # Initialize analyzer
 analyzer = MedicalImageAnalyzer()
 
+# Earlier analyses per patient, by perceptual hash (re-uploads are not re-analyzed)
+image_index = ImageHashIndex(db)
+
 @router.post("/upload", response_model=MedicalImageResponse)
 async def upload_medical_image(
     file: UploadFile = File(...),
@@ -40,7 +47,8 @@ async def upload_medical_image(
     image_type: str = Form("other"),
     appointment_id: Optional[str] = Form(None),
     is_follow_up: bool = Form(False),
-    parent_image_id: Optional[str] = Form(None)
+    parent_image_id: Optional[str] = Form(None),
+    background: bool = False
 ):
     """
     Upload and analyze a medical image
@@ -54,6 +62,8 @@ async def upload_medical_image(
     - **appointment_id**: Related appointment (optional)
     - **is_follow_up**: Is this a follow-up image?
     - **parent_image_id**: Original image ID for follow-ups
+    - **background**: Return a job id at once; the saved image is the job's
+      result (GET /api/jobs/{job_id})
     """
     try:
         # Validate file type
@@ -75,93 +85,33 @@ async def upload_medical_image(
             except json.JSONDecodeError:
                 symptoms_list = [symptoms]
         
-        # Upload to Supabase Storage
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        storage_path = f"{patient_id}/{timestamp}_{file.filename}"
-        
-        storage_response = supabase.storage.from_('medical-images').upload(
-            storage_path,
-            image_data,
-            file_options={"content-type": file.content_type}
-        )
-        
-        # Get public URL
-        image_url = supabase.storage.from_('medical-images').get_public_url(storage_path)
-        
-        # Analyze image with Gemini Vision
-        analysis = await analyzer.analyze_image(
-            image_data=image_data,
-            body_part=body_part,
-            symptoms=symptoms_list,
-            patient_description=patient_description
-        )
-        
-        # Ensure analysis is a dict, not a string
-        if isinstance(analysis, str):
-            try:
-                analysis = json.loads(analysis)
-            except json.JSONDecodeError:
-                analysis = {
-                    "visual_description": analysis,
-                    "severity": "unknown",
-                    "possible_conditions": [],
-                    "recommendations": {},
-                    "disclaimer": "This is not a medical diagnosis. Please consult a healthcare professional."
-                }
-        
-        # Extract key information from analysis
-        severity_level = analysis.get('severity', 'unknown')
-        detected_conditions = [
-            cond.get('name', '') 
-            for cond in analysis.get('possible_conditions', [])
-        ]
-        recommendations_list = []
-        if 'recommendations' in analysis:
-            recs = analysis['recommendations']
-            if isinstance(recs, dict):
-                recommendations_list = recs.get('home_care', []) + recs.get('monitoring', [])
-        
-        requires_immediate = analysis.get('requires_immediate_attention', False)
-        
-        # Calculate days since previous if follow-up
-        days_since_previous = None
-        if is_follow_up and parent_image_id:
-            try:
-                parent = supabase.table('medical_images').select('uploaded_at').eq('id', parent_image_id).single().execute()
-                if parent.data:
-                    parent_date = datetime.fromisoformat(parent.data['uploaded_at'].replace('Z', '+00:00'))
-                    days_since_previous = (datetime.now() - parent_date).days
-            except Exception as e:
-                print(f"Error calculating days since previous: {e}")
-        
-        # Save to database
-        image_record = {
+        upload = {
             'patient_id': patient_id,
-            'appointment_id': appointment_id if appointment_id else None,
-            'image_url': image_url,
-            'storage_path': storage_path,
-            'image_type': image_type,
             'body_part': body_part,
-            'patient_description': patient_description,
             'symptoms': symptoms_list,
-            'ai_analysis': analysis,
-            'severity_level': severity_level,
-            'detected_conditions': detected_conditions,
-            'recommendations': recommendations_list,
-            'requires_immediate_attention': requires_immediate,
-            'analyzed_at': datetime.now().isoformat(),
+            'patient_description': patient_description,
+            'image_type': image_type,
+            'appointment_id': appointment_id,
             'is_follow_up': is_follow_up,
-            'parent_image_id': parent_image_id if parent_image_id else None,
-            'days_since_previous': days_since_previous
+            'parent_image_id': parent_image_id,
+            'content_type': file.content_type,
+            'storage_path': f"{patient_id}/{timestamp}_{uuid4().hex[:8]}_{file.filename}"
         }
         
-        result = supabase.table('medical_images').insert(image_record).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Failed to save image record")
+        if background:
+            job_id = await get_job_queue().enqueue("medical_image", upload, image_data)
+            return JSONResponse(status_code=202, content={
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}"
+            })
         
-        return result.data[0]
+        try:
+            return await process_medical_image(upload, image_data)
+        except Exception:
+            await remove_medical_image_file(upload)
+            raise
         
     except HTTPException:
         raise
@@ -169,37 +119,171 @@ async def upload_medical_image(
         print(f"Error uploading medical image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
-@router.get("/patient/{patient_id}", response_model=List[MedicalImageResponse])
-async def get_patient_images(patient_id: str, limit: int = 50):
-    """Get all medical images for a patient"""
+async def process_medical_image(upload: Dict[str, Any], image_data: bytes) -> Dict[str, Any]:
+    """
+    Store, analyze and save an uploaded image (inline or as a background job)
+    
+    Returns the saved medical_images row; raises JobError when the row
+    cannot be saved.
+    """
+    patient_id = upload['patient_id']
+    body_part = upload['body_part']
+    storage_path = upload['storage_path']
+    
+    # Upload to Supabase Storage (a retried job overwrites its earlier upload)
+    await images_bucket.upload(storage_path, image_data, upload['content_type'], upsert=True)
+    
+    # Get public URL
+    image_url = await images_bucket.get_public_url(storage_path)
+    
+    # Re-upload of an already analyzed image with the same prompt: reuse its analysis
     try:
-        result = supabase.table('medical_images')\
-            .select('*')\
-            .eq('patient_id', patient_id)\
-            .order('uploaded_at', desc=True)\
-            .limit(limit)\
-            .execute()
-        
-        return result.data
+        prepared = await asyncio.to_thread(prepare_image, image_data)
+    except Exception:
+        # Unreadable image: the analyzer reports the error
+        prepared = None
+    duplicate = await image_index.find(
+        patient_id, prepared, body_part, upload['symptoms'], upload['patient_description'], upload['is_follow_up']
+    ) if prepared else None
+    
+    if duplicate:
+        analysis = {**duplicate['ai_analysis'], 'reused_from_image_id': duplicate['id']}
+    else:
+        # Analyze image with Gemini Vision
+        analysis = await analyzer.analyze_image(
+            image_data=image_data,
+            body_part=body_part,
+            symptoms=upload['symptoms'],
+            patient_description=upload['patient_description']
+        )
+    
+    # Ensure analysis is a dict, not a string
+    if isinstance(analysis, str):
+        try:
+            analysis = json.loads(analysis)
+        except json.JSONDecodeError:
+            analysis = {
+                "visual_description": analysis,
+                "severity": "unknown",
+                "possible_conditions": [],
+                "recommendations": {},
+                "disclaimer": "This is not a medical diagnosis. Please consult a healthcare professional."
+            }
+    
+    # Extract key information from analysis
+    severity_level = analysis.get('severity', 'unknown')
+    detected_conditions = [
+        cond.get('name', '') 
+        for cond in analysis.get('possible_conditions', [])
+    ]
+    recommendations_list = []
+    if 'recommendations' in analysis:
+        recs = analysis['recommendations']
+        if isinstance(recs, dict):
+            recommendations_list = recs.get('home_care', []) + recs.get('monitoring', [])
+    
+    requires_immediate = analysis.get('requires_immediate_attention', False)
+    
+    # Calculate days since previous if follow-up
+    is_follow_up = upload['is_follow_up']
+    parent_image_id = upload['parent_image_id']
+    days_since_previous = None
+    if is_follow_up and parent_image_id:
+        try:
+            parent = await db.medical_images.get(parent_image_id, 'uploaded_at')
+            if parent:
+                parent_date = datetime.fromisoformat(parent['uploaded_at'].replace('Z', '+00:00'))
+                days_since_previous = (datetime.now() - parent_date).days
+        except Exception as e:
+            print(f"Error calculating days since previous: {e}")
+    
+    # Save to database
+    image_record = {
+        'patient_id': patient_id,
+        'appointment_id': upload['appointment_id'] if upload['appointment_id'] else None,
+        'image_url': image_url,
+        'storage_path': storage_path,
+        'image_type': upload['image_type'],
+        'body_part': body_part,
+        'patient_description': upload['patient_description'],
+        'symptoms': upload['symptoms'],
+        'ai_analysis': analysis,
+        'severity_level': severity_level,
+        'detected_conditions': detected_conditions,
+        'recommendations': recommendations_list,
+        'requires_immediate_attention': requires_immediate,
+        'analyzed_at': datetime.now().isoformat(),
+        'is_follow_up': is_follow_up,
+        'parent_image_id': parent_image_id if parent_image_id else None,
+        'days_since_previous': days_since_previous
+    }
+    
+    saved = await image_index.insert(image_record, prepared)
+    
+    if not saved:
+        raise JobError("Failed to save image record")
+    
+    return saved
+
+async def remove_medical_image_file(upload: Dict[str, Any]) -> None:
+    """Remove the stored file of an image that could not be saved"""
+    try:
+        await images_bucket.remove([upload['storage_path']])
+    except Exception as e:
+        print(f"Error removing image file {upload['storage_path']}: {str(e)}")
+
+get_job_queue().register("medical_image", process_medical_image, on_failure=remove_medical_image_file)
+
+@router.get("/patient/{patient_id}", response_model=MedicalImageListResponse)
+async def get_patient_images(
+    patient_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    include: Optional[str] = Query(None, description="Comma-separated optional fields, e.g. ai_analysis")
+):
+    """
+    Get a patient's medical images, newest first
+    
+    The full AI analysis is left out unless requested with include=ai_analysis.
+    Pass next_cursor back as cursor to fetch the next page.
+    """
+    try:
+        fields = [f.strip() for f in include.split(',') if f.strip()] if include else []
+        images, next_cursor = await db.medical_images.page_for_patient(patient_id, cursor, limit, fields)
+        return {
+            "images": images,
+            "next_cursor": next_cursor
+        }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error fetching patient images: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/patient/{patient_id}/export")
+async def export_patient_images(patient_id: str):
+    """Stream every image record of a patient, with analysis, as NDJSON"""
+    return ndjson_response(
+        db.medical_images.iter_for_patient(patient_id),
+        f"medical-images-{patient_id}.ndjson"
+    )
+
+@router.get("/dedup/stats")
+async def get_dedup_stats():
+    """Uploads whose analysis was reused vs analyzed"""
+    return image_index.stats()
+
 @router.get("/{image_id}", response_model=MedicalImageResponse)
 async def get_image(image_id: str):
     """Get a specific medical image"""
     try:
-        result = supabase.table('medical_images')\
-            .select('*')\
-            .eq('id', image_id)\
-            .single()\
-            .execute()
+        image = await db.medical_images.get(image_id)
         
-        if not result.data:
+        if not image:
             raise HTTPException(status_code=404, detail="Image not found")
         
-        return result.data
+        return image
         
     except HTTPException:
         raise
@@ -212,19 +296,23 @@ async def compare_images(request: ImageComparisonRequest):
     """Compare two images to track healing progress"""
     try:
         # Get both images
-        before = supabase.table('medical_images').select('*').eq('id', str(request.before_image_id)).single().execute()
-        after = supabase.table('medical_images').select('*').eq('id', str(request.after_image_id)).single().execute()
+        before, after = await asyncio.gather(
+            db.medical_images.get(str(request.before_image_id)),
+            db.medical_images.get(str(request.after_image_id))
+        )
         
-        if not before.data or not after.data:
+        if not before or not after:
             raise HTTPException(status_code=404, detail="One or both images not found")
         
         # Download images from storage
-        before_data = supabase.storage.from_('medical-images').download(before.data['storage_path'])
-        after_data = supabase.storage.from_('medical-images').download(after.data['storage_path'])
+        before_data, after_data = await asyncio.gather(
+            images_bucket.download(before['storage_path']),
+            images_bucket.download(after['storage_path'])
+        )
         
         # Calculate days between
-        before_date = datetime.fromisoformat(before.data['uploaded_at'].replace('Z', '+00:00'))
-        after_date = datetime.fromisoformat(after.data['uploaded_at'].replace('Z', '+00:00'))
+        before_date = datetime.fromisoformat(before['uploaded_at'].replace('Z', '+00:00'))
+        after_date = datetime.fromisoformat(after['uploaded_at'].replace('Z', '+00:00'))
         days_between = (after_date - before_date).days
         
         # Compare images
@@ -253,15 +341,12 @@ async def add_doctor_notes(image_id: str, notes: DoctorNoteUpdate, doctor_id: st
             'doctor_reviewed_by': doctor_id
         }
         
-        result = supabase.table('medical_images')\
-            .update(update_data)\
-            .eq('id', image_id)\
-            .execute()
+        updated = await db.medical_images.update(image_id, update_data)
         
-        if not result.data:
+        if not updated:
             raise HTTPException(status_code=404, detail="Image not found")
         
-        return result.data[0]
+        return updated
         
     except HTTPException:
         raise
@@ -274,20 +359,21 @@ async def delete_image(image_id: str, patient_id: str):
     """Delete a medical image"""
     try:
         # Get image to get storage path
-        image = supabase.table('medical_images').select('storage_path, patient_id').eq('id', image_id).single().execute()
+        image = await db.medical_images.get(image_id, 'storage_path, patient_id')
         
-        if not image.data:
+        if not image:
             raise HTTPException(status_code=404, detail="Image not found")
         
         # Verify patient owns the image
-        if image.data['patient_id'] != patient_id:
+        if image['patient_id'] != patient_id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this image")
         
         # Delete from storage
-        supabase.storage.from_('medical-images').remove([image.data['storage_path']])
+        await images_bucket.remove([image['storage_path']])
         
         # Delete from database
-        supabase.table('medical_images').delete().eq('id', image_id).execute()
+        await db.medical_images.delete(image_id)
+        image_index.discard(patient_id, image_id)
         
         return {"message": "Image deleted successfully"}
         
@@ -301,13 +387,7 @@ async def delete_image(image_id: str, patient_id: str):
 async def get_appointment_images(appointment_id: str):
     """Get all images related to an appointment"""
     try:
-        result = supabase.table('medical_images')\
-            .select('*')\
-            .eq('appointment_id', appointment_id)\
-            .order('uploaded_at', desc=True)\
-            .execute()
-        
-        return result.data
+        return await db.medical_images.list_for_appointment(appointment_id)
         
     except Exception as e:
         print(f"Error fetching appointment images: {str(e)}")
@@ -4,7 +4,7 @@ Pydantic Models for Arogya-AI Backend API
 This module defines all request and response models used in the API.
 """
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from typing import List, Optional
 from datetime import datetime
 
@@ -26,10 +26,10 @@ class LexiconTerm(BaseModel):
 
 class StigmaSuggestion(BaseModel):
     """Model for de-stigmatization suggestion"""
-    original_phrase: str = Field(..., description="Original stigmatizing phrase")
-    suggested_alternative: str = Field(..., description="Person-first alternative")
-    rationale: str = Field(..., description="Explanation for the suggestion")
     section: str = Field(..., description="SOAP section (assessment or plan)")
+    original: str = Field(..., description="Original stigmatizing phrase, as it appears in the note")
+    suggested: str = Field(..., description="Person-first alternative")
+    rationale: str = Field(..., description="Explanation for the suggestion")
     
     @field_validator('section')
     @classmethod
@@ -59,3 +59,148 @@ class ErrorResponse(BaseModel):
     error: str = Field(..., description="Error message")
     detail: Optional[str] = Field(None, description="Detailed error information")
     timestamp: datetime = Field(default_factory=datetime.now, description="Error timestamp")
+
+
+# ============================================================================
+# LLM OUTPUT SCHEMAS
+# Gemini response_schema (JSON mode) and validation of parsed responses
+# (app.llm_json.parse_llm_json)
+# ============================================================================
+
+class LLMOutput(BaseModel):
+    """Base for Gemini JSON responses: extra keys are kept, numbers accepted as text"""
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+    
+    @model_validator(mode="before")
+    @classmethod
+    def drop_nulls(cls, data):
+        """A null optional field means "not given": use its default"""
+        if isinstance(data, dict):
+            return {
+                key: value for key, value in data.items()
+                if value is not None or key not in cls.model_fields or cls.model_fields[key].is_required()
+            }
+        return data
+
+
+class TriageResult(LLMOutput):
+    """Alert engine triage of one patient utterance"""
+    # Required: a reply cut off before these is not a usable triage (the alert engine falls back)
+    is_critical: bool = Field(..., description="True if severity >= 3 (requires medical attention)")
+    symptom_type: str = Field(
+        "other",
+        description="injury, chest_pain, breathing_difficulty, neurological, mental_health, pain, infection, bleeding or other"
+    )
+    severity_score: int = Field(..., description="1 (minor) to 5 (life-threatening)")
+    analysis: str = Field("", description="Brief medical analysis explaining the concern")
+    recommendations: str = Field("", description="Specific action for the patient")
+    emergency_keywords: List[str] = Field(default_factory=list, description="Key symptoms found")
+
+
+class LabValue(LLMOutput):
+    """One test value from a lab report"""
+    name: str = ""
+    value: str = ""
+    unit: str = ""
+    status: str = Field("", description="normal, high or low")
+    normal_range: str = ""
+
+
+class AbnormalLabValue(LabValue):
+    """Lab value outside its normal range, explained for the patient"""
+    explanation: str = ""
+    recommendation: str = ""
+
+
+class LabReportAnalysis(LLMOutput):
+    """Lab report analysis"""
+    values: List[LabValue] = Field(default_factory=list)
+    abnormal_values: List[AbnormalLabValue] = Field(default_factory=list)
+    summary: str = ""
+    urgent_attention: bool = False
+    urgent_message: Optional[str] = None
+
+
+class PossibleCondition(LLMOutput):
+    """Condition that may match a medical image"""
+    name: str = ""
+    likelihood: str = Field("", description="high, medium or low")
+    reasoning: str = ""
+
+
+class ImageRecommendations(LLMOutput):
+    see_doctor_immediately: bool = True
+    urgency_level: str = Field("routine", description="immediate, soon or routine")
+    home_care: List[str] = Field(default_factory=list)
+    monitoring: List[str] = Field(default_factory=list)
+
+
+class ImageFollowUp(LLMOutput):
+    watch_for: List[str] = Field(default_factory=list)
+    photo_timing: str = ""
+    improvement_signs: List[str] = Field(default_factory=list)
+    worsening_signs: List[str] = Field(default_factory=list)
+
+
+class ImageAnalysis(LLMOutput):
+    """Preliminary analysis of a patient-uploaded medical image"""
+    visual_description: str = ""
+    possible_conditions: List[PossibleCondition] = Field(default_factory=list)
+    severity: str = Field("unknown", description="mild, moderate or severe")
+    severity_reasoning: str = ""
+    red_flags: List[str] = Field(default_factory=list)
+    requires_immediate_attention: bool = False
+    recommendations: ImageRecommendations = Field(default_factory=ImageRecommendations)
+    follow_up: ImageFollowUp = Field(default_factory=ImageFollowUp)
+    questions_for_doctor: List[str] = Field(default_factory=list)
+    disclaimer: str = "This is not a medical diagnosis. Please consult a healthcare professional."
+
+
+class ImageChanges(LLMOutput):
+    improved: List[str] = Field(default_factory=list)
+    worsened: List[str] = Field(default_factory=list)
+    unchanged: List[str] = Field(default_factory=list)
+
+
+class ComparisonRecommendations(LLMOutput):
+    continue_treatment: bool = True
+    see_doctor: bool = False
+    urgency: str = Field("routine", description="immediate, soon or routine")
+    care_adjustments: List[str] = Field(default_factory=list)
+    next_photo_days: Optional[int] = None
+
+
+class ImageComparison(LLMOutput):
+    """Healing progress between two medical images"""
+    overall_progress: str = Field("unknown", description="excellent, good, fair, poor or worsening")
+    improvement_percentage: int = Field(0, description="0 to 100")
+    changes: ImageChanges = Field(default_factory=ImageChanges)
+    healing_assessment: str = ""
+    concerns: List[str] = Field(default_factory=list)
+    recommendations: ComparisonRecommendations = Field(default_factory=ComparisonRecommendations)
+    disclaimer: str = "This comparison is for tracking purposes only. Consult your healthcare provider."
+
+
+class IntakeLifestyle(LLMOutput):
+    smoking: Optional[str] = Field(None, description="yes, no or unknown")
+    alcohol: Optional[str] = Field(None, description="yes, no or unknown")
+    exercise: Optional[str] = None
+
+
+class VoiceIntakeExtraction(LLMOutput):
+    """Patient intake form extracted from a spoken description, in English"""
+    full_name: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = Field(None, description="male, female or other")
+    chief_complaint: Optional[str] = None
+    symptom_duration: Optional[str] = None
+    medical_history: List[str] = Field(default_factory=list)
+    current_medications: List[str] = Field(default_factory=list)
+    allergies: List[str] = Field(default_factory=list)
+    previous_surgeries: List[str] = Field(default_factory=list)
+    family_history: Optional[str] = None
+    lifestyle: IntakeLifestyle = Field(default_factory=IntakeLifestyle)
+    additional_notes: Optional[str] = None
+    original_language: Optional[str] = None
+    original_transcript: Optional[str] = None
+    english_transcript: Optional[str] = None
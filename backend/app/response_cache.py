@@ -0,0 +1,207 @@
+"""
+Response Cache for Polled GET Endpoints
+
+Dashboards poll a handful of read-only endpoints (SOAP notes, emotion stats,
+single appointments, images and lab reports) every few seconds, and each poll
+used to go to Supabase. This ASGI middleware serves those GETs from memory:
+
+- Each cached route has its own TTL and names the table (and column) whose
+  writes change it, e.g. ``/api/consultations/{id}/soap`` depends on
+  ``consultations.id``
+- Every repository write is reported by the data access layer
+  (``add_write_listener``) and drops the matching cached responses at once,
+  so a client never waits a TTL for its own write. Other workers catch up
+  within the TTL
+- Responses carry a strong ETag; a request with a matching ``If-None-Match``
+  gets ``304 Not Modified`` with no body
+
+Only 200 responses are stored, keyed by path and query string.
+
+Usage:
+    response_cache = ResponseCache(DEFAULT_ROUTES)
+    app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+    dal.add_write_listener(response_cache.on_write)
+"""
+
+import hashlib
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import TTLCache, register_cache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+CACHE_CONTROL = "private, no-cache"
+
+# Headers recomputed or added for every cached response
+_REPLACED_HEADERS = {b"etag", b"cache-control", b"x-cache"}
+
+
+class CachedRoute:
+    """A GET path template with one parameter, its TTL and the writes that change it."""
+
+    def __init__(self, path: str, ttl: float, table: str, column: str = "id"):
+        """
+        Args:
+            path: Template such as "/api/appointments/{appointment_id}"
+            ttl: Seconds a response is served from the cache
+            table: Table whose writes invalidate the response
+            column: Column of the written row that holds the path parameter
+        """
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self.column = column
+        self.pattern = re.compile(
+            "^" + re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", re.escape(path)) + "$"
+        )
+        # key -> {query string: (status, headers, body, etag)}
+        self.entries = TTLCache(ttl=ttl, max_size=RESPONSE_CACHE_SIZE)
+        # Bumped on every invalidation; a response is only stored if no
+        # write happened while it was being produced
+        self.version = 0
+
+    def match(self, path: str) -> Optional[str]:
+        """The path parameter if ``path`` matches this template."""
+        found = self.pattern.match(path)
+        return found.group(1) if found else None
+
+    def invalidate(self, key: str) -> None:
+        """Drop every cached variant for one path parameter."""
+        self.version += 1
+        self.entries.invalidate(key)
+
+
+DEFAULT_ROUTES = [
+    CachedRoute("/api/consultations/{consultation_id}/soap", ttl=300, table="consultations"),
+    CachedRoute("/api/emotions/stats/{user_id}", ttl=30, table="emotion_logs", column="user_id"),
+    CachedRoute("/api/appointments/{appointment_id}", ttl=60, table="appointments"),
+    CachedRoute("/api/medical-images/{image_id}", ttl=300, table="medical_images"),
+    CachedRoute("/api/lab-reports/{report_id}", ttl=300, table="lab_reports"),
+]
+
+
+def make_etag(body: bytes) -> str:
+    """Strong validator derived from the response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header value matches ``etag``."""
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+class ResponseCache:
+    """Cached responses for a set of routes, plus the write hook that invalidates them."""
+
+    def __init__(self, routes: List[CachedRoute]):
+        self.routes = routes
+        self.not_modified = 0
+        for route in routes:
+            register_cache(f"response {route.path}", route.entries)
+
+    def match(self, path: str) -> Optional[Tuple[CachedRoute, str]]:
+        """The cached route and key for a request path, if any."""
+        for route in self.routes:
+            key = route.match(path)
+            if key is not None:
+                return route, key
+        return None
+
+    def on_write(self, table: str, row: Dict[str, Any]) -> None:
+        """Data access write listener: drop responses built from this row."""
+        for route in self.routes:
+            if route.table == table and row.get(route.column) is not None:
+                route.invalidate(str(row[route.column]))
+
+    def invalidate(self, table: str, key: str) -> None:
+        """Drop cached responses for a row written outside the repositories."""
+        for route in self.routes:
+            if route.table == table:
+                route.invalidate(key)
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        for route in self.routes:
+            route.version += 1
+            route.entries.clear()
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware serving cached GET responses with ETag revalidation."""
+
+    def __init__(self, app, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        matched = self.cache.match(scope["path"])
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        route, key = matched
+        variant = scope.get("query_string", b"").decode("latin-1")
+        if_none_match = None
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+
+        variants = route.entries.get(key)
+        if variants and variant in variants:
+            await self._respond(send, variants[variant], if_none_match, b"HIT")
+            return
+
+        version = route.version
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() not in _REPLACED_HEADERS]
+        body = b"".join(chunks)
+        entry = (start.get("status", 500), headers, body, make_etag(body))
+
+        if entry[0] == 200 and route.version == version:
+            variants = route.entries.get(key) or {}
+            variants[variant] = entry
+            route.entries.set(key, variants)
+        await self._respond(send, entry, if_none_match, b"MISS")
+
+    async def _respond(self, send, entry, if_none_match: Optional[str], cache_status: bytes):
+        status, headers, body, etag = entry
+        if status != 200:
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        validators = [
+            (b"etag", etag.encode()),
+            (b"cache-control", CACHE_CONTROL.encode()),
+            (b"x-cache", cache_status),
+        ]
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.cache.not_modified += 1
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send({"type": "http.response.start", "status": 200, "headers": headers + validators})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,156 @@
+"""
+Slot Booking Engine
+
+Books appointment slots atomically and checks single slots against an index
+instead of scanning appointments in Python. Bulk availability (a doctor's
+free slots over a range, or many doctors at once) is served by
+availability_index.
+
+- A doctor's published schedule is ``doctor_availability.time_slots`` (cached
+  per day by the data access layer).
+- Whether a published slot is taken is answered by ``appointment_slots``, one
+  row per booked (doctor, date, time) with that triple as primary key.
+- Booking calls the ``book_appointment_slot`` Postgres function, which claims
+  the slot and inserts the appointment in one transaction. Two concurrent
+  bookers for the same slot cannot both succeed; the loser gets
+  ``SlotUnavailableError``.
+
+Usage:
+    engine = SlotBookingEngine(get_data_access())
+    appointment = await engine.book({...})
+"""
+
+import logging
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+from .data_access import SupabaseDataAccess
+
+logger = logging.getLogger(__name__)
+
+# Postgres error code for a unique/primary key violation
+UNIQUE_VIOLATION = "23505"
+
+# Longest date range served by a single bulk availability query (availability_index)
+MAX_RANGE_DAYS = 62
+
+
+class SlotUnavailableError(Exception):
+    """Raised when a slot is already booked or not offered by the doctor."""
+
+
+def normalize_time(value: str) -> str:
+    """Reduce a TIME value ("10:00:00" from Postgres) to the API's HH:MM."""
+    return str(value)[:5]
+
+
+class SlotBookingEngine:
+    """Atomic booking and index-backed slot checks."""
+
+    def __init__(self, dal: SupabaseDataAccess):
+        self.dal = dal
+
+    # ------------------------------------------------------------------
+    # Availability
+    # ------------------------------------------------------------------
+
+    async def check(self, doctor_id: str, day: date, time: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check a single slot.
+
+        Returns:
+            Tuple of (available, reason if not available)
+        """
+        offered, reason = await self.is_offered(doctor_id, day, time)
+        if not offered:
+            return False, reason
+
+        if await self.dal.appointment_slots.is_booked(doctor_id, day.isoformat(), time):
+            return False, "This time slot is already booked"
+        return True, None
+
+    async def is_offered(self, doctor_id: str, day: date, time: str) -> Tuple[bool, Optional[str]]:
+        """
+        Whether the doctor's published schedule offers a slot.
+
+        Days without a published schedule are treated as open, matching the
+        previous behaviour of the availability check.
+        """
+        availability = await self.dal.doctor_availability.get_for_day(doctor_id, day.isoformat())
+        if not availability:
+            return True, None
+
+        for slot in availability["time_slots"]:
+            if normalize_time(slot["time"]) == time:
+                if slot.get("is_available", True):
+                    return True, None
+                return False, "Doctor is not available at this time"
+        return False, "Doctor has not set availability for this time"
+
+    # ------------------------------------------------------------------
+    # Booking
+    # ------------------------------------------------------------------
+
+    async def book(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Claim the slot and create the appointment in one transaction.
+
+        Args:
+            appointment: patient_id, doctor_id, date (date), time (HH:MM),
+                consultation_fee and optional patient_name, patient_email,
+                symptom_category, severity, notes
+
+        Returns:
+            The created appointment row
+
+        Raises:
+            SlotUnavailableError: If the slot is already booked
+        """
+        rows = await self.dal.rpc("book_appointment_slot", {
+            "p_patient_id": appointment["patient_id"],
+            "p_doctor_id": appointment["doctor_id"],
+            "p_date": appointment["date"].isoformat(),
+            "p_time": appointment["time"],
+            "p_consultation_fee": appointment["consultation_fee"],
+            "p_patient_name": appointment.get("patient_name"),
+            "p_patient_email": appointment.get("patient_email"),
+            "p_symptom_category": appointment.get("symptom_category"),
+            "p_severity": appointment.get("severity"),
+            "p_notes": appointment.get("notes"),
+        })
+        if not rows:
+            raise SlotUnavailableError("This time slot is already booked")
+        self.dal.notify_slots_changed(appointment["doctor_id"], appointment["date"].isoformat())
+        return rows[0]
+
+    async def claim(self, appointment_id: str, doctor_id: str, day: date, time: str) -> None:
+        """
+        Claim a slot for an existing appointment (the first step of a reschedule).
+
+        The old slot stays claimed until ``release_slot``, so a reschedule
+        whose appointment update fails can be undone by releasing the new
+        claim instead.
+
+        Raises:
+            SlotUnavailableError: If the slot is not offered or already booked
+        """
+        offered, reason = await self.is_offered(doctor_id, day, time)
+        if not offered:
+            raise SlotUnavailableError(reason)
+        try:
+            await self.dal.appointment_slots.claim(doctor_id, day.isoformat(), time, appointment_id)
+        except APIError as e:
+            if e.code == UNIQUE_VIOLATION:
+                raise SlotUnavailableError("This time slot is already booked")
+            raise
+
+    async def release_slot(self, doctor_id: str, day: date, time: str) -> None:
+        """Free one slot (the old slot of a reschedule, or a claim being undone)."""
+        await self.dal.appointment_slots.release(doctor_id, day.isoformat(), time)
+
+    async def release(self, appointment_id: str) -> None:
+        """Free the slot held by an appointment (cancellation)."""
+        await self.dal.appointment_slots.release_for_appointment(appointment_id)
+
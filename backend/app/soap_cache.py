@@ -0,0 +1,129 @@
+"""
+Content-Addressed SOAP Note Cache
+
+Both generate_soap endpoints used to regenerate the note on every click,
+even when the transcript had not changed since the last generation. The
+generated note is now stored with the hash of the inputs it came from:
+
+- ``soap_transcript_hash``: ``transcript_hash`` of the transcript the note
+  in ``soap_notes`` was generated from
+- ``stigma_input_hash``: ``stigma_input_hash`` of that note's Assessment and
+  Plan, which the suggestions in ``stigma_suggestions`` belong to
+
+``cached_soap_notes`` returns the stored note and suggestions when the
+transcript still hashes to the stored key, so the request makes no LLM call.
+When only the transcript changed, the stored suggestions still seed the
+Compassion Reflex cache (app.summarizer), so an identical Assessment and Plan
+skips that call too. Both hashes include the model and prompts, so a prompt
+change invalidates every stored note.
+
+The cache reads ``soap_notes`` / ``stigma_suggestions``, which only the
+backend writes; the doctor's reviewed note lives in ``raw_soap_note``.
+Without migration 007 the hash columns are missing: notes are saved without
+them and every request regenerates, as before.
+
+Usage:
+    cached = cached_soap_notes(consultation, transcript)
+    soap_note, suggestions = cached or await get_soap_drafter().generate(consultation_id, transcript)
+    await save_soap_notes(dal, consultation_id, soap_note, suggestions, transcript)
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .data_access import SupabaseDataAccess
+from .summarizer import SOAP_FIELDS, remember_stigma_suggestions, stigma_input_hash, transcript_hash
+
+logger = logging.getLogger(__name__)
+
+SOAP_CACHE_COLUMNS = ("soap_transcript_hash", "stigma_input_hash")
+
+
+def cached_soap_notes(
+    consultation: Dict[str, Any],
+    transcript: str
+) -> Optional[Tuple[Dict[str, str], List[Dict[str, Any]]]]:
+    """
+    Stored SOAP note and suggestions if they were generated from ``transcript``.
+
+    Args:
+        consultation: Consultation row (needs the SOAP and hash columns)
+        transcript: Transcript the note is requested for
+
+    Returns:
+        (soap_note, suggestions), or None when the note must be generated
+    """
+    note = consultation.get("soap_notes")
+    if not isinstance(note, dict) or any(not isinstance(note.get(field), str) for field in SOAP_FIELDS):
+        return None
+    suggestions = consultation.get("stigma_suggestions") or []
+
+    stigma_key = consultation.get("stigma_input_hash")
+    if stigma_key and stigma_key == stigma_input_hash(note["assessment"], note["plan"]):
+        remember_stigma_suggestions(note["assessment"], note["plan"], suggestions)
+    else:
+        # Suggestions from an older prompt (or unknown origin) are not reused
+        return None
+
+    if consultation.get("soap_transcript_hash") != transcript_hash(transcript):
+        return None
+    logger.info(f"SOAP note for {consultation.get('id')} served from cache (transcript unchanged)")
+    return {field: note[field] for field in SOAP_FIELDS}, suggestions
+
+
+def soap_cache_columns(
+    transcript: str,
+    soap_note: Dict[str, str]
+) -> Dict[str, str]:
+    """Hash columns stored with a note generated from ``transcript``."""
+    return {
+        "soap_transcript_hash": transcript_hash(transcript),
+        "stigma_input_hash": stigma_input_hash(soap_note.get("assessment", ""), soap_note.get("plan", "")),
+    }
+
+
+async def save_soap_notes(
+    dal: SupabaseDataAccess,
+    consultation_id: str,
+    soap_note: Dict[str, str],
+    stigma_suggestions: List[Dict[str, Any]],
+    transcript: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Save a generated note and suggestions, keyed by ``transcript`` when given.
+
+    Writes both the backend columns (``soap_notes``, ``stigma_suggestions``)
+    and the frontend ones (``raw_soap_note``, ``de_stigma_suggestions``).
+
+    Returns:
+        Updated consultation row, or None if it does not exist
+
+    Raises:
+        Exception: If the update fails
+    """
+    changes: Dict[str, Any] = {
+        "soap_notes": soap_note,
+        "raw_soap_note": soap_note,
+        "stigma_suggestions": stigma_suggestions,
+        "de_stigma_suggestions": stigma_suggestions,
+    }
+    if not transcript:
+        # Unknown origin: clear the keys so a stale hash cannot match this note
+        return await _update(dal, consultation_id, {**changes, **dict.fromkeys(SOAP_CACHE_COLUMNS)})
+    return await _update(dal, consultation_id, {**changes, **soap_cache_columns(transcript, soap_note)})
+
+
+async def _update(
+    dal: SupabaseDataAccess,
+    consultation_id: str,
+    changes: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    try:
+        return await dal.consultations.update(consultation_id, changes)
+    except Exception as e:
+        if not any(column in str(e) for column in SOAP_CACHE_COLUMNS):
+            raise
+        logger.warning(f"SOAP cache columns missing (run migration 007_add_soap_cache_columns.sql): {e}")
+        for column in SOAP_CACHE_COLUMNS:
+            changes.pop(column, None)
+        return await dal.consultations.update(consultation_id, changes)
@@ -0,0 +1,284 @@
+"""
+Incremental SOAP Drafting
+
+SOAP generation used to start only when the doctor asked for notes after
+the call, so the doctor waited for the whole transcript to be summarized.
+``SoapDrafter`` drafts the note while the consultation is still running:
+
+- Caption utterances are collected per consultation; every
+  ``SOAP_DRAFT_EVERY`` new utterances a background task summarizes them
+  into a partial note (the map step of ``app.summarizer``) and merges it
+  into the rolling draft, section by section, only for the sections the
+  new utterances touched
+- The Compassion Reflex is re-run in the background whenever Assessment or
+  Plan change
+- When captions stop for ``SOAP_DRAFT_IDLE_FLUSH`` seconds (the call has
+  ended or paused), the remaining utterances are drafted too, so a doctor
+  who asks for notes a few seconds after the call usually finds no tail
+- ``generate`` checks that the stored transcript starts with the drafted
+  utterances and reconciles only the tail after them; with no tail the
+  draft is returned as is. A transcript that does not match the draft (or
+  a failed reconcile) falls back to ``generate_notes_with_empathy``
+
+Drafting is optional (``SOAP_DRAFTER=true``); when it is off ``generate``
+is exactly ``generate_notes_with_empathy``.
+
+Usage:
+    drafter = get_soap_drafter()
+    drafter.add_utterance(consultation_id, "patient", text)
+    soap_note, suggestions = await drafter.generate(consultation_id, transcript)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import summarizer
+from .models import SoapNoteResponse
+from .summarizer import (
+    SOAP_FIELDS,
+    SOAP_MAP_CONCURRENCY,
+    _complete_note,
+    _merge_section,
+    _summarize_chunk,
+    generate_notes_with_empathy,
+    split_speaker_turns,
+)
+
+logger = logging.getLogger(__name__)
+
+SOAP_DRAFTER_ENABLED = os.getenv("SOAP_DRAFTER", "false").lower() == "true"
+SOAP_DRAFT_EVERY = int(os.getenv("SOAP_DRAFT_EVERY", "20"))
+SOAP_DRAFT_IDLE_FLUSH_SECONDS = float(os.getenv("SOAP_DRAFT_IDLE_FLUSH", "5"))
+# Drafts of consultations idle this long are dropped
+SOAP_DRAFT_IDLE_SECONDS = float(os.getenv("SOAP_DRAFT_IDLE_SECONDS", "21600"))
+
+
+def _same_turn(a: str, b: str) -> bool:
+    return a.split() == b.split()
+
+
+class _Draft:
+    """Rolling draft of one consultation."""
+
+    def __init__(self):
+        self.turns: List[str] = []
+        # Turns [0, drafted) are reflected in note and suggestions
+        self.drafted = 0
+        self.note: Dict[str, str] = {field: "" for field in SOAP_FIELDS}
+        self.suggestions: List[Dict[str, Any]] = []
+        self.updates = 0
+        self.task: Optional[asyncio.Task] = None
+        self.flush_timer: Optional[asyncio.TimerHandle] = None
+        self.last_activity = time.monotonic()
+
+
+class SoapDrafter:
+    """Keeps a rolling SOAP draft per live consultation."""
+
+    def __init__(
+        self,
+        enabled: bool = SOAP_DRAFTER_ENABLED,
+        every: int = SOAP_DRAFT_EVERY,
+        idle_flush: float = SOAP_DRAFT_IDLE_FLUSH_SECONDS
+    ):
+        """
+        Args:
+            enabled: Draft in the background (otherwise only full generation)
+            every: New utterances that trigger a draft update
+            idle_flush: Seconds without utterances after which the rest is drafted
+        """
+        self.enabled = enabled
+        self.every = every
+        self.idle_flush = idle_flush
+        self._drafts: Dict[str, _Draft] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.updates = 0
+        self.failed_updates = 0
+        self.reconciled = 0
+        self.fallbacks = 0
+
+    def add_utterance(self, consultation_id: str, speaker: str, text: str) -> None:
+        """Record one caption utterance (must be called from the event loop)."""
+        text = (text or "").strip()
+        if not self.enabled or not text:
+            return
+        draft = self._drafts.get(consultation_id)
+        if draft is None:
+            self._drop_idle()
+            draft = self._drafts[consultation_id] = _Draft()
+        # Same form as the stored transcript (see stt_pipeline)
+        draft.turns.append(f"[{speaker.upper()}]: {text}")
+        draft.last_activity = time.monotonic()
+        self._schedule(consultation_id, draft, self.every)
+        if draft.flush_timer is not None:
+            draft.flush_timer.cancel()
+        draft.flush_timer = asyncio.get_running_loop().call_later(
+            self.idle_flush, self._schedule, consultation_id, draft, 1
+        )
+
+    def _schedule(self, consultation_id: str, draft: _Draft, minimum: int) -> None:
+        """Start a background update if ``minimum`` utterances are waiting and none is running."""
+        if len(draft.turns) - draft.drafted >= minimum and (draft.task is None or draft.task.done()):
+            draft.task = asyncio.create_task(self._update(consultation_id, draft, minimum))
+
+    def _drop_idle(self) -> None:
+        cutoff = time.monotonic() - SOAP_DRAFT_IDLE_SECONDS
+        for consultation_id in [cid for cid, draft in self._drafts.items() if draft.last_activity < cutoff]:
+            self.discard(consultation_id)
+
+    def discard(self, consultation_id: str) -> None:
+        """Forget a consultation's draft."""
+        draft = self._drafts.pop(consultation_id, None)
+        if draft is None:
+            return
+        if draft.task is not None:
+            draft.task.cancel()
+        if draft.flush_timer is not None:
+            draft.flush_timer.cancel()
+
+    async def _update(self, consultation_id: str, draft: _Draft, minimum: int) -> None:
+        # Keep going while utterances arrive faster than drafts complete
+        while len(draft.turns) - draft.drafted >= minimum:
+            end = len(draft.turns)
+            try:
+                draft.note, draft.suggestions = await self._fold(draft, draft.turns[draft.drafted:end], final=False)
+            except Exception as e:
+                self.failed_updates += 1
+                logger.warning(f"SOAP draft update failed for {consultation_id}: {e}")
+                return
+            draft.drafted = end
+            draft.updates += 1
+            self.updates += 1
+
+    async def _fold(
+        self,
+        draft: _Draft,
+        turns: List[str],
+        final: bool
+    ) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+        note_model = summarizer._get_model(SoapNoteResponse)
+        model = summarizer._get_model()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(SOAP_MAP_CONCURRENCY)
+        semaphore = self._semaphore
+
+        partial = await _summarize_chunk(
+            note_model, semaphore, "\n".join(turns),
+            "the latest part" if final else "the latest part (the consultation is still in progress)",
+            draft.turns[draft.drafted - 1] if draft.drafted else None
+        )
+
+        async def section(field: str) -> str:
+            if not partial[field]:
+                return draft.note[field]
+            if not draft.note[field]:
+                return partial[field]
+            return await _merge_section(model, semaphore, field, [draft.note[field], partial[field]])
+
+        changed = {field for field in SOAP_FIELDS if partial[field]}
+        if not final:
+            # Drafts may have empty sections; the final note may not
+            values = await asyncio.gather(*(section(field) for field in SOAP_FIELDS))
+            note = dict(zip(SOAP_FIELDS, values))
+            if changed & {"assessment", "plan"} and note["assessment"] and note["plan"]:
+                suggestions = await summarizer._analyze_for_stigma(note["assessment"], note["plan"])
+            else:
+                suggestions = draft.suggestions
+            return note, suggestions
+
+        return await _complete_note(
+            {field: section(field) if field in changed else _resolved(draft.note[field] or "Not documented")
+             for field in SOAP_FIELDS},
+            None if changed & {"assessment", "plan"} else draft.suggestions
+        )
+
+    async def generate(
+        self,
+        consultation_id: str,
+        transcript: str
+    ) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+        """
+        SOAP note and suggestions for a finished consultation.
+
+        Reconciles the tail of the transcript into the draft when there is
+        one; otherwise (or if that fails) runs ``generate_notes_with_empathy``.
+
+        Raises:
+            Same as generate_notes_with_empathy
+        """
+        draft = self._drafts.get(consultation_id) if self.enabled else None
+        if draft is not None and transcript and transcript.strip() and summarizer.GEMINI_API_KEY:
+            result = await self._reconcile(consultation_id, draft, transcript)
+            if result is not None:
+                return result
+        return await generate_notes_with_empathy(transcript)
+
+    async def _reconcile(
+        self,
+        consultation_id: str,
+        draft: _Draft,
+        transcript: str
+    ) -> Optional[Tuple[Dict[str, str], List[Dict[str, Any]]]]:
+        if draft.task is not None and not draft.task.done():
+            await asyncio.shield(draft.task)
+        if not draft.updates:
+            return None
+
+        turns = split_speaker_turns(transcript)
+        drafted = draft.turns[:draft.drafted]
+        if len(turns) < len(drafted) or not all(map(_same_turn, turns, drafted)):
+            self.fallbacks += 1
+            logger.info(f"Transcript of {consultation_id} does not match its SOAP draft; generating in full")
+            return None
+
+        tail = turns[len(drafted):]
+        try:
+            if tail:
+                note, suggestions = await self._fold(draft, tail, final=True)
+            else:
+                note, suggestions = await _complete_note(
+                    {field: _resolved(draft.note[field] or "Not documented") for field in SOAP_FIELDS},
+                    draft.suggestions
+                )
+        except Exception as e:
+            self.fallbacks += 1
+            logger.warning(f"Reconciling SOAP draft for {consultation_id} failed, generating in full: {e}")
+            return None
+
+        # A repeated request is answered from the updated draft
+        draft.turns, draft.drafted = turns, len(turns)
+        draft.note, draft.suggestions = note, suggestions
+        self.reconciled += 1
+        logger.info(f"SOAP note for {consultation_id} reconciled from draft "
+                    f"({len(drafted)} drafted turns, {len(tail)} in the tail)")
+        return note, suggestions
+
+    def stats(self) -> Dict[str, Any]:
+        """Drafting counters."""
+        return {
+            "enabled": self.enabled,
+            "consultations": len(self._drafts),
+            "updates": self.updates,
+            "failed_updates": self.failed_updates,
+            "reconciled": self.reconciled,
+            "fallbacks": self.fallbacks,
+        }
+
+
+async def _resolved(text: str) -> str:
+    return text
+
+
+_drafter: Optional[SoapDrafter] = None
+
+
+def get_soap_drafter() -> SoapDrafter:
+    """Shared drafter, fed by the caption pipeline and used by the SOAP endpoints."""
+    global _drafter
+    if _drafter is None:
+        _drafter = SoapDrafter()
+    return _drafter
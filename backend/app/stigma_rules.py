@@ -0,0 +1,367 @@
+"""
+Local Stigma-Language Detector
+
+The Compassion Reflex used to send every Assessment and Plan to Gemini,
+although most findings are a short list of well-known phrases
+("non-compliant", "diabetic patient", "drug abuser", "refuses").
+``StigmaDetector`` finds those locally and deterministically:
+
+- A phrase dictionary of judgmental and doubt-casting terms, each with a
+  person-first replacement and a rationale ("non-compliant" -> "not
+  adherent", "denies" -> "reports no", "drug abuser" -> "person with a
+  substance use disorder")
+- Token patterns for non-person-first constructions: a condition adjective
+  before a person noun ("diabetic patient" -> "patient with diabetes",
+  "an epileptic child" -> "a child with epilepsy") or used as a noun ("a
+  known alcoholic", "schizophrenics"). A condition adjective before
+  anything else ("diabetic foot ulcer", "hypertensive crisis") is clinical
+  and left alone
+- Watch terms that are stigmatizing only in some contexts ("abuse",
+  "aggressive", "manipulative"). A watch term not covered by a rule makes
+  the result inconclusive; only then does the Compassion Reflex ask the
+  model (see ``STIGMA_REVIEW`` in app.summarizer)
+
+Suggestions quote the note text exactly, so the frontend can replace
+``original`` with ``suggested`` in place.
+
+Usage:
+    review = get_stigma_detector().review(assessment, plan)
+    if review.inconclusive:
+        ...  # ask the model as well
+    suggestions = review.suggestions
+"""
+
+import hashlib
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+# Handle imports for both direct execution and module import (as app.summarizer)
+try:
+    from app.models import StigmaSuggestion
+except ImportError:
+    from models import StigmaSuggestion
+
+# Person nouns a condition adjective must precede to be non-person-first
+PERSON_NOUNS = {
+    "patient": "patients", "pt": "pts", "person": "people", "individual": "individuals",
+    "man": "men", "woman": "women", "male": "males", "female": "females", "adult": "adults",
+    "child": "children", "boy": "boys", "girl": "girls", "lady": "ladies", "gentleman": "gentlemen",
+    "mother": "mothers", "father": "fathers",
+}
+
+# Condition adjective (or noun used as one) -> person-first condition
+CONDITIONS = {
+    "diabetic": "diabetes",
+    "epileptic": "epilepsy",
+    "asthmatic": "asthma",
+    "schizophrenic": "schizophrenia",
+    "psychotic": "psychosis",
+    "bipolar": "bipolar disorder",
+    "autistic": "autism",
+    "anorexic": "anorexia",
+    "bulimic": "bulimia",
+    "depressed": "depression",
+    "obese": "obesity",
+    "morbidly obese": "severe obesity",
+    "hypertensive": "hypertension",
+    "arthritic": "arthritis",
+    "anaemic": "anaemia",
+    "anemic": "anemia",
+    "demented": "dementia",
+    "paraplegic": "paraplegia",
+    "quadriplegic": "quadriplegia",
+    "alcoholic": "alcohol use disorder",
+    "mentally ill": "mental illness",
+    "hiv": "HIV",
+    "hiv-positive": "HIV",
+    "hiv positive": "HIV",
+    "aids": "AIDS",
+    "cancer": "cancer",
+    "dementia": "dementia",
+    "copd": "COPD",
+    "tb": "TB",
+    "dialysis": "kidney failure on dialysis",
+    "psychiatric": "a psychiatric condition",
+}
+
+# Conditions also used as nouns for people ("a diabetic", "epileptics")
+CONDITION_NOUNS = {
+    "diabetic", "epileptic", "asthmatic", "schizophrenic", "psychotic", "anorexic", "bulimic",
+    "alcoholic", "paraplegic", "quadriplegic", "arthritic",
+}
+
+# "known" and "type 2" stay with the condition ("patient with known type 2 diabetes")
+_QUALIFIER = r"(?P<qualifier>(?:known\s+)?(?:type\s+[12]\s+)?)"
+# A condition used as a noun ends the phrase ("a known diabetic." but not "a diabetic foot")
+_NOUN_END = r"(?=\s*(?:[.,;:)]|$)|\s+(?:and|with|on|who|since|for|but|presenting|presents|admitted)\b)"
+
+# (pattern, replacement, rationale); replacement may be a callable on the match
+PhraseReplacement = Union[str, Callable[["re.Match"], str]]
+
+
+def _person_with_sud(match: "re.Match") -> str:
+    # Keep the article only if the note had one: "Drug addict with..." has none
+    return ("a " if match.group("article") else "") + "person with a substance use disorder"
+
+
+def _person_who_smokes(match: "re.Match") -> str:
+    # "chronic smoker" -> "person who smokes chronically": the degree is clinical information
+    degree = {"chronic": " chronically", "heavy": " heavily"}.get((match.group("degree") or "").lower(), "")
+    return ("a " if match.group("article") else "") + "person who smokes" + degree
+
+
+PHRASE_RULES: List[Tuple[str, PhraseReplacement, str]] = [
+    # Blame and judgment
+    (r"(is|was|has been) non-?compliant (?:with|to)", r"\1 having difficulty adhering to",
+     "Describes the difficulty rather than blaming the patient for non-adherence"),
+    (r"non-?compliant (?:with|to)", "not adherent to",
+     "'Non-compliant' implies disobedience; describe adherence neutrally"),
+    (r"non-?compliant", "not adherent",
+     "'Non-compliant' implies disobedience; describe adherence neutrally"),
+    (r"non-?compliance", "difficulty with adherence",
+     "'Non-compliance' implies disobedience; describe adherence neutrally"),
+    (r"refuses", "declines", "'Refuses' frames the patient's choice as defiance"),
+    (r"refused", "declined", "'Refused' frames the patient's choice as defiance"),
+    (r"refusing", "declining", "'Refusing' frames the patient's choice as defiance"),
+    (r"refusal", "decision to decline", "'Refusal' frames the patient's choice as defiance"),
+    (r"failed (treatment|therapy|medication|management)", r"did not respond to \1",
+     "The treatment did not work; the patient did not fail"),
+    (r"drug[- ]seeking", "requesting pain medication",
+     "'Drug-seeking' presumes intent; document the request itself"),
+    (r"frequent fl(?:y|i)er", "patient with frequent visits",
+     "'Frequent flyer' is dismissive of a patient with ongoing needs"),
+    (r"poor historian", "had difficulty recalling the history",
+     "Describes the difficulty instead of labeling the patient"),
+    # Doubt-casting verbs
+    (r"denies", "reports no", "'Denies' suggests the patient is not believed"),
+    (r"denied", "reported no", "'Denied' suggests the patient is not believed"),
+    (r"claims", "reports", "'Claims' suggests the patient is not believed"),
+    (r"claimed", "reported", "'Claimed' suggests the patient is not believed"),
+    (r"alleges", "reports", "'Alleges' suggests the patient is not believed"),
+    (r"complains of", "reports", "'Complains' portrays the patient as a complainer"),
+    (r"complained of", "reported", "'Complained' portrays the patient as a complainer"),
+    (r"complaining of", "reporting", "'Complaining' portrays the patient as a complainer"),
+    # Substance use
+    (r"(?:drug|substance) abusers", "people with a substance use disorder",
+     "Person-first language; 'abuser' is associated with blame and punitive attitudes"),
+    (r"(?:drug|substance) abuser", "person with a substance use disorder",
+     "Person-first language; 'abuser' is associated with blame and punitive attitudes"),
+    (r"(?:drug|substance) abuse", "substance use disorder",
+     "'Abuse' is associated with blame; use the clinical diagnosis"),
+    (r"alcohol abuse", "alcohol use disorder",
+     "'Abuse' is associated with blame; use the clinical diagnosis"),
+    (r"(?:an? )?(?:drug )?addicts", "people with a substance use disorder",
+     "Person-first language; 'addict' defines the person by the disorder"),
+    (r"(?P<article>an? )?(?:drug )?addict", _person_with_sud,
+     "Person-first language; 'addict' defines the person by the disorder"),
+    (r"(?P<article>an? )?junkie", _person_with_sud,
+     "'Junkie' is a slur; use person-first clinical language"),
+    (r"(?:iv|intravenous) drug users?", "person who injects drugs",
+     "Person-first language for injection drug use"),
+    (r"drug users?", "person who uses drugs", "Person-first language for drug use"),
+    (r"(?<!ex )(?<!non )(?P<article>an? )?(?:(?P<degree>chronic|heavy) )?smoker", _person_who_smokes,
+     "Person-first language; describe the behavior, not an identity"),
+    (r"(?:is )?addicted to", "has a substance use disorder involving",
+     "Person-first language; use the clinical description"),
+    # Mental health
+    (r"crazy|psycho|lunatic|insane|nutcase|mental case",
+     "experiencing psychiatric symptoms (describe them)",
+     "Derogatory mental health term; describe the observed symptoms clinically"),
+    (r"the mentally ill", "people with mental illness",
+     "Person-first language for mental illness"),
+    (r"(?:mentally )?retarded", "with an intellectual disability",
+     "Outdated and offensive term; use 'intellectual disability'"),
+    # Disability
+    (r"wheelchair[- ]bound|confined to a wheelchair", "uses a wheelchair",
+     "A wheelchair enables mobility; it does not confine"),
+    (r"handicapped", "disabled", "Outdated term; use 'disabled' or 'person with a disability'"),
+    (r"suffers from", "has", "'Suffers from' assumes how the patient experiences the condition"),
+    (r"suffering from", "living with",
+     "'Suffering from' assumes how the patient experiences the condition"),
+    (r"afflicted (?:with|by)", "has",
+     "'Afflicted' assumes how the patient experiences the condition"),
+    (r"stroke victim", "person who had a stroke",
+     "'Victim' defines the patient by the event"),
+    (r"(is|was) obese", r"\1 living with obesity", "Person-first language for obesity"),
+]
+
+# Stigmatizing only in some contexts: left to the model when no rule covers them
+WATCH_TERMS = [
+    "abuse", "abusing", "abuser", "addict", "aggressive", "hostile", "combative", "belligerent",
+    "manipulative", "uncooperative", "difficult patient", "demanding", "hysterical", "malinger",
+    "attention seeking", "attention-seeking", "exaggerat", "unreliable", "insists", "lazy",
+    "unmotivated", "dirty", "unkempt", "dramatic", "histrionic", "obese", "alcoholic", "noncomplian",
+    "non-complian", "defiant", "narcotic", "junkie", "user",
+]
+
+NON_PERSON_FIRST_RATIONALE = "Person-first language: the patient is not defined by the condition"
+
+
+class StigmaRule(NamedTuple):
+    """One compiled rule."""
+    pattern: "re.Pattern"
+    replace: Callable[["re.Match"], str]
+    rationale: str
+
+
+class StigmaReview(NamedTuple):
+    """Result of the local pass over Assessment and Plan."""
+    suggestions: List[StigmaSuggestion]
+    # Watch terms no rule accounted for; the model decides those
+    inconclusive: Tuple[str, ...]
+
+
+def _article(word: str) -> str:
+    return "an" if word[:1].lower() in "aeiou" else "a"
+
+
+def _match_case(original: str, suggested: str) -> str:
+    # Capitalized at a sentence start, but not an acronym ("HIV patient")
+    first = re.match(r"\w*", original).group()
+    if first[:1].isupper() and (len(first) == 1 or not first.isupper()) and suggested[:1].islower():
+        return suggested[:1].upper() + suggested[1:]
+    return suggested
+
+
+def _alternation(words) -> str:
+    # Longest first, so "morbidly obese" wins over "obese"
+    return "|".join(re.escape(word).replace(r"\ ", r"\s+") for word in sorted(words, key=len, reverse=True))
+
+
+def _condition(match: "re.Match") -> str:
+    # The qualifier moves mid-sentence: "Known diabetic patient" -> "Patient with known diabetes"
+    qualifier = re.sub(r"\s+", " ", match.group("qualifier") or "").lower()
+    return qualifier + CONDITIONS[re.sub(r"\s+", " ", match.group("condition").lower())]
+
+
+def _person_first_rules() -> List[StigmaRule]:
+    nouns = list(PERSON_NOUNS) + list(PERSON_NOUNS.values())
+
+    def adjective(match: "re.Match") -> str:
+        noun = match.group("noun")
+        article = f"{_article(noun)} " if match.group("article") else ""
+        return f"{article}{noun} with {_condition(match)}"
+
+    def noun_form(match: "re.Match") -> str:
+        return f"a person with {_condition(match)}"
+
+    def plural_form(match: "re.Match") -> str:
+        return f"people with {_condition(match)}"
+
+    return [
+        StigmaRule(
+            re.compile(
+                rf"\b(?P<article>an?\s+)?{_QUALIFIER}(?P<condition>{_alternation(CONDITIONS)})\s+"
+                rf"(?P<noun>{_alternation(nouns)})\b",
+                re.IGNORECASE,
+            ),
+            adjective, NON_PERSON_FIRST_RATIONALE,
+        ),
+        StigmaRule(
+            re.compile(
+                rf"\ban?\s+{_QUALIFIER}(?P<condition>{_alternation(CONDITION_NOUNS)}){_NOUN_END}",
+                re.IGNORECASE,
+            ),
+            noun_form, NON_PERSON_FIRST_RATIONALE,
+        ),
+        StigmaRule(
+            re.compile(rf"\b{_QUALIFIER}(?P<condition>{_alternation(CONDITION_NOUNS)})s\b", re.IGNORECASE),
+            plural_form, NON_PERSON_FIRST_RATIONALE,
+        ),
+    ]
+
+
+def _phrase_rule(pattern: str, replacement: PhraseReplacement, rationale: str) -> StigmaRule:
+    # Not inside a hyphenated word: "non-smoker" is not "smoker"
+    compiled = re.compile(rf"(?<![\w-])(?:{pattern})\b", re.IGNORECASE)
+    if callable(replacement):
+        return StigmaRule(compiled, replacement, rationale)
+    return StigmaRule(compiled, lambda match: match.expand(replacement), rationale)
+
+
+def _replacement_key(replacement: PhraseReplacement):
+    # A function's repr holds its address; its name and constants are stable across processes
+    if callable(replacement):
+        return replacement.__qualname__, replacement.__code__.co_consts
+    return replacement
+
+
+# Changes to the tables change the results cached by app.summarizer
+STIGMA_RULES_VERSION = hashlib.blake2b(
+    repr((PERSON_NOUNS, CONDITIONS, sorted(CONDITION_NOUNS), _QUALIFIER, _NOUN_END,
+          [(p, _replacement_key(r), why) for p, r, why in PHRASE_RULES], WATCH_TERMS)).encode(),
+    digest_size=8,
+).hexdigest()
+
+
+class StigmaDetector:
+    """Phrase dictionary and person-first patterns applied to note sections."""
+
+    def __init__(self, extra_rules: Optional[List[Tuple[str, PhraseReplacement, str]]] = None):
+        """
+        Args:
+            extra_rules: Additional (pattern, replacement, rationale) phrase rules
+        """
+        # Person-first patterns first: "a drug addict patient" is one finding
+        self.rules = _person_first_rules() + [
+            _phrase_rule(*rule) for rule in PHRASE_RULES + list(extra_rules or [])
+        ]
+        self._watch = re.compile(rf"\b(?:{_alternation(WATCH_TERMS)})\w*", re.IGNORECASE)
+
+    def detect(self, section: str, text: str) -> Tuple[List[StigmaSuggestion], Tuple[str, ...]]:
+        """
+        Suggestions for one section, and the watch terms no rule covered.
+
+        Overlapping matches keep the earliest rule (longest span on ties).
+        """
+        text = text or ""
+        spans: List[Tuple[int, int, StigmaRule, "re.Match"]] = []
+        for rule in self.rules:
+            for match in rule.pattern.finditer(text):
+                start, end = match.span()
+                if any(start < other_end and other_start < end for other_start, other_end, _, _ in spans):
+                    continue
+                spans.append((start, end, rule, match))
+        spans.sort(key=lambda span: span[0])
+
+        suggestions: List[StigmaSuggestion] = []
+        seen = set()
+        for start, end, rule, match in spans:
+            original = match.group(0)
+            key = original.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            suggestions.append(StigmaSuggestion(
+                section=section,
+                original=original,
+                suggested=_match_case(original, rule.replace(match)),
+                rationale=rule.rationale,
+            ))
+
+        unresolved = tuple(
+            match.group(0).lower() for match in self._watch.finditer(text)
+            if not any(start <= match.start() < end for start, end, _, _ in spans)
+        )
+        return suggestions, unresolved
+
+    def review(self, assessment: str, plan: str) -> StigmaReview:
+        """Local Compassion Reflex over Assessment and Plan."""
+        suggestions: List[StigmaSuggestion] = []
+        inconclusive: List[str] = []
+        for section, text in (("assessment", assessment), ("plan", plan)):
+            found, unresolved = self.detect(section, text)
+            suggestions.extend(found)
+            inconclusive.extend(unresolved)
+        return StigmaReview(suggestions, tuple(dict.fromkeys(inconclusive)))
+
+
+_detector: Optional[StigmaDetector] = None
+
+
+def get_stigma_detector() -> StigmaDetector:
+    """Shared detector (compiling the rules takes a few milliseconds)."""
+    global _detector
+    if _detector is None:
+        _detector = StigmaDetector()
+    return _detector
@@ -0,0 +1,38 @@
+"""
+NDJSON streaming responses for full exports
+
+Exports can span thousands of rows with large JSON columns. Instead of
+building one JSON array in memory, rows are read page by page (keyset
+pagination in the data access layer) and written to the client as newline-
+delimited JSON while the next page is fetched.
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def ndjson_lines(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """One chunk per page, one JSON document per line."""
+    try:
+        async for rows in pages:
+            yield "".join(json.dumps(row, default=str) + "\n" for row in rows).encode()
+    except Exception as e:
+        # Headers are already sent; the client sees a truncated stream
+        logger.error(f"Export stream failed: {e}")
+        raise
+
+
+def ndjson_response(pages: AsyncIterator[List[Dict[str, Any]]], filename: str) -> StreamingResponse:
+    """Stream pages of rows as an NDJSON attachment."""
+    return StreamingResponse(
+        ndjson_lines(pages),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -6,31 +6,81 @@ This module implements a two-step LLM chain using Google Gemini API:
 2. Identify and suggest alternatives for stigmatizing language (Compassion Reflex)
 
 Based on EMNLP 2024 'Words Matter' research for person-first clinical documentation.
+
+Long transcripts (hour-long consultations) are summarized map-reduce style
+instead of in one prompt: the transcript is split at speaker turns into
+chunks of about ``SOAP_CHUNK_TOKENS`` tokens, the chunks are summarized
+concurrently (at most ``SOAP_MAP_CONCURRENCY`` at a time) into partial SOAP
+notes, and each section is then merged by its own concurrent call, so no
+single call has to write the whole note. The Compassion Reflex starts once
+Assessment and Plan are merged. ``mode="auto"`` switches to map-reduce above
+``SOAP_MAP_REDUCE_MIN_TOKENS``.
+
+Results are content-addressed: ``transcript_hash`` keys a stored SOAP note
+by its transcript (see app.soap_cache), and Compassion Reflex suggestions
+are cached by ``stigma_input_hash`` of Assessment and Plan, so unchanged
+inputs skip the LLM. Both hashes include the model and prompts.
+
+The Compassion Reflex runs the local detector (app.stigma_rules) first and
+only asks the model when that is inconclusive (``STIGMA_REVIEW=auto``), on
+every note (``deep``) or instead of the detector (``llm``).
 """
 
 import os
+import hashlib
+import re
 import json
+import asyncio
 import logging
-from typing import Dict, List, Tuple, Any, Optional
-import google.generativeai as genai
+from typing import Awaitable, Dict, List, Tuple, Type, Any, Optional
+
+from pydantic import BaseModel
 
 # Handle imports for both direct execution and module import
 try:
+    from app.cache import get_cache
+    from app.llm_gateway import get_llm_gateway
+    from app.llm_json import LLMOutputError, json_generation_config, parse_llm_json
     from app.models import SoapNoteResponse, StigmaSuggestion
+    from app.stigma_rules import STIGMA_RULES_VERSION, get_stigma_detector
 except ImportError:
+    from cache import get_cache
+    from llm_gateway import get_llm_gateway
+    from llm_json import LLMOutputError, json_generation_config, parse_llm_json
     from models import SoapNoteResponse, StigmaSuggestion
+    from stigma_rules import STIGMA_RULES_VERSION, get_stigma_detector
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
+# Gemini is configured by the shared gateway (app.llm_gateway)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     logger.warning("GEMINI_API_KEY not found in environment variables")
 
+SOAP_MODEL = 'models/gemini-2.5-flash'
+
+# Map-reduce settings for long transcripts (token counts are estimates)
+SOAP_MAP_REDUCE_MIN_TOKENS = int(os.getenv("SOAP_MAP_REDUCE_MIN_TOKENS", "6000"))
+SOAP_CHUNK_TOKENS = int(os.getenv("SOAP_CHUNK_TOKENS", "2500"))
+SOAP_MAP_CONCURRENCY = int(os.getenv("SOAP_MAP_CONCURRENCY", "4"))
+
+# Compassion Reflex: "auto" asks the model only when the local detector is
+# inconclusive, "deep" always asks it as well, "llm" skips the detector
+STIGMA_REVIEW_MODES = ("auto", "deep", "llm")
+STIGMA_REVIEW_MODE = os.getenv("STIGMA_REVIEW", "auto").lower()
+
+# Compassion Reflex results kept in memory, keyed by Assessment and Plan
+STIGMA_CACHE_TTL_SECONDS = float(os.getenv("STIGMA_CACHE_TTL", "86400"))
+STIGMA_CACHE_SIZE = int(os.getenv("STIGMA_CACHE_SIZE", "2048"))
+
+SOAP_MODES = ("auto", "single", "map_reduce")
+SOAP_FIELDS = ('subjective', 'objective', 'assessment', 'plan')
+
+# A line starting a new speaker turn: "[PATIENT]: ...", "Doctor: ...", "Dr: ..."
+_SPEAKER_TURN = re.compile(r"^\s*\[?(doctor|patient|dr\.?)\]?\s*:", re.IGNORECASE)
+
 
 # Prompts for the two-step LLM chain
 SOAP_GENERATION_PROMPT = """You are an expert, HIPAA-compliant AI medical scribe for the Indian healthcare context. 
@@ -102,9 +152,168 @@ If NO stigmatizing language is found, return:
 
 Return ONLY the JSON object, no additional text or explanation."""
 
+CHUNK_SUMMARY_PROMPT = """You are an expert, HIPAA-compliant AI medical scribe for the Indian healthcare context.
+
+Below is {part_label} of a long multilingual, code-switched (Hinglish) doctor-patient consultation transcript. {context_note}
+
+Extract the clinically relevant facts stated in THIS part into a partial, English-only SOAP note. Other parts are summarized separately and merged later, so:
+- Include only facts from this part; do not guess about the rest of the consultation
+- Leave a section as an empty string if this part has nothing for it
+- Use professional medical terminology; be concise, keep every clinical detail (values, durations, medications, doses)
+- Ignore casual conversation
+
+Transcript part:
+{transcript}
+
+Output a JSON object with this exact structure:
+{{
+  "subjective": "...",
+  "objective": "...",
+  "assessment": "...",
+  "plan": "..."
+}}
+
+Return ONLY the JSON object, no additional text or explanation."""
+
+SOAP_SECTION_DESCRIPTIONS = {
+    "subjective": "Patient's reported symptoms, history, and concerns",
+    "objective": "Observable findings, vital signs, physical examination results",
+    "assessment": "Clinical diagnosis and medical impression",
+    "plan": "Treatment plan, medications, follow-up instructions",
+}
+
+SECTION_MERGE_PROMPT = """You are an expert, HIPAA-compliant AI medical scribe for the Indian healthcare context.
+
+The following are the '{section}' sections of partial SOAP notes written, in order, from consecutive parts of one doctor-patient consultation. Merge them into the single '{section}' section ({description}) of a professional, English-only SOAP note.
+
+Guidelines:
+- Combine facts from all parts; remove repetition
+- Where later parts update or contradict earlier ones (e.g. a revised diagnosis or changed dose), keep the later version
+- Keep every clinical detail (values, durations, medications, doses)
+
+Partial '{section}' sections (JSON list, in consultation order):
+{parts}
+
+Output a JSON object with this exact structure:
+{{
+  "{section}": "merged section text"
+}}
+
+Return ONLY the JSON object, no additional text or explanation."""
+
+# Cached results are only reused while the prompts, model and note schema are unchanged
+SOAP_PROMPT_VERSION = hashlib.blake2b(
+    (SOAP_MODEL + SOAP_GENERATION_PROMPT + CHUNK_SUMMARY_PROMPT + SECTION_MERGE_PROMPT
+     + json.dumps(json_generation_config(SoapNoteResponse), sort_keys=True)).encode(), digest_size=8
+).hexdigest()
+STIGMA_PROMPT_VERSION = hashlib.blake2b(
+    (SOAP_MODEL + COMPASSION_REFLEX_PROMPT + STIGMA_RULES_VERSION).encode(), digest_size=8
+).hexdigest()
+
+_stigma_cache = get_cache("stigma_suggestions", ttl=STIGMA_CACHE_TTL_SECONDS, max_size=STIGMA_CACHE_SIZE)
+
+
+def _content_hash(version: str, *parts: str) -> str:
+    digest = hashlib.blake2b(version.encode(), digest_size=16)
+    for part in parts:
+        digest.update(b"\0")
+        digest.update((part or "").strip().encode())
+    return digest.hexdigest()
+
+
+def transcript_hash(transcript: str) -> str:
+    """Key of the SOAP note generated from ``transcript`` (ignores surrounding whitespace)."""
+    return _content_hash(SOAP_PROMPT_VERSION, transcript)
+
+
+def stigma_input_hash(assessment: str, plan: str, mode: Optional[str] = None) -> str:
+    """Key of the Compassion Reflex suggestions for an Assessment and Plan (and review mode)."""
+    return _content_hash(STIGMA_PROMPT_VERSION + (mode or STIGMA_REVIEW_MODE), assessment, plan)
+
+
+def remember_stigma_suggestions(
+    assessment: str,
+    plan: str,
+    suggestions: List[Dict[str, Any]],
+    mode: Optional[str] = None
+) -> None:
+    """Cache suggestions already known for an Assessment and Plan (e.g. stored with a note)."""
+    _stigma_cache.set(stigma_input_hash(assessment, plan, mode), [dict(s) for s in suggestions])
+
+
+def _get_model(schema: Optional[Type[BaseModel]] = None):
+    """
+    Gemini model for one step of the chain (rate-limited and retried by the gateway).
+
+    JSON mode, constrained to ``schema`` when given: whole and partial notes
+    use SoapNoteResponse; a section merge answers with that one section and
+    the Compassion Reflex with a suggestions list, so those use JSON mode only.
+    """
+    return get_llm_gateway().model(SOAP_MODEL, caller="summarizer", generation_config=json_generation_config(schema))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def split_speaker_turns(transcript: str) -> List[str]:
+    """
+    Split a transcript into speaker turns.
+
+    A line starting with a speaker label ("[PATIENT]:", "Doctor:") starts a
+    turn; unlabeled lines belong to the turn before them.
+    """
+    turns: List[str] = []
+    for line in transcript.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if turns and not _SPEAKER_TURN.match(line):
+            turns[-1] += "\n" + line
+        else:
+            turns.append(line)
+    return turns
+
+
+def chunk_transcript(transcript: str, max_tokens: int = SOAP_CHUNK_TOKENS) -> List[str]:
+    """
+    Pack whole speaker turns into chunks of at most ``max_tokens`` (estimated).
+
+    A single turn longer than ``max_tokens`` is split between words.
+    """
+    pieces: List[str] = []
+    for turn in split_speaker_turns(transcript):
+        if estimate_tokens(turn) <= max_tokens:
+            pieces.append(turn)
+            continue
+        words: List[str] = []
+        for word in turn.split():
+            if words and estimate_tokens(" ".join(words + [word])) > max_tokens:
+                pieces.append(" ".join(words))
+                words = []
+            words.append(word)
+        if words:
+            pieces.append(" ".join(words))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
 
 async def generate_notes_with_empathy(
-    full_transcript: str
+    full_transcript: str,
+    mode: str = "auto"
 ) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
     """
     Generate SOAP notes with Compassion Reflex de-stigmatization suggestions.
@@ -115,6 +324,8 @@ async def generate_notes_with_empathy(
     
     Args:
         full_transcript: Complete consultation transcript (may be multilingual/Hinglish)
+        mode: "single" (one prompt), "map_reduce" (chunked) or "auto"
+            (map-reduce above SOAP_MAP_REDUCE_MIN_TOKENS)
         
     Returns:
         Tuple containing:
@@ -122,27 +333,37 @@ async def generate_notes_with_empathy(
         - List of de-stigmatization suggestions (empty if none found)
         
     Raises:
-        ValueError: If transcript is empty or API key not configured
+        ValueError: If transcript is empty, mode is unknown or API key not configured
         RuntimeError: If LLM API calls fail
     """
     if not full_transcript or not full_transcript.strip():
         raise ValueError("Transcript cannot be empty")
     
+    if mode not in SOAP_MODES:
+        raise ValueError(f"Unknown SOAP generation mode: {mode}")
+    
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY not configured")
     
     logger.info("Starting SOAP note generation with Compassion Reflex")
     
     # Step 1: Generate SOAP note
-    logger.info("Step 1: Generating SOAP note from transcript")
-    raw_soap_note = await _generate_soap_note(full_transcript)
-    
-    # Step 2: Run Compassion Reflex analysis
-    logger.info("Step 2: Running Compassion Reflex de-stigmatization analysis")
-    de_stigma_suggestions = await _analyze_for_stigma(
-        raw_soap_note["assessment"],
-        raw_soap_note["plan"]
-    )
+    if mode == "auto":
+        mode = "map_reduce" if estimate_tokens(full_transcript) > SOAP_MAP_REDUCE_MIN_TOKENS else "single"
+    chunks = chunk_transcript(full_transcript) if mode == "map_reduce" else []
+    if len(chunks) > 1:
+        logger.info(f"Step 1: Generating SOAP note from {len(chunks)} transcript chunks (map-reduce)")
+        raw_soap_note, de_stigma_suggestions = await _generate_notes_map_reduce(chunks)
+    else:
+        logger.info("Step 1: Generating SOAP note from transcript")
+        raw_soap_note = await _generate_soap_note(full_transcript)
+        
+        # Step 2: Run Compassion Reflex analysis
+        logger.info("Step 2: Running Compassion Reflex de-stigmatization analysis")
+        de_stigma_suggestions = await _analyze_for_stigma(
+            raw_soap_note["assessment"],
+            raw_soap_note["plan"]
+        )
     
     logger.info(f"SOAP generation complete. Found {len(de_stigma_suggestions)} suggestions")
     
@@ -164,14 +385,14 @@ async def _generate_soap_note(transcript: str) -> Dict[str, str]:
     """
     try:
         # Initialize Gemini model (using gemini-2.5-flash for better availability)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
+        model = _get_model(SoapNoteResponse)
         
         # Format prompt with transcript
         prompt = SOAP_GENERATION_PROMPT.format(transcript=transcript)
         
         # Generate content
         logger.debug("Calling Gemini API for SOAP note generation")
-        response = model.generate_content(prompt)
+        response = await model.generate_content_async(prompt)
         
         # Extract text from response
         response_text = response.text.strip()
@@ -180,97 +401,290 @@ async def _generate_soap_note(transcript: str) -> Dict[str, str]:
         # Parse JSON response
         soap_note = _parse_json_response(response_text)
         
-        # Validate required fields
-        required_fields = ['subjective', 'objective', 'assessment', 'plan']
-        for field in required_fields:
-            if field not in soap_note:
-                raise ValueError(f"Missing required field: {field}")
-            if not soap_note[field] or not soap_note[field].strip():
-                raise ValueError(f"Field '{field}' cannot be empty")
+        return _validate_soap_note(soap_note)
         
-        # Validate using Pydantic model
-        validated_note = SoapNoteResponse(**soap_note)
+    except Exception as e:
+        logger.error(f"Error generating SOAP note: {str(e)}")
+        raise RuntimeError(f"Failed to generate SOAP note: {str(e)}")
+
+
+def _validate_soap_note(soap_note: Dict[str, Any]) -> Dict[str, str]:
+    """Check that every SOAP section is present and non-empty."""
+    for field in SOAP_FIELDS:
+        if field not in soap_note:
+            raise ValueError(f"Missing required field: {field}")
+        if not soap_note[field] or not str(soap_note[field]).strip():
+            raise ValueError(f"Field '{field}' cannot be empty")
+    
+    # Validate using Pydantic model
+    validated_note = SoapNoteResponse(**soap_note)
+    
+    return {
+        "subjective": validated_note.subjective,
+        "objective": validated_note.objective,
+        "assessment": validated_note.assessment,
+        "plan": validated_note.plan
+    }
+
+
+async def _call_json(model, semaphore: asyncio.Semaphore, prompt: str) -> Dict[str, Any]:
+    """One model call under the concurrency limit, parsed as JSON."""
+    async with semaphore:
+        response = await model.generate_content_async(prompt)
+    return _parse_json_response(response.text.strip())
+
+
+async def _summarize_chunk(
+    model,
+    semaphore: asyncio.Semaphore,
+    chunk: str,
+    part_label: str,
+    context_turn: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Summarize one transcript chunk into a partial SOAP note (sections may be empty).
+    
+    Args:
+        chunk: Speaker turns to summarize
+        part_label: Where the chunk sits, e.g. "part 2 of 5"
+        context_turn: Turn before the chunk, repeated so an answer is not cut
+            off from its question
+    """
+    context_note = ""
+    if context_turn:
+        context_note = (
+            "The first line repeats the end of the previous part for context only; "
+            "do not record facts from it."
+        )
+        chunk = context_turn + "\n" + chunk
+    note = await _call_json(model, semaphore, CHUNK_SUMMARY_PROMPT.format(
+        part_label=part_label, context_note=context_note, transcript=chunk
+    ))
+    return {field: str(note.get(field) or "").strip() for field in SOAP_FIELDS}
+
+
+async def _merge_section(model, semaphore: asyncio.Semaphore, section: str, parts: List[str]) -> str:
+    """
+    Merge one section's partial texts (in consultation order) into one.
+    
+    Parts that do not fit one prompt are merged in groups, level by level.
+    """
+    parts = [part for part in parts if part]
+    if not parts:
+        return "Not documented"
+    
+    async def merge(group: List[str]) -> str:
+        note = await _call_json(model, semaphore, SECTION_MERGE_PROMPT.format(
+            section=section,
+            description=SOAP_SECTION_DESCRIPTIONS[section],
+            parts=json.dumps(group, ensure_ascii=False, indent=1)
+        ))
+        return str(note.get(section) or "").strip()
+    
+    while True:
+        groups: List[List[str]] = [[]]
+        group_tokens = 0
+        for part in parts:
+            tokens = estimate_tokens(part)
+            if groups[-1] and group_tokens + tokens > SOAP_CHUNK_TOKENS:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(part)
+            group_tokens += tokens
+        if len(groups) == 1 or len(groups) == len(parts):
+            break
+        parts = await asyncio.gather(*(merge(group) for group in groups))
+    return await merge(parts)
+
+
+async def _complete_note(
+    sections: Dict[str, Awaitable[str]],
+    suggestions: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    """
+    Await the four sections and the Compassion Reflex together.
+    
+    The Compassion Reflex starts as soon as Assessment and Plan are ready,
+    alongside the other sections, unless ``suggestions`` (for unchanged
+    Assessment and Plan) are passed in.
+    """
+    futures = {field: asyncio.ensure_future(sections[field]) for field in SOAP_FIELDS}
+    
+    async def reflex() -> List[Dict[str, Any]]:
+        if suggestions is not None:
+            return suggestions
+        assessment, plan = await asyncio.gather(futures["assessment"], futures["plan"])
+        logger.info("Step 2: Running Compassion Reflex de-stigmatization analysis")
+        return await _analyze_for_stigma(assessment, plan)
+    
+    suggestions_task = asyncio.ensure_future(reflex())
+    try:
+        merged = dict(zip(SOAP_FIELDS, await asyncio.gather(*futures.values())))
+        raw_soap_note = _validate_soap_note(merged)
+    except BaseException:
+        suggestions_task.cancel()
+        for future in futures.values():
+            future.cancel()
+        raise
+    return raw_soap_note, await suggestions_task
+
+
+async def _generate_notes_map_reduce(
+    chunks: List[str]
+) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    """
+    Both steps for long transcripts, map-reduce style.
+    
+    Map: each chunk is summarized into a partial SOAP note, concurrently.
+    Reduce: each section is merged by its own call, concurrently, so no call
+    has to write the whole note. The Compassion Reflex starts as soon as
+    Assessment and Plan are merged, alongside the other two sections.
+    
+    Args:
+        chunks: Transcript chunks in consultation order
         
-        return {
-            "subjective": validated_note.subjective,
-            "objective": validated_note.objective,
-            "assessment": validated_note.assessment,
-            "plan": validated_note.plan
-        }
+    Returns:
+        Same as generate_notes_with_empathy
+        
+    Raises:
+        RuntimeError: If any SOAP call fails or a response is invalid
+    """
+    note_model = _get_model(SoapNoteResponse)
+    model = _get_model()
+    semaphore = asyncio.Semaphore(SOAP_MAP_CONCURRENCY)
+    
+    try:
+        notes = await asyncio.gather(*(
+            _summarize_chunk(
+                note_model, semaphore, chunk, f"part {index + 1} of {len(chunks)}",
+                split_speaker_turns(chunks[index - 1])[-1] if index else None
+            )
+            for index, chunk in enumerate(chunks)
+        ))
+        logger.info(f"Summarized {len(chunks)} chunks; merging sections")
+        
+        return await _complete_note({
+            field: _merge_section(model, semaphore, field, [note[field] for note in notes])
+            for field in SOAP_FIELDS
+        })
         
     except Exception as e:
-        logger.error(f"Error generating SOAP note: {str(e)}")
+        logger.error(f"Error generating SOAP note (map-reduce): {str(e)}")
         raise RuntimeError(f"Failed to generate SOAP note: {str(e)}")
 
 
 async def _analyze_for_stigma(
     assessment: str,
-    plan: str
+    plan: str,
+    mode: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Step 2: Analyze SOAP note for stigmatizing language using Gemini API.
+    Step 2: Analyze SOAP note for stigmatizing language.
+    
+    The local detector (app.stigma_rules) runs first; Gemini is only asked
+    when its result is inconclusive, or always in "deep" mode. Model
+    suggestions for a phrase the detector already covered are dropped.
     
     Args:
         assessment: Assessment section of SOAP note
         plan: Plan section of SOAP note
+        mode: "auto", "deep" or "llm" (model only); defaults to STIGMA_REVIEW
         
     Returns:
         List of suggestion dictionaries (empty if no issues found)
         
     Raises:
-        RuntimeError: If API call fails or response is invalid
+        ValueError: If mode is unknown
     """
+    mode = mode or STIGMA_REVIEW_MODE
+    if mode not in STIGMA_REVIEW_MODES:
+        raise ValueError(f"Unknown stigma review mode: {mode}")
+    
+    cached = _stigma_cache.get(stigma_input_hash(assessment, plan, mode))
+    if cached is not None:
+        logger.info("Compassion Reflex suggestions served from cache")
+        return [dict(s) for s in cached]
+    
+    local_suggestions: List[Dict[str, Any]] = []
+    if mode != "llm":
+        review = get_stigma_detector().review(assessment, plan)
+        local_suggestions = [suggestion.model_dump() for suggestion in review.suggestions]
+        if mode == "auto" and not review.inconclusive:
+            logger.info(f"Compassion Reflex resolved locally ({len(local_suggestions)} suggestions)")
+            remember_stigma_suggestions(assessment, plan, local_suggestions, mode)
+            return local_suggestions
+        if review.inconclusive:
+            logger.info(f"Compassion Reflex inconclusive locally ({', '.join(review.inconclusive)}); asking the model")
+    
     try:
-        # Initialize Gemini model (using gemini-2.5-flash for better availability)
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        
-        # Format prompt with assessment and plan sections
-        prompt = COMPASSION_REFLEX_PROMPT.format(
-            assessment=assessment,
-            plan=plan
-        )
-        
-        # Generate content
-        logger.debug("Calling Gemini API for Compassion Reflex analysis")
-        response = model.generate_content(prompt)
-        
-        # Extract text from response
-        response_text = response.text.strip()
-        logger.debug(f"Received response: {response_text[:200]}...")
-        
-        # Parse JSON response
-        result = _parse_json_response(response_text)
-        
-        # Extract suggestions array
-        suggestions = result.get("suggestions", [])
-        
-        # Validate each suggestion using Pydantic model
-        validated_suggestions = []
-        for suggestion in suggestions:
-            try:
-                validated = StigmaSuggestion(**suggestion)
-                validated_suggestions.append({
-                    "section": validated.section,
-                    "original": validated.original,
-                    "suggested": validated.suggested,
-                    "rationale": validated.rationale
-                })
-            except Exception as e:
-                logger.warning(f"Invalid suggestion format, skipping: {e}")
-                continue
-        
-        return validated_suggestions
-        
+        model_suggestions = await _llm_stigma_suggestions(assessment, plan)
     except Exception as e:
         logger.error(f"Error analyzing for stigma: {str(e)}")
-        # Return empty list on error rather than failing the entire process
-        logger.warning("Returning empty suggestions due to error")
-        return []
+        # Return the local findings on error rather than failing the entire process
+        logger.warning("Returning local suggestions only due to error")
+        return local_suggestions
+    
+    covered = {(s["section"], s["original"].lower()) for s in local_suggestions}
+    suggestions = local_suggestions + [
+        s for s in model_suggestions
+        if not any(
+            section == s["section"] and (original in s["original"].lower() or s["original"].lower() in original)
+            for section, original in covered
+        )
+    ]
+    # Failures above are not cached, so the next request retries
+    remember_stigma_suggestions(assessment, plan, suggestions, mode)
+    return suggestions
+
+
+async def _llm_stigma_suggestions(assessment: str, plan: str) -> List[Dict[str, Any]]:
+    """
+    Compassion Reflex by Gemini.
+    
+    Raises:
+        RuntimeError: If API call fails or response is invalid
+    """
+    # Initialize Gemini model (using gemini-2.5-flash for better availability)
+    model = _get_model()
+    
+    # Format prompt with assessment and plan sections
+    prompt = COMPASSION_REFLEX_PROMPT.format(
+        assessment=assessment,
+        plan=plan
+    )
+    
+    # Generate content
+    logger.debug("Calling Gemini API for Compassion Reflex analysis")
+    response = await model.generate_content_async(prompt)
+    
+    # Extract text from response
+    response_text = response.text.strip()
+    logger.debug(f"Received response: {response_text[:200]}...")
+    
+    # Parse JSON response
+    result = _parse_json_response(response_text)
+    
+    # Extract suggestions array
+    suggestions = result.get("suggestions", [])
+    
+    # Validate each suggestion using Pydantic model
+    validated_suggestions = []
+    for suggestion in suggestions:
+        try:
+            validated_suggestions.append(StigmaSuggestion(**suggestion).model_dump())
+        except Exception as e:
+            logger.warning(f"Invalid suggestion format, skipping: {e}")
+            continue
+    
+    return validated_suggestions
 
 
 def _parse_json_response(response_text: str) -> Dict[str, Any]:
     """
-    Parse JSON from LLM response, handling common formatting issues.
+    Parse JSON from LLM response (fences and prose are fine).
+    
+    Malformed or truncated output is not repaired: a note cut off mid-plan
+    ("Start amlodipine 5") would otherwise be saved and cached as complete.
     
     Args:
         response_text: Raw text response from LLM
@@ -279,24 +693,14 @@ def _parse_json_response(response_text: str) -> Dict[str, Any]:
         Parsed JSON dictionary
         
     Raises:
-        ValueError: If JSON cannot be parsed
+        ValueError: If JSON cannot be parsed (LLMOutputError)
     """
-    # Remove markdown code blocks if present
-    text = response_text.strip()
-    if text.startswith("```json"):
-        text = text[7:]
-    elif text.startswith("```"):
-        text = text[3:]
-    if text.endswith("```"):
-        text = text[:-3]
-    text = text.strip()
-    
     try:
-        return json.loads(text)
-    except json.JSONDecodeError as e:
+        return parse_llm_json(response_text, allow_repair=False)
+    except LLMOutputError as e:
         logger.error(f"Failed to parse JSON: {e}")
-        logger.error(f"Response text: {text}")
-        raise ValueError(f"Invalid JSON response from LLM: {str(e)}")
+        logger.error(f"Response text: {response_text}")
+        raise
 
 
 # Synchronous wrapper for backward compatibility
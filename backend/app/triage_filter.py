@@ -0,0 +1,271 @@
+"""
+Local Triage Pre-filter
+
+Many patient lines in a consultation are small talk ("haan", "thank you
+doctor", "theek hoon") and cannot raise an alert, yet each one used to cost a
+Gemini call. ``TriagePrefilter`` looks at an utterance locally first:
+
+- It fails open: only clear small talk (every word a greeting,
+  acknowledgement, thanks or filler from ``SMALL_TALK_WORDS``, and no
+  symptom term) is skipped. Every other line goes to the model, since no
+  vocabulary can list every way a patient describes an emergency
+- Symptom vocabulary in English, Hinglish and Hindi (Devanagari is
+  romanized by ``normalize_utterance``) is compiled into one Aho-Corasick
+  automaton, so an utterance is scanned once regardless of vocabulary size.
+  The score and critical flag drive the fallback matcher when the model is
+  unavailable
+- Each term has a weight: critical terms ("chest pain", "behosh", "kill
+  myself") weigh the most, general symptoms ("dard", "fever") less,
+  intensifiers ("bahut", "severe") only add to other terms
+- Terms match at word starts, so "bleed" also finds "bleeding" but "sar"
+  does not fire inside "sardi"
+
+Usage:
+    prefilter = TriagePrefilter()
+    if prefilter.should_escalate(text):
+        ...
+"""
+
+import os
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .utterance_cache import normalize_utterance
+
+TRIAGE_PREFILTER_ENABLED = os.getenv("TRIAGE_PREFILTER", "true").lower() == "true"
+
+CRITICAL_WEIGHT = 3.0
+SYMPTOM_WEIGHT = 1.0
+INTENSIFIER_WEIGHT = 0.5
+
+# English emergencies (also the fallback matcher's keywords)
+CRITICAL_KEYWORDS = [
+    "chest pain", "can't breathe", "heart attack", "stroke", "seizure",
+    "passed out", "bleeding", "suicidal", "overdose", "severe pain",
+    "unconscious", "paralysis", "can't move", "vision loss",
+    "fracture", "broken bone", "broken arm", "broken leg", "head injury",
+    "deep cut", "severe burn", "can't walk", "severe injury",
+    # Suicide and self-harm
+    "suicide", "kill myself", "killing myself", "end my life", "ending my life", "end it all",
+    "take my own life", "want to die", "wanna die", "feel like dying", "better off dead",
+    "no reason to live", "self harm", "hurt myself", "harm myself", "cutting myself",
+    # Overdose and poisoning
+    "overdosed", "too many pills", "too many tablets", "all my pills", "bleach",
+    "poisoned", "poisoning", "pesticide", "rat poison", "kerosene", "drank acid",
+    # Stroke (face, arm, speech)
+    "face drooping", "face is drooping", "drooping", "droopy", "slurred", "slurring",
+    "can't speak", "cannot speak", "can't talk", "cannot talk", "can't feel my", "cannot feel my",
+    "can't lift my", "cannot lift my", "one side of my body", "numb on one side", "weak on one side",
+    # Airway and breathing
+    "cannot breathe", "not breathing", "stopped breathing", "choking", "choked", "gasping",
+    "can't swallow", "cannot swallow", "throat is closing", "throat closing", "throat swelling",
+    "tongue swelling", "lips turning blue", "lips are turning blue", "turning blue", "lips are blue",
+    "blue lips", "chest tightness", "chest is tight", "tight chest",
+]
+
+# Hindi / Hinglish emergencies, in the spellings patients use
+CRITICAL_TERMS_HI = [
+    "seene me dard", "seene mein dard", "chhati me dard", "chati mein dard", "dil me dard",
+    "सीने में दर्द", "छाती में दर्द", "दिल में दर्द",
+    "dil ka daura", "heart attack aaya", "दिल का दौरा",
+    "saans nahi", "saans nahi aa rahi", "saans lene me taklif", "saans phool", "dum ghut",
+    "सांस नहीं", "सांस लेने में तकलीफ", "सांस फूल", "दम घुट",
+    "behosh", "बेहोश", "chakkar aakar gir", "gir gaya", "gir gayi",
+    "khoon beh", "khoon aa raha", "khoon ki ulti", "खून बह", "खून आ रहा", "खून की उल्टी",
+    "lakwa", "लकवा", "haath pair sunn", "मुंह टेढ़ा", "munh tedha",
+    "daura pad", "mirgi", "दौरा पड़", "मिर्गी",
+    "haddi tut", "haddi toot", "हड्डी टूट",
+    "jaan dena", "mar jana chahta", "mar jaana chahti", "atmahatya", "khudkushi",
+    "जान देना", "मर जाना", "आत्महत्या", "खुदकुशी",
+    "marne ka mann", "marne ka man", "marna chahta", "marna chahti", "jeena nahi chahta",
+    "jeena nahi chahti", "khud ko nuksan", "khud ko chot", "मरने का मन", "जीना नहीं",
+    "zeher", "zehar", "जहर", "bahut saari goliyan", "goliyan kha li", "neend ki goliyan",
+    "keetnashak", "chuhe mar", "कीटनाशक", "नींद की गोलियां",
+    "chehra latak", "zubaan ladkhada", "bol nahi pa", "जुबान लड़खड़ा",
+    "gala ghut", "gale mein atak", "saans ruk", "hont neele", "गला घुट", "होंठ नीले",
+    "jal gaya", "jal gayi", "जल गया", "जल गई",
+    "sahan nahi", "बर्दाश्त नहीं", "bardasht nahi",
+]
+
+SYMPTOM_TERMS = [
+    # English
+    "pain", "ache", "hurt", "sore", "fever", "temperature", "vomit", "nausea", "dizzy", "dizziness",
+    "faint", "headache", "migraine", "cough", "breath", "breathing", "wheez", "swell", "swollen",
+    "rash", "itch", "infection", "pus", "injur", "wound", "cut", "burn", "bleed", "blood",
+    "numb", "tingl", "weak", "tired", "fatigue", "palpitation", "heartbeat", "confus",
+    "diarrh", "constipat", "cramp", "sprain", "fall", "fell", "blurr", "vision", "sweat",
+    "cold", "chills", "shiver", "anxious", "panic", "depress", "hopeless", "broke", "fractur",
+    "dislocat", "stitch", "allerg", "poison", "suicid", "kill", "die", "blind",
+    # Hinglish
+    "dard", "bukhar", "bukhaar", "ulti", "ji machla", "chakkar", "sar dard", "sir dard",
+    "khansi", "saans", "sujan", "soojan", "khujli", "chot", "ghav", "zakhm", "khoon",
+    "sunn ho", "sunn pad", "kamzori", "thakan", "ghabrahat", "dhadkan", "dast", "kabz", "ainthan",
+    "jalan", "pasina", "kaanp", "neend nahi", "bhookh nahi", "pet", "dawai se reaction",
+    "toot", "tut gay", "mar ja", "kat gay", "dhundhla", "dikhai nahi",
+    # Hindi
+    "दर्द", "बुखार", "उल्टी", "चक्कर", "खांसी", "सांस", "सूजन", "खुजली", "चोट", "घाव",
+    "खून", "सुन्न हो", "कमजोरी", "थकान", "घबराहट", "धड़कन", "दस्त", "जलन", "पसीना",
+]
+
+# Greetings, acknowledgements, thanks and fillers. A line made only of these
+# (and matching no symptom term) is small talk and skips the model.
+SMALL_TALK_WORDS = [
+    # English
+    "hello", "hi", "hey", "good", "morning", "afternoon", "evening", "night", "thank", "thanks",
+    "you", "doctor", "doc", "sir", "madam", "maam", "ok", "okay", "yes", "yeah", "yep", "no",
+    "nope", "sure", "fine", "alright", "right", "understood", "noted", "bye", "goodbye", "see",
+    "next", "week", "tomorrow", "please", "one", "second", "minute", "sorry", "hmm", "hm", "uh",
+    "um", "ah", "oh", "got", "it", "i", "m", "am", "will", "do", "that", "s", "ll", "all",
+    "nothing", "else", "can", "hear", "me", "welcome", "great", "now", "so", "much", "very",
+    "repeat", "again",
+    # Hinglish and Hindi
+    "haan", "han", "ha", "ji", "nahi", "nahin", "theek", "thik", "hoon", "hun", "hu", "hai", "hain",
+    "dhanyavaad", "dhanyavad", "shukriya", "namaste", "namaskar", "acha", "accha", "achha",
+    "samajh", "gaya", "gayi", "ek", "bas", "itna", "aur", "kuch", "main", "ab", "alvida", "phir",
+    "se", "boliye", "kya", "sun", "raha", "rahi", "awaaz", "aawaz", "aa", "sahab", "bilkul",
+    "हां", "हाँ", "जी", "नहीं", "ठीक", "हूं", "हूँ", "है", "धन्यवाद", "शुक्रिया", "नमस्ते", "अच्छा",
+]
+
+INTENSIFIER_TERMS = [
+    "severe", "extreme", "unbearable", "worst", "very bad", "really bad", "suddenly", "sudden",
+    "bahut", "bohot", "bahot", "tez", "zyada", "achanak", "बहुत", "तेज", "ज्यादा", "अचानक",
+]
+
+
+class TriageTerm(NamedTuple):
+    """One vocabulary entry after normalization."""
+    text: str
+    weight: float
+    critical: bool
+
+
+class TriageScore(NamedTuple):
+    """Result of scoring one utterance."""
+    score: float
+    critical: bool
+    matches: Tuple[str, ...]
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: every occurrence of every pattern in one pass over the text."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._link()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = nxt
+            state = nxt
+        self._out[state].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        """(end index, pattern index) of every match, end exclusive."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = []
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                for pattern in out[state]:
+                    found.append((index + 1, pattern))
+        return found
+
+
+class TriagePrefilter:
+    """Weighted vocabulary scorer deciding which utterances are worth a model call."""
+
+    def __init__(
+        self,
+        critical: Iterable[str] = (),
+        symptoms: Iterable[str] = (),
+        intensifiers: Iterable[str] = (),
+        small_talk: Iterable[str] = ()
+    ):
+        """
+        Args:
+            critical: Extra critical terms
+            symptoms: Extra symptom terms
+            intensifiers: Extra intensifier terms
+            small_talk: Extra small-talk words
+        """
+        terms: Dict[str, TriageTerm] = {}
+        for words, weight, is_critical in [
+            (INTENSIFIER_TERMS + list(intensifiers), INTENSIFIER_WEIGHT, False),
+            (SYMPTOM_TERMS + list(symptoms), SYMPTOM_WEIGHT, False),
+            (CRITICAL_KEYWORDS + CRITICAL_TERMS_HI + list(critical), CRITICAL_WEIGHT, True),
+        ]:
+            for word in words:
+                normalized = normalize_utterance(word, transliterate=True)
+                if normalized:
+                    # Later (heavier) lists win for terms listed twice
+                    terms[normalized] = TriageTerm(normalized, weight, is_critical)
+        self.terms = list(terms.values())
+        self._matcher = AhoCorasick(term.text for term in self.terms)
+        self.small_talk = frozenset(
+            word
+            for entry in SMALL_TALK_WORDS + list(small_talk)
+            for word in normalize_utterance(entry, transliterate=True).split()
+        )
+
+    def score(self, text: str) -> TriageScore:
+        """Sum of the weights of distinct terms found at word starts."""
+        normalized = normalize_utterance(text, transliterate=True)
+        seen = {}
+        for end, index in self._matcher.find(normalized):
+            term = self.terms[index]
+            start = end - len(term.text)
+            if start == 0 or normalized[start - 1] == " ":
+                seen[index] = term
+        return TriageScore(
+            score=sum(term.weight for term in seen.values()),
+            critical=any(term.critical for term in seen.values()),
+            matches=tuple(term.text for term in seen.values()),
+        )
+
+    def is_small_talk(self, text: str) -> bool:
+        """Whether every word is small talk and no symptom term matches."""
+        words = normalize_utterance(text, transliterate=True).split()
+        return all(word in self.small_talk for word in words) and not self.score(text).matches
+
+    def should_escalate(self, text: str) -> bool:
+        """Whether the utterance needs the model: anything but clear small talk."""
+        return not self.is_small_talk(text)
+
+
+_prefilter: Optional[TriagePrefilter] = None
+
+
+def get_triage_prefilter() -> TriagePrefilter:
+    """Shared pre-filter (building the automaton takes a few milliseconds)."""
+    global _prefilter
+    if _prefilter is None:
+        _prefilter = TriagePrefilter()
+    return _prefilter
@@ -0,0 +1,280 @@
+"""
+Utterance Result Cache
+
+Patients repeat themselves: "mujhe chest pain hai", "Mujhe chest pain hai!"
+and "mujhe  chest pain hai..." are the same utterance to a triage model.
+``UtteranceCache`` stores model results under a normalized form of the text
+so those repeats are answered without another model call:
+
+- Normalization: Unicode NFKC, case folding, punctuation and symbols dropped,
+  whitespace collapsed. With ``transliterate=True`` Devanagari is also
+  romanized and common Hinglish spelling variants are folded
+  ("seene"/"sine", "wo"/"vo", "zyada"/"jyada"), so "मुझे दर्द है" and
+  "mujhe dard hai" share an entry
+- Memory tier: LRU with a TTL (``TTLCache(lru=True)``), reported by
+  ``cache_stats()``
+- Optional disk tier: a SQLite file shared across restarts and worker
+  processes; disk hits are promoted to memory
+
+Entries are namespaced by a version string (e.g. a hash of the prompt), so a
+changed prompt never serves results produced by the old one.
+
+Usage:
+    cache = UtteranceCache("alert_results", version=PROMPT_VERSION, path="/var/cache/alerts.db")
+    result = cache.get(text)
+    if result is None:
+        result = call_model(text)
+        cache.set(text, result)
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+from .cache import TTLCache, register_cache
+
+logger = logging.getLogger(__name__)
+
+# Expired disk rows are purged after this many writes
+_DISK_PURGE_EVERY = 1000
+
+_DEVANAGARI = re.compile("[\u0900-\u097f]")
+_ASTRAL = re.compile("[\U00010000-\U0010ffff]")
+
+# Punctuation and symbols -> space, as a str.translate table (Basic Multilingual Plane)
+_PUNCTUATION = {
+    code: " " for code in range(0x10000)
+    if unicodedata.category(chr(code))[0] in "PS"
+}
+
+# Devanagari -> Latin, the way Hindi is usually typed in Hinglish chat
+_DEVANAGARI_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+}
+_DEVANAGARI_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ii", "उ": "u", "ऊ": "uu", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au",
+}
+_DEVANAGARI_MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ii", "ु": "u", "ू": "uu", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au",
+}
+_DEVANAGARI_SIGNS = {"ं": "n", "ँ": "n", "ः": "h", "़": ""}
+_VIRAMA = "्"
+_DEVANAGARI_DIGITS = {chr(0x0966 + digit): str(digit) for digit in range(10)}
+
+# Spelling variants folded after romanization: letters, then digraphs (in
+# order), then doubled letters
+_LETTER_FOLDS = str.maketrans({"w": "v", "z": "j", "q": "k"})
+_DIGRAPH_FOLDS = [("ph", "f"), ("ee", "i"), ("oo", "u"), ("ei", "e")]
+_DOUBLED = re.compile(r"([a-z])\1+")
+# Hindi function words whose nasal ending is written inconsistently
+_HINGLISH_WORDS = {"men": "me", "hain": "hai", "hun": "hu", "main": "mai", "nahin": "nahi"}
+
+
+def _romanize_devanagari(text: str) -> str:
+    """
+    Romanize Devanagari the way Hindi is typed in Latin script.
+
+    The inherent "a" of a consonant is dropped word-finally and, inside a
+    word, before a consonant that carries a vowel sign (Hindi schwa
+    deletion: तकलीफ -> "taklif", not "takalif").
+    """
+    def at(index: int) -> str:
+        # Character at index, looking through nukta
+        char = text[index] if index < len(text) else ""
+        if char == "़":
+            return text[index + 1] if index + 1 < len(text) else ""
+        return char
+
+    def is_letter(char: str) -> bool:
+        return char in _DEVANAGARI_CONSONANTS or char in _DEVANAGARI_VOWELS or char in _DEVANAGARI_MATRAS
+
+    out = []
+    for i, char in enumerate(text):
+        consonant = _DEVANAGARI_CONSONANTS.get(char)
+        if consonant is None:
+            out.append(
+                _DEVANAGARI_MATRAS.get(char)
+                or _DEVANAGARI_VOWELS.get(char)
+                or _DEVANAGARI_SIGNS.get(char, _DEVANAGARI_DIGITS.get(char, "" if char == _VIRAMA else char))
+            )
+            continue
+        out.append(consonant)
+        following_index = i + 2 if i + 1 < len(text) and text[i + 1] == "़" else i + 1
+        following = at(following_index)
+        if following in _DEVANAGARI_MATRAS or following == _VIRAMA:
+            continue
+        if following in _DEVANAGARI_SIGNS:
+            out.append("a")
+        elif following in _DEVANAGARI_CONSONANTS:
+            previous = text[i - 1] if i > 0 else ""
+            word_initial = not (is_letter(previous) or previous in _DEVANAGARI_SIGNS or previous == "़")
+            if word_initial or at(following_index + 1) not in _DEVANAGARI_MATRAS:
+                out.append("a")
+    return "".join(out)
+
+
+def normalize_utterance(text: str, transliterate: bool = False) -> str:
+    """
+    Canonical form of an utterance for cache lookups.
+
+    Args:
+        text: Raw utterance
+        transliterate: Also romanize Devanagari and fold Hinglish spellings
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    if transliterate and _DEVANAGARI.search(text):
+        text = _romanize_devanagari(text)
+    text = text.translate(_PUNCTUATION)
+    if _ASTRAL.search(text):
+        # Emoji and other symbols outside the translate table
+        text = "".join(" " if unicodedata.category(char)[0] in "PS" else char for char in text)
+    if not transliterate:
+        return " ".join(text.split())
+
+    text = text.translate(_LETTER_FOLDS)
+    for digraph, replacement in _DIGRAPH_FOLDS:
+        text = text.replace(digraph, replacement)
+    text = _DOUBLED.sub(r"\1", text)
+    return " ".join(_HINGLISH_WORDS.get(word, word) for word in text.split())
+
+
+class UtteranceCache:
+    """Model results keyed by normalized utterance: LRU/TTL memory tier plus optional SQLite tier."""
+
+    def __init__(
+        self,
+        name: str,
+        version: str = "",
+        ttl: float = 86400,
+        max_size: int = 5000,
+        path: Optional[str] = None,
+        transliterate: bool = False
+    ):
+        """
+        Args:
+            name: Cache name in ``cache_stats()`` and the disk table namespace
+            version: Entries written under another version are never returned
+            ttl: Seconds an entry stays valid (both tiers)
+            max_size: Entries kept in memory
+            path: SQLite file for the disk tier (None disables it)
+            transliterate: Romanize Devanagari and fold Hinglish spellings
+        """
+        self.name = name
+        self.version = version
+        self.ttl = ttl
+        self.transliterate = transliterate
+        self.memory = TTLCache(ttl=ttl, max_size=max_size, lru=True)
+        register_cache(name, self.memory)
+        self.disk_hits = 0
+        self.disk_errors = 0
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        if path:
+            self._open_disk(path)
+
+    def _open_disk(self, path: str) -> None:
+        try:
+            self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS utterance_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._disk.execute("DELETE FROM utterance_cache WHERE expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"Disk tier for {self.name} disabled ({path}): {e}")
+            self._disk = None
+
+    def key(self, text: str) -> Optional[str]:
+        """Cache key for an utterance, or None if nothing is left after normalizing."""
+        normalized = normalize_utterance(text, self.transliterate)
+        return normalized or None
+
+    def _disk_key(self, key: str) -> str:
+        return f"{self.name}:{self.version}:{key}"
+
+    def get(self, text: str) -> Optional[Dict[str, Any]]:
+        """The cached result for an utterance (memory, then disk), or None."""
+        key = self.key(text)
+        if key is None:
+            return None
+        value = self.memory.get(key)
+        if value is not None or self._disk is None:
+            return value
+
+        try:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT value FROM utterance_cache WHERE key = ? AND expires_at >= ?",
+                    (self._disk_key(key), time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            logger.warning(f"Disk tier read failed for {self.name}: {e}")
+            return None
+        if row is None:
+            return None
+        self.disk_hits += 1
+        value = json.loads(row[0])
+        self.memory.set(key, value)
+        return value
+
+    def set(self, text: str, value: Dict[str, Any]) -> None:
+        """Store a result for an utterance in both tiers."""
+        key = self.key(text)
+        if key is None:
+            return
+        self.memory.set(key, value)
+        if self._disk is None:
+            return
+        now = time.time()
+        try:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO utterance_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (self._disk_key(key), json.dumps(value), now + self.ttl)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % _DISK_PURGE_EVERY == 0:
+                    self._disk.execute("DELETE FROM utterance_cache WHERE expires_at < ?", (now,))
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            logger.warning(f"Disk tier write failed for {self.name}: {e}")
+
+    def clear(self) -> None:
+        """Drop every entry in both tiers."""
+        self.memory.clear()
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM utterance_cache WHERE key LIKE ?", (f"{self.name}:%",))
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory tier counters plus disk tier hits; ``hit_rate`` covers both tiers."""
+        stats = self.memory.stats()
+        lookups = self.memory.hits + self.memory.misses
+        stats.update({
+            "disk_enabled": self._disk is not None,
+            "disk_hits": self.disk_hits,
+            "disk_errors": self.disk_errors,
+            "hit_rate": round((self.memory.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        })
+        return stats
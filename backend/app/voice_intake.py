@@ -5,11 +5,14 @@ Converts patient speech (any language) to structured English medical forms
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from typing import Optional
-import google.generativeai as genai
 from google.cloud import speech_v1p1beta1 as speech
 import os
 import json
 from datetime import datetime
+from .data_access import get_data_access
+from .llm_gateway import get_llm_gateway
+from .llm_json import LLMOutputError, json_generation_config, parse_llm_json
+from .models import VoiceIntakeExtraction
 
 router = APIRouter(prefix="/api/voice-intake", tags=["voice-intake"])
 
@@ -18,8 +21,12 @@ def get_gemini_model():
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
         raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel('models/gemini-2.0-flash-exp')
+    get_llm_gateway().configure(api_key)
+    return get_llm_gateway().model(
+        'models/gemini-2.0-flash-exp',
+        caller="voice_intake",
+        generation_config=json_generation_config(VoiceIntakeExtraction)
+    )
 
 # Initialize Google Cloud Speech-to-Text (lazy - only when needed)
 def get_speech_client():
@@ -127,16 +134,12 @@ Return as JSON:
 """
         
         # Get AI extraction
-        ai_response = model.generate_content(extraction_prompt)
-        response_text = ai_response.text.strip()
+        ai_response = await model.generate_content_async(extraction_prompt)
+        response_text = ai_response.text
         
-        # Parse JSON
-        if response_text.startswith('```json'):
-            response_text = response_text.split('```json')[1].split('```')[0].strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.split('```')[1].split('```')[0].strip()
-        
-        extracted_data = json.loads(response_text)
+        # Parse JSON (JSON mode; tolerant of fences and prose). A truncated
+        # reply is not repaired: the extraction is saved to the patient profile
+        extracted_data = parse_llm_json(response_text, VoiceIntakeExtraction, allow_repair=False)
         
         # Add metadata
         extracted_data['processed_at'] = datetime.now().isoformat()
@@ -149,7 +152,7 @@ Return as JSON:
             "message": "Voice intake processed successfully"
         }
         
-    except json.JSONDecodeError as e:
+    except LLMOutputError as e:
         return {
             "success": False,
             "error": "Failed to parse AI response",
@@ -172,12 +175,7 @@ async def save_intake_to_profile(
     to avoid schema dependencies
     """
     try:
-        from supabase import create_client
-        
-        supabase = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_SERVICE_KEY")
-        )
+        db = get_data_access()
         
         data = json.loads(intake_data)
         
@@ -202,15 +200,15 @@ async def save_intake_to_profile(
             print(f"🔄 Attempting to save voice intake for patient: {patient_id}")
             print(f"📊 Data to save: {intake_record}")
             
-            result = supabase.table('voice_intake_records').insert(intake_record).execute()
+            saved = await db.voice_intake_records.insert(intake_record)
             
             print(f"✅ Successfully saved to database!")
-            print(f"📊 Result: {result.data}")
+            print(f"📊 Result: {saved}")
             
             return {
                 "success": True,
                 "message": "Voice intake data saved successfully",
-                "data": result.data,
+                "data": [saved] if saved else [],
                 "saved_to": "voice_intake_records"
             }
         except Exception as table_error:
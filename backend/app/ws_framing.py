@@ -0,0 +1,163 @@
+"""
+WebSocket Message Framing for Caption and Emotion Streams
+
+Captions and emotion updates are pushed to every participant of a consultation
+several times per second. JSON stays the default wire format, but clients can
+negotiate a compact binary framing instead:
+
+- Negotiation: request the ``arogya.msgpack.v1`` WebSocket subprotocol
+  (``new WebSocket(url, ["arogya.msgpack.v1"])``) or add ``?format=msgpack``
+  to the endpoint URL.
+- Encoding: MessagePack with the verbose, repeated keys (``type``, ``speaker``,
+  ``original_text``, ...) replaced by short aliases.
+- Compression: frames are sent through the server's permessage-deflate
+  extension (enabled by default in uvicorn) for both formats.
+
+Frames are encoded once per format per broadcast, so fan-out to a room costs a
+single serialization regardless of the number of participants.
+"""
+
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    logging.warning("msgpack library not available - binary WebSocket framing disabled")
+
+logger = logging.getLogger(__name__)
+
+JSON_FORMAT = "json"
+MSGPACK_FORMAT = "msgpack"
+MSGPACK_SUBPROTOCOL = "arogya.msgpack.v1"
+
+# Short keys used on the msgpack wire. Keys that are not listed are sent as-is.
+KEY_ALIASES: Dict[str, str] = {
+    "type": "t",
+    "speaker": "s",
+    "original_text": "o",
+    "translated_text": "x",
+    "timestamp": "ts",
+    "message": "m",
+    "user_type": "u",
+    "data": "d",
+    "emotion_type": "e",
+    "confidence_score": "c",
+    "consultation_id": "ci",
+    "created_at": "ca",
+    "user_id": "ui",
+    "total_detections": "td",
+    "distribution": "di",
+    "last_emotion": "le",
+    "stats": "st",
+    "detection_count": "dc",
+}
+KEY_EXPANSIONS: Dict[str, str] = {alias: key for key, alias in KEY_ALIASES.items()}
+
+Frame = Union[str, bytes]
+
+
+def negotiate_format(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """
+    Pick the wire format for a WebSocket connection before it is accepted.
+
+    Args:
+        websocket: The WebSocket connection (not yet accepted)
+
+    Returns:
+        Tuple of (format, subprotocol to echo back in the handshake or None)
+    """
+    requested = websocket.scope.get("subprotocols") or []
+    wants_msgpack = (
+        MSGPACK_SUBPROTOCOL in requested
+        or websocket.query_params.get("format") == MSGPACK_FORMAT
+    )
+
+    if not wants_msgpack:
+        return JSON_FORMAT, None
+
+    if not MSGPACK_AVAILABLE:
+        logger.warning("Client requested msgpack framing but msgpack is not installed, using JSON")
+        return JSON_FORMAT, None
+
+    subprotocol = MSGPACK_SUBPROTOCOL if MSGPACK_SUBPROTOCOL in requested else None
+    return MSGPACK_FORMAT, subprotocol
+
+
+def _alias_keys(value: Any, mapping: Dict[str, str]) -> Any:
+    """Recursively rename dictionary keys using the given mapping."""
+    if isinstance(value, dict):
+        return {mapping.get(k, k): _alias_keys(v, mapping) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_alias_keys(v, mapping) for v in value]
+    return value
+
+
+def encode_frame(message: dict, wire_format: str) -> Frame:
+    """
+    Serialize a message for the given wire format.
+
+    Args:
+        message: Message dictionary
+        wire_format: JSON_FORMAT or MSGPACK_FORMAT
+
+    Returns:
+        Text frame (JSON) or binary frame (msgpack)
+    """
+    if wire_format == MSGPACK_FORMAT:
+        return msgpack.packb(_alias_keys(message, KEY_ALIASES), use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode_frame(frame: Frame) -> dict:
+    """
+    Deserialize a frame received from a client.
+
+    Binary frames are treated as msgpack, text frames as JSON.
+
+    Args:
+        frame: Raw text or bytes payload
+
+    Returns:
+        Message dictionary with full key names
+
+    Raises:
+        ValueError: If the frame cannot be decoded
+    """
+    if isinstance(frame, (bytes, bytearray)):
+        if not MSGPACK_AVAILABLE:
+            raise ValueError("Binary frame received but msgpack is not installed")
+        try:
+            return _alias_keys(msgpack.unpackb(frame, raw=False), KEY_EXPANSIONS)
+        except Exception as e:
+            raise ValueError(f"Invalid msgpack frame: {e}")
+
+    try:
+        return json.loads(frame)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON frame: {e}")
+
+
+async def send_frame(websocket: WebSocket, frame: Frame) -> None:
+    """Send an already-encoded frame on the matching WebSocket frame type."""
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+
+async def send_message(websocket: WebSocket, message: dict, wire_format: str) -> None:
+    """
+    Encode and send a single message.
+
+    Args:
+        websocket: Destination WebSocket
+        message: Message dictionary
+        wire_format: Negotiated format for this connection
+    """
+    await send_frame(websocket, encode_frame(message, wire_format))
@@ -0,0 +1,128 @@
+"""
+Local Gemini API stand-in for tests and benchmarks.
+
+Serves ``POST /v1beta/models/{model}:generateContent`` the way the REST
+transport of google-generativeai calls it (``GEMINI_API_ENDPOINT`` /
+``LLMGateway(api_endpoint=...)``). The reply echoes the prompt, so callers
+can tell responses apart, and reports token usage. Every request is
+recorded with its arrival time so tests can check rate limits and
+coalescing; a per-request latency and a queue of injected HTTP errors
+simulate a slow or overloaded API.
+
+Usage:
+    fake = FakeGemini(latency=0.05)
+    fake.failures.extend([429, 503])   # next two requests fail
+    with fake.serve() as url:
+        gateway = LLMGateway(api_endpoint=url)
+        gateway.configure("fake-key")
+        ...
+"""
+
+import asyncio
+import contextlib
+import json
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+_STATUS = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+
+class FakeGemini:
+    """In-memory Gemini generateContent endpoint."""
+
+    def __init__(self, latency: float = 0.0, reply: Optional[Callable[[str, str], str]] = None):
+        """
+        Args:
+            latency: Seconds each request takes
+            reply: ``(model, prompt) -> text``; defaults to echoing the prompt
+        """
+        self.latency = latency
+        self.reply = reply or (lambda model, prompt: f"{model}: {prompt}")
+        # HTTP status codes returned by the next requests, in order
+        self.failures: List[int] = []
+        # (model, prompt, monotonic arrival time)
+        self.requests: List[Tuple[str, str, float]] = []
+        # generationConfig of each request (JSON mode, response schema)
+        self.generation_configs: List[Dict[str, Any]] = []
+        # Request body size and inline (image) parts of each request
+        self.payload_bytes: List[int] = []
+        self.inline_parts: List[List[Dict[str, Any]]] = []
+        self.app = self._build_app()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1beta/models/{model}:generateContent")
+        async def generate_content(model: str, request: Request):
+            raw = await request.body()
+            body = json.loads(raw)
+            prompt = "".join(
+                part.get("text", "")
+                for content in body.get("contents", [])
+                for part in content.get("parts", [])
+            )
+            self.requests.append((model, prompt, time.monotonic()))
+            self.generation_configs.append(body.get("generationConfig", {}))
+            self.payload_bytes.append(len(raw))
+            self.inline_parts.append([
+                part["inlineData"]
+                for content in body.get("contents", [])
+                for part in content.get("parts", [])
+                if "inlineData" in part
+            ])
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+            if self.failures:
+                code = self.failures.pop(0)
+                return JSONResponse(
+                    {"error": {"code": code, "message": "injected failure",
+                               "status": _STATUS.get(code, "UNKNOWN")}},
+                    status_code=code,
+                )
+
+            text = self.reply(model, prompt)
+            return JSONResponse(self.response(text, prompt))
+
+        return app
+
+    @staticmethod
+    def response(text: str, prompt: str = "") -> Dict[str, Any]:
+        """generateContent response body for ``text``."""
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt.split()),
+                "candidatesTokenCount": len(text.split()),
+                "totalTokenCount": len(prompt.split()) + len(text.split()),
+            },
+        }
+
+    @contextlib.contextmanager
+    def serve(self):
+        """Run the stand-in on a free localhost port; yields its base URL."""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        server = uvicorn.Server(config)
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            yield f"http://127.0.0.1:{port}"
+        finally:
+            server.should_exit = True
+            thread.join(timeout=5)
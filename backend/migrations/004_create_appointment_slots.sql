@@ -0,0 +1,89 @@
+-- Atomic slot booking
+-- One row per booked (doctor, date, time). The primary key makes a double
+-- booking impossible, and book_appointment_slot() claims the slot and creates
+-- the appointment in a single transaction (one round trip from the backend).
+-- doctor_availability.time_slots remains the doctor's published schedule;
+-- whether a published slot is taken is answered by this table.
+
+CREATE TABLE IF NOT EXISTS appointment_slots (
+  doctor_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  date DATE NOT NULL,
+  time TIME NOT NULL,
+  appointment_id UUID REFERENCES appointments(id) ON DELETE CASCADE,
+  booked_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (doctor_id, date, time)
+);
+
+-- Range scans for availability queries: WHERE doctor_id = ANY(...) AND date BETWEEN ...
+-- are served by the primary key; releases look slots up by appointment.
+CREATE INDEX IF NOT EXISTS idx_appointment_slots_appointment ON appointment_slots(appointment_id);
+CREATE INDEX IF NOT EXISTS idx_appointment_slots_date ON appointment_slots(date);
+
+-- Cancelled appointments keep their row, so the old per-appointment constraint
+-- blocked rebooking a freed slot. Slot uniqueness now lives in appointment_slots.
+ALTER TABLE appointments DROP CONSTRAINT IF EXISTS unique_doctor_slot;
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date ON appointments(doctor_id, date);
+
+-- Backfill claims for appointments that are still active
+INSERT INTO appointment_slots (doctor_id, date, time, appointment_id)
+SELECT doctor_id, date, time, id
+FROM appointments
+WHERE status IN ('scheduled', 'in-progress')
+ON CONFLICT DO NOTHING;
+
+-- Claim a slot and create the appointment atomically.
+-- Returns the new appointment row, or no rows if the slot is already taken.
+CREATE OR REPLACE FUNCTION book_appointment_slot(
+  p_patient_id UUID,
+  p_doctor_id UUID,
+  p_date DATE,
+  p_time TIME,
+  p_consultation_fee DECIMAL,
+  p_patient_name TEXT DEFAULT NULL,
+  p_patient_email TEXT DEFAULT NULL,
+  p_symptom_category TEXT DEFAULT NULL,
+  p_severity INTEGER DEFAULT NULL,
+  p_notes TEXT DEFAULT NULL
+)
+RETURNS SETOF appointments
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  new_appointment appointments;
+BEGIN
+  INSERT INTO appointment_slots (doctor_id, date, time)
+  VALUES (p_doctor_id, p_date, p_time)
+  ON CONFLICT DO NOTHING;
+
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO appointments (
+    patient_id, patient_name, patient_email, doctor_id, symptom_category,
+    severity, date, time, consultation_fee, status, notes
+  )
+  VALUES (
+    p_patient_id, p_patient_name, p_patient_email, p_doctor_id, p_symptom_category,
+    p_severity, p_date, p_time, p_consultation_fee, 'scheduled', p_notes
+  )
+  RETURNING * INTO new_appointment;
+
+  UPDATE appointment_slots
+  SET appointment_id = new_appointment.id
+  WHERE doctor_id = p_doctor_id AND date = p_date AND time = p_time;
+
+  RETURN NEXT new_appointment;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION book_appointment_slot(UUID, UUID, DATE, TIME, DECIMAL, TEXT, TEXT, TEXT, INTEGER, TEXT) TO service_role;
+
+-- RLS: slots are written by the backend (service role) only
+ALTER TABLE appointment_slots ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Anyone can view booked slots"
+  ON appointment_slots FOR SELECT
+  TO authenticated
+  USING (true);
@@ -0,0 +1,13 @@
+-- Keyset pagination for patient history listings
+-- Listings seek past the last row served (WHERE (sort key) > cursor ORDER BY
+-- sort key LIMIT n) instead of using OFFSET. These indexes match each sort key
+-- exactly, so every page is an index range scan regardless of its depth.
+
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_keyset
+  ON appointments(patient_id, date, time, id);
+
+CREATE INDEX IF NOT EXISTS idx_medical_images_patient_keyset
+  ON medical_images(patient_id, uploaded_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_lab_reports_patient_keyset
+  ON lab_reports(patient_id, uploaded_at DESC, id DESC);
@@ -0,0 +1,9 @@
+-- Consultation emotion timelines
+-- The timeline endpoint reads every log of a consultation in time order, page
+-- by page (ORDER BY created_at, id). Covering the sort key and the selected
+-- columns lets each page be an index-only range scan instead of a sort of all
+-- the consultation's rows.
+
+CREATE INDEX IF NOT EXISTS idx_emotion_logs_consultation_timeline
+  ON emotion_logs(consultation_id, created_at, id)
+  INCLUDE (emotion_type, confidence_score);
@@ -0,0 +1,11 @@
+-- Content-addressed SOAP note cache
+-- generate_soap stores, next to the generated note, the hash of the transcript
+-- it came from and the hash of its Assessment and Plan (both include the model
+-- and prompts). A request whose transcript still matches returns the stored
+-- note and suggestions without calling the LLM (see backend/app/soap_cache.py).
+
+ALTER TABLE consultations
+ADD COLUMN IF NOT EXISTS soap_transcript_hash TEXT;
+
+ALTER TABLE consultations
+ADD COLUMN IF NOT EXISTS stigma_input_hash TEXT;
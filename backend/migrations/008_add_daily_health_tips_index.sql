@@ -0,0 +1,11 @@
+-- Shared daily health tips
+-- The backend generates each category's tip once per day and stores it in
+-- health_tips with user_id NULL (see backend/app/daily_tips.py). This index
+-- keeps one shared tip per category and day, so when several server
+-- instances generate the same day's tips concurrently, only the first insert
+-- succeeds and the others read it back.
+-- Requires database/CREATE_HEALTH_TIPS_TABLE.sql.
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_health_tips_daily_shared
+ON health_tips(category, generated_date)
+WHERE user_id IS NULL;
@@ -0,0 +1,16 @@
+-- Perceptual hashes of medical images
+-- upload_medical_image stores the pHash and dHash (16 hex digits each) of
+-- every successfully analysed image. A new upload whose hashes are within
+-- IMAGE_DEDUP_MAX_DISTANCE bits of one of the patient's earlier images of the
+-- same body part reuses that image's ai_analysis instead of calling Gemini
+-- Vision again (see backend/app/image_dedup.py).
+
+ALTER TABLE medical_images
+ADD COLUMN IF NOT EXISTS image_phash TEXT;
+
+ALTER TABLE medical_images
+ADD COLUMN IF NOT EXISTS image_dhash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_medical_images_patient_hashes
+ON medical_images(patient_id)
+WHERE image_phash IS NOT NULL;
@@ -95,7 +95,8 @@ def main():
             log_level="info",
             reload=False,         # CRITICAL: Disable reload for production
             workers=1,
-            access_log=True
+            access_log=True,
+            ws_per_message_deflate=True  # Compress caption/emotion WebSocket frames
         )
         
     except (ImportError, MemoryError, Exception) as e:
@@ -0,0 +1,249 @@
+"""
+Test and hit-rate measurement for the alert engine's utterance result cache.
+
+Replays a corpus of patient utterances from several consultations through
+AlertEngine with a stand-in triage model (no network), and checks:
+
+- Normalization: case, whitespace and punctuation variants share a key;
+  transliteration maps Devanagari and Hinglish spellings together, while
+  different utterances ("no chest pain") keep their own keys
+- Cached results still go through the 5-minute per-consultation dedup
+- Truncated replies take the keyword fallback; replies that parse only
+  after repair are used but not cached
+- The disk tier survives a restart (a new engine on the same SQLite file)
+- Hit rate and model calls on the replayed corpus: no cache, normalized
+  keys, normalized + transliterated keys
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.alert_engine import AlertEngine
+from app.utterance_cache import UtteranceCache, normalize_utterance
+
+# (meaning, variants as patients actually say/type them)
+UTTERANCES = [
+    ("chest", ["mujhe chest pain hai", "Mujhe chest pain hai!", "mujhe  chest pain hai...", "मुझे chest pain है"]),
+    ("chest", ["seene mein dard hai", "sine me dard hai", "सीने में दर्द है", "Seene mein dard hai."]),
+    ("breath", ["saans lene mein takleef ho rahi hai", "सांस लेने में तकलीफ हो रही है", "Saans lene mein taklif ho rahi hai"]),
+    ("fever", ["teen din se bukhar hai", "Teen din se bukhaar hai", "तीन दिन से बुखार है"]),
+    ("headache", ["sar mein bahut dard hai", "sir mein bahut dard hai!", "सर में बहुत दर्द है"]),
+    ("fracture", ["I think my arm is broken", "i think my arm is broken.", "I think  my arm is BROKEN"]),
+    ("none", ["no chest pain now", "No chest pain now."]),
+    ("none", ["thik hoon", "theek hoon", "ठीक हूं"]),
+    ("none", ["haan", "Haan.", "हां"]),
+    ("none", ["dawai le raha hoon", "davai le raha hun", "दवाई ले रहा हूं"]),
+]
+CONSULTATIONS = 20
+UTTERANCES_PER_CONSULTATION = 40
+
+
+def _triage(text: str) -> dict:
+    """Deterministic stand-in for the triage model's JSON."""
+    text = normalize_utterance(text, transliterate=True)
+    if "no chest" in text:
+        return {"is_critical": False, "symptom_type": "other", "severity_score": 1}
+    for pattern, symptom_type, severity in [
+        (r"chest|sin|chati", "chest_pain", 5),
+        (r"sans|saans", "breathing_difficulty", 5),
+        (r"broken", "injury", 4),
+        (r"bukhar|bukhaar|fever", "infection", 3),
+        (r"sar|sir", "neurological", 3),
+    ]:
+        if re.search(pattern, text):
+            return {"is_critical": True, "symptom_type": symptom_type, "severity_score": severity,
+                    "analysis": "stand-in", "recommendations": "see a doctor"}
+    return {"is_critical": False, "symptom_type": "other", "severity_score": 1}
+
+
+class StandInModel:
+    """Replaces the Gemini model: counts calls and answers from the prompt text."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt: str):
+        self.calls += 1
+        text = re.search(r'Patient says: "(.*)"', prompt).group(1)
+
+        class Response:
+            pass
+
+        response = Response()
+        response.text = "```json\n" + json.dumps(_triage(text)) + "\n```"
+        return response
+
+
+class RepliesModel(StandInModel):
+    """Answers with the given raw replies in turn (malformed or cut off)."""
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+
+    def generate_content(self, prompt: str):
+        response = super().generate_content(prompt)
+        response.text = self.replies.pop(0)
+        return response
+
+
+def _engine(cache: UtteranceCache) -> AlertEngine:
+    engine = AlertEngine()
+    engine.model = StandInModel()
+    engine.ai_enabled = True
+    # Measure the cache alone (the pre-filter would skip small talk)
+    engine.prefilter_enabled = False
+    engine.result_cache = cache
+    return engine
+
+
+def _corpus(seed: int):
+    rng = random.Random(seed)
+    consultations = []
+    for c in range(CONSULTATIONS):
+        # Each consultation dwells on a few complaints and repeats them
+        complaints = rng.sample(UTTERANCES, 5)
+        consultations.append((f"consult-{c}", [
+            rng.choice(rng.choice(complaints)[1]) for _ in range(UTTERANCES_PER_CONSULTATION)
+        ]))
+    return consultations
+
+
+def test_normalization():
+    assert normalize_utterance("Mujhe  chest pain hai!!") == normalize_utterance("mujhe chest pain hai")
+    assert normalize_utterance("ＣＨＥＳＴ pain") == "chest pain"
+    assert normalize_utterance("no chest pain") != normalize_utterance("chest pain")
+    assert normalize_utterance("मुझे दर्द है।") == "मुझे दर्द है"
+    assert normalize_utterance("...!") == ""
+    for meaning, variants in UTTERANCES:
+        keys = {normalize_utterance(variant, transliterate=True) for variant in variants}
+        # "sir"/"sar" differ in a vowel, which is deliberately not folded
+        assert len(keys) == (2 if meaning == "headache" else 1), (meaning, keys)
+    assert normalize_utterance("मुझे दर्द है", transliterate=True) == normalize_utterance("mujhe dard hai", transliterate=True)
+    print("✅ Normalization groups variants and keeps distinct utterances apart")
+
+
+async def _check_dedup():
+    engine = _engine(UtteranceCache("alert_results_test", ttl=60))
+    first = await engine.analyze_transcript("Mujhe chest pain hai!", "consult-a", "patient")
+    assert first is not None and first.symptom_type == "chest_pain"
+    # Cached result, but within the dedup window for this consultation
+    assert await engine.analyze_transcript("mujhe chest pain hai", "consult-a", "patient") is None
+    assert engine.model.calls == 1
+    # Same cached result alerts in another consultation
+    other = await engine.analyze_transcript("mujhe chest pain hai", "consult-b", "patient")
+    assert other is not None and other.symptom_text == "mujhe chest pain hai"
+    engine.clear_consultation_cache("consult-a")
+    assert await engine.analyze_transcript("mujhe chest pain hai", "consult-a", "patient") is not None
+    assert engine.model.calls == 1
+    assert await engine.analyze_transcript("mujhe chest pain hai", "consult-c", "doctor") is None
+
+
+def test_dedup_still_applies():
+    asyncio.run(_check_dedup())
+    print("✅ Cache hits still go through the 5-minute alert dedup")
+
+
+async def _check_malformed_replies():
+    engine = _engine(UtteranceCache("alert_results_malformed", ttl=60))
+    engine.model = RepliesModel([
+        # Cut off before is_critical: no triage, the keyword fallback decides
+        '{"symptom_type": "chest_pain", "severity_score": 5, "is_crit',
+        '{"',
+        "{}",
+        # Complete but missing a comma: used once after repair, never cached
+        '{"is_critical": true, "symptom_type": "chest_pain" "severity_score": 5}',
+        '{"is_critical": true, "symptom_type": "chest_pain", "severity_score": 5}',
+    ])
+    for n in range(3):
+        alert = await engine.analyze_transcript("mujhe chest pain hai", f"consult-{n}", "patient")
+        assert alert is not None and alert.ai_analysis.startswith("Pattern-based")
+    repaired = await engine.analyze_transcript("mujhe chest pain hai", "consult-3", "patient")
+    assert repaired is not None and repaired.severity_score == 5
+    assert engine.model.calls == 4 and engine.result_cache.stats()["size"] == 0
+    # Only the well-formed reply is cached
+    await engine.analyze_transcript("mujhe chest pain hai", "consult-4", "patient")
+    await engine.analyze_transcript("mujhe chest pain hai", "consult-5", "patient")
+    assert engine.model.calls == 5 and engine.result_cache.stats()["size"] == 1
+
+
+def test_malformed_replies():
+    asyncio.run(_check_malformed_replies())
+    print("✅ Truncated replies take the keyword fallback; repaired replies are used but not cached")
+
+
+async def _check_disk_tier(path: str):
+    first = _engine(UtteranceCache("alert_results_disk", version="v1", ttl=60, path=path))
+    await first.analyze_transcript("I think my arm is broken", "consult-1", "patient")
+    first.result_cache.close()
+
+    restarted = _engine(UtteranceCache("alert_results_disk", version="v1", ttl=60, path=path))
+    alert = await restarted.analyze_transcript("i think my arm is broken.", "consult-2", "patient")
+    assert alert is not None and alert.symptom_type == "injury"
+    assert restarted.model.calls == 0 and restarted.result_cache.disk_hits == 1
+    # Promoted to memory
+    await restarted.analyze_transcript("I think my arm is broken", "consult-3", "patient")
+    assert restarted.result_cache.disk_hits == 1
+    restarted.result_cache.close()
+
+    changed_prompt = _engine(UtteranceCache("alert_results_disk", version="v2", ttl=60, path=path))
+    await changed_prompt.analyze_transcript("I think my arm is broken", "consult-4", "patient")
+    assert changed_prompt.model.calls == 1
+    changed_prompt.result_cache.close()
+
+
+def test_disk_tier():
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(_check_disk_tier(os.path.join(directory, "alerts.db")))
+    print("✅ Disk tier survives restarts and is versioned by prompt")
+
+
+async def _replay(cache, corpus):
+    engine = _engine(cache) if cache else _engine(UtteranceCache("alert_results_off", max_size=0))
+    alerts = 0
+    for consultation_id, utterances in corpus:
+        for text in utterances:
+            if await engine.analyze_transcript(text, consultation_id, "patient"):
+                alerts += 1
+    return engine.model.calls, alerts
+
+
+def test_replayed_corpus_hit_rate():
+    corpus = _corpus(37)
+    total = sum(len(utterances) for _, utterances in corpus)
+    print()
+    print(f"Replayed corpus: {CONSULTATIONS} consultations x {UTTERANCES_PER_CONSULTATION} patient utterances")
+    print(f"{'cache key':<26} {'model calls':>12} {'hit rate':>9} {'alerts':>7}")
+    results = {}
+    for label, cache in [
+        ("none", None),
+        ("normalized", UtteranceCache("alert_results_norm")),
+        ("normalized+transliterated", UtteranceCache("alert_results_translit", transliterate=True)),
+    ]:
+        calls, alerts = asyncio.run(_replay(cache, corpus))
+        results[label] = (calls, alerts)
+        print(f"{label:<26} {calls:>12} {1 - calls / total:>9.1%} {alerts:>7}")
+
+    # Same alerts either way: caching never changes what dedup lets through
+    assert len({alerts for _, alerts in results.values()}) == 1
+    for label, transliterate in (("normalized", False), ("normalized+transliterated", True)):
+        keys = {normalize_utterance(text, transliterate) for _, utterances in corpus for text in utterances}
+        assert results[label][0] == len(keys), label
+    assert results["none"][0] == total
+    assert results["normalized+transliterated"][0] < results["normalized"][0] < total / 2
+
+
+if __name__ == "__main__":
+    test_normalization()
+    test_dedup_still_applies()
+    test_malformed_replies()
+    test_disk_tier()
+    test_replayed_corpus_hit_rate()
@@ -0,0 +1,131 @@
+"""
+Test and soak measurement for the alert engine's dedup cache.
+
+- Semantics match the old dict: a symptom is suppressed for the window
+  after it alerts, a suppressed repeat does not extend the window, and
+  clearing a consultation lets it alert again
+- Soak: a million alerts over simulated days from rotating consultations;
+  every decision is checked against the old unbounded dict, size stays
+  bounded by what fits in one window, and memory and time per alert are
+  reported
+- Memory cap: beyond ``max_entries`` the oldest entries are evicted
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.alert_dedup import AlertDedupCache
+from app.alert_engine import ALERT_DEDUP_WINDOW, AlertEngine
+
+SOAK_ALERTS = 1_000_000
+SYMPTOMS = ["chest_pain", "breathing_difficulty", "bleeding", "neurological", "injury", "infection", "other"]
+START = datetime(2026, 1, 1)
+
+
+def test_window_semantics():
+    dedup = AlertDedupCache(window=ALERT_DEDUP_WINDOW)
+    assert not dedup.seen_recently("c1", "chest_pain", START)
+    assert dedup.seen_recently("c1", "chest_pain", START + timedelta(minutes=4))
+    # The suppressed repeat did not restart the window
+    assert not dedup.seen_recently("c1", "chest_pain", START + timedelta(minutes=5))
+    assert not dedup.seen_recently("c1", "bleeding", START + timedelta(minutes=5))
+    assert not dedup.seen_recently("c2", "chest_pain", START + timedelta(minutes=5))
+    assert dedup.stats()["consultations"] == 2 and len(dedup) == 3
+
+    assert dedup.clear_consultation("c1") == 2
+    assert ("c1", "chest_pain") not in dedup and ("c2", "chest_pain") in dedup
+    assert not dedup.seen_recently("c1", "chest_pain", START + timedelta(minutes=6))
+
+    # Entries expire without anyone clearing them
+    dedup.expire(START + timedelta(minutes=20))
+    assert len(dedup) == 0 and dedup.stats()["consultations"] == 0
+    print("✅ Dedup window, clearing and expiry match the old dict")
+
+
+def test_engine_uses_bounded_cache():
+    engine = AlertEngine()
+    assert not engine._recently_alerted("c1", "chest_pain", START)
+    assert engine._recently_alerted("c1", "chest_pain", START + timedelta(minutes=1))
+    engine.clear_consultation_cache("c1")
+    assert not engine._recently_alerted("c1", "chest_pain", START + timedelta(minutes=2))
+    assert engine.cache_stats()["dedup"]["size"] == 1
+    print("✅ AlertEngine dedup goes through AlertDedupCache")
+
+
+def test_soak_million_alerts():
+    rng = random.Random(39)
+    dedup = AlertDedupCache(window=ALERT_DEDUP_WINDOW, max_entries=SOAK_ALERTS)
+    reference = {}
+
+    # ~25 alerts a second from ~200 live consultations; each consultation
+    # lasts about half an hour, then a new one takes its slot
+    live = [f"consult-{i}" for i in range(200)]
+    next_id = len(live)
+    now = START
+    peak = 0
+    mismatches = 0
+
+    tracemalloc.start()
+    elapsed = 0.0
+    for i in range(SOAK_ALERTS):
+        now += timedelta(milliseconds=rng.randint(0, 80))
+        if rng.random() < 1 / 45_000 * len(live):
+            live[rng.randrange(len(live))] = f"consult-{next_id}"
+            next_id += 1
+        consultation_id = rng.choice(live)
+        symptom_type = rng.choice(SYMPTOMS)
+
+        started = time.perf_counter()
+        suppressed = dedup.seen_recently(consultation_id, symptom_type, now)
+        elapsed += time.perf_counter() - started
+
+        key = (consultation_id, symptom_type)
+        expected = key in reference and now - reference[key] < ALERT_DEDUP_WINDOW
+        if not expected:
+            reference[key] = now
+        mismatches += suppressed != expected
+        if i % 1000 == 0:
+            peak = max(peak, len(dedup))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = dedup.stats()
+    print()
+    print(f"Soak: {SOAK_ALERTS:,} alerts over {(now - START).total_seconds() / 3600:.1f} simulated hours, "
+          f"{next_id:,} consultations")
+    print(f"old dict:  {len(reference):,} entries, never shrinks")
+    print(f"new cache: {stats['size']:,} entries now, peak {peak:,}; "
+          f"{stats['expired']:,} expired, {stats['suppressed']:,} suppressed")
+    print(f"time: {elapsed / SOAK_ALERTS * 1e6:.2f} µs per alert; traced memory {current / 1e6:.1f} MB (both maps)")
+
+    assert mismatches == 0
+    # Never more than every (consultation, symptom) live in one window
+    assert peak <= len(live) * len(SYMPTOMS) * 2
+    assert stats["size"] < len(reference) / 10
+    assert stats["evictions"] == 0
+    assert stats["recorded"] + stats["suppressed"] == SOAK_ALERTS
+
+
+def test_memory_cap():
+    dedup = AlertDedupCache(window=ALERT_DEDUP_WINDOW, max_entries=100)
+    for i in range(1000):
+        dedup.seen_recently(f"consult-{i}", "chest_pain", START)
+    stats = dedup.stats()
+    assert stats["size"] == 100 and stats["evictions"] == 900
+    assert ("consult-999", "chest_pain") in dedup and ("consult-0", "chest_pain") not in dedup
+    assert stats["consultations"] == 100
+    print("✅ max_entries caps the cache, evicting the oldest alerts")
+
+
+if __name__ == "__main__":
+    test_window_semantics()
+    test_engine_uses_bounded_cache()
+    test_soak_million_alerts()
+    test_memory_cap()
@@ -0,0 +1,217 @@
+"""
+Test and latency measurement for streaming alert analysis.
+
+Replays scripted patient captions, split into fragments the way
+speech-to-text delivers them, from several concurrent consultations with a
+stand-in triage model (no network). Time is scaled down 10x.
+
+- Windows: fragments are joined until a pause, the max wait or the
+  fragment cap, and every window is analyzed exactly once
+- Per-fragment analysis (what calling POST /analyze for every caption did)
+  vs the stream worker: model calls, alerts found, end-to-end latency
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.alert_engine import AlertEngine
+from app.alert_stream import AlertStreamWorker
+from app.utterance_cache import UtteranceCache, normalize_utterance
+
+SCALE = 0.1
+MODEL_LATENCY = 0.6  # seconds, before scaling
+DEBOUNCE = 1.2
+MAX_WAIT = 4.0
+
+# (pause before the sentence, fragments); fragments arrive ~0.5 s apart
+SCRIPTS = [
+    [
+        (0.0, ["namaste doctor"]),
+        (2.5, ["kal raat se", "mujhe seene mein", "bahut dard ho raha hai"]),
+        (3.0, ["aur left haath", "mein bhi"]),
+        (2.0, ["haan ji"]),
+        (3.0, ["saans lene mein", "bhi takleef hai"]),
+        (2.5, ["theek hai doctor"]),
+    ],
+    [
+        (0.5, ["doctor sahab", "teen din se", "bukhar hai", "aur sar mein dard"]),
+        (2.5, ["dawai le raha hoon", "par aaram nahi"]),
+        (3.0, ["kal ulti mein", "khoon aaya tha"]),
+        (2.0, ["bas itna hi"]),
+    ],
+    [
+        (1.0, ["hello"]),
+        (2.5, ["mere pair mein", "chot lagi hai", "gir gaya tha", "seedhi se", "ab chal nahi pa raha",
+               "sujan bhi hai", "bahut", "zyada", "aur neela pad gaya hai"]),
+        (3.0, ["okay"]),
+    ],
+]
+
+
+def _triage(text: str) -> dict:
+    """Stand-in model: critical only when the complaint is complete."""
+    text = normalize_utterance(text, transliterate=True)
+    for pattern, symptom_type, severity in [
+        (r"(sine|chati).*dard", "chest_pain", 5),
+        (r"sans.*takl", "breathing_difficulty", 5),
+        (r"ulti.*khun", "bleeding", 5),
+        (r"(chot|gir).*(chal nahi|sujan)", "injury", 4),
+        (r"bukhar.*dard", "infection", 3),
+    ]:
+        if re.search(pattern, text):
+            return {"is_critical": True, "symptom_type": symptom_type, "severity_score": severity}
+    return {"is_critical": False, "symptom_type": "other", "severity_score": 1}
+
+
+class StandInModel:
+    """Blocking call like the Gemini SDK, with a fixed latency."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt: str):
+        self.calls += 1
+        time.sleep(MODEL_LATENCY * SCALE)
+        text = re.search(r'Patient says: "(.*)"', prompt).group(1)
+
+        class Response:
+            pass
+
+        response = Response()
+        response.text = json.dumps(_triage(text))
+        return response
+
+
+def _engine() -> AlertEngine:
+    engine = AlertEngine()
+    engine.model = StandInModel()
+    engine.ai_enabled = True
+    engine.result_cache = UtteranceCache("alert_stream_test", max_size=0)
+    return engine
+
+
+async def _replay(consultation_id, script, on_fragment):
+    """Feed one consultation's fragments with scaled real-time gaps."""
+    for pause, fragments in script:
+        await asyncio.sleep(pause * SCALE)
+        for i, fragment in enumerate(fragments):
+            if i:
+                await asyncio.sleep(0.5 * SCALE)
+            await on_fragment(consultation_id, fragment, time.monotonic())
+
+
+async def _per_fragment():
+    engine = _engine()
+    latencies = []
+
+    async def analyze(consultation_id, text, received_at):
+        # The frontend's POST /analyze for each caption, awaited in turn
+        if await engine.analyze_transcript(text, consultation_id, "patient"):
+            latencies.append(time.monotonic() - received_at)
+
+    await asyncio.gather(*(
+        _replay(f"consult-{i}", script, analyze) for i, script in enumerate(SCRIPTS)
+    ))
+    return engine.model.calls, latencies
+
+
+async def _streamed():
+    engine = _engine()
+    latencies = []
+    alerts = []
+
+    async def on_alert(consultation_id, alert, latency):
+        alerts.append((consultation_id, alert.symptom_type))
+        latencies.append(latency)
+
+    worker = AlertStreamWorker(engine, on_alert, debounce=DEBOUNCE * SCALE, max_wait=MAX_WAIT * SCALE)
+
+    async def submit(consultation_id, text, received_at):
+        worker.submit(consultation_id, text)
+
+    await asyncio.gather(*(
+        _replay(f"consult-{i}", script, submit) for i, script in enumerate(SCRIPTS)
+    ))
+    await worker.close()
+    return engine.model.calls, latencies, sorted(alerts), worker.stats()
+
+
+async def _check_windows():
+    analyzed = []
+
+    class Recorder:
+        async def analyze_transcript(self, text, consultation_id, speaker_type):
+            analyzed.append((consultation_id, text))
+            return None
+
+    worker = AlertStreamWorker(Recorder(), debounce=0.05, max_wait=0.2, window=3)
+    worker.submit("a", "mujhe seene mein")
+    worker.submit("b", "haan")
+    await asyncio.sleep(0.02)
+    worker.submit("a", "dard hai")
+    worker.submit("a", "   ")
+    await asyncio.sleep(0.1)
+    assert sorted(analyzed) == [("a", "mujhe seene mein dard hai"), ("b", "haan")]
+
+    # Fragment cap closes a window without waiting
+    for text in ["one", "two", "three"]:
+        worker.submit("c", text)
+    await asyncio.sleep(0)
+    assert analyzed[-1] == ("c", "one two three")
+
+    # A patient who never pauses is still analyzed after max_wait
+    analyzed.clear()
+    started = time.monotonic()
+    while time.monotonic() - started < 0.25:
+        worker.submit("d", "x")
+        await asyncio.sleep(0.04)
+    assert analyzed and time.monotonic() - started < 0.3
+    await worker.close()
+    stats = worker.stats()
+    assert stats["analyses"] == stats["windows"] and stats["open_windows"] == 0
+
+
+def test_windows():
+    asyncio.run(_check_windows())
+    print("✅ Fragments are debounced into windows; cap and max wait close long windows")
+
+
+def test_stream_vs_per_fragment():
+    fragments = sum(len(f) for script in SCRIPTS for _, f in script)
+    per_calls, per_latencies = asyncio.run(_per_fragment())
+    stream_calls, stream_latencies, alerts, stats = asyncio.run(_streamed())
+
+    def ms(values):
+        return f"{sum(values) / len(values) / SCALE * 1000:.0f} ms" if values else "-"
+
+    print()
+    print(f"Replay: {len(SCRIPTS)} consultations, {fragments} patient caption fragments "
+          f"(timings scaled back to real time)")
+    print(f"{'':<14} {'model calls':>11} {'alerts':>7} {'mean latency':>13} {'max latency':>12}")
+    print(f"{'per fragment':<14} {per_calls:>11} {len(per_latencies):>7} {ms(per_latencies):>13} "
+          f"{max(per_latencies, default=0) / SCALE * 1000:>9.0f} ms")
+    print(f"{'streamed':<14} {stream_calls:>11} {len(stream_latencies):>7} {ms(stream_latencies):>13} "
+          f"{max(stream_latencies) / SCALE * 1000:>9.0f} ms")
+    print(f"windows: {stats['windows']} for {stats['fragments']} fragments "
+          f"({stats['analyses_saved']} analyses saved); alerts: {alerts}")
+
+    assert stats["fragments"] == fragments
+    assert stream_calls < per_calls
+    # Complaints split across fragments are only found when analyzed together
+    assert {symptom for _, symptom in alerts} == {
+        "chest_pain", "breathing_difficulty", "bleeding", "injury", "infection"
+    }
+    assert len(stream_latencies) > len(per_latencies)
+    assert max(stream_latencies) < (MAX_WAIT + 2 * MODEL_LATENCY * len(SCRIPTS)) * SCALE
+
+
+if __name__ == "__main__":
+    test_windows()
+    test_stream_vs_per_fragment()
@@ -0,0 +1,132 @@
+"""
+Test and benchmark for appointment listings without N+1 doctor lookups.
+
+Runs the appointment endpoints against the local PostgREST stand-in
+(fake_postgrest.py) and reports Supabase round trips and latency per page:
+
+    legacy      count query + page query + one doctors query per appointment
+    cold cache  one page query (with exact count) + one batched doctors query
+    warm cache  one page query, doctor profiles served from the TTL cache
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.appointments import get_appointment, get_patient_appointments
+from app.data_access import SupabaseDataAccess
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+PAGE_SIZES = [10, 50, 100]
+DOCTORS = 25
+SIMULATED_LATENCY = 0.02  # 20 ms per round trip
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def _seed(fake: FakePostgrest):
+    fake.tables["doctors"] = [
+        {"id": f"doc-{i}", "full_name": f"Dr. {i}", "specialty": "Cardiology", "avatar_url": None}
+        for i in range(DOCTORS)
+    ]
+    fake.tables["appointments"] = [
+        {
+            "id": f"apt-{i}",
+            "patient_id": "patient-1",
+            "doctor_id": f"doc-{i % DOCTORS}",
+            "symptom_category": None,
+            "severity": None,
+            "date": f"2026-{1 + i // 28 % 12:02d}-{1 + i % 28:02d}",
+            "time": f"{9 + i % 8:02d}:00",
+            "status": "scheduled",
+            "consultation_fee": 500.0,
+            "created_at": "2026-01-01T09:00:00",
+            "updated_at": "2026-01-01T09:00:00",
+        }
+        for i in range(300)
+    ]
+
+
+async def _legacy_listing(dal: SupabaseDataAccess, page_size: int):
+    """The previous handler: separate count, then one doctor query per row."""
+    count = await dal.execute(
+        dal.appointments.query().select("id", count="exact").eq("patient_id", "patient-1")
+    )
+    result = await dal.execute(
+        dal.appointments.query().select("*").eq("patient_id", "patient-1")
+        .order("date").order("time").range(0, page_size - 1)
+    )
+    for apt in result.data:
+        doctor = await dal.doctors.get(apt["doctor_id"]) or {}
+        apt["doctor_name"] = doctor.get("full_name")
+    return count.count, result.data
+
+
+async def _check_listing(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        response = await get_patient_appointments("patient-1", status=None, page=2, page_size=40, db=dal)
+        assert response.total == 300
+        assert len(response.appointments) == 40
+        assert all(a.doctor_name == f"Dr. {a.doctor_id.split('-')[1]}" for a in response.appointments)
+
+        single = await get_appointment("apt-7", db=dal)
+        assert single.doctor_name == "Dr. 7" and single.doctor_specialty == "Cardiology"
+
+        # Profile edits are visible immediately despite the cache
+        await dal.doctors.update("doc-7", {"full_name": "Dr. Seven"})
+        assert (await get_appointment("apt-7", db=dal)).doctor_name == "Dr. Seven"
+    finally:
+        await dal.aclose()
+
+
+def test_listing():
+    """Listing returns the full page with doctor details and the right total."""
+    fake = FakePostgrest()
+    _seed(fake)
+    with fake.serve() as url:
+        asyncio.run(_check_listing(url))
+    print("✅ Appointment listing OK")
+
+
+async def _measure(fake: FakePostgrest, url: str, page_size: int):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    rows = []
+    try:
+        runs = [
+            ("legacy", lambda: _legacy_listing(dal, page_size)),
+            ("cold cache", lambda: get_patient_appointments("patient-1", None, 1, page_size, db=dal)),
+            ("warm cache", lambda: get_patient_appointments("patient-1", None, 1, page_size, db=dal)),
+        ]
+        for name, run in runs:
+            fake.reset_counts()
+            start = time.perf_counter()
+            await run()
+            rows.append((name, fake.request_count, (time.perf_counter() - start) * 1000))
+    finally:
+        await dal.aclose()
+    return rows
+
+
+def benchmark_listing():
+    """Round trips and latency of one listing page per page size."""
+    print()
+    print(f"Benchmark: {DOCTORS} distinct doctors, {SIMULATED_LATENCY * 1000:.0f} ms simulated latency")
+    print(f"{'page size':>9} {'mode':<12} {'round trips':>11} {'latency ms':>11}")
+
+    fake = FakePostgrest(latency=SIMULATED_LATENCY)
+    _seed(fake)
+    with fake.serve() as url:
+        for page_size in PAGE_SIZES:
+            for name, trips, ms in asyncio.run(_measure(fake, url, page_size)):
+                print(f"{page_size:>9} {name:<12} {trips:>11} {ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    test_listing()
+    benchmark_listing()
@@ -0,0 +1,195 @@
+"""
+Test and latency benchmark for the bulk availability search.
+
+Runs the search route against the local PostgREST stand-in (fake_postgrest.py):
+
+- Booking and cancelling drop the cached bitmap, so the next search reflects
+  them immediately; the time window filter trims results
+- Slots off the quarter-hour grid (10:10) are kept, in the search and in
+  GET /doctors/{id}/slots
+- 1,000 doctors x 30 days: per-slot checks (previous way to build the grid,
+  extrapolated from a sample) vs one cold search vs one warm search
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.appointment_models import AppointmentCreate, AvailabilityCheckRequest, AvailabilitySearchRequest
+from app.appointments import (
+    cancel_appointment, check_slot_availability, create_appointment, get_doctor_slots, search_availability
+)
+from app.data_access import MAX_ROWS_PER_REQUEST, SupabaseDataAccess
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+DOCTORS = 1000
+DAYS = 30
+START = date.today() + timedelta(days=7)
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 17) for m in (0, 30)]
+BOOKED_FRACTION = 0.2
+LEGACY_SAMPLE = 200
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.appointments").setLevel(logging.WARNING)
+
+
+def _seed(fake: FakePostgrest, doctors: int, days: int, booked_fraction: float = 0.0):
+    rng = random.Random(31)
+    fake.tables["doctors"] = [{"id": f"doc-{i}", "full_name": f"Dr. {i}"} for i in range(doctors)]
+    fake.tables["doctor_availability"] = []
+    fake.tables["appointment_slots"] = []
+    for i in range(doctors):
+        for d in range(days):
+            day = (START + timedelta(days=d)).isoformat()
+            fake.tables["doctor_availability"].append({
+                "id": f"avail-{i}-{d}",
+                "doctor_id": f"doc-{i}",
+                "date": day,
+                "time_slots": [{"time": t, "is_available": t != "13:00"} for t in SLOTS],
+            })
+            for t in SLOTS:
+                if rng.random() < booked_fraction:
+                    fake.tables["appointment_slots"].append({
+                        "doctor_id": f"doc-{i}", "date": day, "time": f"{t}:00", "appointment_id": f"apt-{i}-{d}-{t}",
+                    })
+
+
+def _search(doctors: int, days: int, **window) -> AvailabilitySearchRequest:
+    return AvailabilitySearchRequest(
+        doctor_ids=[f"doc-{i}" for i in range(doctors)],
+        start_date=START,
+        end_date=START + timedelta(days=days - 1),
+        **window,
+    )
+
+
+def _free(response, doctor_id: str, day: date):
+    for doctor in response.doctors:
+        if doctor.doctor_id == doctor_id:
+            for entry in doctor.days:
+                if entry.date == day:
+                    return entry.available
+    return []
+
+
+async def _check_invalidation(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        before = await search_availability(_search(3, 2), db=dal)
+        assert _free(before, "doc-1", START) == [t for t in SLOTS if t != "13:00"]
+
+        booking = AppointmentCreate(
+            patient_id=str(uuid.uuid4()), doctor_id="doc-1", date=START, time="10:00", consultation_fee=500.0
+        )
+        appointment = await create_appointment(booking, db=dal)
+        booked = await search_availability(_search(3, 2), db=dal)
+        assert "10:00" not in _free(booked, "doc-1", START), "booked slot still served from cache"
+        assert "10:00" in _free(booked, "doc-2", START)
+
+        await cancel_appointment(appointment.id, db=dal)
+        cancelled = await search_availability(_search(3, 2), db=dal)
+        assert "10:00" in _free(cancelled, "doc-1", START), "cancelled slot not freed"
+
+        morning = await search_availability(_search(3, 2, time_from="09:00", time_to="10:00"), db=dal)
+        assert _free(morning, "doc-0", START) == ["09:00", "09:30"]
+
+        # A slot off the quarter-hour grid is kept as published, and booking it
+        # leaves its neighbours free
+        day = START + timedelta(days=1)
+        schedule = {"id": "avail-2-1", "doctor_id": "doc-2", "date": day.isoformat()}
+        await dal.doctor_availability.update_time_slots(
+            schedule, [{"time": t, "is_available": True} for t in ("10:00", "10:10", "10:30")]
+        )
+        off_grid = await get_doctor_slots("doc-2", day, day, db=dal)
+        assert off_grid.days[0].available == ["10:00", "10:10", "10:30"]
+        booking = AppointmentCreate(
+            patient_id=str(uuid.uuid4()), doctor_id="doc-2", date=day, time="10:10", consultation_fee=500.0
+        )
+        await create_appointment(booking, db=dal)
+        off_grid = await get_doctor_slots("doc-2", day, day, db=dal)
+        assert off_grid.days[0].available == ["10:00", "10:30"]
+        searched = await search_availability(_search(3, 2), db=dal)
+        assert _free(searched, "doc-2", day) == ["10:00", "10:30"]
+    finally:
+        await dal.aclose()
+
+
+def test_invalidation():
+    fake = FakePostgrest()
+    _seed(fake, doctors=3, days=2)
+    with fake.serve() as url:
+        asyncio.run(_check_invalidation(url))
+    print("✅ Booking and cancelling are reflected in the next search; time window filter OK")
+
+
+async def _benchmark(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        rng = random.Random(7)
+        grid = DOCTORS * DAYS * len(SLOTS)
+
+        fake.reset_counts()
+        start = time.perf_counter()
+        for _ in range(LEGACY_SAMPLE):
+            request = AvailabilityCheckRequest(
+                doctor_id=f"doc-{rng.randrange(DOCTORS)}",
+                date=START + timedelta(days=rng.randrange(DAYS)),
+                time=rng.choice(SLOTS),
+            )
+            await check_slot_availability(request, dal)
+        per_check = (time.perf_counter() - start) / LEGACY_SAMPLE
+        legacy_requests = fake.request_count / LEGACY_SAMPLE * grid
+
+        fake.reset_counts()
+        start = time.perf_counter()
+        cold = await search_availability(_search(DOCTORS, DAYS), db=dal)
+        cold_seconds = time.perf_counter() - start
+        cold_requests = fake.request_count
+
+        fake.reset_counts()
+        start = time.perf_counter()
+        warm = await search_availability(_search(DOCTORS, DAYS), db=dal)
+        warm_seconds = time.perf_counter() - start
+        warm_requests = fake.request_count
+
+        assert warm == cold
+        free = sum(len(day.available) for doctor in cold.doctors for day in doctor.days)
+        booked = len(fake.tables["appointment_slots"])
+        assert free == DOCTORS * DAYS * (len(SLOTS) - 1) - sum(
+            1 for row in fake.tables["appointment_slots"] if row["time"] != "13:00:00"
+        )
+
+        print()
+        print(f"Availability grid: {DOCTORS} doctors x {DAYS} days x {len(SLOTS)} slots, "
+              f"{booked} booked, {free} free")
+        print(f"{'mode':<24} {'requests':>10} {'seconds':>10}")
+        print(f"{'per-slot checks (est.)':<24} {legacy_requests:>10.0f} {per_check * grid:>10.1f}")
+        print(f"{'search (cold)':<24} {cold_requests:>10} {cold_seconds:>10.2f}")
+        print(f"{'search (warm)':<24} {warm_requests:>10} {warm_seconds:>10.2f}")
+
+        assert warm_requests == 0
+        # One schedule page per chunk of doctors plus the booked-slot pages
+        chunks = -(-DOCTORS // (MAX_ROWS_PER_REQUEST // DAYS))
+        assert cold_requests <= 2 * chunks + booked // MAX_ROWS_PER_REQUEST
+    finally:
+        await dal.aclose()
+
+
+def test_benchmark():
+    fake = FakePostgrest()
+    _seed(fake, DOCTORS, DAYS, BOOKED_FRACTION)
+    with fake.serve() as url:
+        asyncio.run(_benchmark(url, fake))
+
+
+if __name__ == "__main__":
+    test_invalidation()
+    test_benchmark()
@@ -0,0 +1,233 @@
+"""
+Test and benchmark for the daily health tips store.
+
+Runs DailyTips against the local PostgREST stand-in (fake_postgrest.py) with
+a stand-in tip generator that takes as long as a Gemini call:
+
+- A cold burst of requests generates each category once, concurrently, and
+  stores the three shared rows; warm requests touch neither Gemini nor the
+  database
+- A restarted (or second) instance serves the stored tips; two instances
+  racing on a cold day end up serving the same tips
+- A new day generates new tips; failed categories get the fallback tip, which
+  is not stored and is retried
+- The endpoints keep their response shapes; compares request latency with
+  the old one-Gemini-call-per-request path
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import health_tips
+from app.daily_tips import DailyTips
+from app.data_access import SupabaseDataAccess
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Seconds a Gemini call takes
+LATENCY = 0.2
+DAY = date(2026, 3, 14)
+
+
+class _Generator:
+    """Stand-in for generate_health_tip: counts calls and how many overlap."""
+
+    def __init__(self, tag: str = "tip", failing=()):
+        self.tag = tag
+        self.failing = set(failing)
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, category: str) -> str:
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(LATENCY)
+            if category in self.failing:
+                raise RuntimeError("429 Resource has been exhausted")
+            return f"{self.tag} for {category}"
+        finally:
+            self.active -= 1
+
+
+def _store(generate, dal, day=None, **kwargs) -> DailyTips:
+    clock = {"day": day or DAY}
+    tips = DailyTips(generate, health_tips.CATEGORIES, health_tips.FALLBACK_TIPS, dal,
+                     today=lambda: clock["day"], **kwargs)
+    tips.clock = clock
+    return tips
+
+
+def _shared_rows(fake: FakePostgrest, day: date = DAY):
+    return [row for row in fake.tables.get("health_tips", [])
+            if row["generated_date"] == day.isoformat() and row.get("user_id") is None]
+
+
+async def _check_cache(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        generate = _Generator()
+        tips = _store(generate, dal)
+
+        # Cold burst: one load, three concurrent generations, three stored rows
+        started = time.perf_counter()
+        results = await asyncio.gather(*(tips.get(category) for category in health_tips.CATEGORIES * 10))
+        cold = time.perf_counter() - started
+        assert generate.calls == 3 and generate.peak == 3, (generate.calls, generate.peak)
+        assert cold < LATENCY * 2, cold
+        assert results[0] == "tip for nutrition"
+        assert len(_shared_rows(fake)) == 3
+        assert tips.stats()["loads"] == 1 and tips.stats()["stored"] == 3
+
+        # Warm: memory only
+        fake.reset_counts()
+        assert (await tips.get_all())["exercise"] == "tip for exercise"
+        assert generate.calls == 3 and fake.request_count == 0
+
+        # Restart: stored tips, no generation
+        restarted_generate = _Generator("restarted")
+        restarted = _store(restarted_generate, dal)
+        assert await restarted.get_all() == await tips.get_all()
+        assert restarted_generate.calls == 0 and fake.request_count == 1
+
+        # Two instances racing on a cold day: one tip per category, served by both
+        day = DAY + timedelta(days=1)
+        first = _store(_Generator("first"), dal, day)
+        second = _store(_Generator("second"), dal, day)
+        a, b = await asyncio.gather(first.get_all(), second.get_all())
+        assert a == b, (a, b)
+        assert len(_shared_rows(fake, day)) == 3
+
+        # Day rollover: the warm instance loads the new day's stored tips
+        tips.clock["day"] = day
+        assert await tips.get_all() == a
+        assert generate.calls == 3
+
+        # A user's own tips are not the shared tips of the day
+        fake.tables["health_tips"].append({"id": "own", "user_id": "user-1", "category": "nutrition",
+                                           "tip_text": "personal", "generated_date": day.isoformat()})
+        assert (await _store(_Generator(), dal, day).get_all()) == a
+    finally:
+        await dal.aclose()
+
+
+def test_cache():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        asyncio.run(_check_cache(url, fake))
+    print("✅ Tips generated once per day, concurrently; stored, shared and served from memory")
+
+
+async def _check_fallback(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        generate = _Generator(failing={"exercise"})
+        tips = _store(generate, dal, retry_seconds=0.1)
+        served = await tips.get_all()
+        assert served["exercise"] == health_tips.FALLBACK_TIPS["exercise"]
+        assert served["nutrition"] == "tip for nutrition"
+        assert sorted(row["category"] for row in _shared_rows(fake)) == ["mental_health", "nutrition"]
+
+        # Fallback served from memory until the retry is due
+        await tips.get_all()
+        assert generate.calls == 3
+
+        # Retry: only the failed category is generated
+        generate.failing.clear()
+        await asyncio.sleep(0.15)
+        assert (await tips.get("exercise")) == "tip for exercise"
+        assert generate.calls == 4 and len(_shared_rows(fake)) == 3
+        assert tips.stats()["fallback_categories"] == []
+    finally:
+        await dal.aclose()
+
+    # Database unreachable: tips still served (memory only)
+    unreachable = SupabaseDataAccess("http://127.0.0.1:9", FAKE_SERVICE_KEY)
+    try:
+        tips = _store(_Generator(), unreachable)
+        assert (await tips.get("nutrition")) == "tip for nutrition"
+        assert tips.stats()["db_errors"] >= 1
+    finally:
+        await unreachable.aclose()
+
+    # Without Supabase credentials
+    tips = _store(_Generator(), None)
+    assert (await tips.get("mental_health")) == "tip for mental_health"
+
+
+def test_fallback():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        asyncio.run(_check_fallback(url, fake))
+    print("✅ Fallback tips are served but not stored, and retried; database errors keep tips in memory")
+
+
+async def _old_all_today(generate):
+    """The old /health-tips/all/today: three sequential Gemini calls per request."""
+    return {category: await generate(category) for category in health_tips.CATEGORIES}
+
+
+async def _check_endpoints(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    saved = health_tips._daily_tips
+    try:
+        generate = _Generator()
+        health_tips._daily_tips = _store(generate, dal)
+
+        started = time.perf_counter()
+        response = await health_tips.get_all_daily_tips()
+        cold = time.perf_counter() - started
+        assert response["success"] and set(response["tips"]) == set(health_tips.CATEGORIES)
+        assert response["tips"]["nutrition"] == {
+            "category": "nutrition", "tip_text": "tip for nutrition", "generated_date": DAY.isoformat()}
+
+        single = await health_tips.get_health_tip("exercise")
+        assert single.success and single.tip.tip_text == "tip for exercise"
+        assert single.tip.generated_date == DAY
+        try:
+            await health_tips.get_health_tip("sleep")
+            raise AssertionError("invalid category accepted")
+        except health_tips.HTTPException as e:
+            assert e.status_code == 400
+
+        rounds = 20
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await health_tips.get_all_daily_tips()
+        warm = (time.perf_counter() - started) / rounds
+        assert generate.calls == 3
+
+        started = time.perf_counter()
+        await _old_all_today(_Generator())
+        old = time.perf_counter() - started
+        return old, cold, warm
+    finally:
+        health_tips._daily_tips = saved
+        await dal.aclose()
+
+
+def test_endpoints():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        old, cold, warm = asyncio.run(_check_endpoints(url))
+    print("✅ Endpoints keep their response shapes")
+    print(f"   /health-tips/all/today ({LATENCY * 1000:.0f}ms per Gemini call): "
+          f"old {old * 1000:.0f}ms every request, "
+          f"new {cold * 1000:.0f}ms first of the day, {warm * 1000:.2f}ms after")
+    assert cold < old / 2 and warm < 0.005
+
+
+if __name__ == "__main__":
+    test_cache()
+    test_fallback()
+    test_endpoints()
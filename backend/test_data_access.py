@@ -0,0 +1,135 @@
+"""
+Test and benchmark for the async Supabase data access layer.
+
+Runs against the local PostgREST stand-in (fake_postgrest.py), no Supabase
+project or credentials needed.
+
+- Verifies the repository queries (get/insert/update/delete, paging, counts)
+- Compares request throughput of:
+    legacy-per-request  sync create_client() built per request (old routers)
+    legacy-shared       one shared sync client, calls serialized on the loop
+    pooled-async        SupabaseDataAccess on the shared keep-alive pool
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from supabase import create_client
+
+from app.data_access import SupabaseDataAccess
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+REQUESTS = 200
+SIMULATED_LATENCY = 0.02  # 20 ms per round trip, typical for a hosted project
+CONCURRENCY = 16
+
+
+def _seed(fake: FakePostgrest):
+    fake.tables["doctors"] = [
+        {"id": f"doc-{i}", "full_name": f"Dr. {i}", "specialization": "General Physician"}
+        for i in range(20)
+    ]
+    fake.tables["appointments"] = [
+        {
+            "id": f"apt-{i}",
+            "patient_id": "patient-1" if i % 2 == 0 else "patient-2",
+            "doctor_id": f"doc-{i % 20}",
+            "date": f"2026-11-{1 + i % 28:02d}",
+            "time": f"{9 + i % 8:02d}:00:00",
+            "status": "scheduled" if i % 3 else "cancelled",
+        }
+        for i in range(60)
+    ]
+
+
+async def _check_repositories(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        doctor = await dal.doctors.get("doc-3")
+        assert doctor["full_name"] == "Dr. 3"
+        assert await dal.doctors.get("missing") is None
+
+        page, total = await dal.appointments.page_for_patient("patient-1", offset=0, limit=5)
+        assert len(page) == 5 and total == 30
+        assert [a["date"] for a in page] == sorted(a["date"] for a in page)
+        _, cancelled = await dal.appointments.page_for_patient("patient-1", status="cancelled")
+        assert cancelled == 10
+
+        created = await dal.emotion_logs.insert(
+            {"user_id": "patient-1", "emotion_type": "calm", "confidence_score": 0.9}
+        )
+        assert created["id"]
+        batch = await dal.emotion_logs.insert_many([
+            {"user_id": "patient-1", "emotion_type": "pain", "confidence_score": 0.7},
+            {"user_id": "patient-1", "emotion_type": "sad", "confidence_score": 0.6},
+        ])
+        assert len(batch) == 2
+        assert len(await dal.emotion_logs.recent_for_user("patient-1")) == 3
+
+        updated = await dal.doctors.update("doc-3", {"full_name": "Dr. Three"})
+        assert updated["full_name"] == "Dr. Three"
+
+        await dal.emotion_logs.delete_for_user("patient-1")
+        assert await dal.emotion_logs.recent_for_user("patient-1") == []
+    finally:
+        await dal.aclose()
+
+
+def test_repositories():
+    """Repository queries return the same rows PostgREST would."""
+    fake = FakePostgrest()
+    _seed(fake)
+    with fake.serve() as url:
+        asyncio.run(_check_repositories(url))
+    print("✅ Repository queries OK")
+
+
+def _legacy_per_request(url: str):
+    for i in range(REQUESTS):
+        client = create_client(url, FAKE_SERVICE_KEY)
+        client.table("doctors").select("*").eq("id", f"doc-{i % 20}").execute()
+
+
+def _legacy_shared(url: str):
+    client = create_client(url, FAKE_SERVICE_KEY)
+    for i in range(REQUESTS):
+        client.table("doctors").select("*").eq("id", f"doc-{i % 20}").execute()
+
+
+async def _pooled_async(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY, max_concurrency=CONCURRENCY)
+    try:
+        await asyncio.gather(*(dal.doctors.get(f"doc-{i % 20}") for i in range(REQUESTS)))
+    finally:
+        await dal.aclose()
+
+
+def benchmark_throughput():
+    """Requests per second for a doctor-profile lookup under load."""
+    print()
+    print(f"Benchmark: {REQUESTS} doctor lookups, {SIMULATED_LATENCY * 1000:.0f} ms simulated latency")
+    print(f"{'mode':<20} {'seconds':>8} {'req/s':>8}")
+
+    fake = FakePostgrest(latency=SIMULATED_LATENCY)
+    _seed(fake)
+    with fake.serve() as url:
+        modes = [
+            ("legacy-per-request", lambda: _legacy_per_request(url)),
+            ("legacy-shared", lambda: _legacy_shared(url)),
+            ("pooled-async", lambda: asyncio.run(_pooled_async(url))),
+        ]
+        for name, run in modes:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<20} {elapsed:>8.2f} {REQUESTS / elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    test_repositories()
+    benchmark_throughput()
@@ -0,0 +1,149 @@
+"""
+Test for the doctor profile and per-day availability caches.
+
+Runs the appointment routes against the local PostgREST stand-in
+(fake_postgrest.py):
+
+- Closing/reopening a slot in the schedule is visible to the next slot check
+  immediately (explicit invalidation, no waiting for the TTL)
+- In steady state, doctor profiles and availability are served without
+  touching the doctors / doctor_availability tables
+- Reports hit rates from cache_stats()
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+from datetime import date
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.appointment_models import AvailabilityCheckRequest
+from app.appointments import (
+    check_slot_availability,
+    get_appointment,
+    get_patient_appointments,
+)
+from app.cache import cache_stats
+from app.data_access import SupabaseDataAccess
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+DOCTORS = 10
+DAY = date(2026, 11, 20)
+SLOTS = [f"{h:02d}:00" for h in range(9, 17)]
+STEADY_STATE_REQUESTS = 500
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def _seed(fake: FakePostgrest):
+    fake.tables["doctors"] = [
+        {"id": f"doc-{i}", "full_name": f"Dr. {i}", "specialty": "Dermatology", "avatar_url": None}
+        for i in range(DOCTORS)
+    ]
+    fake.tables["doctor_availability"] = [
+        {
+            "id": f"avail-{i}",
+            "doctor_id": f"doc-{i}",
+            "date": DAY.isoformat(),
+            "time_slots": [{"time": t, "is_available": True, "appointment_id": None} for t in SLOTS],
+        }
+        for i in range(DOCTORS)
+    ]
+    fake.tables["appointments"] = [
+        {
+            "id": f"apt-{i}",
+            "patient_id": f"patient-{i % 5}",
+            "doctor_id": f"doc-{i % DOCTORS}",
+            "symptom_category": None,
+            "severity": None,
+            "date": DAY.isoformat(),
+            "time": SLOTS[i % len(SLOTS)],
+            "status": "scheduled",
+            "consultation_fee": 500.0,
+            "created_at": "2026-11-01T09:00:00",
+            "updated_at": "2026-11-01T09:00:00",
+        }
+        for i in range(50)
+    ]
+
+
+def _slot_check(doctor: int, slot: str) -> AvailabilityCheckRequest:
+    return AvailabilityCheckRequest(doctor_id=f"doc-{doctor}", date=DAY, time=slot)
+
+
+async def _set_slot(dal: SupabaseDataAccess, doctor: int, slot: str, is_available: bool):
+    availability = await dal.doctor_availability.get_for_day(f"doc-{doctor}", DAY.isoformat())
+    for entry in availability["time_slots"]:
+        if entry["time"] == slot:
+            entry["is_available"] = is_available
+    await dal.doctor_availability.update_time_slots(availability, availability["time_slots"])
+
+
+async def _check_invalidation(dal: SupabaseDataAccess):
+    assert (await check_slot_availability(_slot_check(1, "10:00"), dal)).available
+
+    await _set_slot(dal, 1, "10:00", False)
+    closed = await check_slot_availability(_slot_check(1, "10:00"), dal)
+    assert not closed.available, "closed slot still served from cache"
+
+    await _set_slot(dal, 1, "10:00", True)
+    assert (await check_slot_availability(_slot_check(1, "10:00"), dal)).available
+
+
+async def _steady_state(fake: FakePostgrest, dal: SupabaseDataAccess):
+    rng = random.Random(7)
+
+    async def request():
+        kind = rng.random()
+        if kind < 0.4:
+            await check_slot_availability(_slot_check(rng.randrange(DOCTORS), rng.choice(SLOTS)), dal)
+        elif kind < 0.7:
+            await get_appointment(f"apt-{rng.randrange(50)}", db=dal)
+        else:
+            await get_patient_appointments(f"patient-{rng.randrange(5)}", None, 1, 20, db=dal)
+
+    # Warm up, then measure
+    for _ in range(100):
+        await request()
+    fake.reset_counts()
+    for cache in (dal.doctors.profiles, dal.doctor_availability.days):
+        cache.reset_stats()
+
+    for _ in range(STEADY_STATE_REQUESTS):
+        await request()
+
+    return fake.count_requests("doctors"), fake.count_requests("doctor_availability")
+
+
+async def _run(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        await _check_invalidation(dal)
+        print("✅ Schedule writes invalidate the cached day")
+
+        doctor_reads, availability_reads = await _steady_state(fake, dal)
+        assert doctor_reads == 0, f"{doctor_reads} doctor reads in steady state"
+        assert availability_reads == 0, f"{availability_reads} availability reads in steady state"
+        print(f"✅ Steady state: {STEADY_STATE_REQUESTS} requests, 0 doctors / doctor_availability queries")
+
+        for name, stats in cache_stats().items():
+            if name in ("doctor_profiles", "doctor_availability"):
+                print(f"   {name:<20} hits={stats['hits']:<5} misses={stats['misses']:<3} "
+                      f"hit_rate={stats['hit_rate']:.1%}")
+    finally:
+        await dal.aclose()
+
+
+def test_doctor_cache():
+    fake = FakePostgrest()
+    _seed(fake)
+    with fake.serve() as url:
+        asyncio.run(_run(url, fake))
+
+
+if __name__ == "__main__":
+    test_doctor_cache()
@@ -0,0 +1,201 @@
+"""
+Test and benchmark for batched emotion log ingestion.
+
+Runs EmotionLogBatcher against the local PostgREST stand-in
+(fake_postgrest.py):
+
+- Every submitted update is written exactly once, in multi-row inserts
+  capped at the batch size, and the running emotion stats see them
+- A partial batch is written by the delay timer, or at once by flush()
+  (the WebSocket disconnect path)
+- Downsampling drops repeats of the previous emotion within the window only
+- Invalid updates are rejected on submit; a failed insert is retried
+- Live call load: inserts/sec and Supabase round trips, one insert per
+  update vs batched
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.data_access import SupabaseDataAccess
+from app.database import DatabaseClient
+from app.emotion_ingest import EmotionLogBatcher
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+EMOTIONS = ["calm", "anxious", "distressed", "pain", "sad", "neutral"]
+PATIENTS = 20
+UPDATES_PER_PATIENT = 50
+UPDATE_INTERVAL = 0.01
+SIMULATED_LATENCY = 0.005
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.emotion_ingest").setLevel(logging.CRITICAL)
+
+
+def _inserts(fake: FakePostgrest) -> int:
+    return sum(1 for method, table in fake.requests if method == "POST" and table == "emotion_logs")
+
+
+async def _check_batching(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    db = DatabaseClient(dal)
+    batcher = EmotionLogBatcher(dal, batch_size=10, max_delay=0.05)
+    rng = random.Random(35)
+    try:
+        before = await db.get_emotion_summary("patient-1")
+        assert before["total_detections"] == 0
+
+        # Full batches go out right away
+        for i in range(20):
+            assert batcher.submit("patient-1", rng.choice(EMOTIONS), round(rng.random(), 3), "consult-1")
+        await asyncio.sleep(0.02)
+        assert len(fake.tables["emotion_logs"]) == 20 and _inserts(fake) == 2
+
+        # A partial batch waits for the timer
+        for i in range(5):
+            batcher.submit("patient-1", rng.choice(EMOTIONS), round(rng.random(), 3), "consult-1")
+        await asyncio.sleep(0.01)
+        assert len(fake.tables["emotion_logs"]) == 20
+        await asyncio.sleep(0.1)
+        assert len(fake.tables["emotion_logs"]) == 25 and batcher.pending == 0
+        assert _inserts(fake) == 3
+
+        # Disconnect: flush() writes a partial batch without waiting
+        batcher.submit("patient-1", "pain", 0.9, None)
+        assert await batcher.flush() == 1
+        assert fake.tables["emotion_logs"][-1]["emotion_type"] == "pain"
+        assert fake.tables["emotion_logs"][-1]["consultation_id"] is None
+
+        summary = await db.get_emotion_summary("patient-1")
+        assert summary["total_detections"] == 26
+        assert summary["last_emotion"]["emotion_type"] == "pain"
+
+        for bad in (("joyful", 0.5), ("calm", 1.5), ("calm", None), ("calm", "high"), ("calm", [0.5]),
+                    ("calm", float("nan"))):
+            try:
+                batcher.submit("patient-1", *bad)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"accepted invalid update {bad}")
+
+        # A failed insert keeps its rows for the next flush
+        insert_many = dal.emotion_logs.insert_many
+
+        async def failing(records):
+            raise RuntimeError("connection reset")
+
+        dal.emotion_logs.insert_many = failing
+        batcher.submit("patient-2", "sad", 0.4)
+        assert await batcher.flush() == 0 and batcher.pending == 1
+        dal.emotion_logs.insert_many = insert_many
+        assert await batcher.flush() == 1
+        assert batcher.stats()["failed_batches"] == 1 and batcher.stats()["written"] == 27
+    finally:
+        await batcher.close()
+        await dal.aclose()
+
+
+async def _check_downsampling(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    batcher = EmotionLogBatcher(dal, batch_size=100, max_delay=10, downsample_seconds=0.2)
+    try:
+        kept = [
+            batcher.submit("patient-1", "calm", 0.8, "consult-1"),
+            batcher.submit("patient-1", "calm", 0.7, "consult-1"),     # repeat: dropped
+            batcher.submit("patient-2", "calm", 0.7, "consult-2"),     # other patient
+            batcher.submit("patient-1", "anxious", 0.6, "consult-1"),  # change: kept
+            batcher.submit("patient-1", "calm", 0.8, "consult-1"),     # change back: kept
+        ]
+        assert kept == [True, False, True, True, True]
+        await asyncio.sleep(0.25)
+        assert batcher.submit("patient-1", "calm", "0.8", "consult-1")  # window elapsed; numeric string
+        assert await batcher.flush() == 5
+        assert batcher.stats()["downsampled"] == 1
+        assert [row["emotion_type"] for row in fake.tables["emotion_logs"] if row["user_id"] == "patient-1"] == [
+            "calm", "anxious", "calm", "calm"
+        ]
+    finally:
+        await batcher.close()
+        await dal.aclose()
+
+
+def test_batching():
+    fake = FakePostgrest()
+    fake.tables["emotion_logs"] = []
+    with fake.serve() as url:
+        asyncio.run(_check_batching(url, fake))
+    print("✅ Size/time flushes, flush on disconnect, validation and retry OK")
+
+
+def test_downsampling():
+    fake = FakePostgrest()
+    fake.tables["emotion_logs"] = []
+    with fake.serve() as url:
+        asyncio.run(_check_downsampling(url, fake))
+    print("✅ Consecutive identical emotions are downsampled per patient")
+
+
+async def _live_call(url: str, batched: bool):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    db = DatabaseClient(dal)
+    batcher = EmotionLogBatcher(dal)
+    try:
+        async def patient(i: int):
+            rng = random.Random(i)
+            handling = 0.0
+            for _ in range(UPDATES_PER_PATIENT):
+                emotion, confidence = rng.choice(EMOTIONS), round(rng.random(), 3)
+                start = time.perf_counter()
+                if batched:
+                    batcher.submit(f"patient-{i}", emotion, confidence, f"consult-{i}")
+                else:
+                    await db.log_emotion(f"patient-{i}", emotion, confidence, f"consult-{i}")
+                handling += time.perf_counter() - start
+                await asyncio.sleep(UPDATE_INTERVAL)
+            if batched:
+                await batcher.flush()
+            return handling
+
+        start = time.perf_counter()
+        handling = await asyncio.gather(*(patient(i) for i in range(PATIENTS)))
+        elapsed = time.perf_counter() - start
+        return elapsed, sum(handling) / (PATIENTS * UPDATES_PER_PATIENT)
+    finally:
+        await batcher.close()
+        await dal.aclose()
+
+
+def test_live_call_benchmark():
+    total = PATIENTS * UPDATES_PER_PATIENT
+    print()
+    print(f"Live calls: {PATIENTS} patients x {UPDATES_PER_PATIENT} updates every "
+          f"{UPDATE_INTERVAL * 1000:.0f} ms, {SIMULATED_LATENCY * 1000:.0f} ms simulated latency")
+    print(f"{'mode':<10} {'rows':>6} {'inserts':>8} {'rows/s':>8} {'ms per update':>14}")
+    results = {}
+    for batched in (False, True):
+        fake = FakePostgrest(latency=SIMULATED_LATENCY)
+        fake.tables["emotion_logs"] = []
+        with fake.serve() as url:
+            elapsed, per_update = asyncio.run(_live_call(url, batched))
+        rows = len(fake.tables["emotion_logs"])
+        inserts = _inserts(fake)
+        mode = "batched" if batched else "per-update"
+        results[mode] = inserts
+        print(f"{mode:<10} {rows:>6} {inserts:>8} {rows / elapsed:>8.0f} {per_update * 1000:>14.3f}")
+        assert rows == total
+
+    assert results["batched"] * 10 <= results["per-update"]
+
+
+if __name__ == "__main__":
+    test_batching()
+    test_downsampling()
+    test_live_call_benchmark()
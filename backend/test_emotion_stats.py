@@ -0,0 +1,174 @@
+"""
+Consistency test and benchmark for running emotion statistics.
+
+Runs DatabaseClient against the local PostgREST stand-in (fake_postgrest.py),
+whose emotion_stats view mirrors supabase/migrations/002_emotion_logs.sql:
+
+- After a random mix of logs, summaries and a deletion, the running counters
+  match the view (counts, averages, first/last detection, distribution,
+  latest emotion) for every user; write counters are dropped once seeded
+- Logs without created_at never become the latest emotion over timestamped ones
+- A consultation-style loop (log, then get_stats): Supabase requests and
+  time per stats request, view re-aggregation vs running counters
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.data_access import SupabaseDataAccess
+from app.database import DatabaseClient
+from app.emotion_stats import UserEmotionStats, get_emotion_stats_tracker
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+EMOTIONS = ["calm", "anxious", "distressed", "pain", "sad", "neutral"]
+USERS = [f"patient-{i}" for i in range(5)]
+OPERATIONS = 400
+CONSULTATION_UPDATES = 200
+SIMULATED_LATENCY = 0.005
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def _view_summary(dal: SupabaseDataAccess, user_id: str) -> dict:
+    """The summary as previously computed: the view plus the latest log."""
+    stats = await dal.emotion_stats.for_user(user_id)
+    recent = await dal.emotion_logs.recent_for_user(user_id, limit=1)
+    total = sum(stat["detection_count"] for stat in stats)
+    return {
+        "total_detections": total,
+        "distribution": {
+            stat["emotion_type"]: round(stat["detection_count"] / total * 100, 1) for stat in stats
+        },
+        "last_emotion": recent[0] if recent else None,
+        "stats": sorted(stats, key=lambda stat: stat["emotion_type"]),
+    }
+
+
+def _assert_consistent(running: dict, view: dict, user_id: str):
+    assert running["total_detections"] == view["total_detections"], user_id
+    assert running["distribution"] == view["distribution"], user_id
+    assert (running["last_emotion"] or {}).get("id") == (view["last_emotion"] or {}).get("id"), user_id
+    assert len(running["stats"]) == len(view["stats"]), user_id
+    for mine, theirs in zip(running["stats"], view["stats"]):
+        assert mine["emotion_type"] == theirs["emotion_type"]
+        assert mine["detection_count"] == theirs["detection_count"]
+        assert abs(mine["avg_confidence"] - theirs["avg_confidence"]) < 1e-9
+        assert mine["first_detected"] == theirs["first_detected"]
+        assert mine["last_detected"] == theirs["last_detected"]
+
+
+async def _check_consistency(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    db = DatabaseClient(dal)
+    rng = random.Random(34)
+    try:
+        # Some history exists before the counters are first seeded
+        for _ in range(50):
+            await db.log_emotion(rng.choice(USERS), rng.choice(EMOTIONS), round(rng.random(), 3))
+
+        for i in range(OPERATIONS):
+            user_id = rng.choice(USERS)
+            roll = rng.random()
+            if roll < 0.6:
+                await db.log_emotion(user_id, rng.choice(EMOTIONS), round(rng.random(), 3), "consult-1")
+            elif roll < 0.98:
+                await db.get_emotion_summary(user_id)
+            else:
+                await db.delete_user_emotions(user_id)
+
+        for user_id in USERS:
+            _assert_consistent(await db.get_emotion_summary(user_id), await _view_summary(dal, user_id), user_id)
+
+        # Logging while a fresh tracker (another worker's) seeds
+        fresh = DatabaseClient(SupabaseDataAccess(url, FAKE_SERVICE_KEY))
+        await asyncio.gather(
+            fresh.get_emotion_summary(USERS[0]),
+            *(fresh.log_emotion(USERS[0], rng.choice(EMOTIONS), 0.5) for _ in range(10)),
+        )
+        _assert_consistent(
+            await fresh.get_emotion_summary(USERS[0]), await _view_summary(dal, USERS[0]), USERS[0]
+        )
+        # Write counters are only kept while a user is being seeded
+        assert get_emotion_stats_tracker(dal)._writes == {}
+        assert get_emotion_stats_tracker(fresh.dal)._writes == {}
+        await fresh.dal.aclose()
+    finally:
+        await dal.aclose()
+
+
+def test_log_without_timestamp():
+    stats = UserEmotionStats.from_view("patient-1", [], None)
+    stats.add({"id": "log-1", "emotion_type": "calm", "confidence_score": 0.9, "created_at": None})
+    assert stats.summary()["last_emotion"]["id"] == "log-1"
+    stats.add({"id": "log-2", "emotion_type": "sad", "confidence_score": 0.4, "created_at": "2026-01-01T09:00:00"})
+    # A log without created_at does not displace one with a timestamp
+    stats.add({"id": "log-3", "emotion_type": "pain", "confidence_score": 0.7, "created_at": None})
+    summary = stats.summary()
+    assert summary["last_emotion"]["id"] == "log-2"
+    assert summary["total_detections"] == 3
+    print("✅ Logs without created_at are counted but never become the latest emotion over a timestamped one")
+
+
+def test_consistency_with_view():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        asyncio.run(_check_consistency(url))
+    print("✅ Running counters match the emotion_stats view for every user")
+
+
+async def _consultation(url: str, fake: FakePostgrest, running: bool):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    db = DatabaseClient(dal)
+    rng = random.Random(7)
+    try:
+        # Earlier consultations for this patient
+        fake.tables["emotion_logs"] = [
+            {
+                "id": f"log-{i}",
+                "user_id": "patient-1",
+                "emotion_type": rng.choice(EMOTIONS),
+                "confidence_score": rng.random(),
+                "created_at": f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}",
+            }
+            for i in range(2000)
+        ]
+        fake.reset_counts()
+        stats_seconds = 0.0
+        for _ in range(CONSULTATION_UPDATES):
+            await db.log_emotion("patient-1", rng.choice(EMOTIONS), rng.random(), "consult-1")
+            start = time.perf_counter()
+            summary = await (db.get_emotion_summary("patient-1") if running else _view_summary(dal, "patient-1"))
+            stats_seconds += time.perf_counter() - start
+        assert summary["total_detections"] == 2000 + CONSULTATION_UPDATES
+        reads = sum(1 for method, table in fake.requests if method == "GET")
+        return reads, stats_seconds / CONSULTATION_UPDATES
+    finally:
+        await dal.aclose()
+
+
+def test_consultation_benchmark():
+    print()
+    print(f"Consultation: {CONSULTATION_UPDATES} x (log emotion, get_stats) for a patient with 2000 prior logs, "
+          f"{SIMULATED_LATENCY * 1000:.0f} ms simulated latency")
+    print(f"{'mode':<18} {'DB reads':>9} {'ms per get_stats':>17}")
+    for running in (False, True):
+        fake = FakePostgrest(latency=SIMULATED_LATENCY)
+        with fake.serve() as url:
+            reads, per_request = asyncio.run(_consultation(url, fake, running))
+        mode = "running counters" if running else "view per request"
+        print(f"{mode:<18} {reads:>9} {per_request * 1000:>17.2f}")
+        if running:
+            assert reads == 2
+
+
+if __name__ == "__main__":
+    test_log_without_timestamp()
+    test_consistency_with_view()
+    test_consultation_benchmark()
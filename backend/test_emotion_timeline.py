@@ -0,0 +1,209 @@
+"""
+Test and benchmark for the consultation emotion timeline.
+
+Runs EmotionTimeline against the local PostgREST stand-in (fake_postgrest.py):
+
+- Buckets match a plain-Python reference (counts, per-emotion counts, mean
+  confidence, dominant emotion with confidence tie-break) for several widths
+- Timelines of active consultations are rebuilt per request; once the
+  consultation is completed they are served from the cache, and a late
+  emotion log for it invalidates the entry
+- A long consultation: response size and time of the raw log listing vs the
+  bucketed timeline, cold and cached
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.data_access import SupabaseDataAccess
+from app.database import DatabaseClient
+from app.emotion_ingest import EMOTION_TYPES
+from app.emotion_timeline import EmotionSeries
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+START = datetime.now().replace(microsecond=0) - timedelta(hours=3)
+LONG_CONSULTATION_SECONDS = 2 * 60 * 60
+SIMULATED_LATENCY = 0.005
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def _logs(consultation_id: str, seconds: int, rate: float, seed: int):
+    rng = random.Random(seed)
+    logs, t = [], 0.0
+    while t < seconds:
+        logs.append({
+            "id": f"{consultation_id}-{len(logs)}",
+            "user_id": "patient-1",
+            "consultation_id": consultation_id,
+            "emotion_type": rng.choice(EMOTION_TYPES),
+            "confidence_score": round(rng.random(), 3),
+            "created_at": (START + timedelta(seconds=t)).isoformat(),
+        })
+        t += rng.expovariate(rate)
+    return logs
+
+
+def _reference(logs, bucket_seconds: int):
+    """Straightforward per-row bucketing, as the frontend did it."""
+    buckets = defaultdict(list)
+    first = min(datetime.fromisoformat(log["created_at"]) for log in logs)
+    for log in logs:
+        offset = (datetime.fromisoformat(log["created_at"]) - first).total_seconds()
+        buckets[int(offset // bucket_seconds)].append(log)
+    expected = []
+    for bucket in sorted(buckets):
+        rows = buckets[bucket]
+        counts = Counter(row["emotion_type"] for row in rows)
+        confidence = defaultdict(float)
+        for row in rows:
+            confidence[row["emotion_type"]] += row["confidence_score"]
+        dominant = max(EMOTION_TYPES, key=lambda e: (counts[e], confidence[e], -EMOTION_TYPES.index(e)))
+        expected.append({
+            "offset_seconds": bucket * bucket_seconds,
+            "count": len(rows),
+            "dominant_emotion": dominant,
+            "mean_confidence": sum(row["confidence_score"] for row in rows) / len(rows),
+            "counts": dict(counts),
+        })
+    return expected
+
+
+def test_buckets_match_reference():
+    logs = _logs("consult-ref", 1800, rate=2.0, seed=36)
+    # Ties: two detections each, the second emotion more confident
+    logs += [
+        {"emotion_type": "sad", "confidence_score": 0.2, "created_at": (START + timedelta(seconds=1800)).isoformat()},
+        {"emotion_type": "sad", "confidence_score": 0.3, "created_at": (START + timedelta(seconds=1801)).isoformat()},
+        {"emotion_type": "pain", "confidence_score": 0.4, "created_at": (START + timedelta(seconds=1802)).isoformat()},
+        {"emotion_type": "pain", "confidence_score": 0.5, "created_at": (START + timedelta(seconds=1803)).isoformat()},
+    ]
+    random.Random(1).shuffle(logs)
+    series = EmotionSeries.from_rows(logs)
+    assert len(series) == len(logs)
+    for bucket_seconds in (1, 7, 30, 60, 3600):
+        buckets = series.buckets(bucket_seconds)
+        expected = _reference(logs, bucket_seconds)
+        assert len(buckets) == len(expected), bucket_seconds
+        for mine, theirs in zip(buckets, expected):
+            assert mine["offset_seconds"] == theirs["offset_seconds"]
+            assert mine["count"] == theirs["count"]
+            assert mine["counts"] == theirs["counts"]
+            assert mine["dominant_emotion"] == theirs["dominant_emotion"], (bucket_seconds, mine, theirs)
+            assert abs(mine["mean_confidence"] - theirs["mean_confidence"]) < 1e-4
+    assert series.buckets(60)[-1]["dominant_emotion"] == "pain"
+    assert EmotionSeries.from_rows([]).buckets(30) == []
+
+    for bad in (0, 3601):
+        try:
+            series.buckets(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"accepted bucket_seconds={bad}")
+    print("✅ Buckets match the per-row reference for 1s-1h widths")
+
+
+async def _check_caching(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    db = DatabaseClient(dal)
+    try:
+        fake.tables["consultations"] = [{"id": "consult-1", "status": "active", "end_time": None}]
+        fake.tables["emotion_logs"] = _logs("consult-1", 600, rate=1.0, seed=2)
+
+        fake.reset_counts()
+        first = await db.get_consultation_emotion_timeline("consult-1", 60)
+        again = await db.get_consultation_emotion_timeline("consult-1", 60)
+        assert first == again and first["total_detections"] == len(fake.tables["emotion_logs"])
+        assert sum(1 for _, table in fake.requests if table == "emotion_logs") == 2, "active timeline cached"
+
+        fake.tables["consultations"][0].update(status="completed", end_time="2026-03-01T10:10:00")
+        await db.get_consultation_emotion_timeline("consult-1", 60)
+        fake.reset_counts()
+        widths = [await db.get_consultation_emotion_timeline("consult-1", width) for width in (10, 60, 300)]
+        assert fake.request_count == 0
+        assert all(timeline["total_detections"] == first["total_detections"] for timeline in widths)
+
+        # A late (batched) log for the consultation is never hidden by the cache
+        await db.log_emotion("patient-1", "pain", 0.95, "consult-1")
+        after = await db.get_consultation_emotion_timeline("consult-1", 60)
+        assert after["total_detections"] == first["total_detections"] + 1
+
+        # Logs of other consultations leave the entry alone
+        await db.get_consultation_emotion_timeline("consult-1", 60)
+        await db.log_emotion("patient-1", "calm", 0.5, "consult-2")
+        fake.reset_counts()
+        await db.get_consultation_emotion_timeline("consult-1", 60)
+        assert fake.request_count == 0
+
+        empty = await db.get_consultation_emotion_timeline("does-not-exist", 30)
+        assert empty["total_detections"] == 0 and empty["buckets"] == []
+    finally:
+        await dal.aclose()
+
+
+def test_caching():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        asyncio.run(_check_caching(url, fake))
+    print("✅ Ended consultations are cached; late logs invalidate them")
+
+
+async def _long_consultation(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    db = DatabaseClient(dal)
+    try:
+        fake.tables["consultations"] = [{"id": "consult-long", "status": "completed", "end_time": "2026-03-01T12:00:00"}]
+        fake.tables["emotion_logs"] = _logs("consult-long", LONG_CONSULTATION_SECONDS, rate=1.0, seed=3)
+        results = []
+
+        fake.reset_counts()
+        start = time.perf_counter()
+        raw = await db.get_consultation_emotions("consult-long")
+        results.append(("raw rows", time.perf_counter() - start, len(json.dumps(raw)), len(raw), fake.request_count))
+
+        for label in ("timeline cold", "timeline cached"):
+            fake.reset_counts()
+            start = time.perf_counter()
+            timeline = await db.get_consultation_emotion_timeline("consult-long", 30)
+            elapsed = time.perf_counter() - start
+            results.append((label, elapsed, len(json.dumps(timeline)), len(timeline["buckets"]), fake.request_count))
+
+        series = db.emotion_timeline.series.get("consult-long")
+        return results, len(fake.tables["emotion_logs"]), series.nbytes
+    finally:
+        await dal.aclose()
+
+
+def test_long_consultation_benchmark():
+    fake = FakePostgrest(latency=SIMULATED_LATENCY)
+    with fake.serve() as url:
+        results, detections, nbytes = asyncio.run(_long_consultation(url, fake))
+    print()
+    print(f"Long consultation: {LONG_CONSULTATION_SECONDS // 60} min, {detections} detections, "
+          f"30 s buckets, {SIMULATED_LATENCY * 1000:.0f} ms simulated latency")
+    print(f"{'response':<16} {'items':>7} {'bytes':>9} {'DB requests':>12} {'ms':>8}")
+    for label, seconds, size, items, requests in results:
+        print(f"{label:<16} {items:>7} {size:>9} {requests:>12} {seconds * 1000:>8.1f}")
+    # The stand-in has no max-rows limit; real Supabase truncates the unpaged raw listing
+    print("(raw rows is a single unpaged request; the timeline reads every row page by page)")
+    print(f"Cached arrays: {nbytes} bytes ({nbytes / detections:.0f} bytes per detection)")
+    raw_bytes, cached_ms = results[0][2], results[2][1] * 1000
+    assert results[1][2] * 5 < raw_bytes
+    assert results[2][4] == 0 and cached_ms < results[0][1] * 1000
+
+
+if __name__ == "__main__":
+    test_buckets_match_reference()
+    test_caching()
+    test_long_consultation_benchmark()
@@ -0,0 +1,343 @@
+"""
+Test and benchmark for perceptual-hash dedup of medical image uploads.
+
+Runs ImageHashIndex against the local PostgREST stand-in
+(fake_postgrest.py) on synthetic upload histories: each patient uploads new
+photos, exact re-uploads, copies recompressed and resized by a messaging
+app, sideways copies with an EXIF orientation, the same photo with other
+symptoms and near-identical follow-ups (slightly brighter, new sensor noise):
+
+- Duplicates reuse the stored analysis; different photos, other body parts,
+  other symptoms or descriptions and follow-ups never do; analysis calls
+  avoided are counted per threshold
+- The index survives a restart (loaded from the hash columns) and forgets
+  deleted images; failed analyses are not reused
+- Without migration 009 uploads are saved without hashes and analysed
+- upload_medical_image reuses the analysis end to end (fake_gemini.py);
+  a truncated model reply is stored as an error and not reused
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.data_access import SupabaseDataAccess
+from app.image_dedup import ImageHashIndex
+from app.image_preprocessing import prepare_image
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+from test_image_preprocessing import _jpeg
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.image_dedup").setLevel(logging.WARNING)
+
+ANALYSIS = {"visual_description": "analysis", "severity": "mild", "possible_conditions": []}
+
+
+def _photo(width: int, height: int, seed: int) -> Image.Image:
+    """Photo-like scene: random large shapes, finer texture and sensor noise."""
+    rng = np.random.default_rng(seed)
+    layers = [
+        Image.fromarray(rng.integers(0, 256, (rows, rows * 4 // 3, 3), dtype=np.uint8)).resize(
+            (width, height), Image.Resampling.BICUBIC)
+        for rows in (6, 24)
+    ]
+    pixels = (np.asarray(layers[0], dtype=np.float32) * 0.8 + np.asarray(layers[1], dtype=np.float32) * 0.2
+              + rng.normal(0, 5, (height, width, 3)))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _follow_up(photo: Image.Image, seed: int) -> Image.Image:
+    """Same scene a few days later: a little brighter, new sensor noise."""
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(photo, dtype=np.float32) * 1.04 + rng.normal(0, 4, (photo.height, photo.width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _history(patient: int):
+    """(label, body part, symptoms, bytes, picture, is_follow_up) uploads of one patient."""
+    first = _photo(1600, 1200, seed=100 + patient)
+    second = _photo(1600, 1200, seed=200 + patient)
+    itching = ["itching"]
+    return [
+        ("new photo", "forearm", itching, _jpeg(first), "first", False),
+        ("exact re-upload", "forearm", itching, _jpeg(first), "first", False),
+        ("messaging-app copy", "forearm", itching, _jpeg(first.resize((1280, 960)), quality=60), "first", False),
+        ("sideways copy", "Forearm", [" Itching"], _jpeg(first.transpose(Image.Transpose.ROTATE_90), orientation=6),
+         "first", False),
+        ("near-identical follow-up", "forearm", itching, _jpeg(_follow_up(first, patient)), "first", True),
+        ("same photo, other symptoms", "forearm", ["itching", "swelling"], _jpeg(first), "first", False),
+        ("same photo, other body part", "knee", itching, _jpeg(first), "first", False),
+        ("different photo", "forearm", itching, _jpeg(second), "second", False),
+        ("different photo re-upload", "forearm", itching, _jpeg(second, quality=75), "second", False),
+    ]
+
+
+def _prompt(body_part: str, symptoms) -> tuple:
+    return body_part.lower(), tuple(sorted(symptom.strip().lower() for symptom in symptoms))
+
+
+def _duplicates(uploads) -> int:
+    """Uploads (not follow-ups) showing a picture with a prompt that an earlier upload showed."""
+    seen, count = set(), 0
+    for _, body_part, symptoms, _, picture, is_follow_up in uploads:
+        key = (picture, _prompt(body_part, symptoms))
+        count += key in seen and not is_follow_up
+        seen.add(key)
+    return count
+
+
+def _record(patient_id: str, body_part: str, analysis=None, symptoms=None):
+    return {"patient_id": patient_id, "body_part": body_part, "symptoms": symptoms, "image_url": "url",
+            "storage_path": "path", "ai_analysis": analysis or dict(ANALYSIS)}
+
+
+async def _replay(index: ImageHashIndex, histories):
+    """Upload every history; (analyses run, reused correctly, wrongly reused)."""
+    calls = correct = wrong = 0
+    for patient, uploads in histories.items():
+        for label, body_part, symptoms, data, picture, is_follow_up in uploads:
+            prepared = prepare_image(data)
+            duplicate = await index.find(patient, prepared, body_part, symptoms, is_follow_up=is_follow_up)
+            prompt = repr(_prompt(body_part, symptoms))
+            if duplicate is None:
+                calls += 1
+                analysis = {**ANALYSIS, "source": label, "picture": picture, "prompt": prompt}
+            else:
+                analysis = {**duplicate["ai_analysis"], "reused_from_image_id": duplicate["id"]}
+                if analysis["picture"] == picture and analysis["prompt"] == prompt and not is_follow_up:
+                    correct += 1
+                else:
+                    wrong += 1
+            await index.insert(_record(patient, body_part, analysis, symptoms), prepared)
+    return calls, correct, wrong
+
+
+async def _check_dedup(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        histories = {f"patient-{n}": _history(n) for n in range(3)}
+        uploads = sum(len(history) for history in histories.values())
+        duplicates = sum(_duplicates(history) for history in histories.values())
+
+        print()
+        print(f"{uploads} uploads, {duplicates} duplicates of an earlier upload")
+        print(f"{'max distance':>12} {'analyses':>9} {'avoided':>8} {'wrong reuse':>12}")
+        results = {}
+        for max_distance in (-1, 0, 6, 12):
+            fake.tables["medical_images"] = []
+            index = ImageHashIndex(dal, max_distance=max_distance)
+            calls, correct, wrong = await _replay(index, histories)
+            results[max_distance] = (calls, correct, wrong)
+            print(f"{max_distance:>12} {calls:>9} {uploads - calls:>8} {wrong:>12}")
+        assert results[-1][0] == uploads
+        calls, correct, wrong = results[6]
+        assert wrong == 0 and correct == duplicates and calls == uploads - duplicates
+        assert results[12][2] == 0
+
+        # Restart: the index is rebuilt from the stored hashes
+        fake.reset_counts()
+        restarted = ImageHashIndex(dal)
+        patient = "patient-0"
+        _, body_part, symptoms, data, _, _ = histories[patient][1]
+        duplicate = await restarted.find(patient, prepare_image(data), body_part, symptoms)
+        assert duplicate is not None and duplicate["ai_analysis"]["source"] == "new photo"
+        assert fake.request_count == 2
+        # The prompt is part of the match: another description is analysed again
+        assert await restarted.find(patient, prepare_image(data), body_part, symptoms, "it has spread") is None
+
+        # Deleted image: not reused
+        fresh = prepare_image(_jpeg(_photo(800, 600, seed=999)))
+        saved = await restarted.insert(_record("patient-9", "arm"), fresh)
+        assert (await restarted.find("patient-9", fresh, "arm"))["id"] == saved["id"]
+        fake.tables["medical_images"].remove(next(row for row in fake.tables["medical_images"] if row["id"] == saved["id"]))
+        restarted.discard("patient-9", saved["id"])
+        assert await restarted.find("patient-9", fresh, "arm") is None
+
+        # Failed analyses are stored without hashes and never reused
+        saved = await restarted.insert(_record(patient, "arm", {"error": "429"}), fresh)
+        assert saved.get("image_phash") is None
+        assert await restarted.find(patient, fresh, "arm") is None
+        assert restarted.stats()["analyses_reused"] == 2
+        return results
+    finally:
+        await dal.aclose()
+
+
+def test_dedup():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        results = asyncio.run(_check_dedup(url, fake))
+    _, correct, _ = results[6]
+    print(f"✅ Default threshold (6 bits): {correct} analysis calls avoided, no wrong reuse")
+
+
+class _OldSchemaImages:
+    """medical_images before migration 009."""
+
+    def __init__(self):
+        self.rows = []
+
+    async def hashes_for_patient(self, patient_id):
+        raise Exception("column medical_images.image_phash does not exist")
+
+    async def insert(self, record):
+        if "image_phash" in record:
+            raise Exception("Could not find the 'image_phash' column of 'medical_images' in the schema cache")
+        self.rows.append({"id": str(len(self.rows)), **record})
+        return self.rows[-1]
+
+
+class _OldSchemaDataAccess:
+    def __init__(self):
+        self.medical_images = _OldSchemaImages()
+
+
+async def _check_old_schema():
+    dal = _OldSchemaDataAccess()
+    index = ImageHashIndex(dal)
+    prepared = prepare_image(_jpeg(_photo(800, 600, seed=5)))
+    saved = await index.insert(_record("patient-1", "arm"), prepared)
+    assert "image_phash" not in saved and not index.enabled
+    assert await index.find("patient-1", prepared, "arm") is None
+
+    index = ImageHashIndex(dal)
+    assert await index.find("patient-1", prepared, "arm") is None
+    assert not index.enabled
+    await index.insert(_record("patient-1", "arm"), prepared)
+    assert len(dal.medical_images.rows) == 2
+
+
+def test_old_schema():
+    asyncio.run(_check_old_schema())
+    print("✅ Without migration 009 uploads are saved without hashes and always analysed")
+
+
+class _MemoryBucket:
+    """Stand-in for the medical-images Storage bucket."""
+
+    def __init__(self):
+        self.files = {}
+
+    async def upload(self, path, data, content_type, upsert=False):
+        self.files[path] = data
+
+    async def get_public_url(self, path):
+        return f"https://storage.example/{path}"
+
+
+FAKE_ENV = ("SUPABASE_URL", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY")
+
+
+@asynccontextmanager
+async def _fake_services(postgrest_url: str, gemini_url: str, bucket):
+    """
+    Point medical_images and the LLM gateway at the stand-ins.
+
+    The environment, the shared gateway and data access layer and the
+    module's storage, database, hash index and analyzer are restored
+    afterwards, so later tests in the same session see the real
+    configuration.
+    """
+    from app import cache, data_access, llm_gateway
+    from app.llm_gateway import LLMGateway
+    from app.medical_image_analyzer import MedicalImageAnalyzer
+
+    saved_env = {name: os.environ.get(name) for name in FAKE_ENV}
+    saved_gateway, saved_data_access = llm_gateway._gateway, data_access._data_access
+    os.environ.update({"SUPABASE_URL": postgrest_url, "SUPABASE_SERVICE_KEY": FAKE_SERVICE_KEY,
+                       "GEMINI_API_KEY": "fake-key"})
+    gateway = llm_gateway._gateway = LLMGateway(api_endpoint=gemini_url, rate_limits={})
+    from app import medical_images
+
+    saved_module = (medical_images.db, medical_images.images_bucket, medical_images.image_index,
+                    medical_images.analyzer)
+    dal = SupabaseDataAccess(postgrest_url, FAKE_SERVICE_KEY)
+    medical_images.db, medical_images.images_bucket = dal, bucket
+    medical_images.image_index = ImageHashIndex(dal)
+    # The analyzer's models are bound to the gateway that was current when it was built
+    medical_images.analyzer = MedicalImageAnalyzer()
+    try:
+        yield medical_images
+    finally:
+        gateway.close()
+        await dal.aclose()
+        llm_gateway._gateway, data_access._data_access = saved_gateway, saved_data_access
+        (medical_images.db, medical_images.images_bucket, medical_images.image_index,
+         medical_images.analyzer) = saved_module
+        cache.register_cache("medical_image_hashes", medical_images.image_index._patients)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+async def _check_endpoint(postgrest_url: str, fake_gemini, gemini_url: str):
+    async with _fake_services(postgrest_url, gemini_url, _MemoryBucket()) as medical_images:
+        await _upload_twice(medical_images, fake_gemini)
+
+
+async def _upload_twice(medical_images, fake_gemini):
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    patient_id = "8a6e0f5e-1c1b-4f5e-9a8e-5b7f2f0c1d11"
+    photo = _photo(1600, 1200, seed=42)
+
+    async def upload(data: bytes, name: str, patient_description=None, is_follow_up=False, parent_image_id=None):
+        file = UploadFile(io.BytesIO(data), filename=name, headers=Headers({"content-type": "image/jpeg"}))
+        return await medical_images.upload_medical_image(
+            file=file, patient_id=patient_id, body_part="Forearm", symptoms='["itching"]',
+            patient_description=patient_description, image_type="rash", appointment_id=None,
+            is_follow_up=is_follow_up, parent_image_id=parent_image_id
+        )
+
+    first = await upload(_jpeg(photo), "rash.jpg")
+    again = await upload(_jpeg(photo.resize((1200, 900)), quality=70), "rash (1).jpg")
+    other = await upload(_jpeg(_photo(1600, 1200, seed=43)), "other.jpg")
+    spreading = await upload(_jpeg(photo), "rash.jpg", patient_description="It has spread since yesterday")
+    follow_up = await upload(_jpeg(photo), "rash.jpg", is_follow_up=True, parent_image_id=first["id"])
+    assert len(fake_gemini.requests) == 4
+    assert again["ai_analysis"]["reused_from_image_id"] == first["id"]
+    assert again["severity_level"] == first["severity_level"] == "mild"
+    for saved in (other, spreading, follow_up):
+        assert "reused_from_image_id" not in saved["ai_analysis"]
+
+    # A reply cut off by the token limit is stored as an error, never as defaults to reuse
+    cut_off = [await upload(_jpeg(photo), "rash.jpg", patient_description="Cut off") for _ in range(2)]
+    assert len(fake_gemini.requests) == 6
+    assert all("error" in saved["ai_analysis"] and saved["severity_level"] == "unknown" for saved in cut_off)
+    stats = await medical_images.get_dedup_stats()
+    assert stats["analyses_reused"] == 1 and stats["analyses_run"] == 6
+
+
+def test_endpoint():
+    import json
+
+    from fake_gemini import FakeGemini
+
+    postgrest = FakePostgrest()
+    def reply(model, prompt):
+        text = json.dumps({**ANALYSIS, "severity": "mild"})
+        return text[:len(text) // 2] if "Cut off" in prompt else text
+
+    gemini = FakeGemini(reply=reply)
+    with postgrest.serve() as url, gemini.serve() as gemini_url:
+        asyncio.run(_check_endpoint(url, gemini, gemini_url))
+    print("✅ upload_medical_image reuses the analysis of a re-uploaded photo, not for a new "
+          "description, a follow-up or a truncated reply")
+
+
+if __name__ == "__main__":
+    test_dedup()
+    test_old_schema()
+    test_endpoint()
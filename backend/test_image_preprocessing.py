@@ -0,0 +1,229 @@
+"""
+Test and benchmark for the Gemini Vision image preprocessing stage.
+
+Runs prepare_image on synthetic uploads (a 12 MP phone photo stored
+sideways with an EXIF orientation, an 8 MP photo, a PNG screenshot with
+transparency, a small JPEG):
+
+- Sideways photos come out upright; transparency is flattened; a small
+  JPEG that re-encoding would not shrink is sent as is
+- The perceptual hash survives re-encoding and resizing and tells different
+  images apart; a repeated image is served from the cache
+- MedicalImageAnalyzer sends the prepared JPEGs for both analysis and
+  comparison (checked on the wire against fake_gemini.py)
+
+Compares bytes sent and time per image with the previous path: PIL image
+thumbnailed to 2048 px and re-encoded by the SDK (lossless WebP).
+"""
+
+import asyncio
+import base64
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from google.generativeai.types import content_types
+
+from app import image_preprocessing, llm_gateway
+from app.image_preprocessing import hamming_distance, prepare_image
+from app.llm_gateway import LLMGateway
+from fake_gemini import FakeGemini
+
+ORIENTATION = 0x0112
+
+
+def _photo(width: int, height: int, seed: int = 0) -> Image.Image:
+    """Photo-like RGB image: smooth shading, texture and sensor noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = seed * 1.7
+    channels = [
+        128 + 90 * np.sin(x / (width / 13) + phase) + 25 * np.sin(y / 17),
+        100 + 60 * np.cos(y / (height / 11) + phase) + 10 * np.sin((x - y) / 9),
+        80 + 50 * np.sin((x + y) / (width / 7) + phase),
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 6, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def _jpeg(image: Image.Image, quality: int = 92, orientation: int = 1) -> bytes:
+    output = io.BytesIO()
+    exif = image.getexif()
+    if orientation != 1:
+        exif[ORIENTATION] = orientation
+    image.save(output, format="JPEG", quality=quality, exif=exif)
+    return output.getvalue()
+
+
+def _png(image: Image.Image) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def _uploads():
+    """(name, bytes) of typical uploads."""
+    sideways = _photo(4000, 3000, seed=1)
+    screenshot = _photo(1170, 2532, seed=2).convert("RGBA")
+    screenshot.putalpha(Image.new("L", screenshot.size, 255))
+    return [
+        ("12 MP photo, EXIF rotated", _jpeg(sideways, orientation=6)),
+        ("8 MP photo", _jpeg(_photo(3264, 2448, seed=3))),
+        ("PNG screenshot", _png(screenshot)),
+        ("1 MP JPEG", _jpeg(_photo(1024, 768, seed=4), quality=80)),
+    ]
+
+
+def _old_part(image_data: bytes):
+    """What analyze_image sent before: 2048 px thumbnail, converted by the SDK."""
+    image = Image.open(io.BytesIO(image_data))
+    if image.size[0] > 2048 or image.size[1] > 2048:
+        image.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
+    return content_types.to_part(image)
+
+
+def _clear_cache():
+    image_preprocessing._prepared_images._entries.clear()
+
+
+def test_preprocessing():
+    _clear_cache()
+    uploads = dict(_uploads())
+
+    # Sideways photo: upright, downscaled, JPEG
+    rotated = prepare_image(uploads["12 MP photo, EXIF rotated"])
+    assert (rotated.width, rotated.height) == (1152, 1536), (rotated.width, rotated.height)
+    decoded = Image.open(io.BytesIO(rotated.data))
+    assert decoded.format == "JPEG" and decoded.size == (1152, 1536)
+    assert decoded.getexif().get(ORIENTATION, 1) == 1
+
+    # Transparency flattened onto white
+    transparent = Image.new("RGBA", (300, 200), (255, 0, 0, 0))
+    transparent.paste((0, 0, 255, 255), (0, 0, 150, 200))
+    flattened = Image.open(io.BytesIO(prepare_image(_png(transparent)).data)).convert("RGB")
+    assert all(abs(a - b) < 8 for a, b in zip(flattened.getpixel((250, 100)), (255, 255, 255)))
+    assert flattened.getpixel((50, 100))[2] > 200
+
+    # Small, already compressed JPEG: sent as is
+    small = uploads["1 MP JPEG"]
+    assert prepare_image(small, quality=95).data == small
+
+    # 16-bit greyscale scans and palette images decode
+    for mode, size in (("I;16", (640, 480)), ("P", (640, 480))):
+        output = io.BytesIO()
+        Image.new(mode, size, 3000 if mode == "I;16" else 7).save(output, format="PNG")
+        assert prepare_image(output.getvalue()).mime_type == "image/jpeg"
+    print("✅ EXIF orientation applied, large images downscaled, transparency flattened")
+
+
+def test_perceptual_hash():
+    _clear_cache()
+    photo = _photo(2000, 1500, seed=5)
+    original = prepare_image(_jpeg(photo)).phash
+
+    # The same picture re-encoded, resized or re-saved as PNG
+    variants = [
+        _jpeg(photo, quality=60),
+        _jpeg(photo.resize((1000, 750))),
+        _png(photo.resize((800, 600))),
+        _jpeg(photo.transpose(Image.Transpose.ROTATE_90), orientation=6),
+    ]
+    distances = [hamming_distance(original, prepare_image(data).phash) for data in variants]
+    assert max(distances) <= 6, distances
+
+    # Different pictures
+    others = [prepare_image(_jpeg(_photo(2000, 1500, seed=seed))).phash for seed in (11, 12, 13)]
+    different = [hamming_distance(original, other) for other in others]
+    assert min(different) > 12, different
+
+    # Cache: a repeated upload is not decoded again
+    data = _jpeg(photo)
+    started = time.perf_counter()
+    first = prepare_image(data)
+    assert prepare_image(data) is first
+    repeat = time.perf_counter() - started
+    print(f"✅ Perceptual hash: same image within {max(distances)} bits, "
+          f"different images {min(different)}+ bits apart; repeats served from cache")
+    assert repeat < 1
+
+
+def test_benchmark():
+    _clear_cache()
+    print()
+    print(f"{'upload':<28} {'upload':>9} {'old sent':>10} {'old time':>9} {'new sent':>10} {'new time':>9}")
+    total_old = total_new = 0
+    for name, data in _uploads():
+        started = time.perf_counter()
+        old = _old_part(data)
+        old_seconds = time.perf_counter() - started
+        _clear_cache()
+        started = time.perf_counter()
+        new = prepare_image(data)
+        new_seconds = time.perf_counter() - started
+        old_bytes = len(old.inline_data.data)
+        total_old += old_bytes
+        total_new += len(new.data)
+        print(f"{name:<28} {len(data) / 1024:>7.0f}KB {old_bytes / 1024:>8.0f}KB {old_seconds * 1000:>7.0f}ms "
+              f"{len(new.data) / 1024:>8.0f}KB {new_seconds * 1000:>7.0f}ms")
+        assert len(new.data) <= old_bytes
+        assert new_seconds < old_seconds
+    print(f"   bytes sent to Gemini: {total_old / 1024:.0f}KB -> {total_new / 1024:.0f}KB "
+          f"({total_old / total_new:.0f}x smaller)")
+    assert total_new * 5 < total_old
+    print("✅ Prepared images are smaller and faster to produce than the SDK's lossless re-encode")
+
+
+async def _check_analyzer(url: str, fake: FakeGemini):
+    from app.medical_image_analyzer import MedicalImageAnalyzer
+
+    analyzer = MedicalImageAnalyzer()
+    uploads = dict(_uploads())
+    before, after = uploads["12 MP photo, EXIF rotated"], uploads["8 MP photo"]
+
+    analysis = await analyzer.analyze_image(before, body_part="forearm")
+    assert "error" not in analysis, analysis
+    comparison = await analyzer.compare_images(before, after, days_between=7)
+    assert "error" not in comparison, comparison
+
+    # One image in the analysis request, two in the comparison
+    assert [len(parts) for parts in fake.inline_parts] == [1, 2]
+    sent = [base64.b64decode(part["data"]) for parts in fake.inline_parts for part in parts]
+    assert all(part["mimeType"] == "image/jpeg" for parts in fake.inline_parts for part in parts)
+    assert Image.open(io.BytesIO(sent[0])).size == (1152, 1536)
+    assert sent[1] == sent[0]
+    return fake.payload_bytes
+
+
+def test_analyzer():
+    _clear_cache()
+    fake = FakeGemini(reply=lambda model, prompt: '{"visual_description": "a rash", "severity": "mild", '
+                                                  '"overall_progress": "good", "improvement_percentage": 40}')
+    saved_gateway, saved_key = llm_gateway._gateway, os.environ.get("GEMINI_API_KEY")
+    with fake.serve() as url:
+        llm_gateway._gateway = LLMGateway(api_endpoint=url, rate_limits={})
+        os.environ["GEMINI_API_KEY"] = "fake-key"
+        try:
+            payloads = asyncio.run(_check_analyzer(url, fake))
+        finally:
+            llm_gateway._gateway.close()
+            llm_gateway._gateway = saved_gateway
+            if saved_key is None:
+                os.environ.pop("GEMINI_API_KEY", None)
+            else:
+                os.environ["GEMINI_API_KEY"] = saved_key
+    print("✅ Analysis and comparison send the prepared JPEGs "
+          f"(request bodies {payloads[0] / 1024:.0f}KB and {payloads[1] / 1024:.0f}KB)")
+
+
+if __name__ == "__main__":
+    test_preprocessing()
+    test_perceptual_hash()
+    test_benchmark()
+    test_analyzer()
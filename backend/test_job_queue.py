@@ -0,0 +1,317 @@
+"""
+Test and benchmark for the SQLite-backed background job queue.
+
+Runs JobQueue on a temporary SQLite file with stand-in handlers:
+
+- Transient failures are retried with backoff; JobError and exhausted
+  attempts fail the job and run its cleanup
+- Jobs queued or running when the queue closes resume after a restart, with
+  their spooled upload bytes
+- watch() pushes every status change; at most JOB_WORKERS jobs run at once
+- A burst of 200 uploads to upload_medical_image(background=True) against
+  the PostgREST and Gemini stand-ins (fake_postgrest.py, fake_gemini.py):
+  every request returns before its job has finished, every job completes
+  and the counters add up; an upload whose row cannot be saved fails at
+  once (inline or queued) and its stored file is removed. Request latency vs analysing inline, queue wait
+  and worker utilization are printed, not asserted (they depend on load)
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.job_queue import COMPLETED, FAILED, JobError, JobQueue
+from fake_postgrest import FakePostgrest
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.job_queue").setLevel(logging.CRITICAL)
+
+
+def _queue(directory: str, **options) -> JobQueue:
+    options.setdefault("retry_delay", 0.01)
+    return JobQueue(os.path.join(directory, "jobs.db"), **options)
+
+
+async def _check_retries(directory: str):
+    queue = _queue(directory, max_attempts=3)
+    attempts = {}
+    cleaned = []
+
+    async def flaky(payload, data):
+        attempts[payload["name"]] = attempts.get(payload["name"], 0) + 1
+        if payload["name"] == "bad input":
+            raise JobError("unreadable file")
+        if attempts[payload["name"]] <= payload["failures"]:
+            raise RuntimeError("503 from the model")
+        return {"name": payload["name"], "size": len(data)}
+
+    async def cleanup(payload):
+        cleaned.append(payload["name"])
+
+    queue.register("flaky", flaky, on_failure=cleanup)
+    try:
+        ids = {
+            name: await queue.enqueue("flaky", {"name": name, "failures": failures}, b"x" * 10)
+            for name, failures in (("ok", 0), ("transient", 2), ("down", 5), ("bad input", 0))
+        }
+        await queue.drain()
+        jobs = {name: queue.get(job_id) for name, job_id in ids.items()}
+        assert jobs["ok"]["status"] == COMPLETED and jobs["ok"]["result"] == {"name": "ok", "size": 10}
+        assert jobs["transient"]["status"] == COMPLETED and jobs["transient"]["attempts"] == 3
+        assert jobs["down"]["status"] == FAILED and jobs["down"]["attempts"] == 3
+        assert jobs["bad input"]["status"] == FAILED and jobs["bad input"]["attempts"] == 1
+        assert jobs["bad input"]["error"] == "unreadable file"
+        assert sorted(cleaned) == ["bad input", "down"]
+        # Spooled bytes are removed once a job has finished
+        assert not os.listdir(os.path.join(directory, "spool"))
+        assert queue.get("no-such-job") is None
+        stats = queue.stats()
+        assert stats["completed"] == 2 and stats["failed"] == 2 and stats["retried"] == 4
+    finally:
+        await queue.close()
+
+
+def test_retries():
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(_check_retries(directory))
+    print("✅ Transient failures are retried; JobError and exhausted attempts fail the job and clean up")
+
+
+async def _enqueue_and_stop(directory: str):
+    """Enqueue 6 jobs, then close the queue while the first 2 are running."""
+    queue = _queue(directory, workers=2)
+    started = asyncio.Event()
+
+    async def stuck(payload, data):
+        started.set()
+        await asyncio.sleep(3600)
+
+    queue.register("upload", stuck)
+    ids = [await queue.enqueue("upload", {"n": n}, f"image {n}".encode()) for n in range(6)]
+    await started.wait()
+    await asyncio.sleep(0.05)
+    assert queue.stats()["running"] == 2
+    await queue.close()
+    return ids
+
+
+async def _resume(directory: str, ids):
+    queue = _queue(directory, workers=2)
+    seen = {}
+
+    async def handler(payload, data):
+        seen[payload["n"]] = data
+        return {"n": payload["n"]}
+
+    queue.register("upload", handler)
+    try:
+        queue.start()
+        await queue.drain()
+        assert all(queue.get(job_id)["status"] == COMPLETED for job_id in ids)
+        assert seen == {n: f"image {n}".encode() for n in range(6)}
+        # The interrupted runs are not counted as attempts
+        assert all(queue.get(job_id)["attempts"] == 1 for job_id in ids)
+        assert queue.stats()["recovered"] == 6
+    finally:
+        await queue.close()
+
+
+def test_restart():
+    with tempfile.TemporaryDirectory() as directory:
+        ids = asyncio.run(_enqueue_and_stop(directory))
+        asyncio.run(_resume(directory, ids))
+    print("✅ Queued and interrupted jobs resume with their uploaded bytes after a restart")
+
+
+async def _check_watch(directory: str):
+    queue = _queue(directory, workers=2)
+    running = 0
+    peak = 0
+
+    async def handler(payload, data):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return {"n": payload["n"]}
+
+    queue.register("upload", handler)
+    try:
+        ids = [await queue.enqueue("upload", {"n": n}) for n in range(8)]
+        statuses = [job["status"] async for job in queue.watch(ids[-1])]
+        assert statuses == ["queued", "running", "completed"]
+        assert [job["status"] async for job in queue.watch(ids[-1])] == ["completed"]
+        assert [job async for job in queue.watch("no-such-job")] == []
+        await queue.drain()
+        assert peak == 2
+    finally:
+        await queue.close()
+
+
+def test_watch():
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(_check_watch(directory))
+    print("✅ watch() pushes queued -> running -> completed; at most 2 of 8 jobs ran at once")
+
+
+# ----------------------------------------------------------------------
+# Burst of uploads through upload_medical_image
+# ----------------------------------------------------------------------
+
+BURST = 200
+INLINE_SAMPLE = 10
+GEMINI_LATENCY = 0.25
+
+
+class _MemoryBucket:
+    """Stand-in for the medical-images Storage bucket."""
+
+    def __init__(self):
+        self.files = {}
+
+    async def upload(self, path, data, content_type, upsert=False):
+        assert upsert or path not in self.files
+        self.files[path] = data
+
+    async def remove(self, paths):
+        for path in paths:
+            self.files.pop(path, None)
+
+    async def get_public_url(self, path):
+        return f"https://storage.example/{path}"
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def _check_burst(medical_images, queue: JobQueue, gemini):
+    from fastapi import HTTPException, UploadFile
+    from starlette.datastructures import Headers
+
+    from app.jobs import get_job, get_job_stats
+    from test_image_dedup import _photo
+    from test_image_preprocessing import _jpeg
+
+    # medical_images registers its handler on the queue current at import time
+    queue.register("medical_image", medical_images.process_medical_image,
+                   on_failure=medical_images.remove_medical_image_file)
+    photos = [_jpeg(_photo(640, 480, seed=n)) for n in range(BURST + INLINE_SAMPLE)]
+
+    async def upload(n: int, background: bool):
+        file = UploadFile(io.BytesIO(photos[n]), filename="rash.jpg", headers=Headers({"content-type": "image/jpeg"}))
+        started = time.perf_counter()
+        response = await medical_images.upload_medical_image(
+            file=file, patient_id=f"patient-{n}", body_part="Forearm", symptoms='["itching"]',
+            patient_description=None, image_type="rash", appointment_id=None,
+            is_follow_up=False, parent_image_id=None, background=background
+        )
+        if background:
+            # Accepted without waiting for the analysis
+            assert queue.get(json.loads(response.body)["job_id"])["status"] != COMPLETED
+        return time.perf_counter() - started, response
+
+    # Inline: the request waits for storage, the model and the insert
+    inline = [await upload(BURST + n, background=False) for n in range(INLINE_SAMPLE)]
+    inline_latencies = [latency for latency, _ in inline]
+    assert all(saved["severity_level"] == "mild" for _, saved in inline)
+
+    # Background: the whole burst arrives at once
+    queue.start()
+    burst_started = time.perf_counter()
+    results = await asyncio.gather(*(upload(n, background=True) for n in range(BURST)))
+    enqueued = time.perf_counter() - burst_started
+    latencies = [latency for latency, _ in results]
+    responses = [response for _, response in results]
+    assert all(response.status_code == 202 for response in responses)
+    job_ids = [json.loads(response.body)["job_id"] for response in responses]
+
+    await queue.drain()
+    finished = time.perf_counter() - burst_started
+    stats = await get_job_stats()
+    jobs = [await get_job(job_id) for job_id in job_ids]
+    assert all(job["status"] == COMPLETED for job in jobs)
+    assert all(job["result"]["ai_analysis"]["severity"] == "mild" for job in jobs)
+    assert len({job["result"]["id"] for job in jobs}) == BURST
+    assert stats["enqueued"] == stats["completed"] == BURST
+    assert stats["failed"] == stats["retried"] == stats["queued"] == stats["running"] == 0
+    # One model call per upload, inline or not
+    assert len(gemini.requests) == BURST + INLINE_SAMPLE
+    assert len(medical_images.images_bucket.files) == BURST + INLINE_SAMPLE
+
+    # A row that cannot be saved fails the job without retries and its file is removed
+    async def no_row(record, image):
+        return None
+
+    medical_images.image_index.insert = no_row
+    _, response = await upload(0, background=True)
+    await queue.drain()
+    job = await get_job(json.loads(response.body)["job_id"])
+    assert job["status"] == FAILED and job["attempts"] == 1
+    assert job["error"] == "Failed to save image record"
+    assert len(medical_images.images_bucket.files) == BURST + INLINE_SAMPLE
+    try:
+        await upload(BURST, background=False)
+        raise AssertionError("inline upload without a saved row succeeded")
+    except HTTPException as e:
+        assert e.status_code == 500 and "Failed to save image record" in e.detail
+    assert len(medical_images.images_bucket.files) == BURST + INLINE_SAMPLE
+
+    print()
+    print(f"{BURST} uploads, {queue.workers} workers, model latency {GEMINI_LATENCY * 1000:.0f} ms")
+    print(f"  inline request latency      p50 {_percentile(inline_latencies, 0.5) * 1000:7.1f} ms"
+          f"  p95 {_percentile(inline_latencies, 0.95) * 1000:7.1f} ms  ({INLINE_SAMPLE} sequential uploads)")
+    print(f"  background request latency  p50 {_percentile(latencies, 0.5) * 1000:7.1f} ms"
+          f"  p95 {_percentile(latencies, 0.95) * 1000:7.1f} ms  (all {BURST} accepted in {enqueued:.2f} s)")
+    print(f"  burst analysed in {finished:.1f} s; queue wait p50 {stats['queue_wait_p50_seconds']} s,"
+          f" p95 {stats['queue_wait_p95_seconds']} s; worker utilization {stats['utilization']:.0%}")
+    return _percentile(inline_latencies, 0.5), _percentile(latencies, 0.95), stats
+
+
+def test_burst():
+    from app import job_queue
+    from fake_gemini import FakeGemini
+
+    postgrest = FakePostgrest()
+    gemini = FakeGemini(
+        latency=GEMINI_LATENCY,
+        reply=lambda model, prompt: json.dumps({"visual_description": "rash", "severity": "mild", "possible_conditions": []})
+    )
+    saved_queue = job_queue._job_queue
+    with tempfile.TemporaryDirectory() as directory, postgrest.serve() as url, gemini.serve() as gemini_url:
+        job_queue._job_queue = queue = _queue(directory, workers=8)
+        try:
+            inline_p50, background_p95, stats = asyncio.run(_run_burst(url, gemini, gemini_url, queue))
+        finally:
+            job_queue._job_queue = saved_queue
+    print(f"✅ {BURST} background uploads accepted before analysis and all completed; answered in "
+          f"{background_p95 * 1000:.0f} ms (p95) instead of {inline_p50 * 1000:.0f} ms, "
+          f"{stats['workers']} workers {stats['utilization']:.0%} busy")
+
+
+async def _run_burst(postgrest_url: str, gemini, gemini_url: str, queue: JobQueue):
+    from test_image_dedup import _fake_services
+
+    # Restores the gateway, environment and medical_images state afterwards
+    async with _fake_services(postgrest_url, gemini_url, _MemoryBucket()) as medical_images:
+        try:
+            return await _check_burst(medical_images, queue, gemini)
+        finally:
+            await queue.close()
+
+
+if __name__ == "__main__":
+    test_retries()
+    test_restart()
+    test_watch()
+    test_burst()
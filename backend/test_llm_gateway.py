@@ -0,0 +1,226 @@
+"""
+Test for the shared Gemini gateway.
+
+Calls real ``genai.GenerativeModel`` objects through the gateway against the
+local Gemini stand-in (fake_gemini.py, REST transport):
+
+- 429 responses are retried with backoff; exhausted retries raise
+- The per-model token bucket spaces requests at the configured rate
+- Identical concurrent prompts make one request; different prompts and
+  failures are not shared wrongly, and a cancelled caller does not cancel
+  the others waiting on its request
+- Metrics (calls, coalesced, retries, tokens, latency) are kept per caller
+- Blocking model calls run on worker threads: the event loop keeps running
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import google.generativeai as genai
+
+from app.llm_gateway import LLMGateway, TokenBucket, parse_rate_limits
+from fake_gemini import FakeGemini
+
+logging.getLogger("app.llm_gateway").setLevel(logging.ERROR)
+
+MODEL = "models/gemini-2.5-flash"
+
+
+def _gateway(url: str, **kwargs) -> LLMGateway:
+    kwargs.setdefault("rate_limits", {})
+    kwargs.setdefault("retry_base", 0.01)
+    gateway = LLMGateway(api_endpoint=url, **kwargs)
+    assert gateway.configure("fake-key")
+    return gateway
+
+
+async def _check_retries(url: str, fake: FakeGemini):
+    gateway = _gateway(url)
+    model = gateway.model(MODEL, caller="summarizer")
+
+    fake.failures.extend([429, 429])
+    response = await model.generate_content_async("retry me")
+    assert response.text == "gemini-2.5-flash: retry me"
+    assert len(fake.requests) == 3
+
+    fake.failures.extend([429] * 10)
+    try:
+        await model.generate_content_async("give up")
+        raise AssertionError("exhausted retries did not raise")
+    except Exception as e:
+        assert getattr(e, "code", None) == 429
+    fake.failures.clear()
+
+    # Client errors are not retried
+    fake.failures.append(400)
+    requests = len(fake.requests)
+    try:
+        await model.generate_content_async("bad request")
+        raise AssertionError("400 did not raise")
+    except Exception as e:
+        assert getattr(e, "code", None) == 400
+    assert len(fake.requests) == requests + 1
+
+    stats = gateway.stats()["callers"]["summarizer"]
+    assert stats["retries"] == 2 + gateway.max_retries and stats["errors"] == 2
+    gateway.close()
+
+
+def test_retries():
+    fake = FakeGemini()
+    with fake.serve() as url:
+        asyncio.run(_check_retries(url, fake))
+    print("✅ 429 responses are retried with jittered backoff; other errors surface at once")
+
+
+async def _check_rate_limit(url: str, fake: FakeGemini):
+    # 600 requests per minute = one every 0.1s after a burst of 2
+    gateway = _gateway(url, rate_limits={"gemini-2.5-flash": 600}, burst=2)
+    model = gateway.model(MODEL, caller="health_tips")
+    started = time.monotonic()
+    await asyncio.gather(*(model.generate_content_async(f"tip {i}") for i in range(8)))
+    arrivals = sorted(at - started for _, _, at in fake.requests)
+    assert arrivals[1] < 0.1
+    # Each request after the burst waits its turn
+    for i in range(2, 8):
+        assert arrivals[i] >= (i - 1) * 0.1 - 0.02, arrivals
+    stats = gateway.stats()
+    assert stats["models"]["gemini-2.5-flash"]["throttled"] == 6
+    assert stats["callers"]["health_tips"]["throttled_seconds"] > 1.5
+
+    # Unlisted models are not limited
+    other = gateway.model("models/gemini-2.0-flash-exp", caller="health_tips")
+    started = time.monotonic()
+    await asyncio.gather(*(other.generate_content_async(f"fast {i}") for i in range(8)))
+    assert time.monotonic() - started < 0.5
+    gateway.close()
+
+
+def test_rate_limit():
+    fake = FakeGemini()
+    with fake.serve() as url:
+        asyncio.run(_check_rate_limit(url, fake))
+    print("✅ Requests beyond the per-model rate wait for a token instead of failing")
+
+
+async def _check_coalescing(url: str, fake: FakeGemini):
+    gateway = _gateway(url, max_retries=0)
+    summarizer = gateway.model(MODEL, caller="summarizer")
+    alerts = gateway.model(MODEL, caller="alert_engine")
+
+    responses = await asyncio.gather(
+        *(summarizer.generate_content_async("same prompt") for _ in range(10)),
+        *(alerts.generate_content_async("same prompt") for _ in range(10)),
+        summarizer.generate_content_async("other prompt"),
+    )
+    assert {r.text for r in responses[:20]} == {"gemini-2.5-flash: same prompt"}
+    assert sorted(prompt for _, prompt, _ in fake.requests) == ["other prompt", "same prompt"]
+
+    # Finished calls are not cached: the next identical prompt is a new request
+    await summarizer.generate_content_async("same prompt")
+    assert len(fake.requests) == 3
+
+    # A failure reaches every caller waiting on it
+    fake.failures.append(400)
+    results = await asyncio.gather(
+        *(summarizer.generate_content_async("failing prompt") for _ in range(5)),
+        return_exceptions=True
+    )
+    assert all(getattr(r, "code", None) == 400 for r in results)
+
+    # Cancelling the caller that made the request does not cancel the others
+    leader = asyncio.create_task(summarizer.generate_content_async("cancelled prompt"))
+    await asyncio.sleep(0.01)
+    followers = [asyncio.create_task(alerts.generate_content_async("cancelled prompt")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    responses = await asyncio.gather(*followers)
+    assert leader.cancelled()
+    assert {r.text for r in responses} == {"gemini-2.5-flash: cancelled prompt"}
+    # One follower made the request again; the other two shared it
+    assert [prompt for _, prompt, _ in fake.requests].count("cancelled prompt") == 2
+
+    stats = gateway.stats()["callers"]
+    assert stats["summarizer"]["calls"] == 18 and stats["alert_engine"]["calls"] == 13
+    assert stats["summarizer"]["coalesced"] + stats["alert_engine"]["coalesced"] == 19 + 4 + 2
+    # Tokens come from usageMetadata (the stand-in counts words)
+    assert stats["summarizer"]["prompt_tokens"] == 2 + 2 + 2
+    assert stats["summarizer"]["output_tokens"] == 3 + 3 + 3
+    assert stats["summarizer"]["latency_p95_ms"] >= 50
+    gateway.close()
+
+
+def test_coalescing_and_metrics():
+    fake = FakeGemini(latency=0.05)
+    with fake.serve() as url:
+        asyncio.run(_check_coalescing(url, fake))
+    print("✅ Identical in-flight prompts share one request, even if its caller is cancelled; "
+          "metrics are kept per caller")
+
+
+class BlockingModel:
+    """Sync-only model: blocks its thread for the call latency."""
+
+    model_name = "models/gemini-2.5-flash"
+
+    def generate_content(self, prompt):
+        time.sleep(0.2)
+
+        class Response:
+            text = prompt
+
+        return Response()
+
+
+async def _check_non_blocking():
+    gateway = LLMGateway(rate_limits={})
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    started = time.monotonic()
+    await asyncio.gather(*(
+        gateway.generate(BlockingModel(), f"utterance {i}", caller="alert_engine") for i in range(8)
+    ))
+    seconds = time.monotonic() - started
+    task.cancel()
+    gateway.close()
+    return seconds, ticks
+
+
+def test_non_blocking():
+    seconds, ticks = asyncio.run(_check_non_blocking())
+    # Eight 0.2s calls overlap on worker threads, and the loop keeps ticking
+    assert seconds < 0.6 and ticks >= 10
+    print(f"✅ Blocking model calls run on worker threads: 8 × 0.2s calls took {seconds:.2f}s")
+
+
+def test_configuration():
+    assert parse_rate_limits("models/gemini-2.5-flash=1000, gemini-2.0-flash-exp=10,") == {
+        "gemini-2.5-flash": 1000.0, "gemini-2.0-flash-exp": 10.0
+    }
+    bucket = TokenBucket(60, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0.9 < bucket.reserve() <= 1.0
+    assert 1.9 < bucket.reserve() <= 2.0
+    assert isinstance(LLMGateway().model(MODEL, "x").model, genai.GenerativeModel)
+    print("✅ Rate limits parse from LLM_RATE_LIMITS; buckets hand out tokens in order")
+
+
+if __name__ == "__main__":
+    test_configuration()
+    test_retries()
+    test_rate_limit()
+    test_coalescing_and_metrics()
+    test_non_blocking()
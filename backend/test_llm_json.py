@@ -0,0 +1,285 @@
+"""
+Test and benchmark for the tolerant LLM JSON parser.
+
+Fuzzes parse_llm_json with malformed renderings of realistic Gemini
+responses (triage result, SOAP note, lab analysis, voice intake): code
+fences, surrounding prose, trailing and missing commas, single and curly
+quotes, Python literals, comments, unquoted keys, invalid escapes,
+double-encoding and truncation at every tenth character. Compares the
+recovery rate with the fence-stripping parser the modules used before and
+reports parse time per response.
+
+Also checks that every response schema converts to a Gemini
+response_schema, and that JSON mode reaches the API (fake_gemini.py).
+"""
+
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from google.generativeai.types import generation_types
+
+from app import models
+from app.llm_gateway import LLMGateway
+from app.llm_json import LLMOutputError, extract_json, json_generation_config, parse_llm_json
+from fake_gemini import FakeGemini
+
+SAMPLES = [
+    (models.TriageResult, {
+        "is_critical": True,
+        "symptom_type": "chest_pain",
+        "severity_score": 5,
+        "analysis": "Crushing chest pain radiating to the left arm with sweating: possible acute coronary syndrome.",
+        "recommendations": "Call 108 immediately",
+        "emergency_keywords": ["chest pain", "left arm", "sweating"],
+    }),
+    (models.SoapNoteResponse, {
+        "subjective": "Patient reports \"seene mein dard\" (chest pain) for 2 days, worse on exertion.\nNo fever.",
+        "objective": "BP 150/95 mmHg, HR 96 bpm, SpO2 97% on room air.",
+        "assessment": "Stable angina, rule out ACS. Hypertension, uncontrolled.",
+        "plan": "ECG, troponin I. Aspirin 75 mg OD, atorvastatin 40 mg HS. Review in 1 week.",
+    }),
+    (models.LabReportAnalysis, {
+        "values": [
+            {"name": "Haemoglobin", "value": "8.2", "unit": "g/dL", "status": "low", "normal_range": "12-15"},
+            {"name": "TSH", "value": "2.1", "unit": "mIU/L", "status": "normal", "normal_range": "0.4-4.0"},
+        ],
+        "abnormal_values": [{
+            "name": "Haemoglobin", "value": "8.2", "unit": "g/dL", "normal_range": "12-15", "status": "low",
+            "explanation": "Your blood has fewer red cells than usual, which can make you tired.",
+            "recommendation": "Please see your doctor about iron supplements.",
+        }],
+        "summary": "Mostly normal; haemoglobin is low.",
+        "urgent_attention": False,
+        "urgent_message": None,
+    }),
+    (models.VoiceIntakeExtraction, {
+        "full_name": "Sunita Devi",
+        "age": 52,
+        "gender": "female",
+        "chief_complaint": "Burning while passing urine",
+        "symptom_duration": "3 days",
+        "medical_history": ["Type 2 diabetes"],
+        "current_medications": ["Metformin 500 mg"],
+        "allergies": [],
+        "previous_surgeries": [],
+        "family_history": None,
+        "lifestyle": {"smoking": "no", "alcohol": "no", "exercise": "walks daily"},
+        "additional_notes": None,
+        "original_language": "Hindi",
+        "original_transcript": "पेशाब में जलन तीन दिन से",
+        "english_transcript": "Burning urination for three days",
+    }),
+]
+
+
+def _python_literal(value) -> str:
+    """Python repr with single quotes, True/False/None (as some models answer)."""
+    return repr(value)
+
+
+def _mutations(value):
+    """(kind, malformed text) renderings of one response that should all parse back to ``value``."""
+    pretty = json.dumps(value, indent=2, ensure_ascii=False)
+    compact = json.dumps(value, ensure_ascii=False)
+    yield "clean", compact
+    yield "fenced", f"```json\n{pretty}\n```"
+    yield "bare fence", f"```\n{pretty}\n```"
+    yield "prose", f"Here is the analysis you asked for:\n\n{pretty}\n\nLet me know if you need anything else."
+    yield "prose + fence", f"Sure!\n```json\n{pretty}\n```\nNote: this is not a diagnosis."
+    yield "trailing commas", re.sub(r"(\n\s*[}\]])", r",\1", pretty)
+    yield "missing commas", re.sub(r'(["\]}el0-9]),\n', r"\1\n", pretty)
+    yield "python literals", _python_literal(value)
+    yield "comments", pretty.replace("{\n", "{\n  // generated by the model\n", 1)
+    yield "curly quotes", re.sub(r'"(\w+)":', r"“\1”:", pretty)
+    yield "unquoted keys", re.sub(r'"(\w+)":', r"\1:", pretty)
+    yield "double-encoded", json.dumps(compact)
+    yield "one-element array", f"[{compact}]"
+
+
+def _truncations(value):
+    pretty = json.dumps(value, indent=2, ensure_ascii=False)
+    for end in range(pretty.index("{") + 2, len(pretty) - 1, 10):
+        yield pretty[:end]
+
+
+def _old_parse(response_text: str):
+    """The fence stripping the modules used before."""
+    text = response_text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return json.loads(text.strip())
+
+
+def _time(function, text, repeat=200):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(text)
+    return (time.perf_counter() - started) / repeat
+
+
+def test_hand_written_cases():
+    cases = [
+        ('{"a": "x" "b": "y"}', {"a": "x", "b": "y"}),
+        ('{"path": "C:\\d\\x"}', {"path": "C:\\d\\x"}),
+        ('{"note": "line1\nline2"}', {"note": "line1\nline2"}),
+        ('{"a": NaN, "b": .5, "c": +3}', {"a": None, "b": 0.5, "c": 3}),
+        ('{"a": [1, 2}', {"a": [1, 2]}),
+        ('{"a": "it\'s"}', {"a": "it's"}),
+        ("{'a': 'it\\'s', 'b': True}", {"a": "it's", "b": True}),
+        ('```\n{"a": 1}\n```\n```\n{"b": 2}\n```', {"a": 1}),
+        ('{"a": "unterminated', {"a": "unterminated"}),
+        ('{"a": 1, "b": ', {"a": 1}),
+        ('{"a": 1, "b"', {"a": 1}),
+        ('{"a": }', {"a": None}),
+        ('{"a": {"b": [1, {"c": "d",', {"a": {"b": [1, {"c": "d"}]}}),
+        ('{"a": "ends in escape\\', {"a": "ends in escape"}),
+        ('{"a": 1,, "b": 2}', {"a": 1, "b": 2}),
+        ('{"a": [tr', {"a": [True]}),
+    ]
+    for text, expected in cases:
+        assert extract_json(text) == expected, (text, extract_json(text))
+    for text in ("", "I cannot help with that.", "```\n```"):
+        try:
+            parse_llm_json(text)
+            raise AssertionError(f"{text!r} parsed")
+        except LLMOutputError:
+            pass
+    # Validation: defaults for missing or null optional fields, errors for wrong types
+    triage = parse_llm_json('{"is_critical": true, "severity_score": "4", "symptom_type": null}', models.TriageResult)
+    assert triage["severity_score"] == 4 and triage["symptom_type"] == "other"
+    try:
+        parse_llm_json('{"severity_score": "very high"}', models.TriageResult)
+        raise AssertionError("invalid severity accepted")
+    except LLMOutputError as e:
+        assert isinstance(e, ValueError)
+    # Triage replies cut off before the verdict are unusable, not defaulted
+    for text in ('{"symptom_type": "chest_pain", "severity_score": 5, "is_crit', '{"', "{}"):
+        try:
+            parse_llm_json(text, models.TriageResult)
+            raise AssertionError(f"{text!r} parsed as a triage")
+        except LLMOutputError:
+            pass
+    # Without repair only well-formed JSON is accepted (fences and prose are fine)
+    assert parse_llm_json('Here:\n```json\n{"a": 1}\n```', allow_repair=False) == {"a": 1}
+    try:
+        parse_llm_json('{"a": 1,}', allow_repair=False)
+        raise AssertionError("trailing comma accepted without repair")
+    except LLMOutputError:
+        pass
+    print("✅ Hand-written malformed responses parse; unusable ones raise LLMOutputError")
+
+
+def test_fuzz_corpus():
+    kinds = {}
+    for schema, value in SAMPLES:
+        expected = schema.model_validate(value).model_dump()
+        for kind, text in _mutations(value):
+            old_ok = new_ok = False
+            try:
+                old_ok = _old_parse(text) == value
+            except ValueError:
+                pass
+            parsed = parse_llm_json(text, schema)
+            new_ok = parsed == expected
+            assert new_ok, (kind, schema.__name__, parsed)
+            timing = kinds.setdefault(kind, [0, 0, 0, []])
+            timing[0] += 1
+            timing[1] += old_ok
+            timing[2] += new_ok
+            timing[3].append(_time(lambda t: parse_llm_json(t, schema), text, repeat=50))
+
+        # Truncated responses: never anything but LLMOutputError, and only keys that were there
+        for text in _truncations(value):
+            timing = kinds.setdefault("truncated", [0, 0, 0, []])
+            timing[0] += 1
+            try:
+                timing[1] += _old_parse(text) == value
+            except ValueError:
+                pass
+            try:
+                recovered = extract_json(text)
+            except LLMOutputError:
+                continue
+            assert isinstance(recovered, dict) and set(recovered) <= set(value), text
+            try:
+                parse_llm_json(text, schema)
+                timing[2] += 1
+            except LLMOutputError:
+                pass
+            timing[3].append(_time(extract_json, text, repeat=20))
+
+    print()
+    print(f"{'malformation':<20} {'cases':>5} {'old parser':>10} {'new parser':>10} {'parse time':>11}")
+    for kind, (cases, old, new, seconds) in kinds.items():
+        print(f"{kind:<20} {cases:>5} {old:>10} {new:>10} {statistics.median(seconds) * 1e6:>8.0f} µs")
+    total = sum(cases for cases, _, _, _ in kinds.values())
+    truncated = kinds["truncated"]
+    print(f"(truncated: {truncated[2]} of {truncated[0]} recovered as schema-valid partial objects; "
+          f"the rest lack a required field)")
+    assert kinds["clean"][1] == kinds["clean"][0]
+    assert truncated[2] > truncated[0] * 0.8
+    assert total > 100
+    print("✅ Every malformed rendering parses back to the original; truncations degrade gracefully")
+
+
+def test_parse_time():
+    _, value = SAMPLES[2]
+    clean = json.dumps(value)
+    fenced = f"Sure!\n```json\n{json.dumps(value, indent=2)}\n```"
+    broken = re.sub(r"(\n\s*[}\]])", r",\1", json.dumps(value, indent=2)).replace('"', "'")
+    rows = [
+        ("old parser, clean", _time(_old_parse, clean, 2000)),
+        ("clean (JSON mode)", _time(parse_llm_json, clean, 2000)),
+        ("fences and prose", _time(parse_llm_json, fenced, 2000)),
+        ("needs repair", _time(parse_llm_json, broken, 500)),
+        ("validated", _time(lambda t: parse_llm_json(t, models.LabReportAnalysis), clean, 2000)),
+    ]
+    print()
+    print(f"{len(clean)}-byte lab analysis:")
+    for name, seconds in rows:
+        print(f"   {name:<20} {seconds * 1e6:>7.1f} µs")
+    # The fast path costs no more than json.loads plus a little
+    assert rows[1][1] < rows[0][1] * 3 + 20e-6
+    assert rows[3][1] < 0.005
+    print("✅ Parse time stays in microseconds; repair is only paid for broken output")
+
+
+def test_response_schemas():
+    for schema in (models.TriageResult, models.SoapNoteResponse, models.LabReportAnalysis,
+                   models.ImageAnalysis, models.ImageComparison, models.VoiceIntakeExtraction):
+        config = generation_types.to_generation_config_dict(json_generation_config(schema))
+        assert config["response_mime_type"] == "application/json"
+        assert config["response_schema"].properties
+
+    fake = FakeGemini(reply=lambda model, prompt: json.dumps(SAMPLES[0][1]))
+    with fake.serve() as url:
+        gateway = LLMGateway(api_endpoint=url, rate_limits={})
+        gateway.configure("fake-key")
+        model = gateway.model("models/gemini-2.5-flash", caller="alert_engine",
+                              generation_config=json_generation_config(models.TriageResult))
+        response = asyncio.run(model.generate_content_async("chest pain"))
+        gateway.close()
+    assert parse_llm_json(response.text, models.TriageResult)["severity_score"] == 5
+    config = fake.generation_configs[-1]
+    assert config["responseMimeType"] == "application/json"
+    assert "severity_score" in config["responseSchema"]["properties"]
+    print("✅ Response schemas convert to Gemini's format and JSON mode reaches the API")
+
+
+if __name__ == "__main__":
+    test_hand_written_cases()
+    test_fuzz_corpus()
+    test_parse_time()
+    test_response_schemas()
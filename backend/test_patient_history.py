@@ -0,0 +1,263 @@
+"""
+Test and benchmark for patient history listings and exports.
+
+Runs against the local PostgREST stand-in (fake_postgrest.py):
+
+- Keyset (cursor) pages cover every row exactly once, in order, including
+  rows that share a timestamp or a date/time; the offset listing hands out a
+  cursor that continues where it stopped; the images endpoint returns
+  next_cursor in the body
+- Listings leave ai_analysis / extracted_text out unless requested
+- NDJSON exports stream every row with all columns
+- 10,000 images and lab reports per patient: payload size and latency of a
+  listing page (full vs slim) and of reading the whole history
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+
+from app.appointments import get_patient_appointments
+from app.data_access import SupabaseDataAccess
+from app.streaming import ndjson_lines
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+RECORDS = 10_000
+PAGE_SIZE = 50
+PATIENT_ID = "patient-1"
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.appointments").setLevel(logging.WARNING)
+
+
+def _analysis(i: int) -> dict:
+    """An ai_analysis blob about the size the image analyzer stores."""
+    return {
+        "visual_description": f"Image {i}: " + "erythematous patch with well-defined margins, " * 12,
+        "possible_conditions": [
+            {"name": name, "likelihood": "medium", "reasoning": "Consistent with the visual pattern. " * 6}
+            for name in ("contact dermatitis", "eczema", "psoriasis")
+        ],
+        "severity": "moderate",
+        "severity_reasoning": "Localized, no signs of systemic involvement. " * 4,
+        "red_flags": ["spreading redness", "fever", "pus"],
+        "requires_immediate_attention": False,
+        "recommendations": {
+            "see_doctor_immediately": False,
+            "urgency_level": "routine",
+            "home_care": ["Keep the area clean and dry"] * 4,
+            "monitoring": ["Photograph daily in the same light"] * 3,
+        },
+        "disclaimer": "This is not a diagnosis. " * 5,
+    }
+
+
+def _seed(fake: FakePostgrest, records: int):
+    start = datetime(2024, 1, 1, 8, 0, 0)
+    fake.tables["medical_images"] = [
+        {
+            "id": f"img-{i:05d}",
+            "patient_id": PATIENT_ID,
+            "appointment_id": None,
+            "image_url": f"https://storage.example/medical-images/{PATIENT_ID}/{i}.jpg",
+            "storage_path": f"{PATIENT_ID}/{i}.jpg",
+            "image_type": "rash",
+            "body_part": "arm",
+            "patient_description": "Itchy rash on forearm",
+            "symptoms": ["itching", "redness"],
+            "ai_analysis": _analysis(i),
+            "severity_level": "moderate",
+            "detected_conditions": ["contact dermatitis"],
+            "recommendations": ["Keep the area clean and dry"],
+            "requires_immediate_attention": False,
+            # Pairs of images share an upload time to exercise the id tie-breaker
+            "uploaded_at": (start + timedelta(minutes=i // 2)).isoformat() + "+00:00",
+            "analyzed_at": None,
+            "is_follow_up": False,
+            "parent_image_id": None,
+            "days_since_previous": None,
+            "doctor_notes": None,
+            "doctor_reviewed_at": None,
+            "metadata": {},
+        }
+        for i in range(records)
+    ]
+    fake.tables["lab_reports"] = [
+        {
+            "id": f"lab-{i:05d}",
+            "patient_id": PATIENT_ID,
+            "file_name": f"report-{i}.pdf",
+            "file_path": f"uploads/lab_reports/{i}.pdf",
+            "file_type": "pdf",
+            "extracted_text": f"Report {i}\n" + "Hemoglobin 13.5 g/dL (13.0-17.0)\n" * 120,
+            "analysis_result": {"summary": "Values within reference ranges. " * 20, "flags": []},
+            "status": "completed",
+            "uploaded_at": (start + timedelta(hours=i)).isoformat() + "+00:00",
+            "created_at": (start + timedelta(hours=i)).isoformat() + "+00:00",
+            "updated_at": (start + timedelta(hours=i)).isoformat() + "+00:00",
+        }
+        for i in range(records)
+    ]
+    fake.tables["appointments"] = [
+        {
+            "id": f"apt-{i:04d}",
+            "patient_id": PATIENT_ID,
+            "doctor_id": "doc-1",
+            "symptom_category": None,
+            "severity": None,
+            # Several appointments per date/time to exercise the id tie-breaker
+            "date": f"2026-{1 + i // 40 % 12:02d}-{1 + i // 4 % 10:02d}",
+            "time": f"{9 + i % 2:02d}:00",
+            "status": "scheduled",
+            "consultation_fee": 500.0,
+            "created_at": "2026-01-01T09:00:00",
+            "updated_at": "2026-01-01T09:00:00",
+        }
+        for i in range(200)
+    ]
+    fake.tables["doctors"] = [{"id": "doc-1", "full_name": "Dr. One", "specialty": "Dermatology"}]
+
+
+async def _walk(repository, **kwargs):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = await repository.page_for_patient(PATIENT_ID, cursor, PAGE_SIZE, **kwargs)
+        rows.extend(page)
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+async def _check_pagination(fake: FakePostgrest, dal: SupabaseDataAccess):
+    images, pages = await _walk(dal.medical_images)
+    expected = sorted(fake.tables["medical_images"], key=lambda r: (r["uploaded_at"], r["id"]), reverse=True)
+    assert [r["id"] for r in images] == [r["id"] for r in expected]
+    assert pages == -(-len(expected) // PAGE_SIZE)
+    assert "ai_analysis" not in images[0] and "storage_path" not in images[0]
+
+    page, _ = await dal.medical_images.page_for_patient(PATIENT_ID, include=["ai_analysis"])
+    assert page[0]["ai_analysis"] == expected[0]["ai_analysis"]
+    reports, _ = await dal.lab_reports.page_for_patient(PATIENT_ID, limit=5)
+    assert "extracted_text" not in reports[0] and "analysis_result" not in reports[0]
+    for bad in ({"include": ["storage_path"]}, {"cursor": "not-a-cursor"}):
+        try:
+            await dal.medical_images.page_for_patient(PATIENT_ID, **bad)
+            raise AssertionError(f"{bad} accepted")
+        except ValueError:
+            pass
+
+    # Offset page 1 hands over to cursor pages without gaps or repeats
+    first = await get_patient_appointments(PATIENT_ID, None, 1, 30, None, db=dal)
+    assert first.total == 200 and first.next_cursor
+    ids = [a.id for a in first.appointments]
+    cursor = first.next_cursor
+    while cursor:
+        page = await get_patient_appointments(PATIENT_ID, None, 1, 30, cursor, db=dal)
+        assert page.total is None
+        ids.extend(a.id for a in page.appointments)
+        cursor = page.next_cursor
+    expected = sorted(fake.tables["appointments"], key=lambda r: (r["date"], r["time"], r["id"]))
+    assert ids == [r["id"] for r in expected]
+
+    try:
+        await get_patient_appointments(PATIENT_ID, None, 1, 30, "bad", db=dal)
+        raise AssertionError("invalid cursor accepted")
+    except HTTPException as e:
+        assert e.status_code == 400
+
+    exported = b"".join([chunk async for chunk in ndjson_lines(dal.lab_reports.iter_for_patient(PATIENT_ID))])
+    lines = exported.decode().splitlines()
+    assert len(lines) == len(fake.tables["lab_reports"])
+    assert json.loads(lines[0])["extracted_text"]
+
+
+async def _check_image_endpoint(url: str, fake: FakePostgrest):
+    """The images endpoint returns next_cursor in the body, like lab reports."""
+    from test_image_dedup import _fake_services
+
+    listed, cursor = [], None
+    # No model calls are made, so the Gemini endpoint is never reached
+    async with _fake_services(url, "http://127.0.0.1:9", None) as medical_images:
+        while True:
+            body = await medical_images.get_patient_images(PATIENT_ID, PAGE_SIZE, cursor, None)
+            listed.extend(image["id"] for image in body["images"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+    expected = sorted(fake.tables["medical_images"], key=lambda r: (r["uploaded_at"], r["id"]), reverse=True)
+    assert listed == [r["id"] for r in expected]
+
+
+def _size(rows) -> int:
+    return len(json.dumps(rows, default=str).encode())
+
+
+async def _benchmark(fake: FakePostgrest, dal: SupabaseDataAccess):
+    print()
+    print(f"Patient history: {RECORDS} images and {RECORDS} lab reports, page size {PAGE_SIZE}")
+    print(f"{'table':<15} {'request':<30} {'requests':>9} {'payload':>10} {'seconds':>8}")
+
+    for table, repository in (("medical_images", dal.medical_images), ("lab_reports", dal.lab_reports)):
+        def report(label, requests, payload, seconds):
+            print(f"{table:<15} {label:<30} {requests:>9} {payload / 1024:>8.0f}KB {seconds:>8.2f}")
+
+        # One listing page: the previous select('*') vs the slim projection
+        fake.reset_counts()
+        start = time.perf_counter()
+        result = await dal.execute(
+            repository.query().select("*").eq("patient_id", PATIENT_ID).order("uploaded_at", desc=True).limit(PAGE_SIZE)
+        )
+        report("page, select *", fake.request_count, _size(result.data), time.perf_counter() - start)
+
+        fake.reset_counts()
+        start = time.perf_counter()
+        page, _ = await repository.page_for_patient(PATIENT_ID, limit=PAGE_SIZE)
+        report("page, slim", fake.request_count, _size(page), time.perf_counter() - start)
+
+        # Whole history: slim cursor pages vs the NDJSON export
+        fake.reset_counts()
+        start = time.perf_counter()
+        rows, _ = await _walk(repository)
+        report(f"all {len(rows)}, slim pages", fake.request_count, _size(rows), time.perf_counter() - start)
+
+        fake.reset_counts()
+        start = time.perf_counter()
+        exported = 0
+        first_chunk = None
+        async for chunk in ndjson_lines(repository.iter_for_patient(PATIENT_ID)):
+            exported += len(chunk)
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+        report(f"all, NDJSON export", fake.request_count, exported, time.perf_counter() - start)
+        print(f"{'':<15} {'  first export chunk after':<30} {'':>9} {'':>10} {first_chunk:>8.2f}")
+
+
+async def _run(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        await _check_pagination(fake, dal)
+        await _check_image_endpoint(url, fake)
+        print("✅ Cursor pages, offset-to-cursor handover, slim projections and NDJSON export OK")
+        await _benchmark(fake, dal)
+    finally:
+        await dal.aclose()
+
+
+def test_patient_history():
+    fake = FakePostgrest()
+    _seed(fake, RECORDS)
+    with fake.serve() as url:
+        asyncio.run(_run(url, fake))
+
+
+if __name__ == "__main__":
+    test_patient_history()
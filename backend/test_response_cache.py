@@ -0,0 +1,202 @@
+"""
+Test and polling benchmark for the response cache middleware.
+
+Serves the real appointment routes (and the emotion summary used by
+/api/emotions/stats) through ResponseCacheMiddleware, with the data access
+layer pointed at the local PostgREST stand-in (fake_postgrest.py):
+
+- Repeated GETs are served from the cache; If-None-Match gets a 304
+- A write through the API (PATCH appointment, emotion log) is visible on the
+  very next poll, with a new ETag
+- Simulated dashboard polling with occasional writes: Supabase requests with
+  and without the cache
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI
+
+from app.appointments import get_supabase, router as appointments_router
+from app.data_access import SupabaseDataAccess
+from app.database import DatabaseClient
+from app.response_cache import CachedRoute, ResponseCache, ResponseCacheMiddleware
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+DASHBOARDS = 20
+POLLS = 30
+WRITE_PROBABILITY = 0.05  # per dashboard per poll round
+DAY = date.today() + timedelta(days=10)
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.appointments").setLevel(logging.WARNING)
+
+
+def _seed(fake: FakePostgrest):
+    fake.tables["doctors"] = [{"id": "doc-1", "full_name": "Dr. One", "specialty": "ENT", "avatar_url": None}]
+    fake.tables["appointments"] = [
+        {
+            "id": f"apt-{i}",
+            "patient_id": f"patient-{i}",
+            "doctor_id": "doc-1",
+            "symptom_category": None,
+            "severity": None,
+            "date": DAY.isoformat(),
+            "time": f"{9 + i % 8:02d}:00",
+            "status": "scheduled",
+            "consultation_fee": 500.0,
+            "created_at": "2026-01-01T09:00:00",
+            "updated_at": "2026-01-01T09:00:00",
+        }
+        for i in range(DASHBOARDS)
+    ]
+    fake.tables["emotion_stats"] = [
+        {"user_id": f"patient-{i}", "emotion_type": "calm", "detection_count": 3, "avg_confidence": 0.8}
+        for i in range(DASHBOARDS)
+    ]
+    fake.tables["emotion_logs"] = []
+
+
+def _build_app(dal: SupabaseDataAccess, cached: bool) -> FastAPI:
+    app = FastAPI()
+    app.include_router(appointments_router)
+    app.dependency_overrides[get_supabase] = lambda: dal
+    db_client = DatabaseClient(dal)
+
+    # Same handlers as the emotion endpoints in main.py
+    @app.get("/api/emotions/stats/{user_id}")
+    async def get_emotion_stats(user_id: str):
+        return await db_client.get_emotion_summary(user_id)
+
+    @app.post("/api/emotions/log")
+    async def log_emotion(user_id: str, emotion_type: str, confidence_score: float):
+        return await db_client.log_emotion(user_id, emotion_type, confidence_score)
+
+    if cached:
+        cache = ResponseCache([
+            CachedRoute("/api/appointments/{appointment_id}", ttl=60, table="appointments"),
+            CachedRoute("/api/emotions/stats/{user_id}", ttl=30, table="emotion_logs", column="user_id"),
+        ])
+        app.add_middleware(ResponseCacheMiddleware, cache=cache)
+        dal.add_write_listener(cache.on_write)
+        app.state.response_cache = cache
+    return app
+
+
+async def _check_semantics(url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    app = _build_app(dal, cached=True)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = await client.get("/api/appointments/apt-1")
+            assert first.status_code == 200 and first.headers["x-cache"] == "MISS"
+            etag = first.headers["etag"]
+
+            second = await client.get("/api/appointments/apt-1")
+            assert second.headers["x-cache"] == "HIT" and second.content == first.content
+
+            revalidated = await client.get("/api/appointments/apt-1", headers={"If-None-Match": etag})
+            assert revalidated.status_code == 304 and revalidated.content == b""
+            assert revalidated.headers["etag"] == etag
+
+            patched = await client.patch("/api/appointments/apt-1", json={"status": "completed"})
+            assert patched.status_code == 200
+            after = await client.get("/api/appointments/apt-1", headers={"If-None-Match": etag})
+            assert after.status_code == 200, "stale 304 after a write"
+            assert after.json()["status"] == "completed" and after.headers["etag"] != etag
+
+            stats = await client.get("/api/emotions/stats/patient-2")
+            assert stats.json()["last_emotion"] is None
+            await client.post("/api/emotions/log", params={
+                "user_id": "patient-2", "emotion_type": "anxious", "confidence_score": 0.9
+            })
+            stats = await client.get("/api/emotions/stats/patient-2")
+            assert stats.json()["last_emotion"]["emotion_type"] == "anxious"
+
+            missing = await client.get("/api/appointments/does-not-exist")
+            assert missing.status_code == 404 and "etag" not in missing.headers
+    finally:
+        await dal.aclose()
+
+
+def test_cache_semantics():
+    fake = FakePostgrest()
+    _seed(fake)
+    with fake.serve() as url:
+        asyncio.run(_check_semantics(url))
+    print("✅ Cache hits, 304 on If-None-Match, and invalidation on writes OK")
+
+
+async def _poll(url: str, fake: FakePostgrest, cached: bool):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    app = _build_app(dal, cached)
+    rng = random.Random(33)
+    stale = 0
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            etags = {}
+            expected_status = {f"apt-{i}": "scheduled" for i in range(DASHBOARDS)}
+            statuses = {"200": 0, "304": 0}
+            fake.reset_counts()
+
+            async def dashboard(i: int):
+                nonlocal stale
+                if rng.random() < WRITE_PROBABILITY:
+                    status = rng.choice(["scheduled", "in-progress", "completed"])
+                    expected_status[f"apt-{i}"] = status
+                    await client.patch(f"/api/appointments/apt-{i}", json={"status": status})
+                if rng.random() < WRITE_PROBABILITY:
+                    await client.post("/api/emotions/log", params={
+                        "user_id": f"patient-{i}", "emotion_type": "calm", "confidence_score": 0.7
+                    })
+                for path in (f"/api/appointments/apt-{i}", f"/api/emotions/stats/patient-{i}"):
+                    headers = {"If-None-Match": etags[path]} if path in etags else {}
+                    response = await client.get(path, headers=headers)
+                    statuses[str(response.status_code)] += 1
+                    if response.status_code == 200:
+                        if "etag" in response.headers:
+                            etags[path] = response.headers["etag"]
+                        if path.startswith("/api/appointments/") and response.json()["status"] != expected_status[f"apt-{i}"]:
+                            stale += 1
+
+            for _ in range(POLLS):
+                await asyncio.gather(*(dashboard(i) for i in range(DASHBOARDS)))
+
+            reads = sum(1 for method, table in fake.requests if method == "GET")
+            return reads, fake.request_count, statuses, stale
+    finally:
+        await dal.aclose()
+
+
+def test_polling_load():
+    print()
+    print(f"Dashboard polling: {DASHBOARDS} dashboards x {POLLS} rounds x 2 endpoints, "
+          f"{WRITE_PROBABILITY:.0%} write chance per dashboard per round")
+    print(f"{'mode':<10} {'GETs':>6} {'304s':>6} {'DB reads':>9} {'DB total':>9} {'stale':>6}")
+    results = {}
+    for cached in (False, True):
+        fake = FakePostgrest()
+        _seed(fake)
+        with fake.serve() as url:
+            reads, total, statuses, stale = asyncio.run(_poll(url, fake, cached))
+        mode = "cached" if cached else "uncached"
+        results[mode] = reads
+        print(f"{mode:<10} {statuses['200'] + statuses['304']:>6} {statuses['304']:>6} {reads:>9} {total:>9} {stale:>6}")
+        assert stale == 0
+
+    saved = 1 - results["cached"] / results["uncached"]
+    print(f"DB reads saved: {saved:.0%}")
+    assert saved > 0.5
+
+
+if __name__ == "__main__":
+    test_cache_semantics()
+    test_polling_load()
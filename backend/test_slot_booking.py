@@ -0,0 +1,182 @@
+"""
+Test and contention benchmark for the atomic slot booking engine.
+
+Runs the appointment routes against the local PostgREST stand-in
+(fake_postgrest.py), which mirrors the appointment_slots primary key and the
+book_appointment_slot() function from migration 004.
+
+- Booking, double booking (409), cancel + rebook, reschedule into a taken or
+  unpublished slot, reschedule whose update fails
+- Bulk availability over a date range costs two requests
+- 100 concurrent bookers for one slot: exactly one wins
+- Same race against the previous check-then-insert flow, for comparison
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+
+from app.appointment_models import AppointmentCreate, AppointmentUpdate
+from app.appointments import cancel_appointment, create_appointment, get_doctor_slots, update_appointment
+from app.data_access import SupabaseDataAccess
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+
+BOOKERS = 100
+DOCTOR_ID = "doc-1"
+DAY = date.today() + timedelta(days=30)
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 17) for m in (0, 30)]
+SIMULATED_LATENCY = 0.005
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("app.appointments").setLevel(logging.WARNING)
+
+
+def _seed(fake: FakePostgrest, days: int = 7):
+    fake.tables["doctors"] = [{"id": DOCTOR_ID, "full_name": "Dr. One", "specialty": "ENT"}]
+    fake.tables["doctor_availability"] = [
+        {
+            "id": f"avail-{i}",
+            "doctor_id": DOCTOR_ID,
+            "date": (DAY + timedelta(days=i)).isoformat(),
+            "time_slots": [{"time": t, "is_available": t != "13:00"} for t in SLOTS],
+        }
+        for i in range(days)
+    ]
+
+
+def _request(slot: str, day: date = DAY) -> AppointmentCreate:
+    return AppointmentCreate(
+        patient_id=str(uuid.uuid4()),
+        doctor_id=DOCTOR_ID,
+        date=day,
+        time=slot,
+        consultation_fee=500.0,
+    )
+
+
+async def _status_of(coro) -> int:
+    try:
+        await coro
+        return 200
+    except HTTPException as e:
+        return e.status_code
+
+
+async def _check_booking(fake: FakePostgrest, url: str):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        first = await create_appointment(_request("10:00"), db=dal)
+        assert first.time == "10:00" and first.doctor_name == "Dr. One"
+        assert await _status_of(create_appointment(_request("10:00"), db=dal)) == 409
+        assert await _status_of(create_appointment(_request("13:00"), db=dal)) == 409  # not offered
+
+        await cancel_appointment(first.id, db=dal)
+        rebooked = await create_appointment(_request("10:00"), db=dal)
+
+        other = await create_appointment(_request("11:00"), db=dal)
+        move = AppointmentUpdate(time="10:00")
+        assert await _status_of(update_appointment(other.id, move, db=dal)) == 409
+        assert await _status_of(update_appointment(other.id, AppointmentUpdate(time="13:00"), db=dal)) == 409
+        await update_appointment(other.id, AppointmentUpdate(time="11:30"), db=dal)
+
+        # A failed appointment update undoes the new claim and keeps the old slot
+        update = dal.appointments.update
+
+        async def failing_update(*args, **kwargs):
+            raise RuntimeError("connection reset")
+
+        dal.appointments.update = failing_update
+        try:
+            assert await _status_of(update_appointment(other.id, AppointmentUpdate(time="12:00"), db=dal)) == 500
+        finally:
+            dal.appointments.update = update
+        claimed = {row["time"] for row in fake.tables["appointment_slots"] if row["date"] == DAY.isoformat()}
+        assert "11:30" in claimed and "12:00" not in claimed
+
+        fake.reset_counts()
+        slots = await get_doctor_slots(DOCTOR_ID, DAY, DAY + timedelta(days=6), db=dal)
+        assert fake.request_count == 2, fake.requests
+        assert len(slots.days) == 7
+        first_day = slots.days[0].available
+        assert "10:00" not in first_day and "11:30" not in first_day and "13:00" not in first_day
+        assert "11:00" in first_day, "rescheduled appointment did not free its old slot"
+        assert len(slots.days[1].available) == len(SLOTS) - 1
+        assert rebooked.id
+    finally:
+        await dal.aclose()
+
+
+def test_booking_flow():
+    fake = FakePostgrest()
+    _seed(fake)
+    with fake.serve() as url:
+        asyncio.run(_check_booking(fake, url))
+    print("✅ Booking, 409 on conflict, cancel/rebook, reschedule and range availability OK")
+
+
+async def _legacy_book(dal: SupabaseDataAccess, slot: str) -> int:
+    """Previous flow: read the day's appointments, compare times, then insert."""
+    existing = await dal.execute(
+        dal.appointments.query().select("id, time").eq("doctor_id", DOCTOR_ID).eq("date", DAY.isoformat())
+    )
+    if any(row["time"] == slot for row in existing.data):
+        return 409
+    await dal.appointments.insert({"doctor_id": DOCTOR_ID, "date": DAY.isoformat(), "time": slot})
+    return 200
+
+
+async def _contention(url: str, mode: str, slots):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY, max_concurrency=BOOKERS)
+    try:
+        if mode == "legacy":
+            bookers = [_legacy_book(dal, slots[i % len(slots)]) for i in range(BOOKERS)]
+        else:
+            bookers = [
+                _status_of(create_appointment(_request(slots[i % len(slots)]), db=dal))
+                for i in range(BOOKERS)
+            ]
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*bookers)
+        return statuses, time.perf_counter() - start
+    finally:
+        await dal.aclose()
+
+
+def test_contention():
+    """100 concurrent bookers: one winner per slot, everyone else gets 409."""
+    print()
+    print(f"Contention: {BOOKERS} concurrent bookers, {SIMULATED_LATENCY * 1000:.0f} ms simulated latency")
+    print(f"{'mode':<8} {'slots':>5} {'booked':>7} {'409':>5} {'double-booked':>14} {'seconds':>8}")
+
+    for mode in ["legacy", "atomic"]:
+        for slots in (SLOTS[:1], SLOTS[:8]):
+            fake = FakePostgrest(latency=SIMULATED_LATENCY)
+            _seed(fake, days=1)
+            with fake.serve() as url:
+                statuses, elapsed = asyncio.run(_contention(url, mode, slots))
+
+            per_slot = {}
+            for row in fake.tables.get("appointments", []):
+                per_slot[row["time"]] = per_slot.get(row["time"], 0) + 1
+            double_booked = sum(1 for n in per_slot.values() if n > 1)
+            print(f"{mode:<8} {len(slots):>5} {statuses.count(200):>7} {statuses.count(409):>5} "
+                  f"{double_booked:>14} {elapsed:>8.2f}")
+
+            if mode == "atomic":
+                assert statuses.count(200) == len(slots)
+                assert statuses.count(409) == BOOKERS - len(slots)
+                assert double_booked == 0
+
+
+if __name__ == "__main__":
+    test_booking_flow()
+    test_contention()
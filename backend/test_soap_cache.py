@@ -0,0 +1,204 @@
+"""
+Test for the content-addressed SOAP note cache.
+
+Calls the generate_soap endpoint (appointments router) against the local
+PostgREST stand-in (fake_postgrest.py) with the stand-in Gemini model from
+test_soap_map_reduce, counting model calls:
+
+- A repeated click with an unchanged transcript makes no model call and
+  returns the stored note; a doctor's edit of the reviewed note is replaced
+  as before
+- A changed transcript regenerates the note; the Compassion Reflex is
+  skipped while Assessment and Plan are unchanged, also after a restart
+  (the stored suggestions seed the cache)
+- Changing a prompt invalidates stored notes
+- A reply cut off mid-note is an error, not a saved and cached note
+- Without migration 007 the note is saved without the hash columns
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from fastapi import HTTPException
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import summarizer
+from app.appointments import generate_soap_notes
+from app.data_access import SupabaseDataAccess
+from app.database import DatabaseClient
+from app.soap_cache import cached_soap_notes, save_soap_notes
+from fake_postgrest import FAKE_SERVICE_KEY, FakePostgrest
+from test_soap_map_reduce import SCALE, _Response, _transcript, _use_stand_in
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def _click(dal: SupabaseDataAccess, model, consultation_id: str = "consult-1"):
+    """One generate_soap request: (note, model calls, seconds scaled back to real time)."""
+    calls = model.calls
+    started = time.perf_counter()
+    response = await generate_soap_notes(consultation_id, db=dal)
+    seconds = (time.perf_counter() - started) / SCALE
+    return response.raw_soap_note.model_dump(), model.calls - calls, seconds
+
+
+async def _check_endpoint(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    try:
+        transcript = _transcript(10)
+        fake.tables["consultations"] = [{"id": "consult-1", "transcript": transcript}]
+        row = fake.tables["consultations"][0]
+        model = _use_stand_in()
+
+        note, calls, first_seconds = await _click(dal, model)
+        assert calls == 2
+        assert row["soap_transcript_hash"] == summarizer.transcript_hash(transcript)
+        assert row["stigma_input_hash"] == summarizer.stigma_input_hash(note["assessment"], note["plan"])
+
+        again, calls, repeat_seconds = await _click(dal, model)
+        assert again == note and calls == 0
+
+        # Trailing whitespace is not a change; the doctor's edit is replaced, as before
+        row["transcript"] = transcript + "\n"
+        row["raw_soap_note"] = {**note, "plan": "edited by the doctor"}
+        again, calls, _ = await _click(dal, model)
+        assert again == note and calls == 0 and row["raw_soap_note"] == note
+
+        # A new turn without clinical content after a restart: note regenerated,
+        # Compassion Reflex answered from the stored suggestions
+        summarizer._stigma_cache.clear()
+        row["transcript"] = transcript + "\n[PATIENT]: theek hai doctor"
+        again, calls, _ = await _click(dal, model)
+        assert again == note and calls == 1
+
+        # A new assessment fact changes Assessment: both steps run
+        row["transcript"] += "\n[DOCTOR]: FACT-402"
+        changed, calls, _ = await _click(dal, model)
+        assert "FACT-402" in changed["assessment"] and calls == 2
+
+        # Prompt changes invalidate stored notes and suggestions
+        soap_version, stigma_version = summarizer.SOAP_PROMPT_VERSION, summarizer.STIGMA_PROMPT_VERSION
+        try:
+            summarizer.SOAP_PROMPT_VERSION = "changed"
+            _, calls, _ = await _click(dal, model)
+            assert calls == 1
+            summarizer.STIGMA_PROMPT_VERSION = "changed"
+            _, calls, _ = await _click(dal, model)
+            assert calls == 2
+        finally:
+            summarizer.SOAP_PROMPT_VERSION, summarizer.STIGMA_PROMPT_VERSION = soap_version, stigma_version
+
+        # DatabaseClient (used by /api/consultations/{id}/generate_soap) stores the same keys
+        db = DatabaseClient(dal)
+        assert await db.save_soap_notes("consult-1", note, [], transcript)
+        assert cached_soap_notes(await dal.consultations.get("consult-1"), transcript) == (note, [])
+        assert await db.save_soap_notes("consult-1", note, [])
+        assert cached_soap_notes(await dal.consultations.get("consult-1"), transcript) is None
+        return first_seconds, repeat_seconds
+    finally:
+        await dal.aclose()
+
+
+def test_endpoint():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        first_seconds, repeat_seconds = asyncio.run(_check_endpoint(url, fake))
+    print("✅ Unchanged transcripts skip the LLM; changed inputs and prompts regenerate")
+    print(f"   10-minute consultation: first click {first_seconds:.1f}s, "
+          f"repeat click {repeat_seconds * SCALE * 1000:.1f}ms")
+
+
+class _TruncatedModel:
+    """Answers every call with a note cut off mid-dose (the token limit hit)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        return _Response('{"subjective": "Chest pain for 2 days", "objective": "BP 150/95", '
+                         '"assessment": "Hypertension", "plan": "Start amlodipine 5')
+
+
+async def _check_truncated(url: str, fake: FakePostgrest):
+    dal = SupabaseDataAccess(url, FAKE_SERVICE_KEY)
+    saved_model = summarizer._get_model
+    model = _TruncatedModel()
+    summarizer._get_model = lambda schema=None: model
+    try:
+        fake.tables["consultations"] = [{"id": "consult-2", "transcript": _transcript(1)}]
+        try:
+            await generate_soap_notes("consult-2", db=dal)
+            raise AssertionError("truncated note accepted")
+        except HTTPException as e:
+            assert e.status_code == 500 and "not well-formed JSON" in e.detail
+        row = fake.tables["consultations"][0]
+        assert not row.get("soap_notes") and not row.get("soap_transcript_hash")
+        # Nothing cached: the next click asks the model again
+        model = _use_stand_in()
+        note, calls, _ = await _click(dal, model, "consult-2")
+        assert calls == 2 and note["plan"]
+    finally:
+        summarizer._get_model = saved_model
+        await dal.aclose()
+
+
+def test_truncated_note():
+    fake = FakePostgrest()
+    with fake.serve() as url:
+        asyncio.run(_check_truncated(url, fake))
+    print("✅ A note cut off mid-plan fails the request and is neither saved nor cached")
+
+
+class _OldSchemaRepository:
+    """Consultations table before migration 007."""
+
+    def __init__(self):
+        self.rows = {"consult-1": {"id": "consult-1"}}
+
+    async def update(self, record_id, changes):
+        missing = [column for column in changes if column.endswith("_hash")]
+        if missing:
+            raise Exception(f"Could not find the '{missing[0]}' column of 'consultations' in the schema cache")
+        self.rows[record_id].update(changes)
+        return dict(self.rows[record_id])
+
+
+class _OldSchemaDataAccess:
+    def __init__(self):
+        self.consultations = _OldSchemaRepository()
+
+
+async def _check_old_schema():
+    dal = _OldSchemaDataAccess()
+    note = {"subjective": "s", "objective": "o", "assessment": "a", "plan": "p"}
+    saved = await save_soap_notes(dal, "consult-1", note, [], "[PATIENT]: dard")
+    assert saved["soap_notes"] == note and "soap_transcript_hash" not in saved
+    assert cached_soap_notes(saved, "[PATIENT]: dard") is None
+
+    class _Failing(_OldSchemaRepository):
+        async def update(self, record_id, changes):
+            raise Exception("connection reset")
+
+    dal.consultations = _Failing()
+    try:
+        await save_soap_notes(dal, "consult-1", note, [], "[PATIENT]: dard")
+        raise AssertionError("unrelated error swallowed")
+    except Exception as e:
+        assert str(e) == "connection reset"
+
+
+def test_old_schema():
+    asyncio.run(_check_old_schema())
+    print("✅ Without migration 007 notes are saved without cache keys; other errors propagate")
+
+
+if __name__ == "__main__":
+    test_endpoint()
+    test_truncated_note()
+    test_old_schema()
@@ -0,0 +1,122 @@
+"""
+Test and final-call latency for incremental SOAP drafting.
+
+Feeds a consultation's utterances to SoapDrafter as the caption pipeline
+would, with the stand-in Gemini model from test_soap_map_reduce (latency
+grows with prompt and answer length, notes list the facts they saw), then
+times the doctor's "generate" request after the call.
+
+- The reconciled note holds every fact, each in its section
+- Final-call latency vs today's full generation, when the doctor asks
+  right as the call ends (tail still pending) and a few seconds later
+  (tail drafted on idle)
+- A transcript that does not match the draft falls back to full generation;
+  a disabled drafter is plain generate_notes_with_empathy
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.soap_drafter import SoapDrafter
+from app.summarizer import generate_notes_with_empathy, split_speaker_turns
+from test_soap_map_reduce import SCALE, SECTIONS, _facts, _transcript, _use_stand_in
+
+# Seconds between utterances while feeding (background drafts keep up)
+FEED_INTERVAL = 0.03
+IDLE_FLUSH = 5.0
+# How long after the call the doctor asks for notes (before scaling)
+DOCTOR_DELAY = 10.0
+
+
+async def _feed(drafter: SoapDrafter, consultation_id: str, transcript: str) -> None:
+    for turn in split_speaker_turns(transcript):
+        speaker, text = turn[1:].split("]: ", 1)
+        drafter.add_utterance(consultation_id, speaker.lower(), text)
+        await asyncio.sleep(FEED_INTERVAL)
+
+
+async def _timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) / SCALE
+
+
+async def _drafted_run(minutes: int, every: int = 20, pause: float = 0.0):
+    """Feed a consultation, wait ``pause`` scaled seconds, then generate."""
+    model = _use_stand_in()
+    drafter = SoapDrafter(enabled=True, every=every, idle_flush=IDLE_FLUSH * SCALE)
+    transcript = _transcript(minutes)
+    await _feed(drafter, "consult-1", transcript)
+    await asyncio.sleep(pause * SCALE)
+    calls_during = model.calls
+    (note, suggestions), seconds = await _timed(drafter.generate("consult-1", transcript))
+    return drafter, transcript, note, seconds, calls_during, model.calls - calls_during
+
+
+async def _full_run(minutes: int, mode: str):
+    _use_stand_in()
+    _, seconds = await _timed(generate_notes_with_empathy(_transcript(minutes), mode=mode))
+    return seconds
+
+
+def test_reconciled_note_is_complete():
+    drafter, transcript, note, _, _, _ = asyncio.run(_drafted_run(30))
+    for section in SECTIONS:
+        assert note[section] == (_facts(transcript, section) or "Not documented"), section
+    stats = drafter.stats()
+    assert stats["reconciled"] == 1 and stats["fallbacks"] == 0 and stats["updates"] > 3
+    print(f"✅ Draft + tail note keeps every fact ({stats['updates']} background updates)")
+
+
+async def _check_fallbacks():
+    model = _use_stand_in()
+    drafter = SoapDrafter(enabled=True, every=10, idle_flush=60)
+    transcript = _transcript(10)
+    await _feed(drafter, "consult-2", transcript)
+    edited = transcript.replace("[DOCTOR]:", "[DOCTOR]: (edited)", 1)
+    note, _ = await drafter.generate("consult-2", edited)
+    assert drafter.stats()["fallbacks"] == 1
+    for section in SECTIONS:
+        assert note[section] == (_facts(edited, section) or "Not documented")
+
+    disabled = SoapDrafter(enabled=False)
+    disabled.add_utterance("consult-3", "patient", "seene mein dard")
+    # Fresh stand-in: the edited note's Compassion Reflex result is cached
+    model = _use_stand_in()
+    await disabled.generate("consult-3", transcript)
+    assert disabled.stats()["consultations"] == 0 and model.calls == 2
+
+
+def test_fallbacks():
+    asyncio.run(_check_fallbacks())
+    print("✅ Mismatched transcripts and a disabled drafter use full generation")
+
+
+def test_final_call_latency():
+    print()
+    print(f"Final generate call; the drafter updates every 20 utterances and {IDLE_FLUSH:.0f} s after "
+          f"captions stop")
+    print(f"{'minutes':>7} {'single-shot':>12} {'map-reduce':>11} {'draft, at once':>15} "
+          f"{'draft, after ' + str(int(DOCTOR_DELAY)) + ' s':>17} {'tail':>5} {'drafting calls':>15}")
+    for minutes in (10, 30, 60):
+        single = asyncio.run(_full_run(minutes, "single"))
+        map_reduce = asyncio.run(_full_run(minutes, "map_reduce"))
+        drafter, transcript, _, at_once, during, _ = asyncio.run(_drafted_run(minutes))
+        _, _, _, later, _, later_calls = asyncio.run(_drafted_run(minutes, pause=DOCTOR_DELAY))
+        tail = len(split_speaker_turns(transcript)) % drafter.every
+        print(f"{minutes:>7} {single:>11.1f}s {map_reduce:>10.1f}s {at_once:>14.1f}s "
+              f"{later * SCALE * 1000:>15.1f}ms {tail:>5} {during:>15}")
+        assert at_once < single
+        # No model call left: measured, not scaled
+        assert later_calls == 0 and later * SCALE < 0.05
+
+
+if __name__ == "__main__":
+    test_reconciled_note_is_complete()
+    test_fallbacks()
+    test_final_call_latency()
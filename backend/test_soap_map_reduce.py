@@ -0,0 +1,197 @@
+"""
+Test and timing for chunked (map-reduce) SOAP generation.
+
+Uses a stand-in Gemini model (no network) whose latency follows
+time = 0.3 s + input tokens x 0.2 ms + output tokens x 4 ms, and whose
+notes record the numbered facts ("FACT-17") found in their input, each
+fact belonging to one SOAP section. Time is scaled down 20x.
+
+- Chunking: whole speaker turns, bounded by the token budget; long turns
+  are split; nothing is lost or reordered
+- Map-reduce: every fact reaches its section of the final note; calls
+  overlap but never exceed the concurrency limit
+- Wall-clock time against transcript length, single-shot vs map-reduce
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import summarizer
+from app.models import SoapNoteResponse
+from app.summarizer import chunk_transcript, estimate_tokens, generate_notes_with_empathy, split_speaker_turns
+
+SCALE = 0.05
+BASE_SECONDS = 0.3
+PREFILL_SECONDS_PER_TOKEN = 0.0002
+DECODE_SECONDS_PER_TOKEN = 0.004
+TOKENS_PER_MINUTE = 200  # estimated transcript tokens per consultation minute
+SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+_FACT = re.compile(r"FACT-\d+")
+
+
+def _transcript(minutes: int, seed: int = 41) -> str:
+    rng = random.Random(seed)
+    lines = []
+    fact = 0
+    while estimate_tokens("\n".join(lines)) < minutes * TOKENS_PER_MINUTE:
+        speaker = "DOCTOR" if len(lines) % 2 == 0 else "PATIENT"
+        words = [rng.choice(["haan", "dard", "kab se", "bukhar", "theek", "dawai", "subah", "raat",
+                             "pet", "sar", "doctor", "aur", "nahi", "thoda", "bahut"])
+                 for _ in range(rng.randint(6, 30))]
+        if rng.random() < 0.3:
+            fact += 1
+            words.insert(rng.randrange(len(words)), f"FACT-{fact}")
+        lines.append(f"[{speaker}]: {' '.join(words)}")
+    return "\n".join(lines)
+
+
+def _section(fact: str) -> str:
+    """Which SOAP section a numbered fact belongs in."""
+    return SECTIONS[int(fact.split("-")[1]) % len(SECTIONS)]
+
+
+def _facts(text: str, section: str) -> str:
+    facts = sorted(set(_FACT.findall(text)), key=lambda f: int(f.split("-")[1]))
+    return " ".join(f for f in facts if _section(f) == section)
+
+
+class StandInModel:
+    """Latency grows with prompt and answer length; notes list the facts they saw."""
+
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.peak_active = 0
+        # Response schemas the summarizer asked for, per _get_model call
+        self.schemas = []
+
+    def _answer(self, prompt: str) -> str:
+        if "stigmatizing" in prompt:
+            return json.dumps({"suggestions": []})
+        merged_section = re.search(r"Partial '(\w+)' sections", prompt)
+        if merged_section:
+            section = merged_section.group(1)
+            return json.dumps({section: _facts(prompt, section)})
+        body = prompt
+        if "Transcript part:" in prompt:
+            body = prompt.split("Transcript part:\n", 1)[1]
+            if "for context only" in prompt:
+                body = body.split("\n", 1)[1]  # skip the repeated turn
+        note = {section: _facts(body, section) for section in SECTIONS}
+        if "Transcript part:" not in prompt:
+            note = {section: text or "Not documented" for section, text in note.items()}
+        return json.dumps(note)
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        answer = self._answer(prompt)
+        try:
+            await asyncio.sleep(SCALE * (
+                BASE_SECONDS
+                + estimate_tokens(prompt) * PREFILL_SECONDS_PER_TOKEN
+                # A note grows with what it records: ~6 tokens per fact
+                + (30 + 6 * len(_FACT.findall(answer))) * DECODE_SECONDS_PER_TOKEN
+            ))
+        finally:
+            self.active -= 1
+        return _Response(answer)
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def _use_stand_in() -> StandInModel:
+    model = StandInModel()
+    def get_model(schema=None):
+        model.schemas.append(schema)
+        return model
+
+    summarizer._get_model = get_model
+    summarizer.GEMINI_API_KEY = "stand-in"
+    # The Compassion Reflex as one model call, as the latency model assumes
+    # (the local detector is tested in test_stigma_rules)
+    summarizer.STIGMA_REVIEW_MODE = "llm"
+    # Compassion Reflex results of an earlier stand-in are not reused
+    summarizer._stigma_cache.clear()
+    return model
+
+
+def test_chunking():
+    transcript = _transcript(60)
+    turns = split_speaker_turns(transcript)
+    chunks = chunk_transcript(transcript, max_tokens=500)
+    assert all(estimate_tokens(chunk) <= 500 for chunk in chunks)
+    # Whole turns, in order, nothing lost
+    assert [turn for chunk in chunks for turn in split_speaker_turns(chunk)] == turns
+
+    # Unlabeled continuation lines stay with their turn; an oversized turn is split
+    assert split_speaker_turns("Doctor: hi\nhow are you\nPatient: ok") == ["Doctor: hi\nhow are you", "Patient: ok"]
+    long_turn = "[PATIENT]: " + " ".join(f"word{i}" for i in range(400))
+    pieces = chunk_transcript(long_turn, max_tokens=100)
+    assert len(pieces) > 1 and all(estimate_tokens(p) <= 100 for p in pieces)
+    assert " ".join(pieces).split() == long_turn.split()
+    print(f"✅ Chunking keeps whole speaker turns ({len(turns)} turns -> {len(chunks)} chunks of <= 500 tokens)")
+
+
+def test_map_reduce_keeps_every_fact():
+    model = _use_stand_in()
+    transcript = _transcript(90)
+    note, suggestions = asyncio.run(generate_notes_with_empathy(transcript, mode="map_reduce"))
+    for section in SECTIONS:
+        assert note[section] == _facts(transcript, section), section
+    assert suggestions == []
+    assert 1 < model.peak_active <= summarizer.SOAP_MAP_CONCURRENCY + 1  # + the Compassion Reflex
+    # Partial notes are constrained to the note schema; section merges are plain JSON mode
+    assert SoapNoteResponse in model.schemas and None in model.schemas
+
+    # Short transcripts stay single-shot in auto mode
+    model = _use_stand_in()
+    asyncio.run(generate_notes_with_empathy(_transcript(5)))
+    assert model.calls == 2 and model.peak_active == 1
+    assert model.schemas[0] is SoapNoteResponse
+    try:
+        asyncio.run(generate_notes_with_empathy("Doctor: hi", mode="parallel"))
+        raise AssertionError("unknown mode accepted")
+    except ValueError:
+        pass
+    print("✅ Map-reduce note keeps every fact; chunk calls respect the concurrency limit")
+
+
+def test_wall_clock_vs_length():
+    print()
+    print(f"Stand-in latency: {BASE_SECONDS}s + {PREFILL_SECONDS_PER_TOKEN * 1000:.1f} ms/input token "
+          f"+ {DECODE_SECONDS_PER_TOKEN * 1000:.0f} ms/output token; chunks of {summarizer.SOAP_CHUNK_TOKENS} "
+          f"tokens, concurrency {summarizer.SOAP_MAP_CONCURRENCY}")
+    print(f"{'minutes':>7} {'tokens':>7} {'chunks':>6} {'single-shot':>12} {'map-reduce':>11} {'calls':>6}")
+    results = {}
+    for minutes in (10, 30, 60, 120, 180):
+        transcript = _transcript(minutes)
+        timings = {}
+        for mode in ("single", "map_reduce"):
+            model = _use_stand_in()
+            started = time.perf_counter()
+            asyncio.run(generate_notes_with_empathy(transcript, mode=mode))
+            timings[mode] = (time.perf_counter() - started) / SCALE
+        results[minutes] = timings
+        print(f"{minutes:>7} {estimate_tokens(transcript):>7} {len(chunk_transcript(transcript)):>6} "
+              f"{timings['single']:>11.1f}s {timings['map_reduce']:>10.1f}s {model.calls:>6}")
+    assert results[180]["map_reduce"] < results[180]["single"]
+
+
+if __name__ == "__main__":
+    test_chunking()
+    test_map_reduce_keeps_every_fact()
+    test_wall_clock_vs_length()
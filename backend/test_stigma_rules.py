@@ -0,0 +1,235 @@
+"""
+Test and benchmark for the local stigma-language detector.
+
+Runs the Compassion Reflex over a labeled corpus of Assessment / Plan
+sections (stigmatizing phrases marked by hand, plus clinical look-alikes
+such as "diabetic foot ulcer" and "aggressive lymphoma"):
+
+- Detector: suggestions quote the note exactly and read naturally in place
+- Precision / recall and latency of the local detector alone, of the
+  default "auto" mode (model only when the detector is inconclusive) and of
+  the model-only path. Without GEMINI_API_KEY the model is an oracle
+  stand-in that returns the labels after a fixed latency, so its numbers
+  show the routing, not Gemini's accuracy; with a key Gemini itself is
+  measured
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import summarizer
+from app.stigma_rules import StigmaDetector, get_stigma_detector
+
+_gemini_model = summarizer._get_model
+
+SCALE = 0.01
+MODEL_LATENCY = 1.5  # seconds per Compassion Reflex call, before scaling
+
+# (assessment, plan, stigmatizing phrases as they appear in the note)
+CORPUS = [
+    ("Known diabetic patient with uncontrolled blood sugar. Non-compliant with metformin.",
+     "Patient refuses insulin; counselled on diet.", {"diabetic patient", "non-compliant with", "refuses"}),
+    ("Hypertensive crisis, resolved. Diabetic retinopathy noted.", "Continue amlodipine.", set()),
+    ("Drug abuser presenting with cellulitis at injection site.", "Refer to de-addiction centre.",
+     {"drug abuser"}),
+    ("Patient denies chest pain. Likely GERD.", "PPI for 4 weeks.", {"denies"}),
+    ("Chronic smoker with COPD exacerbation.", "Smoking cessation counselling.", {"chronic smoker"}),
+    ("Schizophrenic patient, stable on medication.", "Continue olanzapine.", {"schizophrenic patient"}),
+    ("Epileptic child with breakthrough seizures after missed doses.", "Increase valproate.",
+     {"epileptic child"}),
+    ("Alcohol abuse with elevated liver enzymes.", "Thiamine; counselling.", {"alcohol abuse"}),
+    ("Patient is a poor historian; complains of vague abdominal pain.", "USG abdomen.",
+     {"poor historian", "complains of"}),
+    ("Frequent flyer in ED, drug-seeking behaviour suspected.", "No opioids.",
+     {"frequent flyer", "drug-seeking"}),
+    ("Asthma exacerbation, moderate.", "Nebulisation, inhaled steroids.", set()),
+    ("Type 2 diabetes mellitus, well controlled.", "Continue metformin 500 mg BD.", set()),
+    ("Obese patient with knee osteoarthritis.", "Weight reduction, physiotherapy.", {"obese patient"}),
+    ("Patient is obese with BMI 34.", "Diet counselling.", {"is obese"}),
+    ("Wheelchair-bound since spinal injury; pressure sore on sacrum.", "Dressing; air mattress.",
+     {"wheelchair-bound"}),
+    ("Suffers from chronic migraine.", "Propranolol prophylaxis.", {"suffers from"}),
+    ("Failed treatment with two antibiotics; resistant UTI.", "Culture-guided therapy.", {"failed treatment"}),
+    ("Aggressive and uncooperative during examination.", "Psychiatry review.", {"aggressive", "uncooperative"}),
+    ("Manipulative behaviour reported by staff.", "Consistent care plan.", {"manipulative"}),
+    ("History of childhood abuse; presents with anxiety.", "CBT referral.", set()),
+    ("Aggressive B-cell lymphoma.", "Oncology referral.", set()),
+    ("HIV patient on ART, CD4 450.", "Continue ART.", {"hiv patient"}),
+    ("Stroke victim with right hemiparesis.", "Physiotherapy.", {"stroke victim"}),
+    ("Known alcoholic with withdrawal tremors.", "Chlordiazepoxide taper.", {"known alcoholic"}),
+    ("Patient claims to have taken all doses.", "Pill count at next visit.", {"claims"}),
+    ("Mentally ill patient brought by family.", "Admit to psychiatry.", {"mentally ill patient"}),
+    ("Bipolar disorder, currently euthymic.", "Continue lithium; levels in 3 months.", set()),
+    ("Depressed mood and poor sleep for 3 weeks.", "Start sertraline 50 mg.", set()),
+    ("Viral fever, day 3.", "Patient refused HIV testing; re-offer at next visit.", {"refused"}),
+    ("Anaemic woman, Hb 8.2.", "Iron supplements.", {"anaemic woman"}),
+    ("Viral fever, day 3.", "Paracetamol, fluids.", set()),
+    ("Non-smoker, no alcohol use.", "Routine follow-up.", set()),
+    ("Hysterical patient with non-epileptic attacks.", "Neurology and psychiatry review.", {"hysterical"}),
+    ("Patient is a diabetic.", "HbA1c in 3 months.", {"a diabetic"}),
+    ("Noncompliance with dialysis schedule.", "Social work referral.", {"noncompliance"}),
+    ("Cancer patient on chemotherapy with febrile neutropenia.", "Admit; IV antibiotics.", {"cancer patient"}),
+    ("Insists on antibiotics for viral URI.", "Explained; symptomatic care.", {"insists"}),
+    ("COPD with acute exacerbation.", "Nebulisation; steroids.", set()),
+    ("Lazy about exercise; BMI 31.", "Lifestyle counselling.", {"lazy"}),
+    ("Substance abuse history, in remission.", "Continue follow-up.", {"substance abuse"}),
+    ("Patient complained of dizziness after starting amlodipine.", "Reduce dose.", {"complained of"}),
+    ("Diabetic foot examination normal.", "Annual review.", set()),
+    ("Psychotic episode, first presentation.", "Antipsychotics; admit.", set()),
+    ("Elderly demented patient, wandering at night.", "Caregiver support.", {"demented patient"}),
+]
+
+
+def _matches(original: str, phrase: str) -> bool:
+    original = original.lower()
+    return phrase in original or original in phrase
+
+
+def _score(results):
+    """Precision and recall of (suggestions, labels) pairs."""
+    true_positives = found = expected = 0
+    for suggestions, labels in results:
+        originals = [s["original"] for s in suggestions]
+        found += len(originals)
+        expected += len(labels)
+        true_positives += sum(1 for original in originals if any(_matches(original, p) for p in labels))
+    precision = true_positives / found if found else 1.0
+    recall = sum(
+        1 for suggestions, labels in results for phrase in labels
+        if any(_matches(s["original"], phrase) for s in suggestions)
+    ) / expected
+    return precision, recall
+
+
+class OracleModel:
+    """Compassion Reflex stand-in: returns the corpus labels after MODEL_LATENCY."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(MODEL_LATENCY * SCALE)
+        assessment = re.search(r"Assessment Section:\n(.*)\n", prompt).group(1)
+        plan = re.search(r"Plan Section:\n(.*)\n", prompt).group(1)
+        suggestions = []
+        for section, text in (("assessment", assessment), ("plan", plan)):
+            for phrase in next(labels for a, p, labels in CORPUS if (a, p) == (assessment, plan)):
+                start = text.lower().find(phrase)
+                if start >= 0:
+                    suggestions.append({"section": section, "original": text[start:start + len(phrase)],
+                                        "suggested": "(rephrased)", "rationale": "stand-in"})
+
+        class Response:
+            pass
+
+        response = Response()
+        response.text = json.dumps({"suggestions": suggestions})
+        return response
+
+
+def test_detector():
+    detector = StigmaDetector()
+    review = detector.review(
+        "A known diabetic patient, non-compliant with metformin. Diabetic foot ulcer.",
+        "Patient refuses insulin. Counselled the non-smoker. HIV-positive patient."
+    )
+    by_original = {s.original: s for s in review.suggestions}
+    assert by_original["A known diabetic patient"].suggested == "A patient with known diabetes"
+    assert by_original["non-compliant with"].suggested == "not adherent to"
+    assert by_original["refuses"].section == "plan" and by_original["refuses"].suggested == "declines"
+    assert by_original["HIV-positive patient"].suggested == "patient with HIV"
+    assert len(review.suggestions) == 4 and review.inconclusive == ()
+
+    # Replacing in place reads naturally
+    text = "He is an epileptic child and a known alcoholic."
+    for suggestion in detector.review(text, "").suggestions:
+        text = text.replace(suggestion.original, suggestion.suggested)
+    assert text == "He is a child with epilepsy and a person with known alcohol use disorder."
+
+    # A moved qualifier is lower-cased; degree words are kept and no article is added
+    def suggested(text):
+        return {s.original: s.suggested for s in detector.review(text, "").suggestions}
+
+    assert suggested("Known diabetic patient.") == {"Known diabetic patient": "Patient with known diabetes"}
+    assert suggested("Chronic smoker with COPD.") == {"Chronic smoker": "Person who smokes chronically"}
+    assert suggested("He is a heavy smoker.") == {"a heavy smoker": "a person who smokes heavily"}
+    assert suggested("Drug addict with cellulitis.") == {"Drug addict": "Person with a substance use disorder"}
+    # No person-first wording that would misread the note
+    assert suggested("Stroke patient, day 2.") == {}
+    assert suggested("TB case in family.") == {}
+
+    # Context-dependent terms are left to the model
+    assert detector.review("Aggressive behaviour; history of abuse.", "").inconclusive == ("aggressive", "abuse")
+    assert detector.review("Aggressive B-cell lymphoma", "").suggestions == []
+    print("✅ Detector quotes the note exactly, keeps qualifiers and degree words, and leaves "
+          "context-dependent terms to the model")
+
+
+async def _run(mode: str):
+    model = OracleModel()
+    summarizer._get_model = lambda schema=None: model
+    summarizer._stigma_cache.clear()
+    results = []
+    started = time.perf_counter()
+    for assessment, plan, labels in CORPUS:
+        results.append((await summarizer._analyze_for_stigma(assessment, plan, mode), labels))
+    seconds = (time.perf_counter() - started) / len(CORPUS)
+    return results, model.calls, seconds
+
+
+async def _run_gemini():
+    summarizer._get_model = _gemini_model
+    summarizer._stigma_cache.clear()
+    results = []
+    started = time.perf_counter()
+    for assessment, plan, labels in CORPUS:
+        results.append((await summarizer._analyze_for_stigma(assessment, plan, "llm"), labels))
+    return results, len(CORPUS), (time.perf_counter() - started) / len(CORPUS)
+
+
+def test_precision_recall_latency():
+    detector = get_stigma_detector()
+    started = time.perf_counter()
+    local = [([s.model_dump() for s in detector.review(a, p).suggestions], labels) for a, p, labels in CORPUS]
+    local_seconds = (time.perf_counter() - started) / len(CORPUS)
+    inconclusive = sum(1 for a, p, _ in CORPUS if detector.review(a, p).inconclusive)
+
+    gemini = bool(os.getenv("GEMINI_API_KEY"))
+    rows = [("local only", *_score(local), 0, local_seconds, local_seconds)]
+    for mode in ("auto", "llm"):
+        results, calls, seconds = asyncio.run(_run(mode))
+        rows.append((f"{mode} (stand-in)", *_score(results), calls, seconds, seconds / SCALE))
+    if gemini:
+        results, calls, seconds = asyncio.run(_run_gemini())
+        rows.append(("llm (Gemini)", *_score(results), calls, seconds, seconds))
+
+    labeled = sum(len(labels) for _, _, labels in CORPUS)
+    print()
+    print(f"Corpus: {len(CORPUS)} notes, {labeled} labeled phrases; "
+          f"{inconclusive} notes inconclusive locally; stand-in model latency {MODEL_LATENCY}s")
+    print(f"{'path':<18} {'precision':>9} {'recall':>7} {'model calls':>11} {'per note':>10}")
+    for name, precision, recall, calls, _, per_note in rows:
+        latency = f"{per_note * 1e6:.0f} µs" if per_note < 0.01 else f"{per_note:.2f} s"
+        print(f"{name:<18} {precision:>9.2f} {recall:>7.2f} {calls:>11} {latency:>10}")
+    if not gemini:
+        print("(set GEMINI_API_KEY to measure Gemini itself)")
+
+    local_precision, local_recall = rows[0][1], rows[0][2]
+    auto = rows[1]
+    assert local_precision == 1.0 and local_recall >= 0.8
+    # The stand-in knows every label: auto misses nothing and asks only for inconclusive notes
+    assert auto[1] == 1.0 and auto[2] == 1.0 and auto[3] == inconclusive < len(CORPUS) / 4
+    assert local_seconds < 0.001
+
+
+if __name__ == "__main__":
+    test_detector()
+    test_precision_recall_latency()
@@ -0,0 +1,291 @@
+"""
+Test and measurements for the local triage pre-filter.
+
+Scores a labeled set of patient utterances (English, Hinglish, Devanagari):
+lines that warrant an alert (severity 3+ under the triage prompt's
+guidelines) and lines that do not (small talk, answers, mild remarks).
+
+- Aho-Corasick matcher agrees with a brute-force substring scan
+- Recall: every alert-worthy line is escalated to the model; only clear
+  small talk is answered locally (the filter fails open)
+- Held-out emergencies (suicide, overdose, stroke, airway) in phrasings
+  outside the tuning set are escalated and scored critical
+- LLM-call reduction: share of lines answered locally
+- Throughput: utterances scored per second
+- AlertEngine: skipped lines never reach the model; the fallback matcher
+  now understands Hindi emergencies
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.alert_engine import AlertEngine
+from app.triage_filter import AhoCorasick, TriagePrefilter
+
+ALERT_WORTHY = [
+    "I have chest pain since morning",
+    "mujhe chest pain ho raha hai",
+    "seene mein bahut dard hai",
+    "सीने में दर्द हो रहा है",
+    "chhati mein jakdan aur dard hai",
+    "I can't breathe properly",
+    "saans lene mein bahut takleef hai",
+    "सांस फूल रही है चलने पर",
+    "dum ghut raha hai",
+    "my father passed out in the bathroom",
+    "woh behosh ho gaye the",
+    "वो बेहोश हो गए",
+    "there is blood in my vomit",
+    "khoon ki ulti hui subah",
+    "खून की उल्टी हुई",
+    "nose is bleeding and won't stop",
+    "naak se khoon aa raha hai",
+    "I think I'm having a heart attack",
+    "dil mein dard ho raha hai left side",
+    "his face is drooping and he can't move his arm",
+    "usko lakwa maar gaya lagta hai",
+    "haath pair sunn ho gaye achanak",
+    "she had a seizure last night",
+    "bachche ko mirgi ka daura pada",
+    "I fell and my wrist is broken",
+    "haddi toot gayi lagti hai",
+    "mera haath toot gaya",
+    "हड्डी टूट गई है",
+    "I have a deep cut on my leg",
+    "hath kat gaya hai gehra",
+    "I burned my hand with boiling water",
+    "haath jal gaya garam paani se",
+    "I have had a high fever for three days",
+    "teen din se tez bukhar hai",
+    "तीन दिन से तेज बुखार है",
+    "bukhar 103 tak ja raha hai",
+    "the headache is the worst I've ever had",
+    "sar mein bahut tez dard hai",
+    "सर में बहुत तेज दर्द है",
+    "I've been vomiting all night",
+    "raat bhar ulti ho rahi thi",
+    "pet mein bahut dard hai",
+    "पेट में बहुत दर्द है",
+    "stomach pain is unbearable",
+    "dard bardasht nahi ho raha",
+    "I feel like killing myself",
+    "main jaan dena chahta hoon",
+    "ab jeena nahi, mar jana chahti hoon",
+    "I took too many sleeping pills, an overdose",
+    "usne zeher kha liya",
+    "I am very dizzy and keep falling",
+    "bahut chakkar aa rahe hain",
+    "my ankle is swollen after the fall",
+    "pair mein sujan aur dard hai",
+    "the wound has pus and is getting red",
+    "ghav mein pus hai",
+    "my vision is suddenly blurry",
+    "achanak dhundhla dikh raha hai",
+    "heart is racing, palpitations",
+    "dhadkan bahut tez hai",
+    "I have severe back pain",
+    "kamar mein bahut tez dard hai",
+    "peshab mein jalan aur bukhar",
+    "I have an allergic reaction, my lips are swelling",
+    "dawai se reaction ho gaya, rashes aa gaye",
+    "my child is not eating and has a fever",
+    "bachche ko dast aur ulti ho rahi hai",
+    "head injury from a bike accident",
+    "sir pe chot lagi hai",
+    "I feel hopeless and depressed all the time",
+]
+
+# Greetings, acknowledgements and fillers: answered locally
+SMALL_TALK = [
+    "hello doctor", "haan", "haan ji", "हां", "nahi", "no", "yes", "okay", "ok doctor",
+    "thank you doctor", "dhanyavaad", "धन्यवाद", "shukriya", "good morning", "namaste doctor",
+    "नमस्ते", "theek hoon", "ठीक हूं", "main theek hoon ab", "I'm fine now", "can you hear me?",
+    "awaaz aa rahi hai?", "one second please", "ek minute", "haan main sun raha hoon",
+    "bas itna hi", "aur kuch nahi", "that's all", "nothing else", "okay I will do that",
+    "theek hai doctor", "ठीक है", "samajh gaya", "understood", "please repeat", "phir se boliye",
+    "sorry?", "kya?", "hmm", "acha", "अच्छा", "bye doctor", "alvida", "see you next week",
+]
+
+# Not alert-worthy, but not clear small talk either: still sent to the model
+OTHER_LINES = [
+    "I am doing better", "pehle se behtar hoon", "aawaz kat rahi hai", "network slow hai",
+    "my name is Ramesh", "mera naam Sunita hai", "I am 45 years old", "meri umar 32 saal hai",
+    "I live in Pune", "main Delhi se hoon", "I had breakfast at 8", "subah nashta kiya tha",
+    "I take my medicine daily", "roz dawai leta hoon", "dawai le raha hoon", "I went for a walk",
+    "kal walk pe gaya tha", "should I come to the clinic?", "clinic kab aana hai",
+    "kitne baje appointment hai", "what time tomorrow?", "kal kitne baje", "I'll send the report",
+    "report bhej dunga", "report WhatsApp kar di hai", "can I eat rice?",
+    "kya main chawal kha sakta hoon", "I sleep about seven hours", "saat ghante sota hoon",
+    "my wife is here with me", "meri beti saath mein hai", "I work in an office",
+    "office jaata hoon", "I drink two cups of tea", "do cup chai peeta hoon", "no smoking",
+    "sharab nahi peeta", "I exercise sometimes", "kabhi kabhi yoga karta hoon", "I am a teacher",
+    "main teacher hoon", "my sugar report came normal", "BP normal aaya", "last visit was in March",
+    "pichhli baar March mein aaya tha", "I forgot the name of the tablet",
+    "tablet ka naam bhool gaya",
+]
+
+NOT_ALERT_WORTHY = SMALL_TALK + OTHER_LINES
+
+# Emergencies outside ALERT_WORTHY, the set the vocabulary was first tuned
+# on; each must reach the model and be critical for the fallback matcher
+HELD_OUT_EMERGENCIES = [
+    "I want to end my life",
+    "I feel like dying",
+    "I took too many pills",
+    "I swallowed bleach",
+    "my lips are turning blue",
+    "my face is drooping",
+    "I cannot feel my left arm",
+    "I am choking",
+    "I have chest tightness",
+    "mujhe marne ka mann karta hai",
+    "I want to kill myself",
+    "honestly there is no reason to live anymore",
+    "she drank some pesticide from the shed",
+    "his speech is slurred and one side of his face looks wrong",
+    "baby is gasping and turning blue",
+    "my throat is closing after the injection",
+    "jeena nahi chahti ab",
+    "usne neend ki goliyan kha li",
+    "गला घुट रहा है",
+]
+
+# Phrasings the vocabulary does not know: the pre-filter must still send them on
+UNKNOWN_EMERGENCIES = [
+    "I don't see the point of anything anymore",
+    "he fell off the roof and is not answering",
+    "my mouth feels weird and my words come out wrong",
+]
+
+THROUGHPUT_UTTERANCES = 20000
+
+
+def test_matcher_matches_brute_force():
+    rng = random.Random(38)
+    alphabet = "abcde "
+    for _ in range(200):
+        patterns = list({"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(8)})
+        text = "".join(rng.choice(alphabet) for _ in range(60))
+        matcher = AhoCorasick(patterns)
+        found = sorted((end, matcher.patterns[index]) for end, index in matcher.find(text))
+        expected = sorted(
+            (start + len(pattern), pattern)
+            for pattern in patterns
+            for start in range(len(text) - len(pattern) + 1)
+            if text.startswith(pattern, start)
+        )
+        assert found == expected, (patterns, text)
+    print("✅ Aho-Corasick finds exactly the brute-force matches")
+
+
+def test_recall_and_reduction():
+    prefilter = TriagePrefilter()
+    missed = [line for line in ALERT_WORTHY if not prefilter.should_escalate(line)]
+    escalated_small_talk = [line for line in SMALL_TALK if prefilter.should_escalate(line)]
+    escalated_other = [line for line in OTHER_LINES if prefilter.should_escalate(line)]
+    total = len(ALERT_WORTHY) + len(NOT_ALERT_WORTHY)
+    escalated = len(ALERT_WORTHY) - len(missed) + len(escalated_small_talk) + len(escalated_other)
+
+    start = time.perf_counter()
+    lines = ALERT_WORTHY + NOT_ALERT_WORTHY
+    for i in range(THROUGHPUT_UTTERANCES):
+        prefilter.should_escalate(lines[i % len(lines)])
+    elapsed = time.perf_counter() - start
+
+    print()
+    print(f"Labeled set: {len(ALERT_WORTHY)} alert-worthy + {len(SMALL_TALK)} small-talk + "
+          f"{len(OTHER_LINES)} other lines, {len(prefilter.terms)} terms")
+    print(f"recall (alert-worthy escalated): {1 - len(missed) / len(ALERT_WORTHY):.1%}")
+    print(f"small talk escalated:            {len(escalated_small_talk)} of {len(SMALL_TALK)}")
+    print(f"other lines escalated:           {len(escalated_other)} of {len(OTHER_LINES)} (fails open)")
+    print(f"LLM calls: {escalated} of {total} ({1 - escalated / total:.1%} fewer)")
+    print(f"throughput: {THROUGHPUT_UTTERANCES / elapsed:,.0f} utterances/s "
+          f"({elapsed / THROUGHPUT_UTTERANCES * 1e6:.1f} µs each)")
+    assert not missed, missed
+    assert not escalated_small_talk, escalated_small_talk
+
+
+def test_held_out_emergencies():
+    prefilter = TriagePrefilter()
+    for line in HELD_OUT_EMERGENCIES + UNKNOWN_EMERGENCIES:
+        assert prefilter.should_escalate(line), line
+    not_critical = [line for line in HELD_OUT_EMERGENCIES if not prefilter.score(line).critical]
+    assert not not_critical, not_critical
+    # Small talk with anything else in it is not small talk
+    for line in ("thank you doctor, I am choking", "haan ji, khoon aa raha hai", "okay but not fine"):
+        assert prefilter.should_escalate(line), line
+    print(f"✅ {len(HELD_OUT_EMERGENCIES)} held-out emergencies escalated and critical; "
+          f"{len(UNKNOWN_EMERGENCIES)} with no known term still escalated")
+
+
+class StandInModel:
+    """Counts model calls; every escalated line is judged critical."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt: str):
+        self.calls += 1
+
+        class Response:
+            text = json.dumps({"is_critical": True, "symptom_type": f"s{self.calls}", "severity_score": 4})
+
+        return Response()
+
+
+async def _check_engine():
+    engine = AlertEngine()
+    engine.model = StandInModel()
+    engine.ai_enabled = True
+    for i, line in enumerate(NOT_ALERT_WORTHY):
+        await engine.analyze_transcript(line, f"consult-{i}", "patient")
+    skipped_calls = engine.model.calls
+    assert engine.prefiltered == len(SMALL_TALK) and skipped_calls == len(OTHER_LINES)
+
+    alerts = 0
+    for i, line in enumerate(ALERT_WORTHY):
+        if await engine.analyze_transcript(line, f"consult-{i}", "patient"):
+            alerts += 1
+    assert alerts == len(ALERT_WORTHY)
+
+    # Fallback matcher (no model) now covers Hindi emergencies
+    engine.ai_enabled = False
+    alert = await engine.analyze_transcript("सीने में दर्द हो रहा है", "consult-fallback", "patient")
+    assert alert is not None and alert.symptom_type == "chest_pain"
+    alert = await engine.analyze_transcript("naak se khoon aa raha hai", "consult-fallback", "patient")
+    assert alert is not None and alert.symptom_type == "bleeding"
+    assert await engine.analyze_transcript("I have chest pain", "consult-fallback", "patient") is None  # dedup
+    assert await engine.analyze_transcript("theek hoon", "consult-fallback", "patient") is None
+    # ... and suicide, overdose, stroke and airway emergencies
+    expected_types = {
+        "I want to end my life": "mental_health",
+        "I took too many pills": "poisoning",
+        "my face is drooping": "neurological",
+        "I am choking": "breathing_difficulty",
+    }
+    for i, line in enumerate(HELD_OUT_EMERGENCIES):
+        alert = await engine.analyze_transcript(line, f"consult-held-out-{i}", "patient")
+        assert alert is not None, line
+        if line in expected_types:
+            assert alert.symptom_type == expected_types[line], (line, alert.symptom_type)
+    return skipped_calls
+
+
+def test_alert_engine_skips_small_talk():
+    calls = asyncio.run(_check_engine())
+    print(f"✅ AlertEngine: {len(SMALL_TALK)} small-talk lines skipped, {calls} other lines sent to the model; "
+          f"every alert-worthy line alerted; fallback covers Hindi and held-out emergencies")
+
+
+if __name__ == "__main__":
+    test_matcher_matches_brute_force()
+    test_recall_and_reduction()
+    test_held_out_emergencies()
+    test_alert_engine_skips_small_talk()
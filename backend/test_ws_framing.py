@@ -0,0 +1,154 @@
+"""
+Test and benchmark for compact WebSocket framing (captions and emotions).
+
+- Verifies msgpack frames round-trip to the same messages as JSON
+- Measures bytes on the wire per message, raw and after permessage-deflate
+- Measures server CPU per message when broadcasting to 100 concurrent rooms
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.ws_framing import (
+    JSON_FORMAT,
+    MSGPACK_FORMAT,
+    decode_frame,
+    encode_frame,
+    send_frame,
+)
+
+ROOMS = 100
+PARTICIPANTS_PER_ROOM = 2
+MESSAGES_PER_ROOM = 200
+
+SAMPLE_CAPTIONS = [
+    ("patient", "Mujhe teen din se bukhar hai aur sar mein dard hai",
+     "I have had a fever for three days and a headache"),
+    ("doctor", "Aapko khansi bhi hai kya? Kitne din se?",
+     "Do you also have a cough? Since how many days?"),
+    ("patient", "Haan, raat ko zyada hoti hai", "Yes, it is worse at night"),
+    ("doctor", "Main kuch tests likh raha hoon", "I am prescribing some tests"),
+]
+
+
+class FakeWebSocket:
+    """Records frames sent so wire sizes can be measured after timing."""
+
+    def __init__(self):
+        self.payloads = []
+
+    def _count(self, payload: bytes):
+        self.payloads.append(payload)
+
+    def wire_sizes(self):
+        """Return (raw bytes, bytes after permessage-deflate with context takeover)."""
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        raw = deflated = 0
+        for payload in self.payloads:
+            raw += len(payload)
+            compressed = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            deflated += len(compressed) - 4  # trailing 00 00 ff ff is stripped on the wire (RFC 7692)
+        return raw, deflated
+
+    async def send_text(self, data: str):
+        self._count(data.encode("utf-8"))
+
+    async def send_bytes(self, data: bytes):
+        self._count(data)
+
+    async def send_json(self, data: dict):
+        # Mirrors starlette's WebSocket.send_json
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+
+def _caption(i: int) -> dict:
+    speaker, original, translated = SAMPLE_CAPTIONS[i % len(SAMPLE_CAPTIONS)]
+    return {
+        "type": "caption",
+        "speaker": speaker,
+        "original_text": f"{original} ({i})",
+        "translated_text": f"{translated} ({i})",
+        "timestamp": 1730000000.0 + i,
+    }
+
+
+def _emotion(i: int) -> dict:
+    return {
+        "type": "emotion_logged",
+        "data": {
+            "emotion_type": ["calm", "anxious", "pain", "neutral"][i % 4],
+            "confidence_score": 0.5 + (i % 50) / 100,
+            "consultation_id": "3f1c2a8e-6c1d-4a4b-9a51-0b5f7a9e2c11",
+        },
+    }
+
+
+def test_round_trip():
+    """msgpack frames decode to the original messages."""
+    for message in [_caption(0), _caption(1), _emotion(2), {"type": "pong"}]:
+        assert decode_frame(encode_frame(message, JSON_FORMAT)) == message
+        frame = encode_frame(message, MSGPACK_FORMAT)
+        assert isinstance(frame, bytes)
+        assert decode_frame(frame) == message
+    print("✅ Round trip OK for JSON and msgpack frames")
+
+
+async def _broadcast_legacy(rooms, message):
+    """Previous behaviour: build and JSON-encode the message per connection."""
+    for connections in rooms:
+        for connection in connections:
+            await connection.send_json(dict(message))
+
+
+async def _broadcast_framed(rooms, message, wire_format):
+    """New behaviour: encode once per broadcast, send the frame to everyone."""
+    for connections in rooms:
+        frames = {}
+        for connection in connections:
+            if wire_format not in frames:
+                frames[wire_format] = encode_frame(message, wire_format)
+            await send_frame(connection, frames[wire_format])
+
+
+async def _run(mode: str, make_message):
+    rooms = [[FakeWebSocket() for _ in range(PARTICIPANTS_PER_ROOM)] for _ in range(ROOMS)]
+    start = time.process_time()
+    for i in range(MESSAGES_PER_ROOM):
+        message = make_message(i)
+        if mode == "legacy-json":
+            await _broadcast_legacy(rooms, message)
+        else:
+            await _broadcast_framed(rooms, message, mode)
+    cpu = time.process_time() - start
+
+    sizes = [ws.wire_sizes() for room in rooms for ws in room]
+    frames = sum(len(ws.payloads) for room in rooms for ws in room)
+    return {
+        "raw_per_msg": sum(raw for raw, _ in sizes) / frames,
+        "deflated_per_msg": sum(deflated for _, deflated in sizes) / frames,
+        "cpu_us_per_msg": cpu / frames * 1e6,
+    }
+
+
+def benchmark_framing():
+    """Bytes on the wire and server CPU per delivered message at 100 rooms."""
+    print()
+    print(f"Benchmark: {ROOMS} rooms x {PARTICIPANTS_PER_ROOM} participants x {MESSAGES_PER_ROOM} messages")
+    print(f"{'stream':<10} {'mode':<12} {'bytes/msg':>10} {'deflate/msg':>12} {'cpu us/msg':>11}")
+    for name, make_message in [("captions", _caption), ("emotions", _emotion)]:
+        for mode in ["legacy-json", JSON_FORMAT, MSGPACK_FORMAT]:
+            r = asyncio.run(_run(mode, make_message))
+            print(f"{name:<10} {mode:<12} {r['raw_per_msg']:>10.1f} "
+                  f"{r['deflated_per_msg']:>12.1f} {r['cpu_us_per_msg']:>11.2f}")
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    benchmark_framing()
@@ -13,6 +13,17 @@ interface Caption {
   id: string
 }
 
+// Critical symptom alert pushed to doctors over the caption WebSocket
+interface SymptomAlert {
+  symptom_text: string
+  symptom_type: string
+  severity_score: number
+  timestamp: string
+  ai_analysis?: string | null
+  recommendations?: string | null
+  id: string
+}
+
 interface LiveCaptionsProps {
   consultationId: string
   userType: 'doctor' | 'patient'
@@ -52,6 +63,7 @@ export default function LiveCaptions({
   })
   
   const [captions, setCaptions] = useState<Caption[]>([])
+  const [alerts, setAlerts] = useState<SymptomAlert[]>([])
   const [isConnected, setIsConnected] = useState(false)
   // Task 7: Add error state for comprehensive error handling
   const [error, setError] = useState<ErrorState | null>(null)
@@ -277,6 +289,14 @@ export default function LiveCaptions({
             // Generic error - don't let it stop the caption flow
             console.error('❌ Backend error (continuing):', data.message)
           }
+        } else if (data.type === 'alert' && data.alert) {
+          // Critical symptom detected in the patient's captions (doctors only)
+          console.warn('🚨 Symptom alert:', data.alert.symptom_type, `severity ${data.alert.severity_score}`)
+          const newAlert: SymptomAlert = {
+            ...data.alert,
+            id: `alert-${Date.now()}-${Math.random()}`
+          }
+          setAlerts(prev => [...prev, newAlert].slice(-3))
         } else if (data.type === 'pong') {
           console.log('🏓 Pong received - connection alive')
         } else {
@@ -1250,6 +1270,39 @@ export default function LiveCaptions({
           </Button>
         </div>
 
+        {/* Symptom alerts from the patient's captions (sent to doctors only) */}
+        {alerts.length > 0 && (
+          <div className="mb-3 space-y-2">
+            {alerts.map((alert) => (
+              <div
+                key={alert.id}
+                className={`p-2 rounded border ${alert.severity_score >= 5 ? 'bg-red-900/50 border-red-500' : 'bg-orange-900/40 border-orange-500'}`}
+              >
+                <div className="flex items-start gap-2">
+                  <span className="text-lg">🚨</span>
+                  <div className="flex-1">
+                    <p className="text-white text-sm font-semibold">
+                      {alert.symptom_type.replace(/_/g, ' ')} (severity {alert.severity_score}/5)
+                    </p>
+                    <p className="text-slate-300 text-xs mt-1 italic">&quot;{alert.symptom_text}&quot;</p>
+                    {alert.recommendations && (
+                      <p className="text-slate-200 text-xs mt-1">{alert.recommendations}</p>
+                    )}
+                  </div>
+                  <Button
+                    variant="ghost"
+                    size="sm"
+                    onClick={() => setAlerts(prev => prev.filter(a => a.id !== alert.id))}
+                    className="text-white hover:bg-slate-700 h-6 w-6 p-0"
+                  >
+                    <X className="w-3 h-3" />
+                  </Button>
+                </div>
+              </div>
+            ))}
+          </div>
+        )}
+
         {/* Captions Display */}
         {/* Task 6.3: Implement proper caption display logic */}
         <div className="space-y-2 max-h-32 overflow-y-auto scrollbar-thin scrollbar-thumb-slate-600 scrollbar-track-transparent">